@@ -4,54 +4,70 @@ Análises sérias e robustas baseadas em regras específicas
 Powered by Google Gemini AI
 """
 
-import PyPDF2
-import openpyxl
 import re
 from datetime import datetime, timedelta
-from dateutil import parser as date_parser
 import json
 import os
-from ai_config import get_ai_analysis
+from ai_config import get_ai_analysis, get_ai_status
+from date_extraction import DATE_RE, extract_dates, validity_date
+from document_extract import get_extract, get_pdf_extract, read_pdf_text
+from excel_rules import scan_sheet
+from prompt_budget import build_context
+
+# Versão das regras de análise - alterar invalida o cache de resultados (analysis_cache.py)
+ANALYZER_VERSION = '2025.4'
+
+# Caracteres de texto lidos por tipo de PDF antes de parar (regras locais; a IA recebe
+# os trechos escolhidos por prompt_budget no documento inteiro)
+DEFAULT_TEXT_BUDGET = int(os.getenv('PDF_TEXT_BUDGET', '6000'))
+PDF_TEXT_BUDGETS = {
+    'apresentacao_institucional': 8000,
+    'qdd_anbima': 8000,
+    'formulario_referencia_cvm': 8000,
+    'certidao_municipal': 3000, 'certidao_estadual': 3000, 'certidao_federal': 3000,
+    'certidao_trabalhista': 3000, 'certidao_fgts': 3000,
+}
+DATE_SIGNAL = (DATE_RE,)
 
 def extract_text_from_pdf(file_path):
-    """Extrai texto completo de PDF com proteção contra erros"""
+    """Extrai texto completo de PDF com proteção contra erros (extrato compartilhado)"""
     try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                except Exception as e:
-                    # Ignorar erros de decodificação de imagens XFormObject
-                    if 'XFormObject' not in str(e):
-                        print(f"⚠️ Erro ao extrair texto da página: {str(e)[:80]}")
-                    continue
-            return text.strip() if text.strip() else "ERRO: Não foi possível extrair texto"
+        text = get_pdf_extract(file_path).text
+        return text if text else "ERRO: Não foi possível extrair texto"
     except Exception as e:
         return f"ERRO: {str(e)}"
 
+def extract_text_budgeted(file_path, document_type, institution_name=None, keywords=(), needs_date=False):
+    """
+    Texto do começo do PDF (orçamento de PDF_TEXT_BUDGETS) - a leitura só para depois
+    que a instituição, uma data (needs_date) e cada grupo de keywords apareceram.
+    Retorna (texto, parcial); texto começa com "ERRO" em caso de falha e parcial é None.
+    """
+    signals = [(term.lower(),) if isinstance(term, str) else tuple(term) for term in keywords]
+    if institution_name:
+        signals.append((institution_name.lower(),))
+    if needs_date:
+        signals.append(DATE_SIGNAL)
+    try:
+        partial = read_pdf_text(file_path, PDF_TEXT_BUDGETS.get(document_type, DEFAULT_TEXT_BUDGET), signals)
+    except Exception as e:
+        return f"ERRO: {str(e)}", None
+    text = partial.text
+    if not text:
+        return "ERRO: Não foi possível extrair texto", None
+    if not partial.complete:
+        print(f"⚡ Leitura parcial: {partial.pages_read}/{partial.page_count} páginas ({len(text)} caracteres)")
+    return text, partial
+
+def full_text_if_partial(text, partial):
+    """Regra que precisa do documento inteiro: completa a leitura (só se ela parou antes do fim)"""
+    if partial is None or partial.complete:
+        return text
+    return partial.full_text() or text
+
 def extract_dates_from_text(text):
-    """Extrai e parseia datas do texto"""
-    dates = []
-    patterns = [
-        r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}',
-        r'\d{1,2}\s+de\s+\w+\s+de\s+\d{4}',
-        r'\w+\s+\d{1,2},\s+\d{4}',
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        for match in matches:
-            try:
-                date_obj = date_parser.parse(match, fuzzy=True, dayfirst=True)
-                dates.append(date_obj)
-            except:
-                continue
-    
-    return dates
+    """Extrai e parseia datas do texto (date_extraction: meses em português, sem parse fuzzy)"""
+    return extract_dates(text)
 
 def is_date_within_one_year(date_obj):
     """Verifica se data está dentro de 1 ano"""
@@ -189,7 +205,8 @@ def analyze_apresentacao_institucional(file_path, institution_name):
     """
     print(f"\n📊 ANÁLISE: Apresentação Institucional")
     
-    text = extract_text_from_pdf(file_path)
+    text, partial = extract_text_budgeted(file_path, 'apresentacao_institucional', institution_name,
+                                          needs_date=True)
     if text.startswith("ERRO"):
         return {
             'is_valid': False,
@@ -211,6 +228,10 @@ def analyze_apresentacao_institucional(file_path, institution_name):
     
     # 2. Verificar data
     dates = extract_dates_from_text(text)
+    if dates and not is_date_within_one_year(max(dates)) and partial and not partial.complete:
+        # Data antiga nas primeiras páginas: a mais recente pode estar adiante
+        text = full_text_if_partial(text, partial)
+        dates = extract_dates_from_text(text)
     if dates:
         most_recent_date = max(dates)
         if not is_date_within_one_year(most_recent_date):
@@ -229,8 +250,8 @@ Você é um auditor especializado em análise de documentos institucionais finan
 
 Analise esta APRESENTAÇÃO INSTITUCIONAL da empresa '{institution_name}'.
 
-TEXTO DO DOCUMENTO:
-{text[:4000]}
+O texto do documento segue abaixo, em CONTEÚDO DO DOCUMENTO: os trechos mais
+relevantes de todas as páginas, na ordem original ("[...]" marca trechos omitidos).
 
 Faça uma análise DETALHADA e responda em JSON com:
 {{
@@ -252,7 +273,10 @@ Seja ESPECÍFICO: cite trechos do documento, seções encontradas, informações
 """
         
         print("📡 [ANÁLISE] Enviando para IA...")
-        ai_result = get_ai_analysis(prompt, text[:3000], "apresentacao_institucional")
+        # Documento enviado uma vez só, com trechos de todas as páginas dentro do orçamento de tokens
+        pages = partial.all_page_texts() if partial is not None and get_ai_status()['available'] else [text]
+        context = build_context(pages, 'apresentacao_institucional', institution_name).text
+        ai_result = get_ai_analysis(prompt, context, "apresentacao_institucional")
         
         print(f"📥 [ANÁLISE] Resposta da IA recebida: {ai_result}")
         
@@ -413,80 +437,34 @@ def analyze_checklist(file_path, institution_name):
     score = 100
     
     try:
-        # Ler arquivo Excel
-        wb = openpyxl.load_workbook(file_path, data_only=True)
-        sheet = wb.active
-        
-        # Extrair dados relevantes
-        all_data = []
-        for row in sheet.iter_rows(min_row=1, max_row=100, values_only=True):
-            if any(cell is not None for cell in row):
-                all_data.append([str(cell) if cell is not None else '' for cell in row])
-        
-        # Converter para texto para análise
-        excel_text = "\n".join([" | ".join(row) for row in all_data])
+        # Uma passada em streaming pela planilha (sem cores) - ver excel_rules.py
+        scan = scan_sheet(file_path, 100, institution_name)
         
         # 1. Verificar preenchimento básico
-        has_institution = any(institution_name.lower() in str(cell).lower() 
-                            for row in all_data 
-                            for cell in row) if institution_name else False
-        
-        if not has_institution and institution_name:
+        if not scan.has_institution and institution_name:
             issues.append(f"❌ Nome da instituição '{institution_name}' não encontrado no checklist")
             score -= 30
         
         # 2. Verificar se há CNPJ
-        cnpj_pattern = r'\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}'
-        has_cnpj = bool(re.search(cnpj_pattern, excel_text))
-        if not has_cnpj:
+        if not scan.has_cnpj:
             issues.append("❌ CNPJ não encontrado no checklist")
             score -= 25
         
         # 3. Verificar completude (procurar por campos vazios)
-        empty_cells = sum(1 for row in all_data for cell in row if cell == '' or cell == 'None')
-        if empty_cells > 20:
-            warnings.append(f"⚠️ Muitas células vazias detectadas ({empty_cells})")
+        if scan.empty_cells > 20:
+            warnings.append(f"⚠️ Muitas células vazias detectadas ({scan.empty_cells})")
             score -= 15
         
-        # 4. Verificar observações (procurar por texto de observações)
-        obs_keywords = ['observação', 'observacao', 'obs:', 'comentário', 'comentario']
-        has_observations = any(keyword in excel_text.lower() for keyword in obs_keywords)
-        
-        if has_observations:
-            # Procurar por textos muito curtos após keywords de observação
-            obs_texts = []
-            for i, row in enumerate(all_data):
-                for j, cell in enumerate(row):
-                    if any(keyword in str(cell).lower() for keyword in obs_keywords):
-                        # Pegar próxima célula ou células próximas
-                        if j + 1 < len(row):
-                            obs_texts.append(str(row[j + 1]))
-                        if i + 1 < len(all_data) and j < len(all_data[i + 1]):
-                            obs_texts.append(str(all_data[i + 1][j]))
-            
-            # Verificar se observações não são rasas
-            for obs in obs_texts:
-                if len(obs) < 20 and obs.strip() and obs != 'None':
-                    warnings.append("⚠️ Observações muito curtas ou genéricas detectadas")
-                    score -= 10
-                    break
+        # 4. Verificar observações: texto muito curto ao lado/abaixo de "observação"
+        if scan.has_observations and scan.short_observation:
+            warnings.append("⚠️ Observações muito curtas ou genéricas detectadas")
+            score -= 10
         
         # 5. Procurar por indicadores de checkboxes não marcados (X vermelho, vazio, etc)
-        negative_indicators = ['❌', '✗', 'X', 'não', 'nao', 'pendente', 'falta']
-        found_negatives = []
-        for row in all_data:
-            for cell in row:
-                cell_str = str(cell).lower()
-                if any(neg in cell_str for neg in negative_indicators):
-                    if 'sim' not in cell_str and 'aprovad' not in cell_str:
-                        found_negatives.append(cell_str[:50])
-        
-        if found_negatives and len(found_negatives) > 3:
+        if scan.negative_cells > 3:
             issues.append(f"❌ Itens não conformes ou pendentes detectados no checklist")
             score -= 30
         
-        wb.close()
-        
     except Exception as e:
         issues.append(f"❌ Erro ao ler arquivo Excel: {str(e)[:100]}")
         score = 0
@@ -521,56 +499,33 @@ def analyze_cadprev(file_path, institution_name):
     score = 100
     
     try:
-        wb = openpyxl.load_workbook(file_path, data_only=True)
-        sheet = wb.active
-        
-        # Extrair todos os dados
-        all_data = []
-        for row in sheet.iter_rows(min_row=1, max_row=200, values_only=True):
-            if any(cell is not None for cell in row):
-                all_data.append([str(cell) if cell is not None else '' for cell in row])
-        
-        excel_text = "\n".join([" | ".join(row) for row in all_data])
+        # Uma passada em streaming pela planilha (sem cores) - ver excel_rules.py
+        scan = scan_sheet(file_path, 200, institution_name)
         
         # 1. Verificar instituição
-        has_institution = any(institution_name.lower() in str(cell).lower() 
-                            for row in all_data 
-                            for cell in row) if institution_name else False
-        
-        if not has_institution and institution_name:
+        if not scan.has_institution and institution_name:
             warnings.append(f"⚠️ Nome da instituição '{institution_name}' não encontrado (não obrigatório)")
         else:
             warnings.append(f"✓ Instituição '{institution_name}' mencionada")
         
         # 2. Verificar CNPJ (não obrigatório, mas reportar)
-        cnpj_pattern = r'\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}'
-        has_cnpj = bool(re.search(cnpj_pattern, excel_text))
-        if not has_cnpj:
+        if not scan.has_cnpj:
             warnings.append("⚠️ CNPJ não encontrado (não obrigatório)")
         else:
             warnings.append("✓ CNPJ presente")
         
         # 3. Verificar Volume Gerido (OBRIGATÓRIO)
-        volume_keywords = ['volume', 'gerido', 'patrimônio', 'patrimonio', 'aum', 'total']
-        has_volume = any(keyword in excel_text.lower() for keyword in volume_keywords)
-        
-        if not has_volume:
+        if not scan.has_volume:
             issues.append("❌ Volume total gerido não encontrado (OBRIGATÓRIO)")
             score -= 40
-        else:
-            # Verificar se há valores numéricos associados
-            numbers = re.findall(r'\d+[.,]?\d*', excel_text)
-            large_numbers = [n for n in numbers if len(n.replace(',', '').replace('.', '')) > 6]
-            if not large_numbers:
-                warnings.append("⚠️ Volume gerido pode estar sem valor numérico adequado")
-                score -= 15
+        elif not scan.has_large_number:
+            # Nenhum valor numérico com mais de 6 dígitos na planilha
+            warnings.append("⚠️ Volume gerido pode estar sem valor numérico adequado")
+            score -= 15
         
         # 4. Verificar completude geral (campos vazios)
-        empty_cells = sum(1 for row in all_data for cell in row if cell == '' or cell == 'None')
-        total_cells = sum(len(row) for row in all_data)
-        
-        if total_cells > 0:
-            empty_ratio = empty_cells / total_cells
+        if scan.total_cells > 0:
+            empty_ratio = scan.empty_cells / scan.total_cells
             if empty_ratio > 0.5:
                 issues.append(f"❌ CadPrev muito incompleto ({int(empty_ratio*100)}% de campos vazios)")
                 score -= 35
@@ -579,13 +534,10 @@ def analyze_cadprev(file_path, institution_name):
                 score -= 15
         
         # 5. Verificar presença de respostas textuais (coerência)
-        text_cells = [cell for row in all_data for cell in row if len(str(cell)) > 50]
-        if len(text_cells) < 5:
+        if scan.long_text_cells < 5:
             warnings.append("⚠️ Poucas respostas textuais detalhadas")
             score -= 10
         
-        wb.close()
-        
     except Exception as e:
         issues.append(f"❌ Erro ao ler arquivo Excel: {str(e)[:100]}")
         score = 0
@@ -620,24 +572,23 @@ def analyze_termo_credenciamento(file_path, institution_name):
     score = 100
     
     try:
-        wb = openpyxl.load_workbook(file_path, data_only=True)
-        sheet = wb.active
+        # Planilha do extrato compartilhado (arquivo lido uma única vez)
+        extract = get_extract(file_path)
         
         # Extrair todos os dados
         all_data = []
         mandatory_fields_found = 0
         optional_fields_found = 0
         
-        for row in sheet.iter_rows(min_row=1, max_row=200):
+        for row in extract.sheet_cells(200):
             row_data = []
-            for cell in row:
-                value = str(cell.value) if cell.value is not None else ''
+            for cell_value, color in row:
+                value = str(cell_value) if cell_value is not None else ''
                 row_data.append(value)
                 
                 # Verificar cor de fundo (laranja = obrigatório)
-                if cell.fill and cell.fill.fgColor:
+                if color:
                     # Laranja = RGB próximo de FF9900 ou variantes
-                    color = str(cell.fill.fgColor.rgb) if hasattr(cell.fill.fgColor, 'rgb') else ''
                     if 'FF9' in color or 'FFA5' in color or 'FFB84D' in color:
                         if value and value != 'None':
                             mandatory_fields_found += 1
@@ -712,8 +663,6 @@ def analyze_termo_credenciamento(file_path, institution_name):
         else:
             warnings.append(f"✓ Data encontrada: {max(dates).strftime('%d/%m/%Y')}")
         
-        wb.close()
-        
     except Exception as e:
         issues.append(f"❌ Erro ao ler arquivo Excel: {str(e)[:100]}")
         score = 0
@@ -741,7 +690,8 @@ def analyze_declaracao_unificada(file_path, institution_name):
     """
     print(f"\n📝 ANÁLISE: Declaração Unificada")
     
-    text = extract_text_from_pdf(file_path)
+    text, partial = extract_text_budgeted(file_path, 'declaracao_unificada', institution_name,
+                                          [('declaração unificada', 'declaracao unificada')], needs_date=True)
     if text.startswith("ERRO"):
         return {'is_valid': False, 'score': 0, 'issues': [text], 'warnings': [], 'summary': 'Erro ao ler PDF'}
     
@@ -757,6 +707,9 @@ def analyze_declaracao_unificada(file_path, institution_name):
     
     # 2. Verificar data
     dates = extract_dates_from_text(text)
+    if dates and not is_date_within_one_year(max(dates)) and partial and not partial.complete:
+        text = full_text_if_partial(text, partial)
+        dates = extract_dates_from_text(text)
     if dates:
         most_recent_date = max(dates)
         if not is_date_within_one_year(most_recent_date):
@@ -786,6 +739,9 @@ def analyze_declaracao_unificada(file_path, institution_name):
 
 
 # ========== ANÁLISE 6: RATING ==========
+RATING_PATTERNS = [r'rating[:\s]+([A-Z]{1,3}[\+\-]?)', r'classificação[:\s]+([A-Z]{1,3})',
+                   r'nota[:\s]+(\d+\.?\d*)', r'score[:\s]+(\d+)']
+
 def analyze_rating(file_path, institution_name):
     """
     Análise RIGOROSA de Rating (PDF)
@@ -796,7 +752,9 @@ def analyze_rating(file_path, institution_name):
     """
     print(f"\n⭐ ANÁLISE: Rating")
     
-    text = extract_text_from_pdf(file_path)
+    text, partial = extract_text_budgeted(file_path, 'rating', institution_name, [
+        ('risco', 'rating', 'classificação', 'análise', 'crédito', 'score'),
+        tuple(re.compile(p, re.IGNORECASE) for p in RATING_PATTERNS)])
     if text.startswith("ERRO"):
         return {'is_valid': False, 'score': 0, 'issues': [text], 'warnings': [], 'summary': 'Erro ao ler PDF'}
     
@@ -818,9 +776,7 @@ def analyze_rating(file_path, institution_name):
         score -= 30
     
     # Verificar presença de classificação/nota
-    rating_patterns = [r'rating[:\s]+([A-Z]{1,3}[\+\-]?)', r'classificação[:\s]+([A-Z]{1,3})',
-                       r'nota[:\s]+(\d+\.?\d*)', r'score[:\s]+(\d+)']
-    has_rating = any(re.search(pattern, text, re.IGNORECASE) for pattern in rating_patterns)
+    has_rating = any(re.search(pattern, text, re.IGNORECASE) for pattern in RATING_PATTERNS)
     
     if not has_rating:
         warnings.append("⚠️ Não foi possível identificar classificação/nota clara no documento")
@@ -839,6 +795,14 @@ def analyze_rating(file_path, institution_name):
 
 
 # ========== ANÁLISE 7: CERTIDÕES ==========
+CERTIDAO_KEYWORDS = {
+    'certidao_municipal': ['municipal', 'prefeitura', 'município'],
+    'certidao_estadual': ['estadual', 'estado', 'fazenda estadual'],
+    'certidao_federal': ['federal', 'receita federal', 'união'],
+    'certidao_trabalhista': ['trabalhista', 'justiça do trabalho', 'tst'],
+    'certidao_fgts': ['fgts', 'fundo de garantia']
+}
+
 def analyze_certidao(file_path, institution_name, certidao_type):
     """
     Análise RIGOROSA de Certidões
@@ -848,7 +812,8 @@ def analyze_certidao(file_path, institution_name, certidao_type):
     """
     print(f"\n🏛️ ANÁLISE: Certidão - {certidao_type}")
     
-    text = extract_text_from_pdf(file_path)
+    text, partial = extract_text_budgeted(file_path, certidao_type, institution_name,
+                                          [CERTIDAO_KEYWORDS.get(certidao_type, ())])
     if text.startswith("ERRO"):
         return {'is_valid': False, 'score': 0, 'issues': [text], 'warnings': [], 'summary': 'Erro ao ler PDF'}
     
@@ -862,21 +827,19 @@ def analyze_certidao(file_path, institution_name, certidao_type):
         score -= 50
     
     # Verificar tipo de certidão
-    certidao_keywords = {
-        'certidao_municipal': ['municipal', 'prefeitura', 'município'],
-        'certidao_estadual': ['estadual', 'estado', 'fazenda estadual'],
-        'certidao_federal': ['federal', 'receita federal', 'união'],
-        'certidao_trabalhista': ['trabalhista', 'justiça do trabalho', 'tst'],
-        'certidao_fgts': ['fgts', 'fundo de garantia']
-    }
-    
-    keywords = certidao_keywords.get(certidao_type, [])
+    keywords = CERTIDAO_KEYWORDS.get(certidao_type, [])
     type_match = any(kw in text.lower() for kw in keywords)
     
     if not type_match and keywords:
         warnings.append(f"⚠️ Tipo de certidão pode não corresponder a '{certidao_type}'")
         score -= 20
     
+    # Validade ("Válida até 10/07/2025"; no CRF do FGTS "Validade: 01/10/2026 a 30/10/2026" vale o fim)
+    valid_until = validity_date(text)
+    if valid_until and valid_until.date() < datetime.now().date():
+        issues.append(f"❌ Certidão vencida (validade: {valid_until.strftime('%d/%m/%Y')})")
+        score -= 40
+    
     score = max(0, score)
     is_valid = score >= 70
     
@@ -894,7 +857,8 @@ def analyze_termo_declaracao(file_path, institution_name):
     """Análise de Termo de Declaração (PDF assinado)"""
     print(f"\n📝 ANÁLISE: Termo de Declaração")
     
-    text = extract_text_from_pdf(file_path)
+    text, partial = extract_text_budgeted(file_path, 'termo_declaracao', institution_name,
+                                          [('declaração', 'declaramos')], needs_date=True)
     if text.startswith("ERRO"):
         return {'is_valid': False, 'score': 0, 'issues': [text], 'warnings': [], 'summary': 'Erro ao ler PDF'}
     
@@ -914,6 +878,9 @@ def analyze_termo_declaracao(file_path, institution_name):
     
     # Verificar data recente (< 1 ano)
     dates = extract_dates_from_text(text)
+    if not any(is_date_within_one_year(date) for date in dates):
+        text = full_text_if_partial(text, partial)
+        dates = extract_dates_from_text(text)
     recent_date = False
     for date in dates:
         if is_date_within_one_year(date):
@@ -941,7 +908,8 @@ def analyze_qdd_anbima(file_path, institution_name):
     """Análise de QDD Anbima Seção I"""
     print(f"\n📊 ANÁLISE: QDD Anbima Seção I")
     
-    text = extract_text_from_pdf(file_path)
+    text, partial = extract_text_budgeted(file_path, 'qdd_anbima', institution_name,
+                                          ['anbima', ('qdd', 'questionário')])
     if text.startswith("ERRO"):
         return {'is_valid': False, 'score': 0, 'issues': [text], 'warnings': [], 'summary': 'Erro ao ler PDF'}
     
@@ -991,7 +959,7 @@ def analyze_certidao_especifica(file_path, institution_name, doc_type):
     info = type_info.get(doc_type, {'nome': doc_type, 'keywords': []})
     print(f"\n🏛️ ANÁLISE: {info['nome']}")
     
-    text = extract_text_from_pdf(file_path)
+    text, partial = extract_text_budgeted(file_path, doc_type, institution_name, info['keywords'])
     if text.startswith("ERRO"):
         return {'is_valid': False, 'score': 0, 'issues': [text], 'warnings': [], 'summary': 'Erro ao ler PDF'}
     
@@ -1030,7 +998,8 @@ def analyze_contrato_distribuicao(file_path, institution_name):
     """Análise de Contrato de Distribuição"""
     print(f"\n📄 ANÁLISE: Contrato de Distribuição")
     
-    text = extract_text_from_pdf(file_path)
+    text, partial = extract_text_budgeted(file_path, 'contrato_distribuicao', institution_name,
+                                          ['contrato', ('distribuição', 'distribuicao')])
     if text.startswith("ERRO"):
         return {'is_valid': False, 'score': 0, 'issues': [text], 'warnings': [], 'summary': 'Erro ao ler PDF'}
     
@@ -1069,7 +1038,8 @@ def analyze_situacao_ancord(file_path, institution_name):
     """Análise de Situação ANCORD (para AAI)"""
     print(f"\n📋 ANÁLISE: Situação ANCORD")
     
-    text = extract_text_from_pdf(file_path)
+    text, partial = extract_text_budgeted(file_path, 'situacao_ancord', None,
+                                          ['ancord', ('aai', 'agente autônomo')])
     if text.startswith("ERRO"):
         return {'is_valid': False, 'score': 0, 'issues': [text], 'warnings': [], 'summary': 'Erro ao ler PDF'}
     
@@ -2,217 +2,461 @@
 Configuração Avançada de IA para Análise de Documentos
 Suporta múltiplos provedores: OpenAI, Anthropic Claude, Google Gemini
 Sistema profissional e robusto para produção
+
+Chamadas assíncronas: cada provedor usa o cliente async do SDK sobre um pool
+httpx com keep-alive, em um event loop compartilhado (thread dedicada). Um
+semáforo por provedor limita as chamadas simultâneas (AI_MAX_CONCURRENCY ou
+AI_MAX_CONCURRENCY_<PROVEDOR>); dentro do limite, vários documentos são
+analisados ao mesmo tempo:
+
+    get_ai_analysis(prompt, context, document_type)            # síncrono, como antes
+    get_ai_analyses([(prompt, context, document_type), ...])    # vários em paralelo
+    await ai_engine.analyze_document_async(prompt, context, document_type)
+
+Respostas bem-sucedidas ficam no cache persistente (llm_cache.py), por prompt
+normalizado + provedor + modelo; bypass_cache=True força uma nova chamada.
+Antes da chamada, o contexto perde o que já está no prompt e é limitado em
+tokens do modelo (prompt_budget.fit_context).
+
+Cada provedor tem limite de taxa adaptativo e circuit breaker (ai_resilience.py);
+a ordem de fallback segue a saúde medida (latência e taxa de erro), então um
+provedor em 429 ou fora do ar é pulado na hora, sem sleep.
+
+Cada chamada ao provedor reserva o custo máximo no orçamento diário e, com a
+resposta, grava os tokens reais, o custo e a latência em ai_call_usage
+(ai_usage.py), atribuídos ao processo/documento marcado com ai_usage.attribute.
 """
 
+import asyncio
+import contextvars
 import os
 import json
-from typing import Optional, Dict, Any, List
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+import ai_resilience
+import ai_usage
+import llm_cache
+import prompt_budget
+
+DEFAULT_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', '8'))
+CALL_TIMEOUT = float(os.getenv('AI_CALL_TIMEOUT', '120'))
+KEEPALIVE_SECONDS = float(os.getenv('AI_KEEPALIVE_SECONDS', '60'))
+# Retentativas internas do SDK (com espera): 0 = o fallback/circuit breaker decide
+SDK_MAX_RETRIES = int(os.getenv('AI_SDK_MAX_RETRIES', '0'))
+MAX_OUTPUT_TOKENS = 2000
+
+
+def provider_concurrency(name: str) -> int:
+    """Limite de chamadas simultâneas do provedor (AI_MAX_CONCURRENCY_OPENAI etc.)"""
+    return max(1, int(os.getenv(f'AI_MAX_CONCURRENCY_{name.upper()}', DEFAULT_CONCURRENCY)))
+
+
+class _AsyncRunner:
+    """
+    Event loop em uma thread dedicada. Chamadas síncronas de qualquer thread (workers
+    da fila, requisições) rodam nele e compartilham pools de conexão e limites.
+    Recriado no processo filho após fork (gunicorn --preload).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='ai-event-loop', daemon=True).start()
+                    self._loop, self._pid = loop, os.getpid()
+        return self._loop
+
+    def run(self, coroutine, timeout: Optional[float] = None):
+        loop = self.loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coroutine.close()
+            raise RuntimeError('Interface síncrona chamada dentro do loop de IA - use a versão async')
+        return asyncio.run_coroutine_threadsafe(_in_context(coroutine, contextvars.copy_context()),
+                                                loop).result(timeout)
+
+
+async def _in_context(coroutine, context):
+    """Variáveis de contexto de quem chamou (ex.: ai_usage.attribute) valem na tarefa do loop"""
+    for var, value in context.items():
+        var.set(value)
+    return await coroutine
+
+
+_runner = _AsyncRunner()
+
+
+def run_async(coroutine, timeout: Optional[float] = None):
+    """Executa a corrotina no loop de IA e espera o resultado (ponte para código síncrono)"""
+    return _runner.run(coroutine, timeout)
+
+
+def _http_client(max_connections: int, transport=None):
+    """Pool httpx com keep-alive: conexões TLS reaproveitadas entre chamadas"""
+    import httpx
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                            keepalive_expiry=KEEPALIVE_SECONDS),
+        timeout=httpx.Timeout(CALL_TIMEOUT, connect=10.0),
+        transport=transport
+    )
+
+
+def _user_content(prompt: str, context: str) -> str:
+    """Prompt + documento (o contexto já vem ajustado por prompt_budget.fit_context)"""
+    if not context:
+        return prompt
+    return f"{prompt}\n\nCONTEÚDO DO DOCUMENTO:\n{context}"
+
+
+def _parse_json_response(text: str) -> Dict[str, Any]:
+    """JSON da resposta (com ou sem bloco markdown); texto livre vira estrutura padrão"""
+    cleaned_text = text.strip()
+    if '```json' in cleaned_text:
+        cleaned_text = cleaned_text.split('```json')[1].split('```')[0].strip()
+    elif '```' in cleaned_text:
+        cleaned_text = cleaned_text.split('```')[1].split('```')[0].strip()
+    try:
+        return json.loads(cleaned_text)
+    except Exception:
+        return {
+            'is_valid': False,
+            'score': 50,
+            'issues': ['Resposta da IA não estruturada corretamente'],
+            'warnings': [],
+            'summary': text[:500]
+        }
+
+
+def _billed_failure(error: str, model: str, input_tokens: int, output_tokens: int) -> Dict[str, Any]:
+    """Resposta recebida mas inutilizável: os tokens foram cobrados e entram no uso medido"""
+    return {
+        'success': False,
+        'error': error,
+        'model': model,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'tokens_used': input_tokens + output_tokens,
+        'cost_estimate': ai_usage.compute_cost(model, input_tokens, output_tokens)
+    }
+
 
 class AIProvider:
     """Classe base para provedores de IA"""
-    
+
+    name = 'base'
+    model = ''
+
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.client = None
-        
-    def analyze(self, prompt: str, context: str, system_prompt: str) -> Dict[str, Any]:
+        self.available = False
+        self.max_concurrency = provider_concurrency(self.name)
+        # Transporte httpx alternativo (testes/benchmarks); None = rede
+        self.transport = None
+        self._loop = None
+        self._semaphore = None
+        # Limite de taxa, circuit breaker e saúde (compartilhados por todas as threads)
+        self.guard = ai_resilience.ProviderGuard(self.name)
+
+    def _bind_loop(self):
+        """Cliente async e semáforo pertencem ao loop em uso (recriados se o loop mudar)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.client = self._create_client()
+        return self.client
+
+    def _create_client(self):
         raise NotImplementedError
 
+    async def _call(self, prompt: str, context: str, system_prompt: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def estimate_tokens(self, prompt: str, context: str, system_prompt: str) -> int:
+        """Tokens reservados no balde antes da chamada (entrada + saída máxima)"""
+        return prompt_budget.count_tokens(f"{system_prompt}\n{prompt}\n{context}", self.model) + MAX_OUTPUT_TOKENS
+
+    async def analyze_async(self, prompt: str, context: str, system_prompt: str,
+                            max_wait: Optional[float] = None, estimated: Optional[int] = None) -> Dict[str, Any]:
+        """max_wait: espera máxima por vaga no limite de taxa (padrão AI_RATE_MAX_QUEUE_WAIT)"""
+        if not self.available:
+            return {'success': False, 'error': f'{self.name} não disponível'}
+        try:
+            self._bind_loop()
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+        if estimated is None:
+            estimated = self.estimate_tokens(prompt, context, system_prompt)
+        async with self._semaphore:
+            # Admissão depois da vaga no semáforo: quem estava na fila já vê o 429/circuito aberto
+            refused = await self.guard.admit(estimated,
+                                             ai_resilience.MAX_QUEUE_WAIT if max_wait is None else max_wait)
+            if refused is not None:
+                return refused
+            start = time.monotonic()
+            try:
+                result = await self._call(prompt, context, system_prompt)
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+                rate_limited, retry_after = ai_resilience.classify_error(e)
+                if rate_limited:
+                    result.update({'rate_limited': True, 'retry_after': retry_after})
+            elapsed = time.monotonic() - start
+            result['latency_ms'] = round(elapsed * 1000)
+            self.guard.record(result, elapsed, estimated)
+        return result
+
+    def analyze(self, prompt: str, context: str, system_prompt: str) -> Dict[str, Any]:
+        """Interface síncrona: roda no loop compartilhado"""
+        return run_async(self.analyze_async(prompt, context, system_prompt))
+
 
 class OpenAIProvider(AIProvider):
     """Provedor OpenAI GPT-4"""
-    
+
+    name = 'openai'
+    model = 'gpt-4-turbo-preview'  # Modelo mais avançado
+
     def __init__(self, api_key: str):
         super().__init__(api_key)
         try:
-            from openai import OpenAI
-            self.client = OpenAI(api_key=api_key)
+            from openai import AsyncOpenAI
+            self._client_class = AsyncOpenAI
             self.available = True
         except Exception as e:
             print(f"OpenAI não disponível: {e}")
             self.available = False
-    
-    def analyze(self, prompt: str, context: str, system_prompt: str) -> Dict[str, Any]:
-        if not self.available:
-            return {'success': False, 'error': 'OpenAI não disponível'}
-        
+
+    def _create_client(self):
+        return self._client_class(api_key=self.api_key, max_retries=SDK_MAX_RETRIES,
+                                  http_client=_http_client(self.max_concurrency, self.transport))
+
+    async def _call(self, prompt: str, context: str, system_prompt: str) -> Dict[str, Any]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": _user_content(prompt, context)}
+            ],
+            temperature=0.1,  # Mais determinístico
+            max_tokens=MAX_OUTPUT_TOKENS,
+            response_format={"type": "json_object"}
+        )
+
+        usage = response.usage
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo-preview",  # Modelo mais avançado
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"{prompt}\n\nCONTEÚDO DO DOCUMENTO:\n{context[:8000]}"}
-                ],
-                temperature=0.1,  # Mais determinístico
-                max_tokens=2000,
-                response_format={"type": "json_object"}
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            
-            return {
-                'success': True,
-                'analysis': result,
-                'provider': 'OpenAI GPT-4 Turbo',
-                'tokens_used': response.usage.total_tokens,
-                'cost_estimate': response.usage.total_tokens * 0.00003  # Estimativa em USD
-            }
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
+            result = json.loads(response.choices[0].message.content or '')
+        except ValueError as e:
+            # Ex.: JSON cortado em MAX_OUTPUT_TOKENS
+            return _billed_failure(f'Resposta da OpenAI não é JSON válido: {e}', self.model,
+                                   usage.prompt_tokens, usage.completion_tokens)
+
+        return {
+            'success': True,
+            'analysis': result,
+            'provider': 'OpenAI GPT-4 Turbo',
+            'model': self.model,
+            'input_tokens': usage.prompt_tokens,
+            'output_tokens': usage.completion_tokens,
+            'tokens_used': usage.prompt_tokens + usage.completion_tokens,
+            'cost_estimate': ai_usage.compute_cost(self.model, usage.prompt_tokens, usage.completion_tokens)
+        }
 
 
 class AnthropicProvider(AIProvider):
     """Provedor Anthropic Claude"""
-    
+
+    name = 'anthropic'
+    model = 'claude-3-opus-20240229'  # Modelo mais avançado
+
     def __init__(self, api_key: str):
         super().__init__(api_key)
         try:
             import anthropic
-            self.client = anthropic.Anthropic(api_key=api_key)
+            self._client_class = anthropic.AsyncAnthropic
             self.available = True
         except Exception as e:
             print(f"Anthropic Claude não disponível: {e}")
             self.available = False
-    
-    def analyze(self, prompt: str, context: str, system_prompt: str) -> Dict[str, Any]:
-        if not self.available:
-            return {'success': False, 'error': 'Anthropic Claude não disponível'}
-        
-        try:
-            message = self.client.messages.create(
-                model="claude-3-opus-20240229",  # Modelo mais avançado
-                max_tokens=2000,
-                temperature=0.1,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": f"{prompt}\n\nCONTEÚDO DO DOCUMENTO:\n{context[:8000]}"}
-                ]
-            )
-            
-            # Claude retorna texto, precisamos pedir JSON estruturado
-            content = message.content[0].text
-            
-            # Tentar parsear como JSON
-            try:
-                result = json.loads(content)
-            except:
-                # Se não for JSON válido, criar estrutura
-                result = {
-                    'is_valid': False,
-                    'score': 50,
-                    'issues': ['Resposta da IA não estruturada corretamente'],
-                    'warnings': [],
-                    'summary': content[:500]
-                }
-            
-            return {
-                'success': True,
-                'analysis': result,
-                'provider': 'Anthropic Claude 3 Opus',
-                'tokens_used': message.usage.input_tokens + message.usage.output_tokens,
-                'cost_estimate': (message.usage.input_tokens * 0.000015 + message.usage.output_tokens * 0.000075)
-            }
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
+
+    def _create_client(self):
+        return self._client_class(api_key=self.api_key, max_retries=SDK_MAX_RETRIES,
+                                  http_client=_http_client(self.max_concurrency, self.transport))
+
+    async def _call(self, prompt: str, context: str, system_prompt: str) -> Dict[str, Any]:
+        message = await self.client.messages.create(
+            model=self.model,
+            max_tokens=MAX_OUTPUT_TOKENS,
+            temperature=0.1,
+            system=system_prompt,
+            messages=[
+                {"role": "user", "content": _user_content(prompt, context)}
+            ]
+        )
+
+        usage = message.usage
+        if not message.content:
+            return _billed_failure('Resposta vazia do Claude', self.model, usage.input_tokens, usage.output_tokens)
+
+        # Claude retorna texto, precisamos pedir JSON estruturado
+        content = message.content[0].text
+        result = _parse_json_response(content)
+
+        return {
+            'success': True,
+            'analysis': result,
+            'provider': 'Anthropic Claude 3 Opus',
+            'model': self.model,
+            'input_tokens': usage.input_tokens,
+            'output_tokens': usage.output_tokens,
+            'tokens_used': usage.input_tokens + usage.output_tokens,
+            'cost_estimate': ai_usage.compute_cost(self.model, usage.input_tokens, usage.output_tokens)
+        }
 
 
 class GeminiProvider(AIProvider):
-    """Provedor Google Gemini - Usando novo SDK google-genai"""
-    
+    """Provedor Google Gemini - Usando novo SDK google-genai (client.aio)"""
+
+    name = 'gemini'
+
+    # Lista de modelos para tentar (nomes corretos para o novo SDK google-genai)
+    # Formato: models/nome-do-modelo
+    MODELS = ['models/gemini-2.0-flash', 'models/gemini-1.5-flash', 'models/gemini-1.5-pro']
+    model = ','.join(MODELS)
+
     def __init__(self, api_key: str):
         super().__init__(api_key)
-        self.api_key = api_key
         try:
             from google import genai
-            self.client = genai.Client(api_key=api_key)
+            self._genai = genai
             self.available = True
         except Exception as e:
             print(f"Google Gemini não disponível: {e}")
             self.available = False
-    
-    def analyze(self, prompt: str, context: str, system_prompt: str) -> Dict[str, Any]:
-        if not self.available:
-            return {'success': False, 'error': 'Google Gemini não disponível'}
-        
-        import time
-        
-        # Lista de modelos para tentar (nomes corretos para o novo SDK google-genai)
-        # Formato: models/nome-do-modelo
-        models_to_try = ['models/gemini-2.0-flash', 'models/gemini-1.5-flash', 'models/gemini-1.5-pro']
-        max_retries = 2
-        
-        for model_name in models_to_try:
-            for attempt in range(max_retries):
-                try:
-                    print(f"🤖 [GEMINI] Tentativa {attempt + 1}/{max_retries} com modelo {model_name}...")
-                    full_prompt = f"{system_prompt}\n\n{prompt}\n\nCONTEÚDO DO DOCUMENTO:\n{context[:8000]}"
-                    
-                    # Usar o novo SDK google-genai
-                    response = self.client.models.generate_content(
-                        model=model_name,
-                        contents=full_prompt
-                    )
-                    
-                    response_text = response.text
-                    print(f"📡 [GEMINI] Resposta recebida: {len(response_text)} caracteres")
-                    print(f"📄 [GEMINI] Primeiros 200 caracteres: {response_text[:200]}")
-            
-                    # Tentar parsear como JSON
-                    try:
-                        # Limpar resposta se tiver markdown
-                        cleaned_text = response_text.strip()
-                        if '```json' in cleaned_text:
-                            cleaned_text = cleaned_text.split('```json')[1].split('```')[0].strip()
-                        elif '```' in cleaned_text:
-                            cleaned_text = cleaned_text.split('```')[1].split('```')[0].strip()
-                        
-                        result = json.loads(cleaned_text)
-                        print(f"✅ [GEMINI] JSON parseado com sucesso!")
-                    except Exception as parse_error:
-                        print(f"❌ [GEMINI] Erro ao parsear JSON: {str(parse_error)}")
-                        print(f"📝 [GEMINI] Texto completo da resposta:\n{response_text}")
-                        result = {
-                            'is_valid': False,
-                            'score': 50,
-                            'issues': ['Resposta da IA não estruturada corretamente'],
-                            'warnings': [],
-                            'summary': response_text[:500]
-                        }
-                    
-                    return {
-                        'success': True,
-                        'analysis': result,
-                        'provider': f'Google Gemini ({model_name})',
-                        'tokens_used': 'N/A',
-                        'cost_estimate': 0.0001
-                    }
-                    
-                except Exception as e:
-                    error_str = str(e)
-                    print(f"⚠️ [GEMINI] Erro com {model_name} (tentativa {attempt + 1}): {error_str[:200]}")
-                    
-                    # Se for erro de quota (429), esperar e tentar novamente
-                    if '429' in error_str or 'RESOURCE_EXHAUSTED' in error_str:
-                        wait_time = (attempt + 1) * 5  # 5s, 10s, 15s
-                        print(f"⏳ [GEMINI] Quota excedida. Aguardando {wait_time}s antes de tentar novamente...")
-                        time.sleep(wait_time)
-                    else:
-                        # Outro erro, tentar próximo modelo
-                        break
-        
+
+    def _create_client(self):
+        # O SDK mantém o próprio pool de conexões (reaproveitado pelo cliente aio)
+        return self._genai.Client(api_key=self.api_key).aio
+
+    async def _call(self, prompt: str, context: str, system_prompt: str) -> Dict[str, Any]:
+        full_prompt = f"{system_prompt}\n\n{_user_content(prompt, context)}"
+
+        # Uma tentativa por modelo, sem espera: a cota é por modelo, e se todos
+        # estiverem em 429 o limite de taxa/circuit breaker desvia para outro provedor
+        rate_limit_error = None
+        billed = None
+        for model_name in self.MODELS:
+            try:
+                print(f"🤖 [GEMINI] Chamando modelo {model_name}...")
+                response = await self.client.models.generate_content(
+                    model=model_name,
+                    contents=full_prompt
+                )
+
+                usage = response.usage_metadata
+                input_tokens = (usage.prompt_token_count if usage else None) or 0
+                output_tokens = (usage.candidates_token_count if usage else None) or 0
+                response_text = response.text
+                if not response_text:
+                    # Resposta bloqueada ou vazia: a entrada foi cobrada mesmo assim
+                    print(f"⚠️ [GEMINI] Resposta vazia de {model_name}")
+                    billed = _billed_failure(f'Resposta vazia do Gemini ({model_name})', model_name,
+                                             input_tokens, output_tokens)
+                    continue
+                print(f"📡 [GEMINI] Resposta recebida: {len(response_text)} caracteres")
+                result = _parse_json_response(response_text)
+
+                return {
+                    'success': True,
+                    'analysis': result,
+                    'provider': f'Google Gemini ({model_name})',
+                    'model': model_name,
+                    'input_tokens': input_tokens,
+                    'output_tokens': output_tokens,
+                    'tokens_used': input_tokens + output_tokens,
+                    'cost_estimate': ai_usage.compute_cost(model_name, input_tokens, output_tokens)
+                }
+
+            except Exception as e:
+                print(f"⚠️ [GEMINI] Erro com {model_name}: {str(e)[:200]}")
+                if ai_resilience.classify_error(e)[0]:
+                    rate_limit_error = e
+
         # Se todos falharam
-        print(f"❌ [GEMINI] Todos os modelos e tentativas falharam")
-        return {'success': False, 'error': 'Todos os modelos Gemini falharam - quota excedida ou erro de API'}
+        print(f"❌ [GEMINI] Todos os modelos falharam")
+        if rate_limit_error is not None:
+            raise rate_limit_error
+        if billed is not None:
+            return billed
+        return {'success': False, 'error': 'Todos os modelos Gemini falharam - erro de API'}
+
+
+# System prompt profissional e detalhado
+SYSTEM_PROMPT = """Você é um analista especializado em credenciamento de instituições financeiras para RPPS (Regime Próprio de Previdência Social).
+
+Sua análise deve ser RIGOROSA, PROFISSIONAL e PRECISA.
+
+RESPONSABILIDADES CRÍTICAS:
+1. Verificar se o documento é REALMENTE do tipo esperado
+2. Confirmar que o documento menciona a instituição financeira correta
+3. Avaliar completude informacional (informações não podem ser rasas, genéricas ou superficiais)
+4. Verificar coerência e relevância das informações
+5. Identificar inconsistências, erros ou tentativas de envio de documentos inadequados
+
+CRITÉRIOS DE REJEIÇÃO AUTOMÁTICA:
+- Documento não é do tipo esperado (ex: enviaram "Termo de Credenciamento" mas disseram ser "Apresentação Institucional")
+- Documento não menciona a instituição financeira correta
+- Conteúdo genérico, copiado ou não relacionado ao credenciamento
+- Informações insuficientes, rasas ou irrelevantes
+- Documento trata de outro assunto/empresa
+- Dados contraditórios ou inconsistentes
+
+FORMATO DE RESPOSTA OBRIGATÓRIO (JSON):
+{
+    "is_valid": true/false,
+    "confidence_score": 0.0-1.0,
+    "score": 0-100,
+    "document_type_correct": true/false,
+    "institution_mentioned": true/false,
+    "content_quality": "excellent/good/fair/poor",
+    "completeness": 0-100,
+    "coherence": 0-100,
+    "issues": ["lista de problemas CRÍTICOS encontrados"],
+    "warnings": ["lista de avisos e pontos de atenção"],
+    "recommendations": ["recomendações para melhoria"],
+    "extracted_data": {
+"institution_name": "nome encontrado",
+"dates_found": ["datas"],
+"key_information": ["informações chave"]
+    },
+    "summary": "resumo executivo da análise em 2-3 sentenças",
+    "detailed_analysis": "análise detalhada e fundamentada"
+}
+
+Seja CRÍTICO e OBJETIVO. Este sistema é comercial e precisa ser confiável."""
 
 
 class AIAnalysisEngine:
     """Motor de Análise de IA - Sistema Robusto Multi-Provedor"""
-    
+
     def __init__(self):
         self.providers = {}
         self.active_provider = None
         self._load_configuration()
-    
+
     def _load_configuration(self):
         """Carrega configuração de múltiplas fontes"""
         
@@ -283,107 +527,136 @@ class AIAnalysisEngine:
             'all_providers': list(self.providers.keys())
         }
     
-    def analyze_document(self, prompt: str, context: str, document_type: str) -> Dict[str, Any]:
+    def analyze_document(self, prompt: str, context: str, document_type: str,
+                         bypass_cache: bool = False) -> Dict[str, Any]:
         """
         Analisa documento com IA de forma robusta
         Implementa retry e fallback entre provedores
         """
-        
+        return run_async(self.analyze_document_async(prompt, context, document_type, bypass_cache))
+
+    async def _analyze_with(self, provider: AIProvider, prompt: str, context: str, document_type: str,
+                            bypass_cache: bool, max_wait: Optional[float] = None) -> Dict[str, Any]:
+        """Chamada ao provedor com o cache de respostas na frente"""
+        context = prompt_budget.fit_context(prompt, context, provider.model)
+        cache_key = llm_cache.make_key(SYSTEM_PROMPT, prompt, context, provider.name, provider.model)
+        if bypass_cache:
+            llm_cache.counters.add('bypassed')
+        else:
+            cached = await llm_cache.lookup_async(cache_key)
+            if cached is not None:
+                return cached
+
+        # Orçamento diário: reserva o custo máximo antes, troca pelo custo real depois
+        estimated = provider.estimate_tokens(prompt, context, SYSTEM_PROMPT)
+        reservation = await ai_usage.reserve_async(
+            ai_usage.current_attribution(),
+            ai_usage.max_cost(provider.model, estimated - MAX_OUTPUT_TOKENS, MAX_OUTPUT_TOKENS))
+        if reservation.refused:
+            return {'success': False, 'budget_exceeded': True, 'error': f'{provider.name}: {reservation.refused}'}
+        result = await provider.analyze_async(prompt, context, SYSTEM_PROMPT, max_wait, estimated)
+        if 'latency_ms' in result:
+            await ai_usage.settle_async(reservation, provider.name, result.get('model') or provider.model,
+                                        document_type, result)
+        elif reservation.scopes:
+            # Recusada pelo limite de taxa/circuito antes do provedor: só devolve a reserva
+            await ai_usage.release_async(reservation)
+        if result['success']:
+            await llm_cache.store_async(cache_key, provider.name, provider.model, document_type, result)
+        return result
+
+    async def analyze_document_async(self, prompt: str, context: str, document_type: str,
+                                     bypass_cache: bool = False) -> Dict[str, Any]:
         if not self.is_available():
             return {
                 'success': False,
                 'error': 'Nenhum provedor de IA configurado',
                 'fallback': True
             }
-        
-        # System prompt profissional e detalhado
-        system_prompt = """Você é um analista especializado em credenciamento de instituições financeiras para RPPS (Regime Próprio de Previdência Social).
-
-Sua análise deve ser RIGOROSA, PROFISSIONAL e PRECISA.
 
-RESPONSABILIDADES CRÍTICAS:
-1. Verificar se o documento é REALMENTE do tipo esperado
-2. Confirmar que o documento menciona a instituição financeira correta
-3. Avaliar completude informacional (informações não podem ser rasas, genéricas ou superficiais)
-4. Verificar coerência e relevância das informações
-5. Identificar inconsistências, erros ou tentativas de envio de documentos inadequados
-
-CRITÉRIOS DE REJEIÇÃO AUTOMÁTICA:
-- Documento não é do tipo esperado (ex: enviaram "Termo de Credenciamento" mas disseram ser "Apresentação Institucional")
-- Documento não menciona a instituição financeira correta
-- Conteúdo genérico, copiado ou não relacionado ao credenciamento
-- Informações insuficientes, rasas ou irrelevantes
-- Documento trata de outro assunto/empresa
-- Dados contraditórios ou inconsistentes
-
-FORMATO DE RESPOSTA OBRIGATÓRIO (JSON):
-{
-    "is_valid": true/false,
-    "confidence_score": 0.0-1.0,
-    "score": 0-100,
-    "document_type_correct": true/false,
-    "institution_mentioned": true/false,
-    "content_quality": "excellent/good/fair/poor",
-    "completeness": 0-100,
-    "coherence": 0-100,
-    "issues": ["lista de problemas CRÍTICOS encontrados"],
-    "warnings": ["lista de avisos e pontos de atenção"],
-    "recommendations": ["recomendações para melhoria"],
-    "extracted_data": {
-        "institution_name": "nome encontrado",
-        "dates_found": ["datas"],
-        "key_information": ["informações chave"]
-    },
-    "summary": "resumo executivo da análise em 2-3 sentenças",
-    "detailed_analysis": "análise detalhada e fundamentada"
-}
-
-Seja CRÍTICO e OBJETIVO. Este sistema é comercial e precisa ser confiável."""
-
-        # Tentar com provedor ativo
-        provider = self.providers[self.active_provider]
-        result = provider.analyze(prompt, context, system_prompt)
-        
-        if result['success']:
-            result['engine_info'] = {
-                'provider': self.active_provider,
-                'fallback_used': False
-            }
-            return result
-        
-        # Fallback: tentar outros provedores
-        for provider_name, provider_obj in self.providers.items():
-            if provider_name != self.active_provider:
+        # Ordem pela saúde: provedor com circuito aberto ou em 429 vai para o fim
+        order = self.provider_order()
+        errors = []
+        budget_exceeded = bool(order)
+        for position, provider_name in enumerate(order):
+            if position > 0:
                 print(f"Tentando fallback para {provider_name}...")
-                result = provider_obj.analyze(prompt, context, system_prompt)
-                if result['success']:
-                    result['engine_info'] = {
-                        'provider': provider_name,
-                        'fallback_used': True,
-                        'original_provider': self.active_provider
-                    }
-                    return result
-        
+            # Só o último da fila espera vaga no limite de taxa; os outros passam adiante
+            max_wait = ai_resilience.MAX_QUEUE_WAIT if position == len(order) - 1 else ai_resilience.MAX_WAIT
+            result = await self._analyze_with(self.providers[provider_name], prompt, context, document_type,
+                                              bypass_cache, max_wait)
+            if result['success']:
+                result['engine_info'] = {
+                    'provider': provider_name,
+                    'fallback_used': provider_name != self.active_provider
+                }
+                if provider_name != self.active_provider:
+                    result['engine_info']['original_provider'] = self.active_provider
+                return result
+            errors.append(f"{provider_name}: {result.get('error')}")
+            budget_exceeded = budget_exceeded and bool(result.get('budget_exceeded'))
+
         # Se todos falharam
         return {
             'success': False,
-            'error': 'Todos os provedores de IA falharam',
+            'error': 'Orçamento diário de IA esgotado' if budget_exceeded else 'Todos os provedores de IA falharam',
+            'provider_errors': errors,
+            'budget_exceeded': budget_exceeded,
             'fallback': True
         }
 
+    def provider_order(self) -> List[str]:
+        """Provedores disponíveis na ordem de tentativa (ai_resilience.order_providers)"""
+        guards = {name: provider.guard for name, provider in self.providers.items() if provider.available}
+        return ai_resilience.order_providers(guards, self.active_provider)
+
+    def get_health(self) -> Dict[str, Any]:
+        """Estado do circuit breaker, limite de taxa e saúde de cada provedor"""
+        return {
+            'active_provider': self.active_provider,
+            'order': self.provider_order(),
+            'providers': {name: provider.guard.snapshot() for name, provider in self.providers.items()}
+        }
+
+    async def analyze_many_async(self, requests: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+        """Vários (prompt, contexto, tipo) ao mesmo tempo - o semáforo de cada provedor limita a vazão"""
+        results = await asyncio.gather(
+            *(self.analyze_document_async(prompt, context, document_type)
+              for prompt, context, document_type in requests),
+            return_exceptions=True
+        )
+        return [r if not isinstance(r, BaseException) else {'success': False, 'error': str(r)}
+                for r in results]
+
+    def analyze_many(self, requests: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+        return run_async(self.analyze_many_async(requests))
+
 
 # Instância global do motor de IA
 ai_engine = AIAnalysisEngine()
 
 
-def get_ai_analysis(prompt: str, context: str, document_type: str) -> Dict[str, Any]:
+def get_ai_analysis(prompt: str, context: str, document_type: str, bypass_cache: bool = False) -> Dict[str, Any]:
     """
     Função principal para obter análise de IA
     Interface simplificada para o resto do sistema
     """
-    return ai_engine.analyze_document(prompt, context, document_type)
+    return ai_engine.analyze_document(prompt, context, document_type, bypass_cache)
+
+
+def get_ai_analyses(requests: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+    """
+    Análise de vários documentos em paralelo: [(prompt, contexto, tipo), ...] ->
+    resultados na mesma ordem; leva mais ou menos o tempo da chamada mais lenta
+    """
+    return ai_engine.analyze_many(requests)
 
 
 def get_ai_status() -> Dict[str, Any]:
     """Retorna status da configuração de IA"""
     return ai_engine.get_provider_info()
+
+
+def get_ai_health() -> Dict[str, Any]:
+    """Circuit breaker, limite de taxa e saúde dos provedores (painel admin)"""
+    return ai_engine.get_health()
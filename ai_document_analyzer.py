@@ -8,17 +8,20 @@ INTEGRADO COM:
 - Validador de Assinatura Digital TCEES (tcees_validator.py)
 """
 
-import PyPDF2
 import openpyxl
 from openpyxl.styles import PatternFill
 import re
 from datetime import datetime, timedelta
-from dateutil import parser as date_parser
 import json
 import os
+from date_extraction import extract_dates
+
+# Extrato compartilhado dos arquivos (cada upload é lido uma única vez)
+from document_extract import cell_fill_color, get_extract, get_pdf_extract
 
 # Importar motor de IA robusto
 from ai_config import get_ai_analysis, get_ai_status
+from prompt_budget import build_context
 
 # Importar base de conhecimento do agente
 from ai_document_knowledge import (
@@ -54,24 +57,7 @@ def get_cell_background_color(cell):
     Extrai a cor de fundo de uma célula do Excel
     Retorna o código RGB ou None
     """
-    try:
-        if cell.fill and cell.fill.patternType:
-            fg_color = cell.fill.fgColor
-            if fg_color:
-                if fg_color.type == 'rgb' and fg_color.rgb:
-                    return str(fg_color.rgb)
-                elif fg_color.type == 'indexed':
-                    # Índices de cores padrão do Excel
-                    indexed_colors = {
-                        0: 'FF000000', 1: 'FFFFFFFF', 2: 'FFFF0000', 3: 'FF00FF00',
-                        4: 'FF0000FF', 5: 'FFFFFF00', 6: 'FFFF00FF', 7: 'FF00FFFF',
-                        10: 'FF00FF00', 11: 'FF0000FF', 13: 'FFFFFF00', 22: 'FFC0C0C0',
-                        44: 'FFFFFF99', 45: 'FF99CCFF', 50: 'FFFF6600', 51: 'FF99CC00'
-                    }
-                    return indexed_colors.get(fg_color.indexed, None)
-        return None
-    except:
-        return None
+    return cell_fill_color(cell)
 
 
 def analyze_excel_by_color(file_path, color_rules):
@@ -95,39 +81,34 @@ def analyze_excel_by_color(file_path, color_rules):
     }
     
     try:
-        wb = openpyxl.load_workbook(file_path, data_only=True)
-        sheet = wb.active
-        
-        for row in sheet.iter_rows():
-            for cell in row:
-                cell_color = get_cell_background_color(cell)
-                if not cell_color:
-                    continue
-                
-                cell_value = cell.value
-                is_filled = cell_value is not None and str(cell_value).strip() != ''
-                
-                # Verificar cada tipo de cor definido
-                for color_type, color_values in EXCEL_COLORS.items():
-                    if any(cv.upper() in cell_color.upper() for cv in color_values):
-                        # Inicializar contadores
-                        if color_type not in result['cells_by_color']:
-                            result['cells_by_color'][color_type] = 0
-                            result['filled_by_color'][color_type] = 0
-                            result['empty_by_color'][color_type] = 0
-                            result['content_by_color'][color_type] = []
-                        
-                        result['cells_by_color'][color_type] += 1
-                        
-                        if is_filled:
-                            result['filled_by_color'][color_type] += 1
-                            result['content_by_color'][color_type].append(str(cell_value))
-                        else:
-                            result['empty_by_color'][color_type] += 1
-                        
-                        break
+        # Grade da planilha do extrato compartilhado (arquivo lido uma única vez)
+        sheet = get_extract(file_path).require_sheet()
         
-        wb.close()
+        for _, _, cell_value, cell_color in sheet['cells']:
+            if not cell_color:
+                continue
+            
+            is_filled = cell_value is not None and str(cell_value).strip() != ''
+            
+            # Verificar cada tipo de cor definido
+            for color_type, color_values in EXCEL_COLORS.items():
+                if any(cv.upper() in cell_color.upper() for cv in color_values):
+                    # Inicializar contadores
+                    if color_type not in result['cells_by_color']:
+                        result['cells_by_color'][color_type] = 0
+                        result['filled_by_color'][color_type] = 0
+                        result['empty_by_color'][color_type] = 0
+                        result['content_by_color'][color_type] = []
+                    
+                    result['cells_by_color'][color_type] += 1
+                    
+                    if is_filled:
+                        result['filled_by_color'][color_type] += 1
+                        result['content_by_color'][color_type].append(str(cell_value))
+                    else:
+                        result['empty_by_color'][color_type] += 1
+                    
+                    break
         
     except Exception as e:
         result['issues'].append(f"Erro ao analisar Excel: {str(e)}")
@@ -143,17 +124,18 @@ def extract_excel_content_for_ai(file_path, max_chars=6000):
     content = []
     
     try:
-        wb = openpyxl.load_workbook(file_path, data_only=True)
-        sheet = wb.active
+        # Grade da planilha do extrato compartilhado (arquivo lido uma única vez)
+        extract = get_extract(file_path)
+        sheet = extract.require_sheet()
         
-        content.append(f"=== PLANILHA: {sheet.title} ===\n")
-        content.append(f"Dimensões: {sheet.max_row} linhas x {sheet.max_column} colunas\n")
+        content.append(f"=== PLANILHA: {sheet['title']} ===\n")
+        content.append(f"Dimensões: {sheet['max_row']} linhas x {sheet['max_column']} colunas\n")
+        content_length = len(content[0]) + len(content[1])
         
-        for row_idx, row in enumerate(sheet.iter_rows(), 1):
+        for row_idx, row in enumerate(extract.sheet_cells(), 1):
             row_content = []
-            for cell in row:
-                if cell.value:
-                    cell_color = get_cell_background_color(cell)
+            for cell_value, cell_color in row:
+                if cell_value:
                     color_info = ""
                     
                     # Identificar cor significativa
@@ -172,18 +154,17 @@ def extract_excel_content_for_ai(file_path, max_chars=6000):
                                     color_info = "[PERGUNTA]"
                                 break
                     
-                    row_content.append(f"{color_info}{cell.value}")
+                    row_content.append(f"{color_info}{cell_value}")
             
             if row_content:
                 content.append(f"L{row_idx}: " + " | ".join(row_content))
+                content_length += len(content[-1])
             
-            # Limitar tamanho
-            if len("\n".join(content)) > max_chars:
+            # Limitar tamanho (= len("\n".join(content)), sem refazer o join a cada linha)
+            if content_length + len(content) - 1 > max_chars:
                 content.append("\n... [conteúdo truncado] ...")
                 break
         
-        wb.close()
-        
     except Exception as e:
         content.append(f"Erro ao extrair Excel: {str(e)}")
     
@@ -234,38 +215,16 @@ def validate_signature_if_applicable(file_path, document_type):
 
 
 def extract_text_from_pdf(file_path):
-    """Extrai texto de um arquivo PDF"""
+    """Extrai texto de um arquivo PDF (extrato compartilhado - ver document_extract.py)"""
     try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+        extract = get_pdf_extract(file_path)
+        return "".join(page_text + "\n" for page_text in extract.page_texts)
     except Exception as e:
         return f"Erro ao extrair texto: {str(e)}"
 
 def extract_dates_from_text(text):
-    """Extrai datas do texto"""
-    dates = []
-    # Padrões de data comuns
-    patterns = [
-        r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}',  # DD/MM/YYYY ou DD-MM-YYYY
-        r'\d{1,2}\s+de\s+\w+\s+de\s+\d{4}',  # DD de Mês de YYYY
-        r'\w+\s+\d{1,2},\s+\d{4}',  # Mês DD, YYYY
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        for match in matches:
-            try:
-                # Tentar parsear a data
-                date_obj = date_parser.parse(match, fuzzy=True, dayfirst=True)
-                dates.append(date_obj)
-            except:
-                continue
-    
-    return dates
+    """Extrai datas do texto (mesmo motor de ai_analyzer_rigorous - ver date_extraction.py)"""
+    return extract_dates(text)
 
 def is_date_within_one_year(date_obj):
     """Verifica se a data está dentro do último ano"""
@@ -388,7 +347,9 @@ REJEITE AUTOMATICAMENTE SE:
 
 SEJA EXTREMAMENTE CRÍTICO. Este é um sistema comercial."""
 
-        ai_result = analyze_with_advanced_ai(gpt_prompt, text, "Apresentação Institucional")
+        context = build_context(get_pdf_extract(file_path).page_texts, 'apresentacao_institucional',
+                                institution_name).text
+        ai_result = analyze_with_advanced_ai(gpt_prompt, context, "Apresentação Institucional")
         
         if ai_result.get('success') and ai_result.get('ai_powered'):
             # Usar análise da IA avançada
@@ -1237,8 +1198,10 @@ def analyze_document_with_ai(file_path, document_type, document_name, institutio
     if ai_status.get('available'):
         try:
             # Extrair conteúdo do documento
+            pages = None
             if file_path.lower().endswith('.pdf'):
                 content = extract_text_from_pdf(file_path)
+                pages = get_pdf_extract(file_path).page_texts
             elif file_path.lower().endswith(('.xlsx', '.xlsm', '.xls')):
                 content = extract_excel_content_for_ai(file_path)
             else:
@@ -1254,7 +1217,9 @@ def analyze_document_with_ai(file_path, document_type, document_name, institutio
                 )
                 
                 if ai_prompt:
-                    ai_result = get_ai_analysis(ai_prompt, content, document_type)
+                    # Trechos mais relevantes dentro do orçamento de tokens (não só o começo do arquivo)
+                    context = build_context(pages or content, document_type, institution_name).text
+                    ai_result = get_ai_analysis(ai_prompt, context, document_type)
                     
                     if ai_result.get('success'):
                         rules_result['ai_content_analysis'] = ai_result.get('analysis', {})
@@ -647,6 +647,32 @@ def get_ai_prompt_for_document(document_type, **kwargs):
     return prompt
 
 
+def get_relevance_keywords(document_type):
+    """
+    Palavras-chave do tipo de documento (indicadores, textos obrigatórios, agências,
+    palavras das certidões) - usadas para escolher os trechos enviados à IA
+    """
+    if not document_type:
+        return []
+    knowledge = get_document_knowledge(document_type)
+    
+    if not knowledge:
+        return []
+    
+    keywords = []
+    for field in ('indicators', 'required_text', 'rating_indicators', 'known_agencies', 'certificate_indicators'):
+        keywords.extend(knowledge.get(field, []))
+    structure = knowledge.get('structure', {})
+    keywords.extend(structure.get('header_contains', []))
+    keywords.extend(structure.get('observation_keywords', []))
+    for certificate_type in knowledge.get('types', {}).values():
+        keywords.extend(certificate_type.get('keywords', []))
+    
+    # Sem repetições, na ordem da base de conhecimento
+    seen = set()
+    return [k.lower() for k in keywords if not (k.lower() in seen or seen.add(k.lower()))]
+
+
 def get_validation_rules(document_type):
     """
     Retorna as regras de validação para o tipo de documento
@@ -0,0 +1,298 @@
+"""
+Resiliência dos Provedores de IA: limite de taxa adaptativo, circuit breaker e saúde
+Substitui as esperas com sleep (Gemini esperava 5s/10s a cada 429 e todos os
+workers dormiam juntos). Cada provedor tem um ProviderGuard, compartilhado por
+todas as threads do processo (as chamadas passam pelo event loop de ai_config):
+
+    RateLimiter     baldes de requisições e tokens por minuto (AI_RPM / AI_TPM, ou
+                    AI_RPM_<PROVEDOR> / AI_TPM_<PROVEDOR>). Depois de um 429 o
+                    provedor fica bloqueado pelo Retry-After e a taxa cai pela
+                    metade; cada sucesso devolve 5% da taxa configurada.
+    CircuitBreaker  abre após AI_BREAKER_FAILURES falhas seguidas; depois de
+                    AI_BREAKER_COOLDOWN segundos deixa passar uma chamada de teste
+                    (meio-aberto) - sucesso fecha, falha reabre com o dobro do tempo.
+    Saúde           média móvel de latência e taxa de erro; order_providers usa
+                    esses números para escolher a ordem de fallback.
+
+Provedor sem vaga no balde não espera se houver outro para tentar: a chamada
+segue para o próximo provedor saudável. Só o último da fila espera (até
+AI_RATE_MAX_QUEUE_WAIT segundos). Os limites valem por processo: com vários
+workers, configure AI_RPM/AI_TPM como a parte de cada um.
+"""
+
+import asyncio
+import os
+import re
+import time
+
+FAILURE_THRESHOLD = int(os.getenv('AI_BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN = float(os.getenv('AI_BREAKER_COOLDOWN', '30'))
+BREAKER_MAX_COOLDOWN = float(os.getenv('AI_BREAKER_MAX_COOLDOWN', '300'))
+# Espera máxima por vaga no balde quando há outro provedor / quando é o último
+MAX_WAIT = float(os.getenv('AI_RATE_MAX_WAIT', '2'))
+MAX_QUEUE_WAIT = float(os.getenv('AI_RATE_MAX_QUEUE_WAIT', '60'))
+# Bloqueio após 429 sem Retry-After: 5s, 10s, 20s... até 60s
+RATE_LIMIT_BACKOFF = float(os.getenv('AI_RATE_LIMIT_BACKOFF', '5'))
+RATE_LIMIT_MAX_BACKOFF = 60.0
+MIN_RATE_FACTOR = 0.1
+RATE_RECOVERY_STEP = 0.05
+
+HEALTH_ALPHA = 0.2
+# Latência presumida de provedor ainda sem chamadas (não passa na frente do preferido)
+DEFAULT_LATENCY = 10.0
+# O provedor preferido (AI_PROVIDER) continua primeiro até ficar 2x pior que outro
+PREFERRED_WEIGHT = 0.5
+
+# Exceções de limite de taxa dos SDKs (openai/anthropic: RateLimitError; google: ResourceExhausted)
+RATE_LIMIT_ERRORS = {'RateLimitError', 'ResourceExhausted', 'TooManyRequests'}
+# Último recurso para erros sem status HTTP: "429" como número inteiro junto de "Too Many Requests"
+# ou o status gRPC do Gemini (um "429" solto no texto pode ser parte de um id ou de um valor)
+RATE_LIMIT_TEXT = re.compile(r'\b429\b.{0,40}too many requests|too many requests.{0,40}\b429\b|\bRESOURCE_EXHAUSTED\b',
+                             re.IGNORECASE | re.DOTALL)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+def _limit(kind, provider, default):
+    value = os.getenv(f'AI_{kind}_{provider.upper()}', os.getenv(f'AI_{kind}', default))
+    return max(0, int(value))
+
+
+def _http_status(error):
+    """Status HTTP da exceção ou da resposta anexada (None se não houver)"""
+    response = getattr(error, 'response', None)
+    for status in (getattr(error, 'status_code', None), getattr(error, 'code', None),
+                   getattr(response, 'status_code', None)):
+        # openai usa `code` para textos como 'rate_limit_exceeded'; só vale número
+        try:
+            return int(status)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def classify_error(error):
+    """(limite de taxa?, segundos do Retry-After ou None) de uma exceção do SDK"""
+    status = _http_status(error)
+    if status is not None:
+        rate_limited = status == 429
+    else:
+        rate_limited = (any(cls.__name__ in RATE_LIMIT_ERRORS for cls in type(error).__mro__)
+                        or bool(RATE_LIMIT_TEXT.search(str(error))))
+    retry_after = None
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers is not None:
+        try:
+            retry_after = float(headers.get('retry-after'))
+        except (TypeError, ValueError):
+            retry_after = None
+    return rate_limited, retry_after
+
+
+class RateLimiter:
+    """Baldes de requisições e tokens por minuto, com redução após 429 (AIMD)"""
+
+    def __init__(self, provider):
+        self.rpm = _limit('RPM', provider, '120')
+        self.tpm = _limit('TPM', provider, '300000')
+        self.factor = 1.0
+        self.requests = float(self.rpm)
+        self.tokens = float(self.tpm)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.consecutive_limits = 0
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        if self.rpm:
+            self.requests = min(self.rpm * self.factor, self.requests + elapsed * self.rpm * self.factor / 60)
+        if self.tpm:
+            self.tokens = min(self.tpm * self.factor, self.tokens + elapsed * self.tpm * self.factor / 60)
+
+    def wait_time(self, tokens, now=None):
+        """Segundos até caber uma requisição de `tokens` tokens (0 = agora)"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        waits = [self.blocked_until - now]
+        if self.rpm and self.requests < 1:
+            waits.append((1 - self.requests) / (self.rpm * self.factor / 60))
+        if self.tpm:
+            # Requisição maior que o balde inteiro passa quando ele estiver cheio
+            needed = min(tokens, self.tpm * self.factor)
+            if self.tokens < needed:
+                waits.append((needed - self.tokens) / (self.tpm * self.factor / 60))
+        return max(0.0, *waits)
+
+    async def acquire(self, tokens, max_wait):
+        """Reserva a vaga; False se for preciso esperar mais que max_wait"""
+        while True:
+            wait = self.wait_time(tokens)
+            if wait <= 0:
+                self.requests -= 1
+                self.tokens -= tokens
+                return True
+            if wait > max_wait:
+                return False
+            await asyncio.sleep(wait)
+
+    def reconcile(self, estimated, actual):
+        """Acerta o balde com os tokens realmente cobrados pelo provedor"""
+        if self.tpm and isinstance(actual, int):
+            self.tokens = min(self.tpm * self.factor, self.tokens + estimated - actual)
+
+    def on_success(self):
+        self.consecutive_limits = 0
+        self.factor = min(1.0, self.factor + RATE_RECOVERY_STEP)
+
+    def on_rate_limited(self, retry_after=None):
+        self.consecutive_limits += 1
+        self.factor = max(MIN_RATE_FACTOR, self.factor / 2)
+        if retry_after is None:
+            retry_after = min(RATE_LIMIT_MAX_BACKOFF, RATE_LIMIT_BACKOFF * 2 ** (self.consecutive_limits - 1))
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def blocked_for(self):
+        return max(0.0, self.blocked_until - time.monotonic())
+
+
+class CircuitBreaker:
+    """Fechado -> aberto (falhas seguidas) -> meio-aberto (uma chamada de teste) -> fechado"""
+
+    def __init__(self):
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        self.opened_until = 0.0
+        self.probe_in_flight = False
+
+    def available(self, now=None):
+        """Aceitaria uma chamada agora? (sem reservar a chamada de teste)"""
+        now = time.monotonic() if now is None else now
+        if self.state == STATE_OPEN:
+            return now >= self.opened_until
+        if self.state == STATE_HALF_OPEN:
+            return not self.probe_in_flight
+        return True
+
+    def allow(self):
+        now = time.monotonic()
+        if not self.available(now):
+            return False
+        if self.state == STATE_OPEN:
+            self.state = STATE_HALF_OPEN
+        if self.state == STATE_HALF_OPEN:
+            self.probe_in_flight = True
+        return True
+
+    def cancel(self):
+        """A chamada liberada não aconteceu (ex.: sem vaga no balde)"""
+        self.probe_in_flight = False
+
+    def on_success(self):
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        self.probe_in_flight = False
+
+    def on_failure(self):
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == STATE_HALF_OPEN:
+            self.cooldown = min(BREAKER_MAX_COOLDOWN, self.cooldown * 2)
+            self._open()
+        elif self.consecutive_failures >= FAILURE_THRESHOLD:
+            self._open()
+
+    def _open(self):
+        if self.state != STATE_OPEN:
+            print(f"🛑 Circuito aberto por {self.cooldown:.0f}s após {self.consecutive_failures} falha(s) seguida(s)")
+        self.state = STATE_OPEN
+        self.opened_until = time.monotonic() + self.cooldown
+
+
+class ProviderGuard:
+    """Limite de taxa + circuit breaker + estatísticas de saúde de um provedor"""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.limiter = RateLimiter(provider)
+        self.breaker = CircuitBreaker()
+        self.latency = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.rejected = 0
+        self.last_error = None
+
+    async def admit(self, tokens, max_wait):
+        """None se a chamada pode seguir; senão o resultado de recusa (sem chamar o provedor)"""
+        if not self.breaker.allow():
+            self.rejected += 1
+            return {'success': False, 'circuit_open': True,
+                    'error': f'{self.provider}: circuito aberto após falhas seguidas'}
+        if not await self.limiter.acquire(tokens, max_wait):
+            self.breaker.cancel()
+            self.rejected += 1
+            return {'success': False, 'rate_limited': True,
+                    'error': f'{self.provider}: limite de requisições/tokens por minuto atingido'}
+        return None
+
+    def record(self, result, elapsed, estimated_tokens):
+        self.calls += 1
+        self.latency = elapsed if self.latency is None else (
+            HEALTH_ALPHA * elapsed + (1 - HEALTH_ALPHA) * self.latency)
+        failed = not result.get('success')
+        self.error_rate = HEALTH_ALPHA * failed + (1 - HEALTH_ALPHA) * self.error_rate
+        if failed:
+            self.failures += 1
+            self.last_error = (result.get('error') or '')[:200]
+            if result.get('rate_limited'):
+                self.rate_limited += 1
+                self.limiter.on_rate_limited(result.get('retry_after'))
+            self.breaker.on_failure()
+        else:
+            self.limiter.on_success()
+            self.limiter.reconcile(estimated_tokens, result.get('tokens_used'))
+            self.breaker.on_success()
+
+    def health_score(self):
+        """Menor é melhor: latência média inflada pela taxa de erro e pelo bloqueio por 429"""
+        latency = DEFAULT_LATENCY if self.latency is None else self.latency
+        return latency * (1 + 10 * self.error_rate) + self.limiter.blocked_for()
+
+    def snapshot(self):
+        return {
+            'state': self.breaker.state,
+            'available': self.breaker.available(),
+            'consecutive_failures': self.breaker.consecutive_failures,
+            'reopens_in': round(max(0.0, self.breaker.opened_until - time.monotonic()), 1)
+                          if self.breaker.state == STATE_OPEN else None,
+            'latency_ms': round(self.latency * 1000) if self.latency is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'calls': self.calls,
+            'failures': self.failures,
+            'rate_limited': self.rate_limited,
+            'rejected': self.rejected,
+            'rpm_limit': self.limiter.rpm,
+            'tpm_limit': self.limiter.tpm,
+            'rate_factor': round(self.limiter.factor, 2),
+            'blocked_for': round(self.limiter.blocked_for(), 1),
+            'last_error': self.last_error
+        }
+
+
+def order_providers(guards, preferred):
+    """
+    Nomes dos provedores na ordem de tentativa: circuito disponível primeiro, depois
+    pela saúde (o preferido leva vantagem até ficar 2x pior)
+    """
+    def key(name):
+        guard = guards[name]
+        score = guard.health_score() * (PREFERRED_WEIGHT if name == preferred else 1)
+        return (not guard.breaker.available(), score, name != preferred)
+    return sorted(guards, key=key)
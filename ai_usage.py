@@ -0,0 +1,376 @@
+"""
+Uso Medido da IA: tokens, custo e latência por chamada, com orçamento diário
+Antes, cada análise do processo registrava um palpite (3000 tokens por
+documento) em ai_usage_log e o Gemini devolvia tokens_used 'N/A'. Agora cada
+chamada ao provedor grava em ai_call_usage os tokens de entrada e saída
+informados pelo provedor, o modelo, a latência e o custo calculado pela tabela
+de preços, ligada ao processo, documento e job que a originou.
+
+Atribuição: o job da fila marca o contexto (contextvars) e o motor de IA lê de
+lá - os analisadores não precisam repassar processo/documento:
+
+    with ai_usage.attribute(process_id, document_id, job_id):
+        analyze_document_rigorous(...)
+
+Orçamento diário em US$ por RPPS (AI_BUDGET_RPPS_DAILY_USD), por instituição
+financeira (AI_BUDGET_INSTITUTION_DAILY_USD) e geral (AI_BUDGET_DAILY_USD).
+Todos vêm desligados (0): o uso é só registrado. Para limitar, defina o valor
+no .env, por exemplo
+
+    AI_BUDGET_RPPS_DAILY_USD=20
+    AI_BUDGET_INSTITUTION_DAILY_USD=5
+
+Cada chamada reserva o custo máximo (entrada medida + saída máxima) com um
+UPDATE condicional em ai_budget_usage - atômico mesmo com vários workers - e,
+depois da resposta, troca a reserva pelo custo real; chamadas que falharam
+depois de chegar ao provedor contam pelos tokens informados, como na cobrança. Sem vaga no
+orçamento a chamada nem chega ao provedor; se só as reservas de chamadas em
+andamento ocupam a vaga, espera até AI_BUDGET_WAIT segundos que elas acertem.
+
+Preços em US$ por milhão de tokens (entrada, saída); AI_PRICE_<MODELO> =
+"entrada,saída" sobrescreve ou acrescenta um modelo. AI_USAGE_TRACKING=false
+desliga registro e orçamento (benchmarks sem banco).
+"""
+
+import asyncio
+import contextvars
+import os
+import re
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import prompt_budget
+from db_executor import DBExecutor
+
+TRACKING_ENABLED = os.getenv('AI_USAGE_TRACKING', 'true').lower() != 'false'
+BUDGET_RPPS_USD = float(os.getenv('AI_BUDGET_RPPS_DAILY_USD', '0'))
+BUDGET_INSTITUTION_USD = float(os.getenv('AI_BUDGET_INSTITUTION_DAILY_USD', '0'))
+BUDGET_GLOBAL_USD = float(os.getenv('AI_BUDGET_DAILY_USD', '0'))
+# Sem histórico medido: tokens por documento usados na estimativa da análise do processo
+DEFAULT_TOKENS_PER_DOCUMENT = 3000
+ESTIMATE_WINDOW_DAYS = 30
+# Espera por vaga ocupada só por reservas (o custo real costuma ser bem menor que o máximo)
+RESERVATION_WAIT = float(os.getenv('AI_BUDGET_WAIT', '30'))
+RESERVATION_POLL = 0.25
+
+# US$ por milhão de tokens (entrada, saída) - o prefixo mais longo contido no nome do modelo vale
+PRICES = {
+    'gpt-4-turbo': (10.0, 30.0),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.0),
+    'gpt-4': (30.0, 60.0),
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'claude-3-opus': (15.0, 75.0),
+    'claude-3-5-sonnet': (3.0, 15.0),
+    'claude-3-sonnet': (3.0, 15.0),
+    'claude-3-5-haiku': (0.80, 4.0),
+    'claude-3-haiku': (0.25, 1.25),
+    'gemini-2.0-flash': (0.10, 0.40),
+    'gemini-1.5-flash': (0.075, 0.30),
+    'gemini-1.5-pro': (1.25, 5.0),
+}
+# Modelo fora da tabela: preço do mais caro (o orçamento nunca fica subestimado)
+DEFAULT_PRICE = (30.0, 75.0)
+
+SCOPE_GLOBAL = 'global'
+SCOPE_RPPS = 'rpps'
+SCOPE_INSTITUTION = 'institution'
+
+Attribution = namedtuple('Attribution', ['process_id', 'document_id', 'job_id'])
+Reservation = namedtuple('Reservation', ['attribution', 'rpps_id', 'institution_id', 'day', 'scopes',
+                                         'reserved_usd', 'refused', 'retry'])
+
+_attribution = contextvars.ContextVar('ai_usage_attribution', default=None)
+
+
+@contextmanager
+def attribute(process_id=None, document_id=None, job_id=None):
+    """Chamadas de IA dentro do bloco (inclusive no loop de IA) contam para este processo/documento"""
+    token = _attribution.set(Attribution(process_id, document_id, job_id))
+    try:
+        yield
+    finally:
+        _attribution.reset(token)
+
+
+def current_attribution():
+    return _attribution.get() or Attribution(None, None, None)
+
+
+def _utc_now():
+    return datetime.now(timezone.utc)
+
+
+def _timestamp(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _today():
+    return _utc_now().strftime('%Y-%m-%d')
+
+
+def price_for(model):
+    """(US$ por milhão de tokens de entrada, de saída) do modelo"""
+    model = (model or '').lower().replace('models/', '')
+    name = re.sub(r'\W+', '_', model.upper()).strip('_')
+    override = os.getenv(f'AI_PRICE_{name}') if name else None
+    if override:
+        input_price, output_price = (float(value) for value in override.split(','))
+        return input_price, output_price
+    matches = [prefix for prefix in PRICES if prefix in model]
+    return PRICES[max(matches, key=len)] if matches else DEFAULT_PRICE
+
+
+def compute_cost(model, input_tokens, output_tokens):
+    input_price, output_price = price_for(model)
+    return round(((input_tokens or 0) * input_price + (output_tokens or 0) * output_price) / 1_000_000, 6)
+
+
+def max_cost(model, input_tokens, output_tokens):
+    """Custo para reservar: model pode listar vários separados por vírgula (Gemini) - vale o mais caro"""
+    return max(compute_cost(name.strip(), input_tokens, output_tokens) for name in (model or '').split(','))
+
+
+def budget_limits():
+    return {SCOPE_GLOBAL: BUDGET_GLOBAL_USD, SCOPE_RPPS: BUDGET_RPPS_USD,
+            SCOPE_INSTITUTION: BUDGET_INSTITUTION_USD}
+
+
+def _process_owners(c, process_id):
+    """(rpps_id, financial_institution_id) do processo"""
+    if process_id is None:
+        return None, None
+    c.execute('SELECT rpps_id, financial_institution_id FROM processes WHERE id = ?', (process_id,))
+    row = c.fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+
+def _scopes(rpps_id, institution_id):
+    scopes = [(SCOPE_GLOBAL, 0)]
+    if rpps_id is not None:
+        scopes.append((SCOPE_RPPS, rpps_id))
+    if institution_id is not None:
+        scopes.append((SCOPE_INSTITUTION, institution_id))
+    return scopes
+
+
+def reserve(conn, attribution, estimated_usd):
+    """
+    Reserva estimated_usd em todos os orçamentos do dia que valem para a chamada.
+    O UPDATE só passa se gasto + reservado + estimado couber no limite; se algum
+    orçamento recusar, nada fica reservado (o chamador desfaz a transação).
+    """
+    c = conn.cursor()
+    rpps_id, institution_id = _process_owners(c, attribution.process_id)
+    day = _today()
+    limits = budget_limits()
+    scopes = _scopes(rpps_id, institution_id)
+    for scope, scope_id in scopes:
+        limit = limits[scope]
+        c.execute('''INSERT INTO ai_budget_usage (scope, scope_id, usage_day) VALUES (?, ?, ?)
+                     ON CONFLICT (scope, scope_id, usage_day) DO NOTHING''', (scope, scope_id, day))
+        c.execute('''UPDATE ai_budget_usage SET reserved_usd = reserved_usd + ?
+                     WHERE scope = ? AND scope_id = ? AND usage_day = ?
+                       AND (? <= 0 OR cost_usd + reserved_usd + ? <= ?)''',
+                  (estimated_usd, scope, scope_id, day, limit, estimated_usd, limit))
+        if c.rowcount == 0:
+            c.execute('''SELECT cost_usd, reserved_usd FROM ai_budget_usage
+                         WHERE scope = ? AND scope_id = ? AND usage_day = ?''', (scope, scope_id, day))
+            spent, reserved = c.fetchone()
+            refused = (f'Orçamento diário de IA esgotado ({scope}): US$ {spent + reserved:.2f} '
+                       f'de US$ {limit:.2f} já usados ou reservados')
+            # Caberia sem as reservas das chamadas em andamento: vale tentar de novo
+            return Reservation(attribution, rpps_id, institution_id, day, [], 0.0, refused,
+                               spent + estimated_usd <= limit)
+    return Reservation(attribution, rpps_id, institution_id, day, scopes, estimated_usd, None, False)
+
+
+def settle(conn, reservation, provider, model, document_type, result):
+    """
+    Grava a chamada em ai_call_usage e troca a reserva pelo custo real. Falhas
+    também contam: os tokens que o provedor informou foram cobrados.
+    """
+    input_tokens = result.get('input_tokens') or 0
+    output_tokens = result.get('output_tokens') or 0
+    success = bool(result.get('success'))
+    cost = compute_cost(model, input_tokens, output_tokens)
+    attribution = reservation.attribution
+    now = _utc_now()
+    c = conn.cursor()
+    c.execute('''INSERT INTO ai_call_usage
+                 (process_id, document_id, job_id, rpps_id, institution_id, provider, model, document_type,
+                  input_tokens, output_tokens, cost_usd, latency_ms, success, error, usage_day, created_at)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+              (attribution.process_id, attribution.document_id, attribution.job_id, reservation.rpps_id,
+               reservation.institution_id, provider, model, document_type, input_tokens, output_tokens, cost,
+               result.get('latency_ms'), 1 if success else 0,
+               None if success else (result.get('error') or '')[:500], reservation.day, _timestamp(now)))
+    for scope, scope_id in reservation.scopes:
+        c.execute('''UPDATE ai_budget_usage
+                     SET reserved_usd = reserved_usd - ?, cost_usd = cost_usd + ?, calls = calls + 1,
+                         input_tokens = input_tokens + ?, output_tokens = output_tokens + ?
+                     WHERE scope = ? AND scope_id = ? AND usage_day = ?''',
+                  (reservation.reserved_usd, cost, input_tokens, output_tokens, scope, scope_id, reservation.day))
+    return cost
+
+
+def release(conn, reservation):
+    """Devolve a reserva de uma chamada que não chegou ao provedor"""
+    c = conn.cursor()
+    for scope, scope_id in reservation.scopes:
+        c.execute('''UPDATE ai_budget_usage SET reserved_usd = reserved_usd - ?
+                     WHERE scope = ? AND scope_id = ? AND usage_day = ?''',
+                  (reservation.reserved_usd, scope, scope_id, reservation.day))
+
+
+# Gravações do event loop de IA: banco indisponível não bloqueia a análise
+_db = DBExecutor('ai-usage', "⚠️  Controle de uso da IA indisponível ({error}) - seguindo sem registro nem orçamento")
+
+
+def _reserve_in_transaction(conn, attribution, estimated_usd):
+    """Reserva recusada não deixa nada gravado"""
+    reservation = reserve(conn, attribution, estimated_usd)
+    if reservation.refused:
+        conn.rollback()
+    return reservation
+
+
+async def reserve_async(attribution, estimated_usd):
+    # Sem controle (desligado ou banco indisponível): a chamada segue sem reserva
+    untracked = Reservation(attribution, None, None, _today(), [], 0.0, None, False)
+    if not TRACKING_ENABLED:
+        return untracked
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + RESERVATION_WAIT
+    while True:
+        reservation = await _db.run(_reserve_in_transaction, attribution, estimated_usd, default=untracked)
+        if not reservation.retry or loop.time() >= deadline:
+            return reservation
+        await asyncio.sleep(RESERVATION_POLL)
+
+
+async def settle_async(reservation, provider, model, document_type, result):
+    if not TRACKING_ENABLED:
+        return None
+    return await _db.run(settle, reservation, provider, model, document_type, result)
+
+
+async def release_async(reservation):
+    if not TRACKING_ENABLED:
+        return
+    await _db.run(release, reservation)
+
+
+def estimate_per_document(conn):
+    """
+    (tokens, US$, medido?) por documento: média medida nos últimos ESTIMATE_WINDOW_DAYS
+    dias; sem histórico, DEFAULT_TOKENS_PER_DOCUMENT no preço do provedor ativo
+    """
+    since = (_utc_now() - timedelta(days=ESTIMATE_WINDOW_DAYS)).strftime('%Y-%m-%d')
+    c = conn.cursor()
+    c.execute('''SELECT COUNT(DISTINCT document_id), SUM(input_tokens + output_tokens), SUM(cost_usd)
+                 FROM ai_call_usage
+                 WHERE usage_day >= ? AND document_id IS NOT NULL AND success = 1''', (since,))
+    documents, tokens, cost = c.fetchone()
+    if not documents:
+        tokens = DEFAULT_TOKENS_PER_DOCUMENT
+        return tokens, max_cost(prompt_budget.active_model(), tokens * 2 // 3, tokens // 3), False
+    return round(tokens / documents), round(cost / documents, 6), True
+
+
+def check_budgets(conn, process_id, estimated_usd=0.0):
+    """
+    Orçamentos de hoje (RPPS, instituição, geral) em que gasto + reservado + estimated_usd
+    passaria do limite: [(escopo, usado, limite)]. Só informa - a trava é a reserva por chamada.
+    """
+    c = conn.cursor()
+    rpps_id, institution_id = _process_owners(c, process_id)
+    limits = budget_limits()
+    exceeded = []
+    for scope, scope_id in _scopes(rpps_id, institution_id):
+        limit = limits[scope]
+        if limit <= 0:
+            continue
+        c.execute('''SELECT cost_usd + reserved_usd FROM ai_budget_usage
+                     WHERE scope = ? AND scope_id = ? AND usage_day = ?''', (scope, scope_id, _today()))
+        row = c.fetchone()
+        used = row[0] if row else 0.0
+        if used + estimated_usd > limit:
+            exceeded.append((scope, round(used, 4), limit))
+    return exceeded
+
+
+def get_process_usage(conn, process_id):
+    """Chamadas, tokens e custo medidos de um processo"""
+    c = conn.cursor()
+    c.execute('''SELECT COUNT(*), COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0),
+                        COALESCE(SUM(cost_usd), 0)
+                 FROM ai_call_usage WHERE process_id = ?''', (process_id,))
+    calls, input_tokens, output_tokens, cost = c.fetchone()
+    return {'calls': calls, 'input_tokens': input_tokens, 'output_tokens': output_tokens,
+            'cost_usd': round(cost, 4)}
+
+
+def get_summary(conn, days=30):
+    """Uso agregado para o painel admin: totais, por dia, modelo, tipo, RPPS e instituição"""
+    since = (_utc_now() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    c = conn.cursor()
+    c.execute('''SELECT COUNT(*), COALESCE(SUM(1 - success), 0), COALESCE(SUM(input_tokens), 0),
+                        COALESCE(SUM(output_tokens), 0), COALESCE(SUM(cost_usd), 0), AVG(latency_ms)
+                 FROM ai_call_usage WHERE usage_day >= ?''', (since,))
+    calls, failures, input_tokens, output_tokens, cost, latency = c.fetchone()
+
+    c.execute('''SELECT usage_day, COUNT(*), SUM(input_tokens + output_tokens), SUM(cost_usd)
+                 FROM ai_call_usage WHERE usage_day >= ?
+                 GROUP BY usage_day ORDER BY usage_day''', (since,))
+    by_day = [{'day': row[0], 'calls': row[1], 'tokens': row[2] or 0, 'cost_usd': round(row[3] or 0, 4)}
+              for row in c.fetchall()]
+
+    c.execute('''SELECT provider, model, COUNT(*), SUM(1 - success), SUM(input_tokens), SUM(output_tokens),
+                        SUM(cost_usd), AVG(latency_ms)
+                 FROM ai_call_usage WHERE usage_day >= ?
+                 GROUP BY provider, model ORDER BY SUM(cost_usd) DESC, provider''', (since,))
+    by_model = [{'provider': row[0], 'model': row[1], 'calls': row[2], 'failures': row[3] or 0,
+                 'input_tokens': row[4] or 0, 'output_tokens': row[5] or 0, 'cost_usd': round(row[6] or 0, 4),
+                 'average_latency_ms': round(row[7]) if row[7] is not None else None} for row in c.fetchall()]
+
+    c.execute('''SELECT document_type, COUNT(*), SUM(input_tokens + output_tokens), SUM(cost_usd)
+                 FROM ai_call_usage WHERE usage_day >= ?
+                 GROUP BY document_type ORDER BY SUM(cost_usd) DESC, document_type''', (since,))
+    by_type = [{'document_type': row[0], 'calls': row[1], 'tokens': row[2] or 0,
+                'cost_usd': round(row[3] or 0, 4)} for row in c.fetchall()]
+
+    def top(column):
+        c.execute(f'''SELECT a.{column}, u.name, COUNT(*), SUM(a.input_tokens + a.output_tokens), SUM(a.cost_usd)
+                      FROM ai_call_usage a LEFT JOIN users u ON u.id = a.{column}
+                      WHERE a.usage_day >= ? AND a.{column} IS NOT NULL
+                      GROUP BY a.{column}, u.name ORDER BY SUM(a.cost_usd) DESC LIMIT 10''', (since,))
+        return [{'id': row[0], 'name': row[1], 'calls': row[2], 'tokens': row[3] or 0,
+                 'cost_usd': round(row[4] or 0, 4)} for row in c.fetchall()]
+
+    limits = budget_limits()
+    c.execute('''SELECT b.scope, b.scope_id, u.name, b.calls, b.cost_usd, b.reserved_usd
+                 FROM ai_budget_usage b LEFT JOIN users u ON u.id = b.scope_id
+                 WHERE b.usage_day = ? ORDER BY b.cost_usd DESC''', (_today(),))
+    budgets_today = [{'scope': row[0], 'id': row[1], 'name': row[2] if row[0] != SCOPE_GLOBAL else None,
+                      'calls': row[3], 'cost_usd': round(row[4], 4), 'reserved_usd': round(row[5], 4),
+                      'limit_usd': limits[row[0]] or None} for row in c.fetchall()]
+
+    return {
+        'days': days,
+        'since': since,
+        'calls': calls,
+        'failures': failures,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'cost_usd': round(cost, 4),
+        'average_latency_ms': round(latency) if latency is not None else None,
+        'limits_usd': {scope: limit or None for scope, limit in limits.items()},
+        'by_day': by_day,
+        'by_model': by_model,
+        'by_document_type': by_type,
+        'top_rpps': top('rpps_id'),
+        'top_institutions': top('institution_id'),
+        'budgets_today': budgets_today
+    }
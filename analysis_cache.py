@@ -0,0 +1,161 @@
+"""
+Cache de Resultados de Análise (endereçado pelo conteúdo do arquivo)
+As instituições reenviam as mesmas certidões e apresentações em vários processos;
+o resultado de analyze_document_rigorous é reaproveitado quando coincidem:
+
+    SHA-256 dos bytes do arquivo + tipo do documento + instituição (nome/CNPJ)
+    + ANALYZER_VERSION (mudou a regra, muda a chave)
+
+Tipos cuja análise depende da data de hoje (validade de certidões, "emitido há
+menos de 1 ano") expiram em ANALYSIS_CACHE_DATE_TTL_HOURS; os demais em
+ANALYSIS_CACHE_TTL_DAYS. ANALYSIS_CACHE=false desliga o cache.
+
+As funções recebem a conexão do chamador: a gravação entra na mesma transação
+do resultado da análise.
+"""
+
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+from ai_analyzer_rigorous import ANALYZER_VERSION, analyze_document_rigorous
+from cache_metrics import Counters, stored_hit_rate
+from document_extract import file_sha256
+
+CACHE_ENABLED = os.getenv('ANALYSIS_CACHE', 'true').lower() != 'false'
+TTL_DAYS = int(os.getenv('ANALYSIS_CACHE_TTL_DAYS', '30'))
+DATE_TTL_HOURS = int(os.getenv('ANALYSIS_CACHE_DATE_TTL_HOURS', '24'))
+
+# Análises que comparam datas do documento com a data atual
+DATE_SENSITIVE_TYPES = {
+    'apresentacao_institucional', 'termo_credenciamento', 'termo_declaracao', 'declaracao_unificada',
+    'rating', 'cadprev', 'situacao_ancord',
+    'certidao_municipal', 'certidao_estadual', 'certidao_federal', 'certidao_trabalhista', 'certidao_fgts',
+    'certidao_bacen_autorizacao', 'certidao_bacen_nada_consta', 'certidao_anbima',
+}
+
+
+# Acertos/erros deste processo (o total persistido fica em analysis_cache.hit_count)
+counters = Counters()
+
+
+def _timestamp(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _utc_now():
+    return datetime.now(timezone.utc)
+
+
+def institution_key(institution_name, institution_cnpj=None):
+    name = ' '.join((institution_name or '').lower().split())
+    cnpj = re.sub(r'\D', '', institution_cnpj or '')
+    return f'{name}|{cnpj}'
+
+
+def make_key(file_sha, document_type, institution_name, institution_cnpj=None):
+    raw = '\x1f'.join([file_sha, document_type or '', institution_key(institution_name, institution_cnpj),
+                       ANALYZER_VERSION])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def ttl_for(document_type):
+    if document_type in DATE_SENSITIVE_TYPES:
+        return timedelta(hours=DATE_TTL_HOURS)
+    return timedelta(days=TTL_DAYS)
+
+
+def lookup(conn, cache_key):
+    """Resultado guardado e ainda válido (ou None); registra o acerto na linha do cache"""
+    if not CACHE_ENABLED:
+        return None
+    now = _timestamp(_utc_now())
+    c = conn.cursor()
+    c.execute('''SELECT result FROM analysis_cache
+                 WHERE cache_key = ? AND expires_at > ?''', (cache_key, now))
+    row = c.fetchone()
+    if row is None:
+        counters.add('misses')
+        return None
+    counters.add('hits')
+    c.execute('''UPDATE analysis_cache SET hit_count = hit_count + 1, last_hit_at = ?
+                 WHERE cache_key = ?''', (now, cache_key))
+    return json.loads(row[0])
+
+
+def is_cached(conn, cache_key):
+    """Só consulta (não conta acerto) - usado para decidir se uma análise vai gastar IA"""
+    if not CACHE_ENABLED:
+        return False
+    c = conn.cursor()
+    c.execute('SELECT 1 FROM analysis_cache WHERE cache_key = ? AND expires_at > ?',
+              (cache_key, _timestamp(_utc_now())))
+    return c.fetchone() is not None
+
+
+def store(conn, cache_key, file_sha, document_type, institution_name, institution_cnpj, result):
+    if not CACHE_ENABLED or not isinstance(result, dict) or result.get('error'):
+        return
+    now = _utc_now()
+    c = conn.cursor()
+    c.execute('''INSERT INTO analysis_cache
+                 (cache_key, file_sha256, document_type, institution_key, analyzer_version, result,
+                  created_at, expires_at, hit_count)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+                 ON CONFLICT (cache_key) DO UPDATE SET
+                     result = excluded.result, created_at = excluded.created_at,
+                     expires_at = excluded.expires_at''',
+              (cache_key, file_sha, document_type, institution_key(institution_name, institution_cnpj),
+               ANALYZER_VERSION, json.dumps(result), _timestamp(now), _timestamp(now + ttl_for(document_type))))
+    # Entradas vencidas saem na próxima gravação (índice em expires_at)
+    c.execute('DELETE FROM analysis_cache WHERE expires_at <= ?', (_timestamp(now),))
+    counters.add('stores')
+
+
+def analyze_document_cached(conn, file_path, document_type, document_name, institution_name,
+                            institution_cnpj=None):
+    """
+    analyze_document_rigorous com cache. Retorna (resultado, veio_do_cache).
+    conn só é usada para ler/gravar o cache; o commit fica com o chamador.
+    """
+    if not CACHE_ENABLED:
+        return analyze_document_rigorous(file_path, document_type, document_name,
+                                         institution_name, institution_cnpj), False
+
+    file_sha = file_sha256(file_path)
+    cache_key = make_key(file_sha, document_type, institution_name, institution_cnpj)
+    cached = lookup(conn, cache_key)
+    if cached is not None:
+        print(f"⚡ Análise reaproveitada do cache ({document_type}, sha256 {file_sha[:12]}...)")
+        return cached, True
+
+    result = analyze_document_rigorous(file_path, document_type, document_name,
+                                       institution_name, institution_cnpj)
+    store(conn, cache_key, file_sha, document_type, institution_name, institution_cnpj, result)
+    return result, False
+
+
+def get_stats(conn):
+    """Métricas do cache: entradas, acertos persistidos e taxa de acerto deste processo"""
+    c = conn.cursor()
+    now = _timestamp(_utc_now())
+    c.execute('''SELECT COUNT(*), SUM(CASE WHEN expires_at > ? THEN 1 ELSE 0 END), SUM(hit_count)
+                 FROM analysis_cache''', (now,))
+    entries, active, stored_hits = c.fetchone()
+    stored_hits = stored_hits or 0
+    c.execute('''SELECT document_type, COUNT(*), SUM(hit_count) FROM analysis_cache
+                 GROUP BY document_type ORDER BY SUM(hit_count) DESC, document_type''')
+    by_type = [{'document_type': row[0], 'entries': row[1], 'hits': row[2] or 0} for row in c.fetchall()]
+
+    return {
+        'enabled': CACHE_ENABLED,
+        'analyzer_version': ANALYZER_VERSION,
+        'entries': entries or 0,
+        'active_entries': active or 0,
+        'stored_hits': stored_hits,
+        'hit_rate': stored_hit_rate(stored_hits, entries),
+        'process': counters.as_dict(),
+        'by_type': by_type
+    }
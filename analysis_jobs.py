@@ -0,0 +1,475 @@
+"""
+Fila Durável de Análises (analysis_jobs)
+Substitui a thread por upload: cada análise vira uma linha em analysis_jobs e um
+pool com número fixo de workers consome a fila.
+
+- prioridade: maior primeiro; empate pela ordem de chegada
+- lease: o worker reserva o job por ANALYSIS_LEASE_SECONDS e renova (heartbeat)
+  enquanto processa; lease vencido (worker morto/reiniciado) volta para a fila
+- retry: falhas voltam para a fila com backoff exponencial até max_attempts
+- recuperação: ao iniciar, leases vencidos são reenfileirados e cada tipo de job
+  pode registrar uma rotina de recuperação (ex.: documentos presos em 'analyzing')
+- execuções (run_id): jobs de uma mesma execução (ex.: análise do processo inteiro)
+  ocupam no máximo ANALYSIS_RUN_CONCURRENCY workers ao mesmo tempo
+- resultado: o que o handler retorna é gravado (JSON) na coluna result do job
+
+Os handlers são registrados por tipo (register_handler) em analysis_pipeline.py.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from database import get_db_connection, release_thread_connection
+
+WORKER_COUNT = int(os.getenv('ANALYSIS_WORKERS', '2'))
+LEASE_SECONDS = int(os.getenv('ANALYSIS_LEASE_SECONDS', '180'))
+HEARTBEAT_SECONDS = max(5, LEASE_SECONDS // 4)
+POLL_SECONDS = float(os.getenv('ANALYSIS_POLL_SECONDS', '2'))
+MAX_ATTEMPTS = int(os.getenv('ANALYSIS_MAX_ATTEMPTS', '3'))
+RETRY_BASE_SECONDS = int(os.getenv('ANALYSIS_RETRY_BASE_SECONDS', '30'))
+RETRY_MAX_SECONDS = int(os.getenv('ANALYSIS_RETRY_MAX_SECONDS', '900'))
+RUN_CONCURRENCY = int(os.getenv('ANALYSIS_RUN_CONCURRENCY', '4'))
+
+PRIORITY_LOW = -10
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 10
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+JobRow = namedtuple('JobRow', [
+    'id', 'job_type', 'document_id', 'process_id', 'payload', 'priority', 'status',
+    'attempts', 'max_attempts', 'run_after', 'lease_owner', 'lease_expires_at',
+    'last_error', 'created_at', 'started_at', 'finished_at', 'run_id', 'result'
+])
+
+_JOB_COLUMNS = '''id, job_type, document_id, process_id, payload, priority, status,
+                  attempts, max_attempts, run_after, lease_owner, lease_expires_at,
+                  last_error, created_at, started_at, finished_at, run_id, result'''
+
+# job_type -> (handler(job), on_failure(job, error) | None, recover() | None, on_success(job, result) | None)
+_handlers = {}
+
+
+class PermanentJobError(Exception):
+    """Falha que não adianta repetir (ex.: arquivo removido): o job falha sem novas tentativas"""
+
+
+def register_handler(job_type, handler, on_failure=None, recover=None, on_success=None):
+    _handlers[job_type] = (handler, on_failure, recover, on_success)
+
+
+def _timestamp(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def utc_now(offset_seconds=0):
+    """Texto 'YYYY-MM-DD HH:MM:SS' em UTC (mesmo formato de datetime('now'))"""
+    return _timestamp(datetime.now(timezone.utc) + timedelta(seconds=offset_seconds))
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = JobRow(*row)
+    return job._replace(payload=json.loads(job.payload) if job.payload else {},
+                        result=json.loads(job.result) if job.result else None)
+
+
+def retry_delay(attempts):
+    """Backoff exponencial: 30s, 60s, 120s... limitado a RETRY_MAX_SECONDS"""
+    return min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+
+
+# ==================== FILA ====================
+
+def enqueue(job_type, payload, document_id=None, process_id=None, priority=PRIORITY_NORMAL,
+            max_attempts=MAX_ATTEMPTS, conn=None, run_id=None):
+    """
+    Enfileira um job e retorna o id. Com conn, o job entra na transação do chamador
+    (só fica visível aos workers após o commit - chamar worker_pool.wake() depois).
+    run_id agrupa jobs de uma execução (limite de RUN_CONCURRENCY em paralelo).
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        now = utc_now()
+        c.execute('''INSERT INTO analysis_jobs
+                     (job_type, document_id, process_id, payload, priority, status, attempts,
+                      max_attempts, run_after, created_at, run_id)
+                     VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?)''',
+                  (job_type, document_id, process_id, json.dumps(payload), priority, STATUS_QUEUED,
+                   max_attempts, now, now, run_id))
+        job_id = c.lastrowid
+        if own_conn:
+            conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+    if own_conn:
+        worker_pool.wake()
+    return job_id
+
+
+def requeue_expired_leases(conn):
+    """Jobs 'running' com lease vencido (worker caiu) voltam para a fila"""
+    c = conn.cursor()
+    now = utc_now()
+    c.execute('''UPDATE analysis_jobs
+                 SET status = ?, lease_owner = NULL, lease_expires_at = NULL, run_after = ?,
+                     last_error = COALESCE(last_error, 'Lease expirado (worker interrompido)')
+                 WHERE status = ? AND lease_expires_at < ?''',
+              (STATUS_QUEUED, now, STATUS_RUNNING, now))
+    return c.rowcount
+
+
+def claim_next(owner):
+    """Reserva atomicamente o próximo job disponível para este worker"""
+    conn = get_db_connection()
+    try:
+        if conn.in_transaction:
+            conn.commit()
+        c = conn.cursor()
+        # Lock de escrita: dois workers nunca reservam o mesmo job
+        c.execute('BEGIN IMMEDIATE')
+        requeue_expired_leases(conn)
+        now = utc_now()
+        # Execuções que já ocupam RUN_CONCURRENCY workers esperam a vez
+        c.execute('''SELECT id FROM analysis_jobs
+                     WHERE status = ? AND run_after <= ?
+                       AND (run_id IS NULL OR run_id NOT IN (
+                            SELECT run_id FROM analysis_jobs
+                            WHERE status = ? AND run_id IS NOT NULL
+                            GROUP BY run_id HAVING COUNT(*) >= ?))
+                     ORDER BY priority DESC, run_after, id
+                     LIMIT 1''', (STATUS_QUEUED, now, STATUS_RUNNING, RUN_CONCURRENCY))
+        row = c.fetchone()
+        if row is None:
+            conn.commit()
+            return None
+        c.execute('''UPDATE analysis_jobs
+                     SET status = ?, lease_owner = ?, lease_expires_at = ?, heartbeat_at = ?,
+                         attempts = attempts + 1, started_at = COALESCE(started_at, ?)
+                     WHERE id = ?''',
+                  (STATUS_RUNNING, owner, utc_now(LEASE_SECONDS), now, now, row[0]))
+        c.execute(f'SELECT {_JOB_COLUMNS} FROM analysis_jobs WHERE id = ?', (row[0],))
+        job = _row_to_job(c.fetchone())
+        conn.commit()
+        return job
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def renew_leases(owner, job_ids):
+    """Heartbeat: estende o lease dos jobs em execução por este worker"""
+    if not job_ids:
+        return 0
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        placeholders = ','.join('?' * len(job_ids))
+        c.execute(f'''UPDATE analysis_jobs SET lease_expires_at = ?, heartbeat_at = ?
+                      WHERE id IN ({placeholders}) AND lease_owner = ? AND status = ?''',
+                  [utc_now(LEASE_SECONDS), utc_now()] + list(job_ids) + [owner, STATUS_RUNNING])
+        conn.commit()
+        return c.rowcount
+    finally:
+        conn.close()
+
+
+def release_leases(owner, job_ids):
+    """Encerramento do worker: jobs em andamento voltam para a fila imediatamente"""
+    if not job_ids:
+        return 0
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        placeholders = ','.join('?' * len(job_ids))
+        c.execute(f'''UPDATE analysis_jobs
+                      SET status = ?, attempts = attempts - 1, run_after = ?, lease_owner = NULL,
+                          lease_expires_at = NULL
+                      WHERE id IN ({placeholders}) AND lease_owner = ? AND status = ?''',
+                  [STATUS_QUEUED, utc_now()] + list(job_ids) + [owner, STATUS_RUNNING])
+        conn.commit()
+        return c.rowcount
+    finally:
+        conn.close()
+
+
+def complete(job, owner, result=None):
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute('''UPDATE analysis_jobs
+                     SET status = ?, finished_at = ?, lease_owner = NULL, lease_expires_at = NULL,
+                         result = ?
+                     WHERE id = ? AND lease_owner = ?''',
+                  (STATUS_SUCCEEDED, utc_now(), json.dumps(result) if result is not None else None,
+                   job.id, owner))
+        conn.commit()
+        return c.rowcount == 1
+    finally:
+        conn.close()
+
+
+def fail(job, owner, error, permanent=False):
+    """Registra a falha; retorna True se o job esgotou as tentativas"""
+    final = permanent or job.attempts >= job.max_attempts
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        if final:
+            c.execute('''UPDATE analysis_jobs
+                         SET status = ?, finished_at = ?, last_error = ?, lease_owner = NULL,
+                             lease_expires_at = NULL
+                         WHERE id = ? AND lease_owner = ?''',
+                      (STATUS_FAILED, utc_now(), error[:2000], job.id, owner))
+        else:
+            c.execute('''UPDATE analysis_jobs
+                         SET status = ?, run_after = ?, last_error = ?, lease_owner = NULL,
+                             lease_expires_at = NULL
+                         WHERE id = ? AND lease_owner = ?''',
+                      (STATUS_QUEUED, utc_now(retry_delay(job.attempts)), error[:2000], job.id, owner))
+        conn.commit()
+    finally:
+        conn.close()
+    return final
+
+
+# ==================== CONSULTA ====================
+
+def _public_job(job, position=None):
+    data = job._asdict()
+    data.pop('payload')
+    data.pop('lease_owner')
+    if position is not None:
+        data['queue_position'] = position
+    return data
+
+
+def _queue_position(c, job):
+    c.execute('''SELECT COUNT(*) FROM analysis_jobs
+                 WHERE status = ? AND (priority > ? OR (priority = ? AND id < ?))''',
+              (STATUS_QUEUED, job.priority, job.priority, job.id))
+    return c.fetchone()[0] + 1
+
+
+def get_job_status(job_id):
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute(f'SELECT {_JOB_COLUMNS} FROM analysis_jobs WHERE id = ?', (job_id,))
+        job = _row_to_job(c.fetchone())
+        if job is None:
+            return None
+        position = _queue_position(c, job) if job.status == STATUS_QUEUED else None
+        return _public_job(job, position)
+    finally:
+        conn.close()
+
+
+def get_document_job_status(document_id):
+    """Último job do documento"""
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute(f'''SELECT {_JOB_COLUMNS} FROM analysis_jobs
+                      WHERE document_id = ? ORDER BY id DESC LIMIT 1''', (document_id,))
+        job = _row_to_job(c.fetchone())
+        if job is None:
+            return None
+        position = _queue_position(c, job) if job.status == STATUS_QUEUED else None
+        return _public_job(job, position)
+    finally:
+        conn.close()
+
+
+def list_run_jobs(conn, run_id):
+    """Jobs de uma execução (com o resultado gravado pelo handler)"""
+    c = conn.cursor()
+    c.execute(f'SELECT {_JOB_COLUMNS} FROM analysis_jobs WHERE run_id = ? ORDER BY id', (run_id,))
+    return [_row_to_job(row) for row in c.fetchall()]
+
+
+def list_process_jobs(process_id):
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute(f'''SELECT {_JOB_COLUMNS} FROM analysis_jobs
+                      WHERE process_id = ? ORDER BY id DESC''', (process_id,))
+        return [_public_job(_row_to_job(row)) for row in c.fetchall()]
+    finally:
+        conn.close()
+
+
+def has_active_job(conn, document_id):
+    c = conn.cursor()
+    c.execute('''SELECT 1 FROM analysis_jobs WHERE document_id = ? AND status IN (?, ?) LIMIT 1''',
+              (document_id,) + ACTIVE_STATUSES)
+    return c.fetchone() is not None
+
+
+# ==================== POOL DE WORKERS ====================
+
+class WorkerPool:
+    """Número fixo de threads consumindo a fila; inicia sob demanda e reinicia após fork"""
+
+    def __init__(self, size=WORKER_COUNT):
+        self.size = size
+        self.owner = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._halt = threading.Event()
+        self._threads = []
+        self._heartbeat = None
+        self._active = {}
+
+    @property
+    def running(self):
+        return self._pid == os.getpid() and any(t.is_alive() for t in self._threads)
+
+    def start(self):
+        if self.size <= 0 or self.running:
+            return
+        with self._lock:
+            if self.running:
+                return
+            self._pid = os.getpid()
+            self.owner = f'{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}'
+            self._stop = threading.Event()
+            self._halt = threading.Event()
+            self._wake = threading.Event()
+            self._active = {}
+            self.recover()
+            self._threads = [
+                threading.Thread(target=self._worker_loop, name=f'analysis-worker-{i + 1}', daemon=True)
+                for i in range(self.size)
+            ]
+            # Heartbeat separado: continua renovando os leases durante o drain
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='analysis-heartbeat', daemon=True)
+            for thread in self._threads + [self._heartbeat]:
+                thread.start()
+            print(f"⚙️  Fila de análises: {self.size} worker(s) iniciados ({self.owner})")
+
+    def recover(self):
+        """Leases vencidos voltam para a fila; cada tipo de job recupera o que ficou pendente"""
+        conn = get_db_connection()
+        try:
+            requeued = requeue_expired_leases(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        if requeued:
+            print(f"♻️  {requeued} job(s) com lease expirado reenfileirados")
+        for job_type, (_, _, recover, _) in _handlers.items():
+            if recover is not None:
+                try:
+                    recover()
+                except Exception as e:
+                    print(f"⚠️  Erro na recuperação de jobs '{job_type}': {e}")
+
+    def wake(self):
+        # Pool iniciado antes do fork (gunicorn --preload) sobe de novo no processo filho
+        if self.size > 0 and self._pid is not None and not self.running:
+            self.start()
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        """Para de reservar jobs e espera os em andamento terminarem"""
+        self._stop.set()
+        self._wake.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        drained = not any(t.is_alive() for t in self._threads)
+        if drained:
+            self._halt.set()
+        return drained
+
+    def release_active(self):
+        """Devolve à fila os jobs que não terminaram no drain (sem contar a tentativa)"""
+        job_ids = self.active_jobs()
+        self._halt.set()
+        return release_leases(self.owner, job_ids)
+
+    def active_jobs(self):
+        return list(self._active)
+
+    def _worker_loop(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    job = claim_next(self.owner)
+                except Exception as e:
+                    print(f"⚠️  Erro ao reservar job de análise: {e}")
+                    job = None
+                if job is None:
+                    self._wake.wait(POLL_SECONDS)
+                    self._wake.clear()
+                    continue
+                self._active[job.id] = job
+                try:
+                    self._run(job)
+                finally:
+                    self._active.pop(job.id, None)
+        finally:
+            release_thread_connection()
+
+    def _run(self, job):
+        handler, on_failure, _, on_success = _handlers.get(job.job_type, (None, None, None, None))
+        try:
+            if handler is None:
+                raise RuntimeError(f"Tipo de job desconhecido: {job.job_type}")
+            result = handler(job)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            permanent = isinstance(e, PermanentJobError)
+            print(f"❌ Job #{job.id} ({job.job_type}) falhou na tentativa {job.attempts}/{job.max_attempts}: {error}")
+            if not permanent:
+                traceback.print_exc()
+            try:
+                final = fail(job, self.owner, error + '\n' + traceback.format_exc()[-1500:], permanent)
+                if final and on_failure is not None:
+                    on_failure(job, error)
+            except Exception as fail_error:
+                print(f"⚠️  Erro ao registrar falha do job #{job.id}: {fail_error}")
+            return
+        if not complete(job, self.owner, result):
+            print(f"⚠️  Job #{job.id} concluído, mas o lease já pertence a outro worker")
+            return
+        if on_success is not None:
+            try:
+                on_success(job, result)
+            except Exception as e:
+                print(f"⚠️  Erro após a conclusão do job #{job.id}: {e}")
+
+    def _heartbeat_loop(self):
+        try:
+            while not self._halt.wait(HEARTBEAT_SECONDS):
+                try:
+                    renew_leases(self.owner, self.active_jobs())
+                except Exception as e:
+                    print(f"⚠️  Erro no heartbeat dos jobs de análise: {e}")
+        finally:
+            release_thread_connection()
+
+
+worker_pool = WorkerPool()
@@ -0,0 +1,277 @@
+"""
+Pipeline de Análise de Documentos (handler da fila analysis_jobs)
+Mesmo fluxo que rodava na thread do upload: análise de conteúdo rigorosa,
+validação TCEES (se o documento exige assinatura), veredito, resultado
+estruturado e indexação para a busca.
+
+Exceções sobem para o worker, que reagenda com backoff; esgotadas as tentativas
+o documento sai de 'analyzing' e vai para 'pending' (revisão manual).
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+import ai_usage
+import analysis_cache
+import analysis_jobs
+import analysis_store
+import document_extract
+import search_index
+from ai_analyzer_rigorous import analyze_document_rigorous
+from database import get_db_connection
+
+# Validador TCEES (opcional - requer Selenium/Chrome)
+try:
+    from tcees_validator import validate_pdf_with_tcees
+except ImportError:
+    def validate_pdf_with_tcees(*args, **kwargs):
+        return {'success': False, 'error': 'TCEES não disponível neste ambiente'}
+
+JOB_TYPE = 'document_analysis'
+UPLOAD_FOLDER = 'uploads'
+
+
+def enqueue_document_analysis(conn, doc_id, process_id, document_type, document_name, filepath,
+                              requires_signature, institution_name, institution_cnpj, uploaded_at,
+                              priority=analysis_jobs.PRIORITY_NORMAL):
+    """Enfileira a análise na transação do upload (documento e job gravados juntos)"""
+    payload = {
+        'document_type': document_type,
+        'document_name': document_name,
+        'filepath': filepath,
+        'requires_signature': requires_signature,
+        'institution_name': institution_name,
+        'institution_cnpj': institution_cnpj,
+        'uploaded_at': uploaded_at
+    }
+    return analysis_jobs.enqueue(JOB_TYPE, payload, document_id=doc_id, process_id=process_id,
+                                 priority=priority, conn=conn)
+
+
+def run_document_analysis(job):
+    doc_id = job.document_id
+    process_id = job.process_id
+    payload = job.payload
+    document_type = payload['document_type']
+    document_name = payload['document_name']
+    filepath = payload['filepath']
+    requires_signature = payload.get('requires_signature', False)
+    institution_name = payload.get('institution_name')
+    institution_cnpj = payload.get('institution_cnpj')
+
+    print(f"🤖 [JOB #{job.id}] Iniciando análise IA para documento #{doc_id} (tentativa {job.attempts}/{job.max_attempts})...")
+    print(f"   Tipo: {document_type} | Arquivo: {document_name}")
+    print(f"   Instituição: {institution_name} | CNPJ: {institution_cnpj}")
+
+    if not os.path.exists(filepath):
+        # Arquivo removido: repetir não adianta, o documento vai direto para revisão manual
+        raise analysis_jobs.PermanentJobError(f'Arquivo do documento não encontrado: {filepath}')
+
+    # Analisadores leem só o começo dos PDFs (read_pdf_text); o texto completo
+    # é extraído depois do veredito, para a busca
+    analysis_started = time.perf_counter()
+
+    # Mesmo arquivo + tipo + instituição já analisado: reaproveita o resultado
+    file_sha = document_extract.file_sha256(filepath)
+    cache_key = analysis_cache.make_key(file_sha, document_type, institution_name, institution_cnpj)
+    conn = get_db_connection()
+    try:
+        ai_result = analysis_cache.lookup(conn, cache_key)
+        conn.commit()
+    finally:
+        conn.close()
+    from_cache = ai_result is not None
+
+    # ANÁLISE DE IA RIGOROSA
+    if from_cache:
+        print(f"⚡ [JOB #{job.id}] Resultado reaproveitado do cache (sha256 {file_sha[:12]}...)")
+    else:
+        # Tokens e custo das chamadas de IA ficam registrados para este processo/documento
+        with ai_usage.attribute(process_id, doc_id, job.id):
+            ai_result = analyze_document_rigorous(
+                filepath,
+                document_type,
+                document_name,
+                institution_name,
+                institution_cnpj
+            )
+
+    latency_ms = int((time.perf_counter() - analysis_started) * 1000)
+
+    print(f"📊 [JOB #{job.id}] Resultado da análise IA:")
+    print(f"   Score: {ai_result.get('score', 0)}/100")
+    print(f"   Válido: {ai_result.get('is_valid', False)}")
+    print(f"   Issues: {ai_result.get('issues', [])}")
+
+    # Preparar dados da análise
+    analysis_data = {
+        'status': 'analyzed',
+        'analyzed_at': datetime.now().isoformat(),
+        'uploaded_at': payload.get('uploaded_at'),
+        'requires_signature': requires_signature,
+        'ai_content_analysis': ai_result,
+        'from_cache': from_cache,
+        'signature_validated': False
+    }
+
+    # Determinar status baseado na análise
+    content_ok = ai_result.get('is_valid', False)
+
+    # ========== VALIDAÇÃO TCEES (SE REQUER ASSINATURA) ==========
+    tcees_result = None
+    if requires_signature:
+        print(f"🔐 [JOB #{job.id}] Documento requer assinatura - validando com TCEES...")
+        try:
+            tcees_result = validate_pdf_with_tcees(filepath)
+            analysis_data['tcees_validation'] = tcees_result
+
+            # Verificar se passou na validação TCEES
+            tcees_passed = (
+                tcees_result.get('assinado', False) and
+                tcees_result.get('autenticidade_ok', False) and
+                tcees_result.get('integridade_ok', False) and
+                tcees_result.get('resultado_final', '') == 'VALIDADO'
+            )
+
+            analysis_data['signature_validated'] = True
+            analysis_data['tcees_passed'] = tcees_passed
+
+            print(f"📋 [JOB #{job.id}] TCEES Result: {tcees_result.get('resultado_final', 'N/A')}")
+            print(f"   Assinado: {tcees_result.get('assinado', False)}")
+            print(f"   Autenticidade: {tcees_result.get('autenticidade_ok', False)}")
+            print(f"   Integridade: {tcees_result.get('integridade_ok', False)}")
+            print(f"   Pontuação: {tcees_result.get('pontuacao', 0)}/100")
+
+        except Exception as tcees_error:
+            print(f"⚠️ [JOB #{job.id}] Erro na validação TCEES: {str(tcees_error)}")
+            analysis_data['tcees_validation'] = {
+                'resultado_final': 'ERRO',
+                'erros': [f'Erro ao validar assinatura: {str(tcees_error)[:200]}']
+            }
+            analysis_data['signature_validated'] = True
+            analysis_data['tcees_passed'] = False
+            tcees_result = analysis_data['tcees_validation']
+
+    # Determinar status final
+    if not content_ok:
+        final_status = 'rejected'
+        analysis_data['rejection_summary'] = ' | '.join(ai_result.get('issues', ['Documento reprovado']))
+    elif requires_signature:
+        # Se requer assinatura, verificar resultado TCEES
+        if tcees_result and analysis_data.get('tcees_passed', False):
+            final_status = 'approved'
+            analysis_data['approval_summary'] = 'Documento aprovado - Conteúdo e assinatura digital válidos'
+        else:
+            final_status = 'rejected'
+            tcees_msg = tcees_result.get('resultado_final', 'N/A') if tcees_result else 'Não validado'
+            analysis_data['rejection_summary'] = f'Assinatura digital: {tcees_msg}'
+    else:
+        final_status = 'approved'
+        analysis_data['approval_summary'] = 'Documento aprovado'
+
+    analysis_data['final_verdict'] = final_status
+    analysis_data['content_ok'] = content_ok
+
+    print(f"💾 [JOB #{job.id}] Atualizando banco de dados...")
+    print(f"   Status final: {final_status}")
+
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        # Atualizar documento (JSON completo só como arquivo opcional)
+        c.execute('''UPDATE documents
+                     SET status = ?, analysis_data = ?
+                     WHERE id = ?''',
+                  (final_status, analysis_store.archive_payload(analysis_data), doc_id))
+        if c.rowcount == 0:
+            # Documento excluído enquanto estava na fila
+            conn.rollback()
+            print(f"⚠️ [JOB #{job.id}] Documento #{doc_id} não existe mais - resultado descartado")
+            return
+
+        if not from_cache:
+            analysis_cache.store(conn, cache_key, file_sha, document_type, institution_name,
+                                 institution_cnpj, ai_result)
+
+        # Resultado estruturado (document_analysis / document_issue) para relatórios em SQL
+        analysis_store.save_document_analysis(conn, doc_id, process_id, analysis_data,
+                                              latency_ms=latency_ms)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print(f"✅ [JOB #{job.id}] Análise concluída para documento #{doc_id}")
+    print(f"   Score: {ai_result.get('score', 0)}/100 | Status: {final_status}")
+
+    # Indexar o texto do arquivo para a busca (/api/search): única etapa que precisa
+    # do texto completo - extraído fora da transação, com o veredito já gravado
+    try:
+        document_extract.get_extract(filepath)
+        conn = get_db_connection()
+        try:
+            c = conn.cursor()
+            c.execute('SELECT 1 FROM documents WHERE id = ?', (doc_id,))
+            if c.fetchone():
+                search_index.index_document_file(conn, doc_id, process_id, document_name, filepath)
+                conn.commit()
+        finally:
+            conn.close()
+    except Exception as index_error:
+        print(f"⚠️ [JOB #{job.id}] Erro ao indexar documento #{doc_id} para busca: {index_error}")
+
+
+def on_document_analysis_failed(job, error):
+    """Tentativas esgotadas: documento sai de 'analyzing' para revisão manual"""
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute('''UPDATE documents SET status = 'pending'
+                     WHERE id = ? AND status = 'analyzing' ''', (job.document_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"⚠️ [JOB #{job.id}] Documento #{job.document_id} enviado para revisão manual: {error}")
+
+
+def recover_stuck_documents():
+    """Documentos em 'analyzing' sem job ativo (ex.: enviados antes da fila) voltam para a fila"""
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        # Lock de escrita: dois processos iniciando juntos não duplicam os jobs
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('''SELECT d.id, d.process_id, d.type, d.name, d.filename, d.analysis_data,
+                            p.financial_institution_name, p.financial_institution_cnpj
+                     FROM documents d
+                     JOIN processes p ON p.id = d.process_id
+                     WHERE d.status = 'analyzing'
+                       AND NOT EXISTS (SELECT 1 FROM analysis_jobs j
+                                       WHERE j.document_id = d.id AND j.status IN (?, ?))''',
+                  analysis_jobs.ACTIVE_STATUSES)
+        stuck = c.fetchall()
+        for doc_id, process_id, doc_type, name, filename, raw, inst_name, inst_cnpj in stuck:
+            try:
+                initial = json.loads(raw) if raw else {}
+            except (TypeError, ValueError):
+                initial = {}
+            enqueue_document_analysis(conn, doc_id, process_id, doc_type, name,
+                                      os.path.join(UPLOAD_FOLDER, filename),
+                                      bool(initial.get('requires_signature', False)),
+                                      inst_name, inst_cnpj, initial.get('uploaded_at'),
+                                      priority=analysis_jobs.PRIORITY_LOW)
+        conn.commit()
+    finally:
+        conn.close()
+    if stuck:
+        print(f"♻️  {len(stuck)} documento(s) presos em 'analyzing' reenfileirados para análise")
+    return len(stuck)
+
+
+analysis_jobs.register_handler(JOB_TYPE, run_document_analysis,
+                               on_failure=on_document_analysis_failed,
+                               recover=recover_stuck_documents)
@@ -0,0 +1,488 @@
+"""
+Execuções de Análise do Processo (analysis_runs)
+A análise de todos os documentos do processo (POST /api/process/<id>/analyze)
+não roda mais dentro da requisição: a rota cria uma execução e enfileira um job
+por documento na fila analysis_jobs. Os workers analisam os documentos em
+paralelo (até ANALYSIS_RUN_CONCURRENCY por execução), cada resultado vira uma
+mensagem nas comunicações e o último job a terminar fecha a execução com a
+mensagem final e o resumo.
+
+    run_id = start_run(conn, process_id, user_id, documents, institution_name, institution_cnpj)
+    conn.commit()
+    analysis_jobs.worker_pool.wake()
+    get_run_status(run_id)      # feitos / com erro / ETA / resumo
+
+O progresso vem dos próprios jobs (status + resultado gravado pelo handler):
+não há contador para ficar inconsistente se um worker cair no meio.
+
+Reanálise incremental: process_analysis_state guarda, por documento, o SHA-256
+do arquivo, tipo, instituição e ANALYZER_VERSION do último resultado. plan_run
+só manda para a fila o que mudou (documento novo, arquivo trocado, analisador
+atualizado); o parecer do processo é recalculado a partir dos resultados
+guardados de todos os documentos.
+"""
+
+import json
+import os
+from collections import namedtuple
+from datetime import datetime
+
+import ai_usage
+import analysis_cache
+import analysis_jobs
+import document_extract
+from ai_analyzer_rigorous import ANALYZER_VERSION, analyze_document_rigorous
+from database import get_db_connection
+
+JOB_TYPE = 'process_document_analysis'
+UPLOAD_FOLDER = 'uploads'
+# Análise interativa: uma nova tentativa só (o usuário está acompanhando o progresso)
+RUN_MAX_ATTEMPTS = int(os.getenv('ANALYSIS_RUN_MAX_ATTEMPTS', '2'))
+
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+
+VERDICT_APPROVED = 'approved'
+VERDICT_REJECTED = 'rejected'
+VERDICT_INCOMPLETE = 'incomplete'
+VERDICT_LABELS = {VERDICT_APPROVED: '✅ APROVADO', VERDICT_REJECTED: '❌ REPROVADO',
+                  VERDICT_INCOMPLETE: '⚠️ INCOMPLETO'}
+
+_RUN_COLUMNS = '''id, process_id, user_id, status, total_documents, summary, created_at, finished_at,
+                  reused_documents'''
+
+# changed: documentos que vão para a fila; unchanged: mantêm o último resultado;
+# fresh: quantos dos alterados também não estão no cache (vão gastar IA)
+RunPlan = namedtuple('RunPlan', ['changed', 'unchanged', 'fresh'])
+
+
+def _parse_timestamp(value):
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S') if value else None
+
+
+def _add_communication(c, process_id, user_id, message):
+    # Processo excluído durante a execução: a mensagem é descartada
+    c.execute('''INSERT INTO communications
+                 (process_id, sender_id, sender_role, message, message_type, is_internal)
+                 SELECT ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM processes WHERE id = ?)''',
+              (process_id, user_id, 'rpps', message, 'system', 0, process_id))
+
+
+# ==================== CRIAÇÃO ====================
+
+def active_run_id(conn, process_id):
+    """Execução ainda em andamento do processo (ou None)"""
+    c = conn.cursor()
+    c.execute('''SELECT id FROM analysis_runs WHERE process_id = ? AND status = ?
+                 ORDER BY id DESC LIMIT 1''', (process_id, STATUS_RUNNING))
+    row = c.fetchone()
+    return row[0] if row else None
+
+
+def plan_run(conn, process_id, documents, institution_name, institution_cnpj, full=False):
+    """
+    Separa os documentos [(id, filename, type, name), ...] entre os que precisam de
+    análise e os que continuam iguais à última análise do processo (mesmo arquivo,
+    tipo, instituição e versão do analisador). full=True reanalisa todos.
+    """
+    institution = analysis_cache.institution_key(institution_name, institution_cnpj)
+    c = conn.cursor()
+    c.execute('''SELECT document_id, file_sha256, document_type, institution_key, analyzer_version
+                 FROM process_analysis_state WHERE process_id = ?''', (process_id,))
+    stored = {row[0]: tuple(row[1:]) for row in c.fetchall()}
+
+    changed, unchanged, fresh = [], [], 0
+    for document in documents:
+        doc_id, filename, doc_type, _ = document
+        path = os.path.join(UPLOAD_FOLDER, filename)
+        if not os.path.exists(path):
+            # Vai para a fila mesmo assim: o job registra o arquivo ausente
+            changed.append(document)
+            continue
+        file_sha = document_extract.file_sha256(path)
+        if not full and stored.get(doc_id) == (file_sha, doc_type, institution, ANALYZER_VERSION):
+            unchanged.append(document)
+            continue
+        changed.append(document)
+        cache_key = analysis_cache.make_key(file_sha, doc_type, institution_name, institution_cnpj)
+        if not analysis_cache.is_cached(conn, cache_key):
+            fresh += 1
+    return RunPlan(changed, unchanged, fresh)
+
+
+def start_run(conn, process_id, user_id, documents, institution_name, institution_cnpj, reused=0):
+    """
+    Cria a execução e enfileira um job por documento [(id, filename, type, name), ...]
+    na transação do chamador. Depois do commit, chamar worker_pool.wake() - ou
+    finish_run_if_done(run_id), se nenhum documento precisou de análise.
+    """
+    c = conn.cursor()
+    c.execute('''INSERT INTO analysis_runs
+                 (process_id, user_id, status, total_documents, reused_documents, created_at)
+                 VALUES (?, ?, ?, ?, ?, ?)''',
+              (process_id, user_id, STATUS_RUNNING, len(documents), reused, analysis_jobs.utc_now()))
+    run_id = c.lastrowid
+    for doc_id, filename, doc_type, doc_name in documents:
+        payload = {
+            'user_id': user_id,
+            'document_type': doc_type,
+            'document_name': doc_name,
+            'filepath': os.path.join(UPLOAD_FOLDER, filename),
+            'institution_name': institution_name,
+            'institution_cnpj': institution_cnpj
+        }
+        analysis_jobs.enqueue(JOB_TYPE, payload, document_id=doc_id, process_id=process_id,
+                              max_attempts=RUN_MAX_ATTEMPTS, conn=conn, run_id=run_id)
+    return run_id
+
+
+# ==================== HANDLER ====================
+
+def format_analysis_message(doc_name, doc_type, result, from_cache):
+    """Mensagem das comunicações com o resultado de um documento"""
+    if not isinstance(result, dict):
+        # Resultado em texto simples
+        return f"\n📄 **{doc_name}**\n\n{result}"
+
+    is_valid = result.get('is_valid', False)
+    score = result.get('score', 0)
+    issues = result.get('issues', [])
+    warnings = result.get('warnings', [])
+    details = result.get('details', {})
+
+    status_icon = "✅" if is_valid else "❌"
+    message_parts = [
+        f"\n{'='*50}",
+        f"{status_icon} **ANÁLISE: {doc_name}**",
+        f"{'='*50}",
+        f"\n📊 **Score:** {score}/100",
+        f"📋 **Tipo:** {doc_type}",
+        f"🔍 **Status:** {'APROVADO' if is_valid else 'REPROVADO'}",
+    ]
+    if from_cache:
+        message_parts.append("⚡ Resultado reaproveitado de análise anterior do mesmo arquivo")
+
+    # Detalhes da IA
+    if details.get('ai_powered'):
+        message_parts.append(f"\n🤖 **Análise com IA:** {details.get('provider', 'Gemini')}")
+        message_parts.append(f"   Confiança: {int(details.get('confidence', 0) * 100)}%")
+        if details.get('summary'):
+            message_parts.append(f"\n📝 **Resumo:** {details['summary']}")
+
+    # Problemas encontrados
+    if issues:
+        message_parts.append(f"\n❌ **Problemas Encontrados:**")
+        for issue in issues:
+            message_parts.append(f"   • {issue}")
+
+    # Avisos
+    if warnings:
+        message_parts.append(f"\n⚠️ **Avisos:**")
+        for warning in warnings:
+            message_parts.append(f"   • {warning}")
+
+    # Se aprovado, mostrar pontos positivos
+    if is_valid and not issues:
+        message_parts.append(f"\n✅ **Pontos Positivos:**")
+        message_parts.append(f"   • Documento em conformidade")
+        message_parts.append(f"   • Tipo correto identificado")
+        message_parts.append(f"   • Conteúdo adequado para credenciamento")
+
+    message_parts.append(f"\n{'='*50}\n")
+    return "\n".join(message_parts)
+
+
+def run_process_document(job):
+    """Analisa um documento da execução e publica o resultado nas comunicações"""
+    payload = job.payload
+    doc_name = payload['document_name']
+    doc_type = payload['document_type']
+    filepath = payload['filepath']
+    institution_name = payload.get('institution_name')
+    institution_cnpj = payload.get('institution_cnpj')
+
+    print(f"📄 [RUN #{job.run_id} / JOB #{job.id}] Analisando documento: {doc_name} ({doc_type})")
+    if not os.path.exists(filepath):
+        raise analysis_jobs.PermanentJobError(f"Documento '{doc_name}' não encontrado no servidor")
+
+    # Mesmo arquivo + tipo + instituição já analisado: reaproveita o resultado
+    file_sha = document_extract.file_sha256(filepath)
+    cache_key = analysis_cache.make_key(file_sha, doc_type, institution_name, institution_cnpj)
+    conn = get_db_connection()
+    try:
+        result = analysis_cache.lookup(conn, cache_key)
+        conn.commit()
+    finally:
+        conn.close()
+    from_cache = result is not None
+    if not from_cache:
+        with ai_usage.attribute(job.process_id, job.document_id, job.id):
+            result = analyze_document_rigorous(filepath, doc_type, doc_name, institution_name, institution_cnpj)
+
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        if not from_cache:
+            analysis_cache.store(conn, cache_key, file_sha, doc_type, institution_name, institution_cnpj, result)
+        save_document_state(c, job, file_sha, result)
+        _add_communication(c, job.process_id, payload.get('user_id'),
+                           format_analysis_message(doc_name, doc_type, result, from_cache))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print(f"   ✅ [RUN #{job.run_id}] {doc_name} analisado{' (cache)' if from_cache else ''}")
+    if not isinstance(result, dict):
+        return {'from_cache': from_cache}
+    return {'score': result.get('score', 0), 'is_valid': bool(result.get('is_valid', False)),
+            'from_cache': from_cache}
+
+
+def save_document_state(c, job, file_sha, result):
+    """Último resultado do documento (base da próxima reanálise e do parecer do processo)"""
+    payload = job.payload
+    details = result if isinstance(result, dict) else {}
+    score = details.get('score')
+    c.execute('''INSERT INTO process_analysis_state
+                 (document_id, process_id, file_sha256, document_type, institution_key, analyzer_version,
+                  score, is_valid, issue_count, run_id, analyzed_at)
+                 SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM documents WHERE id = ?)
+                 ON CONFLICT (document_id) DO UPDATE SET
+                     file_sha256 = excluded.file_sha256, document_type = excluded.document_type,
+                     institution_key = excluded.institution_key, analyzer_version = excluded.analyzer_version,
+                     score = excluded.score, is_valid = excluded.is_valid, issue_count = excluded.issue_count,
+                     run_id = excluded.run_id, analyzed_at = excluded.analyzed_at''',
+              (job.document_id, job.process_id, file_sha, payload['document_type'],
+               analysis_cache.institution_key(payload.get('institution_name'), payload.get('institution_cnpj')),
+               ANALYZER_VERSION, int(score) if isinstance(score, (int, float)) else None,
+               (1 if details['is_valid'] else 0) if 'is_valid' in details else None,
+               len(details.get('issues') or []), job.run_id, analysis_jobs.utc_now(), job.document_id))
+
+
+def on_process_document_done(job, result):
+    finish_run_if_done(job.run_id)
+
+
+def on_process_document_failed(job, error):
+    """Tentativas esgotadas: registra o erro nas comunicações e tenta fechar a execução"""
+    # Falha permanente já traz a mensagem pronta (ex.: arquivo não encontrado)
+    reason = error.split(': ', 1)[1] if error.startswith(analysis_jobs.PermanentJobError.__name__ + ': ') else error
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        # Resultado anterior não vale mais (o documento mudou): fica pendente no parecer
+        c.execute('DELETE FROM process_analysis_state WHERE document_id = ?', (job.document_id,))
+        _add_communication(c, job.process_id, job.payload.get('user_id'),
+                           f"❌ Erro ao analisar '{job.payload.get('document_name')}': {reason}")
+        conn.commit()
+    finally:
+        conn.close()
+    finish_run_if_done(job.run_id)
+
+
+# ==================== ENCERRAMENTO ====================
+
+def process_verdict(conn, process_id):
+    """Parecer do processo a partir do último resultado guardado de cada documento"""
+    c = conn.cursor()
+    c.execute('''SELECT d.id, s.score, s.is_valid FROM documents d
+                 LEFT JOIN process_analysis_state s ON s.document_id = d.id
+                 WHERE d.process_id = ?''', (process_id,))
+    rows = c.fetchall()
+    approved = sum(1 for _, _, is_valid in rows if is_valid == 1)
+    rejected = sum(1 for _, _, is_valid in rows if is_valid == 0)
+    pending = len(rows) - approved - rejected
+    scores = [score for _, score, _ in rows if score is not None]
+    if rejected:
+        verdict = VERDICT_REJECTED
+    elif pending or not rows:
+        verdict = VERDICT_INCOMPLETE
+    else:
+        verdict = VERDICT_APPROVED
+    return {
+        'verdict': verdict,
+        'documents': len(rows),
+        'approved': approved,
+        'rejected': rejected,
+        'pending': pending,
+        'average_score': round(sum(scores) / len(scores), 1) if scores else None
+    }
+
+
+def _summarize(jobs, created_at, finished_at, reused, verdict):
+    results = [job.result or {} for job in jobs if job.status == analysis_jobs.STATUS_SUCCEEDED]
+    scores = [r['score'] for r in results if isinstance(r.get('score'), (int, float))]
+    started = _parse_timestamp(created_at)
+    finished = _parse_timestamp(finished_at)
+    return {
+        'total': len(jobs),
+        'reused': reused,
+        'analyzed': len(results),
+        'failed': sum(1 for job in jobs if job.status == analysis_jobs.STATUS_FAILED),
+        'approved': sum(1 for r in results if r.get('is_valid')),
+        'rejected': sum(1 for r in results if 'is_valid' in r and not r['is_valid']),
+        'from_cache': sum(1 for r in results if r.get('from_cache')),
+        'average_score': round(sum(scores) / len(scores), 1) if scores else None,
+        'duration_seconds': int((finished - started).total_seconds()) if started and finished else None,
+        'process': verdict
+    }
+
+
+def finish_run_if_done(run_id):
+    """Sem jobs pendentes: fecha a execução (uma única vez) e publica a mensagem final"""
+    if run_id is None:
+        return False
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute(f'SELECT {_RUN_COLUMNS} FROM analysis_runs WHERE id = ?', (run_id,))
+        run = c.fetchone()
+        if run is None or run[3] != STATUS_RUNNING:
+            return False
+        jobs = analysis_jobs.list_run_jobs(conn, run_id)
+        if any(job.status in analysis_jobs.ACTIVE_STATUSES for job in jobs):
+            return False
+
+        finished_at = analysis_jobs.utc_now()
+        summary = _summarize(jobs, run[6], finished_at, run[8], process_verdict(conn, run[1]))
+        # Dois workers terminando juntos: só o UPDATE condicional de um deles vale
+        c.execute('''UPDATE analysis_runs SET status = ?, finished_at = ?, summary = ?
+                     WHERE id = ? AND status = ?''',
+                  (STATUS_COMPLETED, finished_at, json.dumps(summary), run_id, STATUS_RUNNING))
+        if c.rowcount != 1:
+            conn.rollback()
+            return False
+        _add_communication(c, run[1], run[2], _final_message(summary))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    print(f"\n{'='*60}")
+    print(f"✅ ANÁLISE COMPLETA! Execução #{run_id} - Processo {run[1]}")
+    print(f"   Documentos analisados: {summary['analyzed']}/{summary['total']} "
+          f"({summary['failed']} com erro, {summary['from_cache']} do cache, {summary['reused']} sem alteração) "
+          f"em {summary['duration_seconds']}s")
+    print(f"   Parecer do processo: {summary['process']['verdict']}")
+    print(f"{'='*60}\n")
+    return True
+
+
+def _final_message(summary):
+    verdict = summary['process']
+    if summary['total']:
+        lines = [f"\n🎉 **Análise concluída!** {summary['analyzed']}/{summary['total']} documentos analisados com sucesso."]
+    else:
+        lines = ["\n🎉 **Análise concluída!** Nenhum documento novo ou alterado desde a última análise."]
+    if summary['reused']:
+        lines.append(f"♻️ {summary['reused']} documento(s) sem alteração desde a última análise (resultado mantido).")
+    lines.append(f"📋 **Parecer do processo:** {VERDICT_LABELS[verdict['verdict']]} - "
+                 f"{verdict['approved']} aprovado(s), {verdict['rejected']} reprovado(s), "
+                 f"{verdict['pending']} pendente(s)")
+    return "\n".join(lines)
+
+
+def recover_finished_runs():
+    """Execuções cujos jobs terminaram sem fechar a execução (worker caiu entre os dois passos)"""
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute('''SELECT r.id FROM analysis_runs r
+                     WHERE r.status = ?
+                       AND NOT EXISTS (SELECT 1 FROM analysis_jobs j
+                                       WHERE j.run_id = r.id AND j.status IN (?, ?))''',
+                  (STATUS_RUNNING,) + analysis_jobs.ACTIVE_STATUSES)
+        run_ids = [row[0] for row in c.fetchall()]
+    finally:
+        conn.close()
+    closed = sum(1 for run_id in run_ids if finish_run_if_done(run_id))
+    if closed:
+        print(f"♻️  {closed} execução(ões) de análise concluída(s) na recuperação")
+    return closed
+
+
+# ==================== CONSULTA ====================
+
+def _document_status(job):
+    error = None
+    if job.last_error and job.status != analysis_jobs.STATUS_SUCCEEDED:
+        error = job.last_error.split('\n', 1)[0]
+    return {
+        'document_id': job.document_id,
+        'name': job.payload.get('document_name'),
+        'status': job.status,
+        'attempts': job.attempts,
+        'result': job.result,
+        'error': error
+    }
+
+
+def _run_status(conn, run):
+    run_id, process_id, user_id, status, total, summary, created_at, finished_at, reused = run
+    jobs = analysis_jobs.list_run_jobs(conn, run_id)
+    counts = {state: 0 for state in (analysis_jobs.STATUS_QUEUED, analysis_jobs.STATUS_RUNNING,
+                                     analysis_jobs.STATUS_SUCCEEDED, analysis_jobs.STATUS_FAILED)}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    finished = counts[analysis_jobs.STATUS_SUCCEEDED] + counts[analysis_jobs.STATUS_FAILED]
+
+    # ETA pela vazão da própria execução (já reflete quantos documentos rodam em paralelo)
+    started = _parse_timestamp(created_at)
+    ended = _parse_timestamp(finished_at) or _parse_timestamp(analysis_jobs.utc_now())
+    elapsed = max(0, int((ended - started).total_seconds()))
+    eta = None
+    if status == STATUS_RUNNING and finished:
+        eta = int(elapsed / finished * (len(jobs) - finished))
+
+    return {
+        'run_id': run_id,
+        'process_id': process_id,
+        'status': status,
+        'total': total,
+        'done': counts[analysis_jobs.STATUS_SUCCEEDED],
+        'failed': counts[analysis_jobs.STATUS_FAILED],
+        'running': counts[analysis_jobs.STATUS_RUNNING],
+        'queued': counts[analysis_jobs.STATUS_QUEUED],
+        'reused': reused,
+        'percent': round(100 * finished / total) if total else 100,
+        'elapsed_seconds': elapsed,
+        'eta_seconds': eta,
+        'created_at': created_at,
+        'finished_at': finished_at,
+        'summary': json.loads(summary) if summary else None,
+        'documents': [_document_status(job) for job in jobs]
+    }
+
+
+def get_run_status(run_id):
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute(f'SELECT {_RUN_COLUMNS} FROM analysis_runs WHERE id = ?', (run_id,))
+        run = c.fetchone()
+        return _run_status(conn, run) if run else None
+    finally:
+        conn.close()
+
+
+def get_latest_process_run(process_id):
+    conn = get_db_connection()
+    try:
+        c = conn.cursor()
+        c.execute(f'''SELECT {_RUN_COLUMNS} FROM analysis_runs
+                      WHERE process_id = ? ORDER BY id DESC LIMIT 1''', (process_id,))
+        run = c.fetchone()
+        return _run_status(conn, run) if run else None
+    finally:
+        conn.close()
+
+
+analysis_jobs.register_handler(JOB_TYPE, run_process_document,
+                               on_failure=on_process_document_failed,
+                               recover=recover_finished_runs,
+                               on_success=on_process_document_done)
@@ -0,0 +1,145 @@
+"""
+Resultados de Análise Estruturados
+Grava o resultado da análise de cada documento em tabelas consultáveis por SQL:
+
+    document_analysis  - uma linha por documento (score, validade, TCEES, veredito, provedor, latência)
+    document_issue     - problemas (issue) e alertas (warning) apontados, um por linha
+
+documents.analysis_data continua existindo como arquivo opcional do JSON completo
+(ANALYSIS_ARCHIVE_JSON=false desliga a gravação).
+"""
+
+import json
+import os
+
+ARCHIVE_ANALYSIS_JSON = os.getenv('ANALYSIS_ARCHIVE_JSON', 'true').lower() != 'false'
+
+SEVERITY_ISSUE = 'issue'
+SEVERITY_WARNING = 'warning'
+
+# Provedor registrado quando o resultado vem das regras locais (sem IA externa)
+DEFAULT_PROVIDER = 'analisador_rigoroso'
+
+_ANALYSIS_COLUMNS = (
+    'process_id', 'score', 'is_valid', 'content_ok', 'tcees_passed', 'signature_validated',
+    'signature_valid', 'final_verdict', 'summary', 'completeness', 'completeness_comment',
+    'coherence', 'coherence_comment', 'institution_mentioned', 'institution_comment',
+    'issue_count', 'warning_count', 'analyzed_at', 'provider', 'latency_ms'
+)
+
+
+def _flag(value):
+    """bool/None -> 1/0/None (colunas INTEGER)"""
+    if value is None:
+        return None
+    return 1 if value else 0
+
+
+def _number(value):
+    """Scores como inteiro (0-100); valores inválidos viram NULL"""
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError):
+        return None
+
+
+def _text_list(values):
+    if not isinstance(values, (list, tuple)):
+        return [str(values)] if values else []
+    return [str(v) for v in values if v is not None and str(v).strip()]
+
+
+def has_analysis(analysis_data):
+    """Se o JSON já contém o resultado de uma análise (e não só o estado inicial do upload)"""
+    return isinstance(analysis_data, dict) and (
+        'ai_content_analysis' in analysis_data or 'final_verdict' in analysis_data
+    )
+
+
+def build_analysis_record(analysis_data, provider=None, latency_ms=None):
+    """Extrai do dict da análise os campos da tabela document_analysis e a lista de problemas"""
+    ai = analysis_data.get('ai_content_analysis') or {}
+    signature = analysis_data.get('signature_validation') or {}
+    issues = _text_list(ai.get('issues', []))
+    warnings = _text_list(ai.get('warnings', []))
+
+    record = {
+        'score': _number(ai.get('score')),
+        'is_valid': _flag(ai.get('is_valid')) if 'is_valid' in ai else None,
+        'content_ok': _flag(analysis_data.get('content_ok')),
+        'tcees_passed': _flag(analysis_data.get('tcees_passed')),
+        'signature_validated': _flag(analysis_data.get('signature_validated')),
+        'signature_valid': _flag(signature.get('is_valid')) if 'is_valid' in signature else None,
+        'final_verdict': analysis_data.get('final_verdict'),
+        'summary': ai.get('summary'),
+        'completeness': _number(ai.get('completeness')),
+        'completeness_comment': ai.get('completeness_comment'),
+        'coherence': _number(ai.get('coherence')),
+        'coherence_comment': ai.get('coherence_comment'),
+        'institution_mentioned': _flag(ai.get('institution_mentioned')),
+        'institution_comment': ai.get('institution_comment'),
+        'issue_count': len(issues),
+        'warning_count': len(warnings),
+        'analyzed_at': analysis_data.get('analyzed_at'),
+        'provider': provider or ai.get('provider') or DEFAULT_PROVIDER,
+        'latency_ms': latency_ms,
+    }
+    entries = [(SEVERITY_ISSUE, text) for text in issues] + [(SEVERITY_WARNING, text) for text in warnings]
+    return record, entries
+
+
+def save_document_analysis(conn, document_id, process_id, analysis_data, provider=None, latency_ms=None):
+    """Grava/atualiza o resultado estruturado (na transação do chamador)"""
+    record, entries = build_analysis_record(analysis_data, provider, latency_ms)
+    record['process_id'] = process_id
+    c = conn.cursor()
+    columns = ', '.join(_ANALYSIS_COLUMNS)
+    placeholders = ', '.join('?' * len(_ANALYSIS_COLUMNS))
+    updates = ', '.join(f'{col} = excluded.{col}' for col in _ANALYSIS_COLUMNS)
+    c.execute(f'''INSERT INTO document_analysis (document_id, {columns})
+                  VALUES (?, {placeholders})
+                  ON CONFLICT (document_id) DO UPDATE SET {updates}''',
+              [document_id] + [record[col] for col in _ANALYSIS_COLUMNS])
+
+    c.execute('DELETE FROM document_issue WHERE document_id = ?', (document_id,))
+    if entries:
+        c.executemany('''INSERT INTO document_issue (document_id, process_id, severity, position, text)
+                         VALUES (?, ?, ?, ?, ?)''',
+                      [(document_id, process_id, severity, position, text)
+                       for position, (severity, text) in enumerate(entries)])
+
+
+def update_signature_result(conn, document_id, signature_valid, final_verdict):
+    """Atualiza só o resultado da assinatura (validação manual via TCEES)"""
+    c = conn.cursor()
+    c.execute('''UPDATE document_analysis
+                 SET signature_validated = 1, signature_valid = ?, final_verdict = ?
+                 WHERE document_id = ?''', (_flag(signature_valid), final_verdict, document_id))
+
+
+def get_content_ok(conn, document_id):
+    c = conn.cursor()
+    c.execute('SELECT content_ok FROM document_analysis WHERE document_id = ?', (document_id,))
+    row = c.fetchone()
+    return bool(row and row[0])
+
+
+def archive_payload(analysis_data):
+    """Valor da coluna documents.analysis_data (None quando o arquivo JSON está desligado)"""
+    return json.dumps(analysis_data) if ARCHIVE_ANALYSIS_JSON else None
+
+
+def backfill_from_archive(conn):
+    """Popula as tabelas a partir dos JSONs já gravados em documents.analysis_data"""
+    c = conn.cursor()
+    c.execute('SELECT id, process_id, analysis_data FROM documents WHERE analysis_data IS NOT NULL')
+    migrated = 0
+    for document_id, process_id, raw in c.fetchall():
+        try:
+            analysis_data = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+        if has_analysis(analysis_data):
+            save_document_analysis(conn, document_id, process_id, analysis_data)
+            migrated += 1
+    return migrated
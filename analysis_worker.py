@@ -0,0 +1,136 @@
+"""
+Worker de Análises (processo separado do gunicorn)
+Consome a fila analysis_jobs fora dos processos web: PyPDF2, openpyxl, chamadas
+de IA e validação TCEES (Chrome) não disputam CPU/memória com as requisições.
+
+    python -m analysis_worker                          # 1 processo, ANALYSIS_WORKER_THREADS threads
+    python -m analysis_worker --processes 4 --threads 1
+
+O padrão continua sendo o pool de análises dentro do gunicorn (Procfile:
+web: gunicorn app:app). O worker separado é opcional e só funciona quando web e
+worker enxergam o mesmo banco e os mesmos arquivos: no mesmo host, ou em hosts
+diferentes com PostgreSQL (DATABASE_URL) e a pasta uploads/ em armazenamento
+compartilhado. Em plataformas de Procfile cada tipo de processo roda em um
+container próprio, sem disco em comum; para ativar nesse caso:
+
+    web: ANALYSIS_WORKERS=0 gunicorn app:app
+    worker: python -m analysis_worker
+
+Assim web e análise escalam de forma independente.
+
+SIGTERM/SIGINT: para de reservar jobs, espera os que estão em andamento (até
+ANALYSIS_DRAIN_TIMEOUT segundos) e devolve à fila o que não terminou.
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+
+DEFAULT_THREADS = int(os.getenv('ANALYSIS_WORKER_THREADS', '2'))
+DEFAULT_PROCESSES = int(os.getenv('ANALYSIS_WORKER_PROCESSES', '1'))
+DRAIN_TIMEOUT = float(os.getenv('ANALYSIS_DRAIN_TIMEOUT', '300'))
+
+
+def _install_signal_handlers(stop):
+    def handle_signal(signum, frame):
+        if not stop.is_set():
+            print(f"🛑 [{os.getpid()}] Sinal {signal.Signals(signum).name} recebido - encerrando após os jobs em andamento")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+
+def run_worker(threads, drain_timeout=DRAIN_TIMEOUT):
+    """Um processo de análise: pool de threads consumindo a fila até receber SIGTERM/SIGINT"""
+    import analysis_jobs
+    import analysis_pipeline  # noqa: F401 - registra o handler 'document_analysis'
+    import analysis_runs  # noqa: F401 - registra o handler 'process_document_analysis'
+
+    stop = threading.Event()
+    _install_signal_handlers(stop)
+
+    pool = analysis_jobs.worker_pool
+    pool.size = threads
+    pool.start()
+
+    while not stop.wait(1):
+        if not pool.running:
+            print(f"❌ [{os.getpid()}] Threads de análise encerradas inesperadamente")
+            return 1
+
+    print(f"⏳ [{os.getpid()}] Aguardando {len(pool.active_jobs())} job(s) em andamento (até {drain_timeout:.0f}s)...")
+    if pool.stop(drain_timeout):
+        print(f"✅ [{os.getpid()}] Worker encerrado sem jobs pendentes")
+        return 0
+
+    released = pool.release_active()
+    print(f"⚠️  [{os.getpid()}] Tempo de drain esgotado - {released} job(s) devolvidos à fila")
+    return 1
+
+
+def _child_main(threads, drain_timeout):
+    sys.exit(run_worker(threads, drain_timeout))
+
+
+def supervise(processes, threads, drain_timeout=DRAIN_TIMEOUT):
+    """Mantém N processos de análise vivos e repassa o SIGTERM no encerramento"""
+    # spawn: cada processo abre suas próprias conexões (nada herdado do pai)
+    ctx = multiprocessing.get_context('spawn')
+    stop = threading.Event()
+    _install_signal_handlers(stop)
+    children = {}
+
+    def spawn(slot):
+        child = ctx.Process(target=_child_main, args=(threads, drain_timeout),
+                            name=f'analysis-worker-{slot + 1}')
+        child.start()
+        children[slot] = child
+
+    for slot in range(processes):
+        spawn(slot)
+    print(f"⚙️  {processes} processo(s) de análise x {threads} thread(s)")
+
+    while not stop.wait(1):
+        for slot, child in list(children.items()):
+            if not child.is_alive():
+                print(f"⚠️  {child.name} (pid {child.pid}) saiu com código {child.exitcode} - reiniciando")
+                spawn(slot)
+
+    for child in children.values():
+        if child.is_alive():
+            os.kill(child.pid, signal.SIGTERM)
+    exit_code = 0
+    for child in children.values():
+        child.join(drain_timeout + 30)
+        if child.is_alive():
+            print(f"⚠️  {child.name} (pid {child.pid}) não encerrou a tempo - finalizando")
+            child.kill()
+            child.join()
+        exit_code = exit_code or (child.exitcode or 0)
+    return exit_code
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Worker da fila de análises de documentos')
+    parser.add_argument('--processes', type=int, default=DEFAULT_PROCESSES,
+                        help='processos de análise (padrão: ANALYSIS_WORKER_PROCESSES ou 1)')
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help='threads por processo (padrão: ANALYSIS_WORKER_THREADS ou 2)')
+    parser.add_argument('--drain-timeout', type=float, default=DRAIN_TIMEOUT,
+                        help='segundos de espera pelos jobs em andamento no encerramento')
+    args = parser.parse_args(argv)
+
+    from migrations import ensure_schema
+    ensure_schema()
+
+    if args.processes <= 1:
+        return run_worker(args.threads, args.drain_timeout)
+    return supervise(args.processes, args.threads, args.drain_timeout)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
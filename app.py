@@ -8,10 +8,10 @@ import json
 from datetime import datetime
 import requests
 from bs4 import BeautifulSoup
-import PyPDF2
 import io
 import base64
 import threading
+import time
 import zipfile
 import tempfile
 
@@ -23,6 +23,22 @@ if os.path.exists('.env'):
                 key, value = line.strip().split('=', 1)
                 os.environ[key] = value
 
+# Gerenciador de conexões com o banco (pool por thread, WAL)
+from database import get_db_connection, release_thread_connection, init_app as init_database, IntegrityError
+from migrations import ensure_schema
+import repositories
+import search_index
+import analysis_store
+import analysis_cache
+import ai_usage
+import llm_cache
+from ai_config import get_ai_health
+from document_extract import get_pdf_extract, remove_sidecar
+import analysis_jobs
+import analysis_pipeline
+import analysis_runs
+from audit_log import audit_writer, make_event, write_history_event
+
 # Importar módulo de análise RIGOROSA com IA
 from ai_analyzer_rigorous import analyze_document_rigorous
 
@@ -50,17 +66,21 @@ app = Flask(__name__)
 app.secret_key = 'sua_chave_secreta_super_segura_aqui_12345'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+init_database(app)
 
 # Criar pasta de uploads se não existir
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Função para gerar ID customizado
-def generate_custom_id(institution_name, credentialing_type):
+def generate_custom_id(conn, institution_name, credentialing_type):
     """
     Gera ID no formato: IT00001G
     - 2 primeiras letras da instituição (ex: Itaú = IT)
     - 5 dígitos sequenciais (00001, 00002, etc)
     - 1 letra do tipo (G=Gestor, D=Distribuidor, A=Administrador)
+    
+    O número vem da tabela id_sequences e é reservado na transação de conn;
+    o INSERT do processo precisa ser confirmado no mesmo commit.
     """
     # Extrair 2 primeiras letras da instituição
     institution_code = ''.join(c.upper() for c in institution_name if c.isalpha())[:2]
@@ -75,166 +95,20 @@ def generate_custom_id(institution_name, credentialing_type):
     }
     type_letter = type_map.get(credentialing_type, 'X')
     
-    # Buscar último número sequencial para esta instituição
-    conn = sqlite3.connect('credenciamento.db')
-    c = conn.cursor()
-    c.execute('''SELECT custom_id FROM processes 
-                 WHERE custom_id LIKE ? 
-                 ORDER BY custom_id DESC LIMIT 1''', (f'{institution_code}%',))
-    last_id = c.fetchone()
-    conn.close()
-    
-    if last_id and last_id[0]:
-        # Extrair número do último ID
-        try:
-            last_number = int(last_id[0][2:7])  # Posições 2-7 contêm o número
-            next_number = last_number + 1
-        except:
-            next_number = 1
-    else:
-        next_number = 1
+    # Próximo número sequencial para esta instituição (incremento atômico)
+    next_number = repositories.next_sequence_value(conn, institution_code)
     
     # Formatar ID: IT00001G
     custom_id = f"{institution_code}{next_number:05d}{type_letter}"
     return custom_id
 
-# Inicializar banco de dados
-def init_db():
-    conn = sqlite3.connect('credenciamento.db')
-    c = conn.cursor()
-    
-    # Tabela de usuários
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  email TEXT UNIQUE NOT NULL,
-                  password TEXT NOT NULL,
-                  name TEXT NOT NULL,
-                  cpf_cnpj TEXT NOT NULL,
-                  role TEXT NOT NULL,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
-    # Tabela de processos de credenciamento
-    c.execute('''CREATE TABLE IF NOT EXISTS processes
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  custom_id TEXT UNIQUE,
-                  financial_institution_id INTEGER NOT NULL,
-                  financial_institution_name TEXT NOT NULL,
-                  financial_institution_cnpj TEXT,
-                  rpps_id INTEGER NOT NULL,
-                  rpps_name TEXT NOT NULL,
-                  credentialing_type TEXT NOT NULL,
-                  status TEXT DEFAULT 'draft',
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  submitted_at TIMESTAMP,
-                  reviewed_at TIMESTAMP,
-                  final_review_note TEXT,
-                  final_decision TEXT,
-                  final_decision_at TIMESTAMP,
-                  final_decision_by INTEGER,
-                  is_archived INTEGER DEFAULT 0,
-                  FOREIGN KEY (financial_institution_id) REFERENCES users(id),
-                  FOREIGN KEY (rpps_id) REFERENCES users(id))''')
-    
-    # Tabela de documentos
-    c.execute('''CREATE TABLE IF NOT EXISTS documents
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  process_id INTEGER NOT NULL,
-                  type TEXT NOT NULL,
-                  name TEXT NOT NULL,
-                  filename TEXT NOT NULL,
-                  mime_type TEXT NOT NULL,
-                  uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  uploaded_by INTEGER NOT NULL,
-                  status TEXT DEFAULT 'pending',
-                  analysis_data TEXT,
-                  workflow_status TEXT DEFAULT 'initial',
-                  workflow_version INTEGER DEFAULT 1,
-                  FOREIGN KEY (process_id) REFERENCES processes(id),
-                  FOREIGN KEY (uploaded_by) REFERENCES users(id))''')
-    
-    # Tabela de comunicações
-    c.execute('''CREATE TABLE IF NOT EXISTS communications
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  process_id INTEGER NOT NULL,
-                  sender_id INTEGER,
-                  sender_role TEXT NOT NULL,
-                  message TEXT NOT NULL,
-                  message_type TEXT DEFAULT 'comment',
-                  is_internal INTEGER DEFAULT 0,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (process_id) REFERENCES processes(id),
-                  FOREIGN KEY (sender_id) REFERENCES users(id))''')
-    
-    # Adicionar coluna is_fulfilled se não existir (para rastrear documentos solicitados atendidos)
-    try:
-        c.execute('ALTER TABLE communications ADD COLUMN is_fulfilled INTEGER DEFAULT 0')
-    except:
-        pass  # Coluna já existe
-    
-    # Tabela de histórico do processo
-    c.execute('''CREATE TABLE IF NOT EXISTS process_history
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  process_id INTEGER NOT NULL,
-                  user_id INTEGER,
-                  user_name TEXT,
-                  user_role TEXT,
-                  action TEXT NOT NULL,
-                  details TEXT,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (process_id) REFERENCES processes(id),
-                  FOREIGN KEY (user_id) REFERENCES users(id))''')
-    
-    # Tabela de controle de uso de IA (proteção financeira)
-    c.execute('''CREATE TABLE IF NOT EXISTS ai_usage_log
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  process_id INTEGER NOT NULL,
-                  user_id INTEGER NOT NULL,
-                  documents_analyzed INTEGER DEFAULT 0,
-                  tokens_estimated INTEGER DEFAULT 0,
-                  analysis_date DATE DEFAULT CURRENT_DATE,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (process_id) REFERENCES processes(id),
-                  FOREIGN KEY (user_id) REFERENCES users(id))''')
-    
-    # Tabela de Documentos Especiais (Termo de Credenciamento - fluxo de assinaturas)
-    c.execute('''CREATE TABLE IF NOT EXISTS special_documents
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  process_id INTEGER NOT NULL,
-                  document_type TEXT NOT NULL,
-                  version INTEGER DEFAULT 1,
-                  status TEXT NOT NULL,
-                  filename TEXT NOT NULL,
-                  original_filename TEXT,
-                  mime_type TEXT,
-                  uploaded_by INTEGER,
-                  uploaded_by_role TEXT,
-                  notes TEXT,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (process_id) REFERENCES processes(id),
-                  FOREIGN KEY (uploaded_by) REFERENCES users(id))''')
-    
-    # Status possíveis para special_documents:
-    # - excel_if: Excel original enviado pela IF
-    # - pdf_rpps_signed: PDF alterado e assinado pelo RPPS
-    # - awaiting_if_signature: Aguardando assinatura da IF
-    # - signed_by_if: Assinado pela IF e retornado
-    # - official_final: Documento oficial final no dossiê
-    
-    # Inserir usuários de teste se não existirem
-    c.execute("SELECT COUNT(*) FROM users")
-    if c.fetchone()[0] == 0:
-        test_users = [
-            ('rpps@teste.com', generate_password_hash('rpps123'), 'RPPS Teste', '12345678000190', 'rpps'),
-            ('financeira@teste.com', generate_password_hash('financeira123'), 'Instituição Financeira Teste', '98765432000180', 'financial_institution'),
-            ('suporte.aicsj@gmail.com', generate_password_hash('Fieleaquelequeprometeu'), 'Administrador do Sistema', '00000000000', 'admin')
-        ]
-        c.executemany('INSERT INTO users (email, password, name, cpf_cnpj, role) VALUES (?, ?, ?, ?, ?)', test_users)
-    
-    conn.commit()
-    conn.close()
+# Processos do pool de extração de PDF ('spawn') reimportam este arquivo como __mp_main__
+if __name__ != '__mp_main__':
+    # Inicializar banco de dados (esquema versionado - ver migrations.py)
+    ensure_schema()
 
-init_db()
+    # Fila de análises: workers no próprio processo web (ANALYSIS_WORKERS=0 desliga)
+    analysis_jobs.worker_pool.start()
 
 # Decorador para rotas protegidas
 def login_required(f):
@@ -255,13 +129,65 @@ def role_required(role):
         return decorated_function
     return decorator
 
+# Helpers de paginação por cursor das listagens
+def get_page_args():
+    """(limit, cursor) quando o cliente pede paginação; None mantém a resposta antiga (lista completa)"""
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return None
+    return request.args.get('limit', repositories.DEFAULT_PAGE_SIZE), request.args.get('cursor') or None
+
+def get_list_arg(name):
+    """Parâmetro repetido ou separado por vírgula: ?status=a,b ou ?status=a&status=b"""
+    values = []
+    for value in request.args.getlist(name):
+        values.extend(v.strip() for v in value.split(',') if v.strip())
+    return values
+
+def get_process_filters():
+    return {
+        'status': get_list_arg('status'),
+        'types': get_list_arg('type'),
+        'institution_id': request.args.get('institution_id', type=int),
+        'institution': request.args.get('institution', '').strip(),
+        'q': request.args.get('q', '').strip(),
+        'created_from': request.args.get('created_from'),
+        'created_to': request.args.get('created_to'),
+        'archived': request.args.get('archived', 'false') == 'true'
+    }
+
+def page_response(page, serialize):
+    return jsonify({
+        'items': [serialize(row) for row in page.items],
+        'next_cursor': page.next_cursor,
+        'total': page.total
+    })
+
+def paginated_processes(owner):
+    """Resposta paginada das listas de processos (RPPS e IF)"""
+    limit, cursor = get_page_args()
+    conn = get_db_connection()
+    try:
+        page = repositories.page_processes(
+            conn, owner, session['user_id'],
+            filters=get_process_filters(),
+            sort=request.args.get('sort', 'created_at'),
+            descending=request.args.get('order', 'desc') != 'asc',
+            limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        conn.close()
+    return page_response(page, lambda row: row._asdict())
+
 # Função helper para registrar histórico do processo
-def log_process_history(process_id, action, details=None, user_id=None, user_name=None, user_role=None):
-    """Registra uma ação no histórico do processo"""
+def log_process_history(process_id, action, details=None, user_id=None, user_name=None, user_role=None, conn=None):
+    """
+    Registra uma ação no histórico do processo.
+    Sem conn: o evento vai para a fila do audit_writer (gravação em lote, assíncrona).
+    Com conn: grava na transação do chamador, que confirma junto com a própria alteração.
+    """
     try:
-        conn = sqlite3.connect('credenciamento.db')
-        c = conn.cursor()
-        
         # Se não passou user info, pegar da sessão
         if user_id is None:
             user_id = session.get('user_id')
@@ -270,12 +196,11 @@ def log_process_history(process_id, action, details=None, user_id=None, user_nam
         if user_role is None:
             user_role = session.get('role', 'system')
         
-        c.execute('''INSERT INTO process_history (process_id, user_id, user_name, user_role, action, details, created_at)
-                     VALUES (?, ?, ?, ?, ?, ?, datetime('now'))''',
-                  (process_id, user_id, user_name, user_role, action, details))
-        
-        conn.commit()
-        conn.close()
+        event = make_event(process_id, action, details, user_id, user_name, user_role)
+        if conn is not None:
+            write_history_event(conn, event)
+        else:
+            audit_writer.enqueue(event)
     except Exception as e:
         print(f"Erro ao registrar histórico: {e}")
 
@@ -287,156 +212,139 @@ def validate_signature_tcees(document_path):
     Retorna checks detalhados de conformidade
     """
     try:
-        # Ler o arquivo PDF
-        with open(document_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            
-            # Informações básicas do arquivo
-            file_size = os.path.getsize(document_path)
-            page_count = len(pdf_reader.pages)
-            file_extension = os.path.splitext(document_path)[1].lower()
-            has_password = pdf_reader.is_encrypted
-            
-            # Verificar se é PDF
-            extensao_check = file_extension == '.pdf'
-            
-            # Verificar se tem senha
-            sem_senha_check = not has_password
-            
-            # Verificar tamanho do arquivo (máximo 10MB como no TCE-ES)
-            tamanho_arquivo_check = file_size <= (10 * 1024 * 1024)
-            
-            # Verificar tamanho das páginas e se é pesquisável
-            is_searchable = False
-            tamanho_pagina_check = True
-            
-            try:
-                for page in pdf_reader.pages:
-                    # Verificar se tem texto extraível (com proteção contra erros de imagem)
-                    try:
-                        text = page.extract_text()
-                        if text and len(text.strip()) > 0:
-                            is_searchable = True
-                    except Exception as e:
-                        # Ignorar erros de decodificação de imagens
-                        if 'XFormObject' not in str(e):
-                            print(f"⚠️ Aviso ao extrair texto da página: {str(e)[:80]}")
-                    
-                    # Verificar dimensões da página (A4 padrão: 210x297mm ou 595x842 pontos)
-                    try:
-                        if hasattr(page, 'mediabox'):
-                            width = float(page.mediabox.width)
-                            height = float(page.mediabox.height)
-                            # Aceitar páginas entre A5 e A3
-                            if width < 420 or width > 1191 or height < 595 or height > 1684:
-                                tamanho_pagina_check = False
-                    except:
-                        pass
-            except:
-                is_searchable = False
-            
-            pesquisavel_check = is_searchable
-            
-            # 🔐 VALIDAÇÃO REAL COM TCEES
-            # Usar o site oficial conformidadepdf.tcees.tc.br para validar
-            print("\n🔐 Iniciando validação TCEES...")
-            
-            tcees_results = validate_pdf_with_tcees(document_path)
-            
-            # Usar os resultados do TCEES
-            extensao_check = tcees_results.get('extensao_valida', extensao_check)
-            sem_senha_check = tcees_results.get('sem_senha', sem_senha_check)
-            tamanho_arquivo_check = tcees_results.get('tamanho_arquivo_ok', tamanho_arquivo_check)
-            tamanho_pagina_check = tcees_results.get('tamanho_pagina_ok', tamanho_pagina_check)
-            assinado_check = tcees_results.get('assinado', False)
-            autenticidade_check = tcees_results.get('autenticidade', False)
-            integridade_check = tcees_results.get('integridade', False)
-            pesquisavel_check = tcees_results.get('pesquisavel', pesquisavel_check)
-            
-            validation_details = f"Validação TCEES: {tcees_results.get('resultado_final', 'ERRO')}"
-            if tcees_results.get('observacoes'):
-                validation_details += f" | Obs: {'; '.join(tcees_results['observacoes'][:2])}"
-            
-            has_signature = assinado_check
-            signature_count = 1 if has_signature else 0
-            
-            print(f"✅ Validação TCEES concluída: {tcees_results.get('resultado_final', 'ERRO')}")
-            
-            # Calcular resultado final
-            all_checks_passed = (
-                extensao_check and 
-                sem_senha_check and 
-                tamanho_arquivo_check and 
-                tamanho_pagina_check and 
-                assinado_check and 
-                autenticidade_check and 
-                integridade_check and
-                pesquisavel_check
-            )
-            
-            resultado_final = 'approved' if all_checks_passed else 'rejected'
-            
-            # Montar mensagem de detalhes
-            details_parts = []
-            if not extensao_check:
-                details_parts.append("❌ Extensão inválida (apenas PDF)")
-            if not sem_senha_check:
-                details_parts.append("❌ Documento protegido por senha")
-            if not tamanho_arquivo_check:
-                details_parts.append(f"❌ Arquivo muito grande ({file_size / 1024 / 1024:.1f}MB > 10MB)")
-            if not tamanho_pagina_check:
-                details_parts.append("❌ Tamanho de página fora do padrão")
-            if not pesquisavel_check:
-                details_parts.append("❌ Documento não é pesquisável")
-            if not assinado_check:
-                details_parts.append("❌ Documento não possui assinatura digital")
-            if not autenticidade_check:
-                details_parts.append("❌ Falha na verificação de autenticidade")
-            if not integridade_check:
-                details_parts.append("❌ Falha na verificação de integridade")
-            
-            if all_checks_passed:
-                details_parts.append("✅ Documento aprovado em todas as verificações")
-            
-            details = " | ".join(details_parts) if details_parts else "Documento analisado"
-            if validation_details:
-                details += f" | {validation_details}"
-            
-            if signature_count > 0:
-                details += f" | {signature_count} assinatura(s) detectada(s)"
-            
-            return {
-                # Checks do TCE-ES (conforme imagem)
-                'extensao_valida': extensao_check,
-                'sem_senha': sem_senha_check,
-                'tamanho_arquivo_ok': tamanho_arquivo_check,
-                'tamanho_pagina_ok': tamanho_pagina_check,
-                'assinado': assinado_check,
-                'autenticidade': autenticidade_check,
-                'integridade': integridade_check,
-                'pesquisavel': pesquisavel_check,
-                'resultado_final_conformidade': resultado_final,
-                
-                # Informações adicionais
-                'numero_assinaturas': signature_count,
-                'extension': file_extension,
-                'file_size': f"{file_size / 1024:.2f} KB",
-                'file_size_mb': f"{file_size / 1024 / 1024:.2f} MB",
-                'page_count': page_count,
-                'has_password': has_password,
-                'details': details,
-                
-                # Compatibilidade com código anterior
-                'is_valid': all_checks_passed,
-                'has_identifiable_signature': has_signature,
-                'is_intact': integridade_check,
-                'is_searchable': pesquisavel_check,
-                'is_signed': assinado_check,
-                'has_authenticity': autenticidade_check,
-                'has_integrity': integridade_check,
-                'final_result': resultado_final
-            }
-    
+        # Extrato compartilhado: o PDF é lido uma única vez (ver document_extract.py)
+        extract = get_pdf_extract(document_path)
+        
+        # Informações básicas do arquivo
+        file_size = extract.file_size
+        page_count = extract.page_count
+        file_extension = os.path.splitext(document_path)[1].lower()
+        has_password = extract.is_encrypted
+        
+        # Verificar se é PDF
+        extensao_check = file_extension == '.pdf'
+        
+        # Verificar se tem senha
+        sem_senha_check = not has_password
+        
+        # Verificar tamanho do arquivo (máximo 10MB como no TCE-ES)
+        tamanho_arquivo_check = file_size <= (10 * 1024 * 1024)
+        
+        # Verificar se é pesquisável (texto extraível em alguma página)
+        is_searchable = extract.is_searchable
+        
+        # Verificar dimensões das páginas (A4 padrão: 210x297mm ou 595x842 pontos)
+        tamanho_pagina_check = True
+        for page_size in extract.page_sizes:
+            if not page_size:
+                continue
+            width, height = page_size
+            # Aceitar páginas entre A5 e A3
+            if width < 420 or width > 1191 or height < 595 or height > 1684:
+                tamanho_pagina_check = False
+        
+        pesquisavel_check = is_searchable
+        
+        # 🔐 VALIDAÇÃO REAL COM TCEES
+        # Usar o site oficial conformidadepdf.tcees.tc.br para validar
+        print("\n🔐 Iniciando validação TCEES...")
+        
+        tcees_results = validate_pdf_with_tcees(document_path)
+        
+        # Usar os resultados do TCEES
+        extensao_check = tcees_results.get('extensao_valida', extensao_check)
+        sem_senha_check = tcees_results.get('sem_senha', sem_senha_check)
+        tamanho_arquivo_check = tcees_results.get('tamanho_arquivo_ok', tamanho_arquivo_check)
+        tamanho_pagina_check = tcees_results.get('tamanho_pagina_ok', tamanho_pagina_check)
+        assinado_check = tcees_results.get('assinado', False)
+        autenticidade_check = tcees_results.get('autenticidade', False)
+        integridade_check = tcees_results.get('integridade', False)
+        pesquisavel_check = tcees_results.get('pesquisavel', pesquisavel_check)
+        
+        validation_details = f"Validação TCEES: {tcees_results.get('resultado_final', 'ERRO')}"
+        if tcees_results.get('observacoes'):
+            validation_details += f" | Obs: {'; '.join(tcees_results['observacoes'][:2])}"
+        
+        has_signature = assinado_check
+        signature_count = 1 if has_signature else 0
+        
+        print(f"✅ Validação TCEES concluída: {tcees_results.get('resultado_final', 'ERRO')}")
+        
+        # Calcular resultado final
+        all_checks_passed = (
+            extensao_check and 
+            sem_senha_check and 
+            tamanho_arquivo_check and 
+            tamanho_pagina_check and 
+            assinado_check and 
+            autenticidade_check and 
+            integridade_check and
+            pesquisavel_check
+        )
+        
+        resultado_final = 'approved' if all_checks_passed else 'rejected'
+        
+        # Montar mensagem de detalhes
+        details_parts = []
+        if not extensao_check:
+            details_parts.append("❌ Extensão inválida (apenas PDF)")
+        if not sem_senha_check:
+            details_parts.append("❌ Documento protegido por senha")
+        if not tamanho_arquivo_check:
+            details_parts.append(f"❌ Arquivo muito grande ({file_size / 1024 / 1024:.1f}MB > 10MB)")
+        if not tamanho_pagina_check:
+            details_parts.append("❌ Tamanho de página fora do padrão")
+        if not pesquisavel_check:
+            details_parts.append("❌ Documento não é pesquisável")
+        if not assinado_check:
+            details_parts.append("❌ Documento não possui assinatura digital")
+        if not autenticidade_check:
+            details_parts.append("❌ Falha na verificação de autenticidade")
+        if not integridade_check:
+            details_parts.append("❌ Falha na verificação de integridade")
+        
+        if all_checks_passed:
+            details_parts.append("✅ Documento aprovado em todas as verificações")
+        
+        details = " | ".join(details_parts) if details_parts else "Documento analisado"
+        if validation_details:
+            details += f" | {validation_details}"
+        
+        if signature_count > 0:
+            details += f" | {signature_count} assinatura(s) detectada(s)"
+        
+        return {
+            # Checks do TCE-ES (conforme imagem)
+            'extensao_valida': extensao_check,
+            'sem_senha': sem_senha_check,
+            'tamanho_arquivo_ok': tamanho_arquivo_check,
+            'tamanho_pagina_ok': tamanho_pagina_check,
+            'assinado': assinado_check,
+            'autenticidade': autenticidade_check,
+            'integridade': integridade_check,
+            'pesquisavel': pesquisavel_check,
+            'resultado_final_conformidade': resultado_final,
+            
+            # Informações adicionais
+            'numero_assinaturas': signature_count,
+            'extension': file_extension,
+            'file_size': f"{file_size / 1024:.2f} KB",
+            'file_size_mb': f"{file_size / 1024 / 1024:.2f} MB",
+            'page_count': page_count,
+            'has_password': has_password,
+            'details': details,
+            
+            # Compatibilidade com código anterior
+            'is_valid': all_checks_passed,
+            'has_identifiable_signature': has_signature,
+            'is_intact': integridade_check,
+            'is_searchable': pesquisavel_check,
+            'is_signed': assinado_check,
+            'has_authenticity': autenticidade_check,
+            'has_integrity': integridade_check,
+            'final_result': resultado_final
+        }
+
     except Exception as e:
         print(f"Erro ao validar assinatura: {e}")
         return {
@@ -464,56 +372,51 @@ def analyze_document_content(document_type, document_name, file_path):
     Analisa o conteúdo do documento
     """
     try:
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            
-            # Extrair texto do PDF
-            text_content = ""
-            for page in pdf_reader.pages:
-                text_content += page.extract_text()
-            
-            # Análise básica baseada no tipo de documento
-            issues = []
-            recommendations = []
-            completeness = 80
-            coherence = 85
-            
-            if not text_content.strip():
-                issues.append("Documento parece estar vazio ou não possui texto extraível")
-                completeness = 20
-            
-            if len(text_content) < 100:
-                issues.append("Documento possui conteúdo muito reduzido")
-                completeness = 40
-            
-            # Verificações específicas por tipo de documento
-            if document_type == "termo_declaracao" and "declaração" not in text_content.lower():
-                issues.append("Documento não parece ser uma declaração")
-                coherence = 50
-            
-            if document_type == "certidao_cvm" and "cvm" not in text_content.lower():
-                issues.append("Documento não parece ser uma certidão da CVM")
-                coherence = 50
-            
-            if not issues:
-                recommendations.append("Documento aparenta estar em conformidade")
-            else:
-                recommendations.append("Revisar os pontos destacados e corrigir se necessário")
-            
-            summary = f"Documento '{document_name}' analisado. "
-            if issues:
-                summary += f"Foram encontrados {len(issues)} problema(s). "
-            else:
-                summary += "Documento aprovado na análise preliminar."
-            
-            return {
-                'is_valid': len(issues) == 0,
-                'completeness': completeness,
-                'coherence': coherence,
-                'issues': issues,
-                'recommendations': recommendations,
-                'summary': summary
-            }
+        # Extrair texto do PDF (extrato compartilhado - arquivo lido uma única vez)
+        text_content = "".join(get_pdf_extract(file_path).page_texts)
+        
+        # Análise básica baseada no tipo de documento
+        issues = []
+        recommendations = []
+        completeness = 80
+        coherence = 85
+        
+        if not text_content.strip():
+            issues.append("Documento parece estar vazio ou não possui texto extraível")
+            completeness = 20
+        
+        if len(text_content) < 100:
+            issues.append("Documento possui conteúdo muito reduzido")
+            completeness = 40
+        
+        # Verificações específicas por tipo de documento
+        if document_type == "termo_declaracao" and "declaração" not in text_content.lower():
+            issues.append("Documento não parece ser uma declaração")
+            coherence = 50
+        
+        if document_type == "certidao_cvm" and "cvm" not in text_content.lower():
+            issues.append("Documento não parece ser uma certidão da CVM")
+            coherence = 50
+        
+        if not issues:
+            recommendations.append("Documento aparenta estar em conformidade")
+        else:
+            recommendations.append("Revisar os pontos destacados e corrigir se necessário")
+        
+        summary = f"Documento '{document_name}' analisado. "
+        if issues:
+            summary += f"Foram encontrados {len(issues)} problema(s). "
+        else:
+            summary += "Documento aprovado na análise preliminar."
+        
+        return {
+            'is_valid': len(issues) == 0,
+            'completeness': completeness,
+            'coherence': coherence,
+            'issues': issues,
+            'recommendations': recommendations,
+            'summary': summary
+        }
     
     except Exception as e:
         return {
@@ -543,36 +446,58 @@ def favicon():
 @app.route('/api/process/<int:process_id>/documents')
 @login_required
 def get_process_documents(process_id):
-    conn = sqlite3.connect('credenciamento.db')
-    c = conn.cursor()
-    c.execute('''SELECT id, process_id, type, name, filename, mime_type, uploaded_at, 
-                        status, workflow_status, workflow_version 
-                 FROM documents WHERE process_id = ? ORDER BY uploaded_at DESC''', (process_id,))
-    docs = c.fetchall()
+    conn = get_db_connection()
+    docs = repositories.list_process_documents(conn, process_id)
     conn.close()
     
-    documents = []
-    for doc in docs:
-        documents.append({
-            'id': doc[0],
-            'process_id': doc[1],
-            'document_type': doc[2],
-            'name': doc[3],
-            'filename': doc[4],
-            'mime_type': doc[5],
-            'uploaded_at': doc[6],
-            'status': doc[7] if len(doc) > 7 else 'pending',
-            'workflow_status': doc[8] if len(doc) > 8 else 'initial',
-            'workflow_version': doc[9] if len(doc) > 9 else 1
-        })
-    
-    return jsonify(documents)
+    return jsonify([doc._asdict() for doc in docs])
+
+@app.route('/api/analysis-jobs/<int:job_id>')
+@login_required
+def get_analysis_job(job_id):
+    """Status de um job da fila de análises (queued / running / succeeded / failed)"""
+    job = analysis_jobs.get_job_status(job_id)
+    if not job:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify(job)
+
+@app.route('/api/document/<int:document_id>/analysis-job')
+@login_required
+def get_document_analysis_job(document_id):
+    """Último job de análise do documento (posição na fila, tentativas, erro)"""
+    job = analysis_jobs.get_document_job_status(document_id)
+    if not job:
+        return jsonify({'error': 'Nenhuma análise registrada para o documento'}), 404
+    return jsonify(job)
+
+@app.route('/api/analysis-runs/<int:run_id>')
+@login_required
+def get_analysis_run(run_id):
+    """Progresso da análise do processo: documentos feitos/com erro, ETA e resumo final"""
+    run = analysis_runs.get_run_status(run_id)
+    if not run:
+        return jsonify({'error': 'Execução não encontrada'}), 404
+    return jsonify(run)
+
+@app.route('/api/process/<int:process_id>/analysis-run')
+@login_required
+def get_process_analysis_run(process_id):
+    """Última execução de análise do processo"""
+    run = analysis_runs.get_latest_process_run(process_id)
+    if not run:
+        return jsonify({'error': 'Nenhuma análise registrada para o processo'}), 404
+    return jsonify(run)
+
+@app.route('/api/process/<int:process_id>/analysis-jobs')
+@login_required
+def get_process_analysis_jobs(process_id):
+    return jsonify(analysis_jobs.list_process_jobs(process_id))
 
 @app.route('/api/process/<int:process_id>/download-zip')
 @login_required
 def download_documents_zip(process_id):
     """Baixar todos os documentos de um processo em um arquivo ZIP"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Verificar permissão do usuário
@@ -643,48 +568,48 @@ def download_documents_zip(process_id):
 @app.route('/api/process/<int:process_id>/communications')
 @login_required
 def get_process_communications(process_id):
-    from datetime import datetime, timedelta
+    page_args = get_page_args()
     
-    conn = sqlite3.connect('credenciamento.db')
-    c = conn.cursor()
+    conn = get_db_connection()
     # Filtrar apenas mensagens de comunicação real (excluir análises automáticas)
-    c.execute('''SELECT c.id, c.message, c.sender_role, c.message_type, u.name as sender_name, c.created_at
-                 FROM communications c
-                 LEFT JOIN users u ON c.sender_id = u.id
-                 WHERE c.process_id = ? 
-                 AND (c.message_type = 'comment' OR c.message_type = 'message')
-                 AND c.message NOT LIKE '%**Análise%'
-                 AND c.message NOT LIKE '%Análise com IA%'
-                 AND c.message NOT LIKE '%**Score:**%'
-                 ORDER BY c.id ASC''', (process_id,))
-    comms = c.fetchall()
+    if page_args:
+        try:
+            page = repositories.page_process_communications(conn, process_id, *page_args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        finally:
+            conn.close()
+        return page_response(page, format_communication)
+    
+    comms = repositories.list_process_communications(conn, process_id)
     conn.close()
     
-    communications = []
-    for comm in comms:
-        # Ajustar para horário de Brasília (UTC-3)
-        created_at = comm[5]
-        if created_at:
-            try:
-                dt = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
-                dt_brasilia = dt - timedelta(hours=3)
-                created_at_formatted = dt_brasilia.strftime('%Y-%m-%d %H:%M:%S')
-            except:
-                created_at_formatted = created_at
-        else:
-            created_at_formatted = '2026-01-23 12:00:00'
-            
-        communications.append({
-            'id': comm[0],
-            'message': comm[1],
-            'sender_role': comm[2] if comm[2] else 'system',
-            'message_type': comm[3] if comm[3] else 'comment',
-            'sender_name': comm[4] if comm[4] else 'Sistema',
-            'created_at': created_at_formatted,
-            'sent_at': created_at_formatted
-        })
+    return jsonify([format_communication(comm) for comm in comms])
+
+def format_communication(comm):
+    from datetime import timedelta
     
-    return jsonify(communications)
+    # Ajustar para horário de Brasília (UTC-3)
+    created_at = comm.created_at
+    if created_at:
+        try:
+            dt = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
+            dt_brasilia = dt - timedelta(hours=3)
+            created_at_formatted = dt_brasilia.strftime('%Y-%m-%d %H:%M:%S')
+        except:
+            created_at_formatted = created_at
+    else:
+        created_at_formatted = '2026-01-23 12:00:00'
+    
+    return {
+        'id': comm.id,
+        'message': comm.message,
+        'sender_role': comm.sender_role or 'system',
+        'message_type': comm.message_type or 'comment',
+        'sender_name': comm.sender_name or 'Sistema',
+        'created_at': created_at_formatted,
+        'sent_at': created_at_formatted
+    }
 
 @app.route('/api/process/<int:process_id>/communications', methods=['POST'])
 @login_required
@@ -700,14 +625,14 @@ def send_communication(process_id):
     sender_role = session.get('role')
     if not sender_role:
         # Buscar role do usuário no banco
-        conn_temp = sqlite3.connect('credenciamento.db')
+        conn_temp = get_db_connection()
         c_temp = conn_temp.cursor()
         c_temp.execute('SELECT role FROM users WHERE id = ?', (session.get('user_id'),))
         user = c_temp.fetchone()
         conn_temp.close()
         sender_role = user[0] if user else 'financial_institution'
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Inserir a comunicação
@@ -726,7 +651,7 @@ def send_communication(process_id):
 @login_required
 def check_has_analysis(process_id):
     """Verifica se o processo já possui análise de IA"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Verificar se existe log de uso de IA para este processo
@@ -740,7 +665,7 @@ def check_has_analysis(process_id):
 @login_required
 def get_return_info(process_id):
     """Retorna informações de devolução do processo"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Buscar a última comunicação de devolução
@@ -777,37 +702,82 @@ def get_return_info(process_id):
 @login_required
 @role_required('rpps')
 def analyze_process_with_ai(process_id):
-    """Inicia análise com IA de todos os documentos do processo"""
+    """
+    Inicia análise com IA dos documentos do processo: cria uma execução
+    (analysis_runs) com um job por documento novo ou alterado desde a última
+    análise e responde na hora com o run_id; o progresso fica em
+    /api/analysis-runs/<run_id>. {"full": true} reanalisa todos os documentos.
+    """
     try:
         from datetime import datetime, timedelta
         
-        conn = sqlite3.connect('credenciamento.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         user_id = session.get('user_id')
         
+        # Buscar processo e instituição
+        c.execute('''SELECT financial_institution_name, financial_institution_cnpj FROM processes WHERE id = ?''', (process_id,))
+        process = c.fetchone()
+        
+        if not process:
+            conn.close()
+            return jsonify({'success': False, 'error': 'Processo não encontrado'}), 404
+        
+        institution_name = process[0]
+        institution_cnpj = process[1]
+        
+        # Buscar todos os documentos do processo
+        c.execute('SELECT id, filename, type, name FROM documents WHERE process_id = ?', (process_id,))
+        documents = c.fetchall()
+        
+        if not documents:
+            conn.close()
+            return jsonify({'success': False, 'error': 'Nenhum documento encontrado'}), 400
+        
+        # Já existe uma execução em andamento: devolve a mesma (sem novo uso de IA)
+        running_id = analysis_runs.active_run_id(conn, process_id)
+        if running_id:
+            conn.close()
+            return jsonify({
+                'success': True,
+                'run_id': running_id,
+                'already_running': True,
+                'message': 'Análise já em andamento para este processo.',
+                'status_url': url_for('get_analysis_run', run_id=running_id)
+            }), 202
+        
+        # Só vão para a fila documentos novos ou alterados desde a última análise do processo;
+        # dos alterados, os que já estão no cache (mesmo arquivo, tipo e instituição) não gastam IA
+        full = bool((request.get_json(silent=True) or {}).get('full'))
+        plan = analysis_runs.plan_run(conn, process_id, documents, institution_name, institution_cnpj, full)
+        fresh_documents = plan.fresh
+        
         # ========== PROTEÇÃO FINANCEIRA: CONTROLE DE USO DE IA ==========
+        # (só conta quando algum documento precisa de análise nova)
         
-        # 1. Verificar limite diário de análises por processo (máx 3 por dia)
-        c.execute('''SELECT COUNT(*) FROM ai_usage_log 
+        # 1. Limite diário em documentos analisados pela IA: o equivalente a 3 análises completas
+        #    do processo por dia - reanálises incrementais só consomem os documentos alterados
+        c.execute('''SELECT COUNT(*), COALESCE(SUM(documents_analyzed), 0) FROM ai_usage_log 
                      WHERE process_id = ? AND analysis_date = DATE('now')''', (process_id,))
-        daily_count = c.fetchone()[0]
+        daily_count, daily_documents = c.fetchone()
         
         MAX_DAILY_ANALYSES = 3
-        if daily_count >= MAX_DAILY_ANALYSES:
+        daily_budget = MAX_DAILY_ANALYSES * len(documents)
+        if fresh_documents and daily_documents + fresh_documents > daily_budget:
             conn.close()
             return jsonify({
                 'success': False, 
-                'error': f'Limite diário atingido. Este processo já foi analisado {daily_count} vez(es) hoje. Máximo permitido: {MAX_DAILY_ANALYSES} análises por dia.'
+                'error': f'Limite diário atingido. Hoje já foram analisados {daily_documents} documento(s) deste processo com IA e esta análise precisaria de mais {fresh_documents}. Máximo permitido: {daily_budget} por dia ({MAX_DAILY_ANALYSES} análises completas).'
             }), 429
         
-        # 2. Verificar cooldown entre análises (mínimo 30 minutos)
+        # 2. Verificar cooldown entre análises completas (mínimo 30 minutos)
         c.execute('''SELECT created_at FROM ai_usage_log 
                      WHERE process_id = ? 
                      ORDER BY created_at DESC LIMIT 1''', (process_id,))
         last_analysis = c.fetchone()
         
-        if last_analysis:
+        if fresh_documents == len(documents) and last_analysis:
             last_time = datetime.strptime(last_analysis[0], '%Y-%m-%d %H:%M:%S')
             cooldown_minutes = 30
             time_diff = datetime.now() - last_time
@@ -820,38 +790,57 @@ def analyze_process_with_ai(process_id):
                     'error': f'Aguarde {remaining} minuto(s) antes de solicitar nova análise. Cooldown: {cooldown_minutes} minutos entre análises.'
                 }), 429
         
-        # ========== FIM PROTEÇÃO FINANCEIRA ==========
-        
-        # Buscar processo e instituição
-        c.execute('''SELECT financial_institution_name FROM processes WHERE id = ?''', (process_id,))
-        process = c.fetchone()
-        
-        if not process:
+        # 3. Orçamento diário em US$ (RPPS / instituição) pelo custo medido das chamadas;
+        #    a trava definitiva é a reserva atômica feita a cada chamada ao provedor
+        tokens_per_document, cost_per_document, measured = ai_usage.estimate_per_document(conn)
+        tokens_estimated = fresh_documents * tokens_per_document
+        cost_estimated = fresh_documents * cost_per_document
+        exceeded = ai_usage.check_budgets(conn, process_id, cost_estimated) if fresh_documents else []
+        if exceeded:
+            scope, used, limit = exceeded[0]
+            scope_label = {'rpps': 'do RPPS', 'institution': 'da instituição financeira'}.get(scope, 'geral')
             conn.close()
-            return jsonify({'success': False, 'error': 'Processo não encontrado'}), 404
-        
-        institution_name = process[0]
+            return jsonify({
+                'success': False,
+                'budget_exceeded': True,
+                'error': f'Orçamento diário de IA {scope_label} insuficiente: US$ {used:.2f} de US$ {limit:.2f} já usados hoje e esta análise custaria ~US$ {cost_estimated:.2f}.'
+            }), 429
         
-        # Buscar todos os documentos do processo
-        c.execute('SELECT id, filename, type, name FROM documents WHERE process_id = ?', (process_id,))
-        documents = c.fetchall()
+        # ========== FIM PROTEÇÃO FINANCEIRA ==========
         
-        if not documents:
+        # Um job por documento alterado; os workers analisam em paralelo e publicam cada resultado.
+        # A execução é criada antes de qualquer outro registro: o índice único parcial
+        # (uma execução 'running' por processo) barra dois pedidos simultâneos
+        try:
+            run_id = analysis_runs.start_run(conn, process_id, user_id, plan.changed, institution_name,
+                                             institution_cnpj, reused=len(plan.unchanged))
+        except IntegrityError:
+            conn.rollback()
+            running_id = analysis_runs.active_run_id(conn, process_id)
             conn.close()
-            return jsonify({'success': False, 'error': 'Nenhum documento encontrado'}), 400
-        
-        # Registrar uso de IA (ANTES de analisar)
-        tokens_estimated = len(documents) * 3000  # ~3000 tokens por documento
-        c.execute('''INSERT INTO ai_usage_log 
-                     (process_id, user_id, documents_analyzed, tokens_estimated)
-                     VALUES (?, ?, ?, ?)''',
-                  (process_id, user_id, len(documents), tokens_estimated))
+            return jsonify({
+                'success': False,
+                'run_id': running_id,
+                'already_running': True,
+                'error': 'Análise já em andamento para este processo.',
+                'status_url': url_for('get_analysis_run', run_id=running_id) if running_id else None
+            }), 409
+        
+        # Registrar a análise (ANTES de analisar) - documentos em cache não consomem tokens;
+        # tokens e custo reais de cada chamada ficam em ai_call_usage
+        if fresh_documents:
+            c.execute('''INSERT INTO ai_usage_log 
+                         (process_id, user_id, documents_analyzed, tokens_estimated)
+                         VALUES (?, ?, ?, ?)''',
+                      (process_id, user_id, fresh_documents, tokens_estimated))
         
         print(f"\n{'='*60}")
         print(f"🔍 ANÁLISE COM IA INICIADA - Processo {process_id}")
         print(f"   Instituição: {institution_name}")
-        print(f"   Documentos encontrados: {len(documents)}")
-        print(f"   💰 Tokens estimados: {tokens_estimated}")
+        print(f"   Documentos encontrados: {len(documents)} ({len(plan.changed)} novos/alterados, "
+              f"{len(plan.unchanged)} sem alteração, {fresh_documents} para a IA)")
+        print(f"   💰 Tokens estimados: {tokens_estimated} (~US$ {cost_estimated:.2f}, "
+              f"{'média medida' if measured else 'sem histórico medido'})")
         print(f"   📊 Análise #{daily_count + 1} do dia para este processo")
         print(f"{'='*60}\n")
         
@@ -859,136 +848,36 @@ def analyze_process_with_ai(process_id):
         c.execute('UPDATE processes SET status = ? WHERE id = ?', ('in_review', process_id))
         
         # Registrar no histórico
-        log_process_history(process_id, 'Análise com IA iniciada', f'{len(documents)} documento(s) analisados')
+        log_process_history(process_id, 'Análise com IA iniciada',
+                            f'{len(plan.changed)} documento(s) analisados, {len(plan.unchanged)} sem alteração')
         
         # Adicionar mensagem inicial
+        start_message = f'🤖 Análise com IA iniciada para {len(plan.changed)} documento(s)...'
+        if plan.unchanged:
+            start_message += f' ({len(plan.unchanged)} sem alteração desde a última análise)'
         c.execute('''INSERT INTO communications 
                      (process_id, sender_id, sender_role, message, message_type, is_internal)
                      VALUES (?, ?, ?, ?, ?, ?)''',
-                  (process_id, session.get('user_id'), 'rpps', 
-                   f'🤖 Análise com IA iniciada para {len(documents)} documento(s)...', 'system', 0))
-        
-        conn.commit()
-        
-        # Analisar cada documento
-        analysis_count = 0
-        for doc_id, filename, doc_type, doc_name in documents:
-            try:
-                full_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                print(f"\n📄 Analisando documento: {doc_name}")
-                print(f"   Tipo: {doc_type}")
-                print(f"   Arquivo: {filename}")
-                print(f"   Caminho: {full_path}")
-                
-                if not os.path.exists(full_path):
-                    print(f"   ❌ Arquivo não encontrado!")
-                    error_msg = f"❌ Documento '{doc_name}' não encontrado no servidor"
-                    c.execute('''INSERT INTO communications 
-                                 (process_id, sender_id, sender_role, message, message_type, is_internal)
-                                 VALUES (?, ?, ?, ?, ?, ?)''',
-                              (process_id, session.get('user_id'), 'rpps', error_msg, 'system', 0))
-                    continue
-                
-                # Chamar análise RIGOROSA com IA
-                print(f"   🤖 Chamando analyze_document_rigorous()...")
-                result = analyze_document_rigorous(full_path, doc_type, doc_name, institution_name)
-                print(f"   ✅ Análise concluída!")
-                
-                # Formatar resultado bonito
-                if isinstance(result, dict):
-                    is_valid = result.get('is_valid', False)
-                    score = result.get('score', 0)
-                    issues = result.get('issues', [])
-                    warnings = result.get('warnings', [])
-                    details = result.get('details', {})
-                    
-                    # Criar mensagem formatada
-                    status_icon = "✅" if is_valid else "❌"
-                    message_parts = [
-                        f"\n{'='*50}",
-                        f"{status_icon} **ANÁLISE: {doc_name}**",
-                        f"{'='*50}",
-                        f"\n📊 **Score:** {score}/100",
-                        f"📋 **Tipo:** {doc_type}",
-                        f"🔍 **Status:** {'APROVADO' if is_valid else 'REPROVADO'}",
-                    ]
-                    
-                    # Detalhes da IA
-                    if details.get('ai_powered'):
-                        message_parts.append(f"\n🤖 **Análise com IA:** {details.get('provider', 'Gemini')}")
-                        message_parts.append(f"   Confiança: {int(details.get('confidence', 0) * 100)}%")
-                        if details.get('summary'):
-                            message_parts.append(f"\n📝 **Resumo:** {details['summary']}")
-                    
-                    # Problemas encontrados
-                    if issues:
-                        message_parts.append(f"\n❌ **Problemas Encontrados:**")
-                        for issue in issues:
-                            message_parts.append(f"   • {issue}")
-                    
-                    # Avisos
-                    if warnings:
-                        message_parts.append(f"\n⚠️ **Avisos:**")
-                        for warning in warnings:
-                            message_parts.append(f"   • {warning}")
-                    
-                    # Se aprovado, mostrar pontos positivos
-                    if is_valid and not issues:
-                        message_parts.append(f"\n✅ **Pontos Positivos:**")
-                        message_parts.append(f"   • Documento em conformidade")
-                        message_parts.append(f"   • Tipo correto identificado")
-                        message_parts.append(f"   • Conteúdo adequado para credenciamento")
-                    
-                    message_parts.append(f"\n{'='*50}\n")
-                    
-                    message = "\n".join(message_parts)
-                else:
-                    # Resultado em texto simples
-                    message = f"\n📄 **{doc_name}**\n\n{result}"
-                
-                # Salvar resultado na comunicação
-                c.execute('''INSERT INTO communications 
-                             (process_id, sender_id, sender_role, message, message_type, is_internal)
-                             VALUES (?, ?, ?, ?, ?, ?)''',
-                          (process_id, session.get('user_id'), 'rpps', message, 'system', 0))
-                
-                conn.commit()
-                analysis_count += 1
-                print(f"   💾 Resultado salvo nas comunicações!")
-                
-            except Exception as e:
-                print(f"   ❌ Erro ao analisar documento {doc_id}: {e}")
-                import traceback
-                traceback.print_exc()
-                
-                error_msg = f"❌ Erro ao analisar '{doc_name}': {str(e)}"
-                c.execute('''INSERT INTO communications 
-                             (process_id, sender_id, sender_role, message, message_type, is_internal)
-                             VALUES (?, ?, ?, ?, ?, ?)''',
-                          (process_id, session.get('user_id'), 'rpps', error_msg, 'system', 0))
-                conn.commit()
-        
-        # Mensagem final
-        final_message = f"\n🎉 **Análise concluída!** {analysis_count}/{len(documents)} documentos analisados com sucesso."
-        c.execute('''INSERT INTO communications 
-                     (process_id, sender_id, sender_role, message, message_type, is_internal)
-                     VALUES (?, ?, ?, ?, ?, ?)''',
-                  (process_id, session.get('user_id'), 'rpps', final_message, 'system', 0))
+                  (process_id, session.get('user_id'), 'rpps', start_message, 'system', 0))
         
         conn.commit()
         conn.close()
+        if plan.changed:
+            analysis_jobs.worker_pool.wake()
+        else:
+            # Nada mudou: o parecer sai na hora, só com os resultados guardados
+            analysis_runs.finish_run_if_done(run_id)
         
-        print(f"\n{'='*60}")
-        print(f"✅ ANÁLISE COMPLETA!")
-        print(f"   Documentos analisados: {analysis_count}/{len(documents)}")
-        print(f"{'='*60}\n")
+        print(f"   ⚙️  Execução #{run_id}: {len(plan.changed)} documento(s) enfileirados")
         
         return jsonify({
-            'success': True, 
-            'message': f'Análise concluída! {analysis_count} documento(s) processado(s).',
-            'analyzed': analysis_count,
-            'total': len(documents)
-        })
+            'success': True,
+            'run_id': run_id,
+            'message': f'Análise iniciada para {len(plan.changed)} documento(s).',
+            'total': len(plan.changed),
+            'reused': len(plan.unchanged),
+            'status_url': url_for('get_analysis_run', run_id=run_id)
+        }), 202
         
     except Exception as e:
         print(f"\n❌ ERRO CRÍTICO na análise com IA: {e}")
@@ -1003,7 +892,7 @@ def change_process_status(process_id):
     new_status = data.get('status')
     reason = data.get('reason', '')
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     c.execute('UPDATE processes SET status = ? WHERE id = ?', (new_status, process_id))
     
@@ -1048,7 +937,7 @@ def request_document(process_id):
     if not description:
         return jsonify({'success': False, 'error': 'Descrição é obrigatória'}), 400
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     user_id = session.get('user_id')
@@ -1073,7 +962,7 @@ def request_document(process_id):
 @login_required
 def get_document_requests(process_id):
     """Retorna solicitações de documentos pendentes"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Buscar todas as solicitações de documentos
@@ -1105,7 +994,7 @@ def get_document_requests(process_id):
 @login_required
 def get_pending_issues(process_id):
     """Retorna pendências do processo (devolução e/ou documentos solicitados não atendidos)"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Verificar status do processo
@@ -1153,7 +1042,7 @@ def resolve_issues(process_id):
     resolve_return = data.get('resolve_return', False)
     resolved_doc_ids = data.get('resolved_doc_ids', [])
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Verificar estado atual
@@ -1205,13 +1094,13 @@ def resolve_issues(process_id):
                   (new_status, process_id))
         history_actions.append(('Processo reenviado ao RPPS', 'Todas as pendências foram sanadas'))
     
+    # Registrar ações no histórico (mesma transação das alterações)
+    for action, details in history_actions:
+        log_process_history(process_id, action, details, conn=conn)
+    
     conn.commit()
     conn.close()
     
-    # Registrar ações no histórico
-    for action, details in history_actions:
-        log_process_history(process_id, action, details)
-    
     return jsonify({
         'success': True,
         'all_resolved': all_resolved,
@@ -1223,101 +1112,84 @@ def resolve_issues(process_id):
 @login_required
 def get_process_history(process_id):
     """Retorna histórico completo do processo"""
-    conn = sqlite3.connect('credenciamento.db')
-    c = conn.cursor()
+    # Eventos ainda na fila do audit_writer precisam aparecer na resposta
+    audit_writer.flush()
+    conn = get_db_connection()
     
     # Buscar dados completos do processo para incluir eventos inferidos
-    c.execute('''SELECT created_at, financial_institution_name, rpps_name, status,
-                        submitted_at, reviewed_at, final_decision_at, final_decision
-                 FROM processes WHERE id = ?''', (process_id,))
-    process_data = c.fetchone()
+    process_data = repositories.get_process_timeline(conn, process_id)
     
     # Buscar histórico registrado
-    c.execute('''SELECT user_name, user_role, action, details, created_at 
-                 FROM process_history 
-                 WHERE process_id = ? 
-                 ORDER BY created_at ASC''', (process_id,))
-    history_data = c.fetchall()
+    history_data = repositories.list_process_history(conn, process_id)
     
     # Buscar comunicações de devolução que não estão no histórico
-    c.execute('''SELECT sender_role, message, created_at FROM communications 
-                 WHERE process_id = ? AND message_type = 'return_reason'
-                 ORDER BY created_at ASC''', (process_id,))
-    return_comms = c.fetchall()
+    return_comms = repositories.list_communications_by_type(conn, process_id, 'return_reason')
     
     # Buscar solicitações de documentos
-    c.execute('''SELECT sender_role, message, created_at FROM communications 
-                 WHERE process_id = ? AND message_type = 'document_request'
-                 ORDER BY created_at ASC''', (process_id,))
-    doc_requests = c.fetchall()
+    doc_requests = repositories.list_communications_by_type(conn, process_id, 'document_request')
     
     conn.close()
     
     history = []
-    existing_actions = set()
-    
-    # Rastrear ações já registradas
-    for item in history_data:
-        existing_actions.add((item[2], item[4]))  # (action, created_at)
     
     # Adicionar criação do processo como primeiro item
     if process_data:
         history.append({
-            'user_name': process_data[1] or 'Instituição Financeira',
+            'user_name': process_data.financial_institution_name or 'Instituição Financeira',
             'user_role': 'financial_institution',
             'action': 'Processo criado',
             'details': f'Processo de credenciamento iniciado',
-            'created_at': process_data[0],
+            'created_at': process_data.created_at,
             'icon': 'create'
         })
         
         # Se foi submetido mas não está no histórico, adicionar
-        if process_data[4]:  # submitted_at
-            submitted_found = any('enviado' in str(h[2]).lower() for h in history_data)
+        if process_data.submitted_at:
+            submitted_found = any('enviado' in str(h.action).lower() for h in history_data)
             if not submitted_found:
                 history.append({
-                    'user_name': process_data[1] or 'Instituição Financeira',
+                    'user_name': process_data.financial_institution_name or 'Instituição Financeira',
                     'user_role': 'financial_institution',
                     'action': 'Processo enviado ao RPPS',
                     'details': 'Documentos submetidos para análise',
-                    'created_at': process_data[4],
+                    'created_at': process_data.submitted_at,
                     'icon': 'send'
                 })
     
     # Adicionar histórico registrado
     for item in history_data:
         history.append({
-            'user_name': item[0] or 'Sistema',
-            'user_role': item[1] or 'system',
-            'action': item[2],
-            'details': item[3],
-            'created_at': item[4],
-            'icon': get_history_icon(item[2])
+            'user_name': item.user_name or 'Sistema',
+            'user_role': item.user_role or 'system',
+            'action': item.action,
+            'details': item.details,
+            'created_at': item.created_at,
+            'icon': get_history_icon(item.action)
         })
     
     # Adicionar devoluções da tabela de communications se não estão no histórico
     for comm in return_comms:
-        devol_found = any('devolvido' in str(h.get('action', '')).lower() and h.get('created_at') == comm[2] for h in history)
+        devol_found = any('devolvido' in str(h.get('action', '')).lower() and h.get('created_at') == comm.created_at for h in history)
         if not devol_found:
             history.append({
                 'user_name': 'RPPS',
-                'user_role': comm[0] or 'rpps',
+                'user_role': comm.sender_role or 'rpps',
                 'action': 'Processo devolvido para correção',
-                'details': comm[1].replace('📋 Processo devolvido para correção:\n\n', ''),
-                'created_at': comm[2],
+                'details': comm.message.replace('📋 Processo devolvido para correção:\n\n', ''),
+                'created_at': comm.created_at,
                 'icon': 'return'
             })
     
     # Adicionar solicitações de documentos se não estão no histórico
     for req in doc_requests:
-        req_found = any('solicit' in str(h.get('action', '')).lower() and h.get('created_at') == req[2] for h in history)
+        req_found = any('solicit' in str(h.get('action', '')).lower() and h.get('created_at') == req.created_at for h in history)
         if not req_found:
             history.append({
                 'user_name': 'RPPS',
-                'user_role': req[0] or 'rpps',
+                'user_role': req.sender_role or 'rpps',
                 'action': 'Documento adicional solicitado',
-                'details': req[1].replace('📋 Documento adicional solicitado:\n\n', ''),
-                'created_at': req[2],
+                'details': req.message.replace('📋 Documento adicional solicitado:\n\n', ''),
+                'created_at': req.created_at,
                 'icon': 'request'
             })
     
@@ -1357,7 +1229,7 @@ def get_history_icon(action):
 @login_required
 def get_special_documents(process_id):
     """Retorna documentos especiais (Termo de Credenciamento) com todas as versões"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     c.execute('''SELECT id, document_type, version, status, filename, original_filename, 
@@ -1420,7 +1292,7 @@ def upload_special_document(process_id):
     document_type = request.form.get('document_type', 'termo_credenciamento')
     
     # Calcular próxima versão
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     c.execute('SELECT MAX(version) FROM special_documents WHERE process_id = ? AND document_type = ?', 
@@ -1471,7 +1343,7 @@ def send_term_for_signature(process_id):
     special_doc_id = data.get('special_doc_id')
     message = data.get('message', 'Por favor, assine digitalmente o Termo de Credenciamento e retorne.')
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Se não foi passado special_doc_id, buscar o mais recente com status pdf_rpps_signed
@@ -1515,7 +1387,7 @@ def return_signed_term(process_id):
     if not file:
         return jsonify({'error': 'Nenhum arquivo enviado'}), 400
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Calcular próxima versão
@@ -1555,7 +1427,7 @@ def finalize_term(process_id):
     data = request.json
     special_doc_id = data.get('special_doc_id')
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Buscar documento especial
@@ -1595,7 +1467,7 @@ def finalize_term(process_id):
 @login_required
 def check_term_pending(process_id):
     """Verifica se há termo aguardando assinatura da IF"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     c.execute('''SELECT id, filename, original_filename, notes, created_at 
@@ -1624,7 +1496,7 @@ def check_term_pending(process_id):
 @login_required
 def download_special_document(doc_id):
     """Download de documento especial"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     c.execute('SELECT filename, original_filename, mime_type FROM special_documents WHERE id = ?', (doc_id,))
@@ -1765,7 +1637,7 @@ def sign_process_document(doc_id):
     signature_position = request.form.get('signature_position', 'bottom-right')
     
     # Buscar documento original
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     c.execute('SELECT filename, original_filename, process_id, document_type FROM documents WHERE id = ?', (doc_id,))
@@ -1887,7 +1759,7 @@ def prepare_a3_hash():
 @app.route('/api/process/<int:process_id>/delete', methods=['DELETE'])
 @login_required
 def delete_process(process_id):
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Deletar documentos associados
@@ -1911,7 +1783,7 @@ def login():
         email = data.get('email')
         password = data.get('password')
         
-        conn = sqlite3.connect('credenciamento.db')
+        conn = get_db_connection()
         c = conn.cursor()
         c.execute('SELECT id, email, password, name, role FROM users WHERE email = ?', (email,))
         user = c.fetchone()
@@ -1938,7 +1810,7 @@ def register():
         cpf_cnpj = data.get('cpf_cnpj')
         role = data.get('role')
         
-        conn = sqlite3.connect('credenciamento.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # Verificar se email já existe
@@ -1975,7 +1847,7 @@ def logout():
 @login_required
 def get_profile():
     """Obter dados do perfil do usuário logado"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute('''SELECT id, email, name, cpf_cnpj, role, 
@@ -2012,7 +1884,7 @@ def update_profile():
     """Atualizar dados do perfil do usuário"""
     data = request.get_json()
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Atualizar campos do perfil
@@ -2077,7 +1949,7 @@ def upload_profile_photo():
     
     # Atualizar banco de dados com o caminho relativo
     relative_path = f"uploads/profile_photos/{filename}"
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Obter foto antiga para deletar
@@ -2103,7 +1975,7 @@ def upload_profile_photo():
 @login_required
 def admin_home():
     """Painel administrativo"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     c.execute('SELECT role FROM users WHERE id = ?', (session['user_id'],))
     role = c.fetchone()
@@ -2118,37 +1990,19 @@ def admin_home():
 @login_required
 def admin_stats():
     """Estatísticas para o dashboard admin"""
-    conn = sqlite3.connect('credenciamento.db')
-    c = conn.cursor()
-    
-    # Total de processos
-    c.execute("SELECT COUNT(*) FROM processes")
-    total_processos = c.fetchone()[0]
-    
-    # Processos em análise
-    c.execute("SELECT COUNT(*) FROM processes WHERE status = 'em_analise'")
-    em_analise = c.fetchone()[0]
-    
-    # Processos aprovados
-    c.execute("SELECT COUNT(*) FROM processes WHERE status = 'aprovado'")
-    aprovados = c.fetchone()[0]
-    
-    # Processos devolvidos
-    c.execute("SELECT COUNT(*) FROM processes WHERE status = 'devolvido'")
-    devolvidos = c.fetchone()[0]
-    
-    # Total por categoria
-    c.execute("SELECT COUNT(*) FROM processes WHERE credentialing_type = 'Gestor'")
-    total_gestor = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM processes WHERE credentialing_type = 'Distribuidor'")
-    total_distribuidor = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM processes WHERE credentialing_type = 'Administrador'")
-    total_administrador = c.fetchone()[0]
-    
+    conn = get_db_connection()
+    rollup = repositories.get_status_rollup(conn)
     conn.close()
     
+    # Totais a partir do rollup status x tipo (mantido por triggers)
+    total_processos = sum(row.total for row in rollup)
+    em_analise = sum(row.total for row in rollup if row.status == 'em_analise')
+    aprovados = sum(row.total for row in rollup if row.status == 'aprovado')
+    devolvidos = sum(row.total for row in rollup if row.status == 'devolvido')
+    total_gestor = sum(row.total for row in rollup if row.credentialing_type == 'Gestor')
+    total_distribuidor = sum(row.total for row in rollup if row.credentialing_type == 'Distribuidor')
+    total_administrador = sum(row.total for row in rollup if row.credentialing_type == 'Administrador')
+    
     return jsonify({
         'total_processos': total_processos,
         'em_analise': em_analise,
@@ -2159,12 +2013,96 @@ def admin_stats():
         'total_administrador': total_administrador
     })
 
+@app.route('/api/admin/analysis-stats')
+@login_required
+def admin_analysis_stats():
+    """Indicadores das análises de documentos (agregados em SQL sobre document_analysis)"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'error': 'Acesso negado'}), 403
+    
+    conn = get_db_connection()
+    stats = repositories.get_analysis_stats(conn)
+    top_issues = repositories.list_top_issues(conn)
+    conn.close()
+    
+    by_type = []
+    for row in stats:
+        by_type.append({
+            'document_type': row.document_type,
+            'analyzed': row.analyzed,
+            'average_score': round(float(row.average_score), 1) if row.average_score is not None else None,
+            'approved': row.approved,
+            'rejected': row.rejected,
+            'issue_count': row.issue_count or 0,
+            'warning_count': row.warning_count or 0,
+            'tcees_checked': row.tcees_checked,
+            'tcees_pass_rate': round(100 * row.tcees_passed / row.tcees_checked, 1) if row.tcees_checked else None,
+            'average_latency_ms': round(float(row.average_latency_ms)) if row.average_latency_ms is not None else None
+        })
+    
+    analyzed = sum(row.analyzed for row in stats)
+    tcees_checked = sum(row.tcees_checked for row in stats)
+    return jsonify({
+        'analyzed': analyzed,
+        'approved': sum(row.approved for row in stats),
+        'rejected': sum(row.rejected for row in stats),
+        'tcees_pass_rate': round(100 * sum(row.tcees_passed for row in stats) / tcees_checked, 1) if tcees_checked else None,
+        'by_type': by_type,
+        'top_issues': [{'text': text, 'count': count} for text, count in top_issues]
+    })
+
+@app.route('/api/admin/analysis-cache-stats')
+@login_required
+def admin_analysis_cache_stats():
+    """Taxa de acerto e ocupação do cache de resultados de análise"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'error': 'Acesso negado'}), 403
+    
+    conn = get_db_connection()
+    stats = analysis_cache.get_stats(conn)
+    conn.close()
+    return jsonify(stats)
+
+@app.route('/api/admin/llm-cache-stats')
+@login_required
+def admin_llm_cache_stats():
+    """Acertos, ocupação e tokens economizados pelo cache de respostas da IA"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'error': 'Acesso negado'}), 403
+    
+    conn = get_db_connection()
+    stats = llm_cache.get_stats(conn)
+    conn.close()
+    return jsonify(stats)
+
+@app.route('/api/admin/ai-health')
+@login_required
+def admin_ai_health():
+    """Circuit breaker, limite de taxa e saúde (latência/erros) de cada provedor de IA"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'error': 'Acesso negado'}), 403
+    
+    return jsonify(get_ai_health())
+
+@app.route('/api/admin/ai-usage')
+@login_required
+def admin_ai_usage():
+    """Tokens, custo e latência medidos das chamadas de IA (por dia, modelo, tipo, RPPS e instituição)"""
+    if session.get('user_role') != 'admin':
+        return jsonify({'error': 'Acesso negado'}), 403
+    
+    days = max(1, min(request.args.get('days', 30, type=int), 365))
+    conn = get_db_connection()
+    summary = ai_usage.get_summary(conn, days)
+    conn.close()
+    return jsonify(summary)
+
 @app.route('/admin/category/<categoria>')
 @login_required
 def admin_category(categoria):
     """Visualizar processos por categoria"""
     # Verificar se é admin
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     c.execute('SELECT role FROM users WHERE id = ?', (session['user_id'],))
     role = c.fetchone()
@@ -2196,46 +2134,18 @@ def admin_category(categoria):
     categoria_info = categorias[categoria]
     
     # Buscar processos da categoria
-    c.execute('''
-        SELECT 
-            p.id,
-            p.custom_id,
-            p.institution_name,
-            p.credentialing_type,
-            p.status,
-            p.created_at,
-            COUNT(d.id) as document_count
-        FROM processes p
-        LEFT JOIN documents d ON d.process_id = p.id
-        WHERE p.credentialing_type = ?
-        GROUP BY p.id
-        ORDER BY p.created_at DESC
-    ''', (categoria_info['nome'],))
-    
     processos = []
-    for row in c.fetchall():
-        processos.append({
-            'id': row[0],
-            'custom_id': row[1],
-            'institution_name': row[2],
-            'credentialing_type': row[3],
-            'status': row[4],
-            'created_at': datetime.fromisoformat(row[5]).strftime('%d/%m/%Y') if row[5] else '-',
-            'document_count': row[6]
-        })
-    
-    # Estatísticas da categoria
-    c.execute("SELECT COUNT(*) FROM processes WHERE credentialing_type = ?", (categoria_info['nome'],))
-    total = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM processes WHERE credentialing_type = ? AND status = 'em_analise'", (categoria_info['nome'],))
-    em_analise = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM processes WHERE credentialing_type = ? AND status = 'aprovado'", (categoria_info['nome'],))
-    aprovados = c.fetchone()[0]
-    
-    c.execute("SELECT COUNT(*) FROM processes WHERE credentialing_type = ? AND status = 'devolvido'", (categoria_info['nome'],))
-    devolvidos = c.fetchone()[0]
+    for row in repositories.list_category_processes(conn, categoria_info['nome']):
+        processo = row._asdict()
+        processo['created_at'] = datetime.fromisoformat(row.created_at).strftime('%d/%m/%Y') if row.created_at else '-'
+        processos.append(processo)
+    
+    # Estatísticas da categoria (rollup mantido por triggers)
+    rollup = repositories.get_status_rollup(conn, categoria_info['nome'])
+    total = sum(row.total for row in rollup)
+    em_analise = sum(row.total for row in rollup if row.status == 'em_analise')
+    aprovados = sum(row.total for row in rollup if row.status == 'aprovado')
+    devolvidos = sum(row.total for row in rollup if row.status == 'devolvido')
     
     conn.close()
     
@@ -2256,12 +2166,24 @@ def admin_category(categoria):
 @login_required
 def admin_get_organizations():
     """Lista todas as organizações"""
-    conn = sqlite3.connect('credenciamento.db')
+    page_args = get_page_args()
+    if page_args:
+        conn = get_db_connection()
+        try:
+            page = repositories.page_organizations(conn, request.args.get('status'),
+                                                   request.args.get('q', '').strip(), *page_args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        finally:
+            conn.close()
+        return page_response(page, lambda row: row._asdict())
+    
+    conn = get_db_connection()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
     c.execute('''
-        SELECT o.*, u.email
+        SELECT o.*, MIN(u.email) AS email
         FROM organizations o
         LEFT JOIN users u ON u.organization_id = o.id
         GROUP BY o.id
@@ -2279,7 +2201,7 @@ def admin_create_organization():
     """Cria nova organização e usuário"""
     data = request.json
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     try:
@@ -2356,7 +2278,7 @@ def admin_create_organization():
 @login_required
 def admin_get_subscriptions():
     """Lista todas as assinaturas"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
@@ -2376,7 +2298,7 @@ def admin_get_subscriptions():
 @login_required
 def admin_get_settings():
     """Lista configurações do sistema"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
@@ -2386,11 +2308,38 @@ def admin_get_settings():
     conn.close()
     return jsonify(settings)
 
+@app.route('/api/search')
+@login_required
+def search_processes():
+    """Busca textual em documentos, comunicações e histórico dos processos do usuário"""
+    query = request.args.get('q', '').strip()
+    if len(query) < 2:
+        return jsonify({'results': [], 'count': 0})
+    
+    limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+    
+    conn = get_db_connection()
+    try:
+        results = search_index.search(
+            conn, query,
+            session['user_id'],
+            session.get('user_role'),
+            process_id=request.args.get('process_id', type=int),
+            limit=limit
+        )
+    except Exception as e:
+        print(f"❌ Erro na busca: {e}")
+        return jsonify({'error': 'Consulta de busca inválida'}), 400
+    finally:
+        conn.close()
+    
+    return jsonify({'results': results, 'count': len(results)})
+
 @app.route('/api/user/info')
 @login_required
 def user_info():
     """Retorna informações do usuário logado"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     c.execute('SELECT name, email, role FROM users WHERE id = ?', (session['user_id'],))
     user = c.fetchone()
@@ -2411,36 +2360,37 @@ def user_info():
 def financial_home():
     return render_template('financial_home_final.html')
 
+@app.route('/api/financial/processes/summary')
+@login_required
+@role_required('financial_institution')
+def get_financial_processes_summary():
+    """Totais por tipo x status dos processos da IF"""
+    conn = get_db_connection()
+    rows = repositories.summarize_processes(conn, 'financial', session['user_id'],
+                                            archived=request.args.get('archived', 'false') == 'true')
+    conn.close()
+    return jsonify({
+        'groups': [row._asdict() for row in rows],
+        'total': sum(row.total for row in rows)
+    })
+
 @app.route('/api/financial/processes')
 @login_required
 @role_required('financial_institution')
 def get_financial_processes():
-    conn = sqlite3.connect('credenciamento.db')
-    c = conn.cursor()
-    c.execute('''SELECT p.*, 
-                        (SELECT COUNT(*) FROM documents WHERE process_id = p.id) as doc_count
-                 FROM processes p 
-                 WHERE p.financial_institution_id = ? AND p.is_archived = 0
-                 ORDER BY p.created_at DESC''', (session['user_id'],))
+    if get_page_args():
+        return paginated_processes('financial')
+    
+    conn = get_db_connection()
+    rows = repositories.list_financial_processes(conn, session['user_id'])
+    conn.close()
     
     processes = []
-    for row in c.fetchall():
-        processes.append({
-            'id': row[0],
-            'custom_id': row[1],  # posição 1
-            'financial_institution_id': row[2],
-            'financial_institution_name': row[3],
-            'financial_institution_cnpj': row[4],
-            'rpps_id': row[5],
-            'rpps_name': row[6],
-            'credentialing_type': row[7],
-            'status': row[8],
-            'created_at': row[9],
-            'updated_at': row[10],
-            'document_count': row[18]  # doc_count é a última coluna após todas as 18 colunas da tabela
-        })
+    for row in rows:
+        process = row._asdict()
+        del process['final_decision']
+        processes.append(process)
     
-    conn.close()
     return jsonify(processes)
 
 @app.route('/financial/new-process')
@@ -2454,7 +2404,7 @@ def financial_new_process():
 @role_required('financial_institution')
 def list_rpps():
     """Lista todos os RPPS cadastrados no sistema para a IF escolher"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Buscar todos os RPPS (usuários com role='rpps' e que são entity_id=NULL ou são o próprio entity)
@@ -2485,13 +2435,13 @@ def create_process():
         return jsonify({'error': 'Selecione um RPPS'}), 400
     
     # Obter informações do usuário
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     c.execute('SELECT name, cpf_cnpj FROM users WHERE id = ?', (session['user_id'],))
     user_info = c.fetchone()
     
     # Obter RPPS selecionado
-    c.execute('SELECT id, name FROM users WHERE id = ? AND role = "rpps"', (rpps_id,))
+    c.execute("SELECT id, name FROM users WHERE id = ? AND role = 'rpps'", (rpps_id,))
     rpps_info = c.fetchone()
     
     if not rpps_info:
@@ -2499,7 +2449,7 @@ def create_process():
         return jsonify({'error': 'RPPS não encontrado'}), 404
     
     # Gerar ID customizado
-    custom_id = generate_custom_id(user_info[0], credentialing_type)
+    custom_id = generate_custom_id(conn, user_info[0], credentialing_type)
     
     # Criar processo
     c.execute('''INSERT INTO processes 
@@ -2524,50 +2474,27 @@ def financial_process_detail(process_id):
 @app.route('/api/financial/process/<int:process_id>')
 @login_required
 def get_process_detail(process_id):
-    conn = sqlite3.connect('credenciamento.db')
-    c = conn.cursor()
+    conn = get_db_connection()
     
     # Obter processo
-    c.execute('SELECT * FROM processes WHERE id = ?', (process_id,))
-    process_row = c.fetchone()
+    process_row = repositories.get_process_detail(conn, process_id)
     
     if not process_row:
         conn.close()
         return jsonify({'error': 'Processo não encontrado'}), 404
     
     # Obter documentos
-    c.execute('SELECT * FROM documents WHERE process_id = ?', (process_id,))
-    docs = c.fetchall()
+    docs = repositories.list_documents_with_analysis(conn, process_id)
+    conn.close()
     
     documents = []
     for doc in docs:
-        analysis = json.loads(doc[9]) if doc[9] else None
-        documents.append({
-            'id': doc[0],
-            'type': doc[2],
-            'name': doc[3],
-            'filename': doc[4],
-            'mime_type': doc[5],
-            'uploaded_at': doc[6],
-            'status': doc[8],
-            'analysis': analysis
-        })
-    
-    process = {
-        'id': process_row[0],
-        'custom_id': process_row[1],
-        'financial_institution_name': process_row[3],
-        'rpps_name': process_row[6],
-        'credentialing_type': process_row[7],
-        'status': process_row[8],
-        'created_at': process_row[9],
-        'submitted_at': process_row[11],
-        'documents': documents,
-        'final_review_note': process_row[13],
-        'final_decision': process_row[14]
-    }
+        document = doc._asdict()
+        document['analysis'] = json.loads(document.pop('analysis_data')) if doc.analysis_data else None
+        documents.append(document)
     
-    conn.close()
+    process = process_row._asdict()
+    process['documents'] = documents
     return jsonify(process)
 
 @app.route('/api/upload-document/<int:process_id>', methods=['POST'])
@@ -2631,7 +2558,7 @@ def upload_document(process_id):
     print(f"💾 Arquivo salvo: {filename}")
     
     # Salvar no banco COM STATUS "analyzing" (em análise)
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Análise inicial vazia
@@ -2656,7 +2583,16 @@ def upload_document(process_id):
     c.execute('SELECT financial_institution_name, financial_institution_cnpj FROM processes WHERE id = ?', (process_id,))
     process_info = c.fetchone()
     
+    institution_name = process_info[0] if process_info else None
+    institution_cnpj = process_info[1] if process_info else None
+    
+    # 🚀 ENFILEIRAR ANÁLISE (mesma transação do documento - não se perde em restart)
+    job_id = analysis_pipeline.enqueue_document_analysis(
+        conn, doc_id, process_id, document_type, document_name, filepath, requires_signature,
+        institution_name, institution_cnpj, initial_analysis['uploaded_at'])
+    
     conn.commit()
+    analysis_jobs.worker_pool.wake()
     
     # Se for Termo de Credenciamento, criar também entrada em special_documents
     if document_type == 'termo_credenciamento':
@@ -2673,134 +2609,11 @@ def upload_document(process_id):
     # Registrar no histórico
     log_process_history(process_id, 'Documento enviado', document_name)
     
-    institution_name = process_info[0] if process_info else None
-    institution_cnpj = process_info[1] if process_info else None
-    
-    # 🚀 INICIAR ANÁLISE EM BACKGROUND (não bloqueia o upload)
-    def analyze_in_background():
-        """Função que roda em thread separada para analisar com IA"""
-        try:
-            print(f"🤖 [BACKGROUND] Iniciando análise IA para documento #{doc_id}...")
-            print(f"   Tipo: {document_type} | Arquivo: {document_name}")
-            print(f"   Instituição: {institution_name} | CNPJ: {institution_cnpj}")
-            
-            # ANÁLISE DE IA RIGOROSA
-            ai_result = analyze_document_rigorous(
-                filepath, 
-                document_type, 
-                document_name,
-                institution_name,
-                institution_cnpj
-            )
-            
-            print(f"📊 [BACKGROUND] Resultado da análise IA:")
-            print(f"   Score: {ai_result.get('score', 0)}/100")
-            print(f"   Válido: {ai_result.get('is_valid', False)}")
-            print(f"   Issues: {ai_result.get('issues', [])}")
-            
-            # Atualizar banco com resultado
-            conn_bg = sqlite3.connect('credenciamento.db')
-            c_bg = conn_bg.cursor()
-            
-            # Preparar dados da análise
-            analysis_data = {
-                'status': 'analyzed',
-                'analyzed_at': datetime.now().isoformat(),
-                'uploaded_at': initial_analysis['uploaded_at'],
-                'requires_signature': requires_signature,
-                'ai_content_analysis': ai_result,
-                'signature_validated': False
-            }
-            
-            # Determinar status baseado na análise
-            content_ok = ai_result.get('is_valid', False)
-            
-            # ========== VALIDAÇÃO TCEES (SE REQUER ASSINATURA) ==========
-            tcees_result = None
-            if requires_signature:
-                print(f"🔐 [BACKGROUND] Documento requer assinatura - validando com TCEES...")
-                try:
-                    tcees_result = validate_pdf_with_tcees(filepath)
-                    analysis_data['tcees_validation'] = tcees_result
-                    
-                    # Verificar se passou na validação TCEES
-                    tcees_passed = (
-                        tcees_result.get('assinado', False) and
-                        tcees_result.get('autenticidade_ok', False) and
-                        tcees_result.get('integridade_ok', False) and
-                        tcees_result.get('resultado_final', '') == 'VALIDADO'
-                    )
-                    
-                    analysis_data['signature_validated'] = True
-                    analysis_data['tcees_passed'] = tcees_passed
-                    
-                    print(f"📋 [BACKGROUND] TCEES Result: {tcees_result.get('resultado_final', 'N/A')}")
-                    print(f"   Assinado: {tcees_result.get('assinado', False)}")
-                    print(f"   Autenticidade: {tcees_result.get('autenticidade_ok', False)}")
-                    print(f"   Integridade: {tcees_result.get('integridade_ok', False)}")
-                    print(f"   Pontuação: {tcees_result.get('pontuacao', 0)}/100")
-                    
-                except Exception as tcees_error:
-                    print(f"⚠️ [BACKGROUND] Erro na validação TCEES: {str(tcees_error)}")
-                    import traceback
-                    traceback.print_exc()
-                    analysis_data['tcees_validation'] = {
-                        'resultado_final': 'ERRO',
-                        'erros': [f'Erro ao validar assinatura: {str(tcees_error)[:200]}']
-                    }
-                    analysis_data['signature_validated'] = True
-                    analysis_data['tcees_passed'] = False
-                    tcees_result = analysis_data['tcees_validation']  # Garantir que tcees_result está definido
-            
-            # Determinar status final
-            if not content_ok:
-                final_status = 'rejected'
-                analysis_data['rejection_summary'] = ' | '.join(ai_result.get('issues', ['Documento reprovado']))
-            elif requires_signature:
-                # Se requer assinatura, verificar resultado TCEES
-                if tcees_result and analysis_data.get('tcees_passed', False):
-                    final_status = 'approved'
-                    analysis_data['approval_summary'] = 'Documento aprovado - Conteúdo e assinatura digital válidos'
-                else:
-                    final_status = 'rejected'
-                    tcees_msg = tcees_result.get('resultado_final', 'N/A') if tcees_result else 'Não validado'
-                    analysis_data['rejection_summary'] = f'Assinatura digital: {tcees_msg}'
-            else:
-                final_status = 'approved'
-                analysis_data['approval_summary'] = 'Documento aprovado'
-            
-            analysis_data['final_verdict'] = final_status
-            analysis_data['content_ok'] = content_ok
-            
-            print(f"💾 [BACKGROUND] Atualizando banco de dados...")
-            print(f"   Status final: {final_status}")
-            
-            # Atualizar documento
-            c_bg.execute('''UPDATE documents 
-                           SET status = ?, analysis_data = ?
-                           WHERE id = ?''',
-                        (final_status, json.dumps(analysis_data), doc_id))
-            
-            rows_updated = c_bg.rowcount
-            conn_bg.commit()
-            conn_bg.close()
-            
-            print(f"✅ [BACKGROUND] Análise concluída para documento #{doc_id} (rows_updated: {rows_updated})")
-            print(f"   Score: {ai_result.get('score', 0)}/100 | Status: {final_status}")
-        
-        except Exception as e:
-            print(f"❌ [BACKGROUND] ERRO na análise do documento #{doc_id}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-    
-    # Iniciar thread de análise
-    thread = threading.Thread(target=analyze_in_background, daemon=True)
-    thread.start()
-    
     # ⚡ RETORNO IMEDIATO - Upload concluído, análise rodando em background
     return jsonify({
         'success': True,
         'document_id': doc_id,
+        'job_id': job_id,
         'status': 'analyzing',
         'message': '✅ Documento enviado! A análise com IA está sendo processada...',
         'analyzing': True
@@ -2812,7 +2625,7 @@ def delete_document(document_id):
     """Exclui um documento enviado erroneamente"""
     print(f"\n🗑️ DELETE DOCUMENTO - ID #{document_id}")
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Buscar documento e verificar permissão
@@ -2848,6 +2661,7 @@ def delete_document(document_id):
     if os.path.exists(filepath):
         try:
             os.remove(filepath)
+            remove_sidecar(filepath)
             print(f"🗂️ Arquivo removido: {filename}")
         except Exception as e:
             print(f"⚠️ Erro ao remover arquivo: {e}")
@@ -2868,7 +2682,7 @@ def delete_document(document_id):
 @login_required
 def validate_document_signature(document_id):
     """Valida assinatura digital de um documento usando TCEES"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Buscar documento
@@ -2898,7 +2712,7 @@ def validate_document_signature(document_id):
     
     # Determinar novo status
     signature_ok = signature_validation.get('is_valid', False)
-    content_ok = analysis_data.get('content_ok', False)
+    content_ok = analysis_store.get_content_ok(conn, document_id)
     
     if content_ok and signature_ok:
         new_status = 'approved'
@@ -2911,7 +2725,8 @@ def validate_document_signature(document_id):
     
     # Atualizar banco
     c.execute('UPDATE documents SET status = ?, analysis_data = ? WHERE id = ?',
-              (new_status, json.dumps(analysis_data), document_id))
+              (new_status, analysis_store.archive_payload(analysis_data), document_id))
+    analysis_store.update_signature_result(conn, document_id, signature_ok, new_status)
     conn.commit()
     conn.close()
     
@@ -3195,16 +3010,16 @@ def validar_assinaturas_multiplas():
 @login_required
 @role_required('financial_institution')
 def submit_process(process_id):
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     c.execute('''UPDATE processes 
                  SET status = 'submitted', submitted_at = CURRENT_TIMESTAMP 
                  WHERE id = ?''', (process_id,))
-    conn.commit()
-    conn.close()
     
     # Registrar no histórico
-    log_process_history(process_id, 'Processo enviado ao RPPS', 'Documentos submetidos para análise')
+    log_process_history(process_id, 'Processo enviado ao RPPS', 'Documentos submetidos para análise', conn=conn)
+    conn.commit()
+    conn.close()
     
     return jsonify({'success': True})
 
@@ -3215,42 +3030,34 @@ def submit_process(process_id):
 def rpps_home():
     return render_template('rpps_home_final.html')
 
+@app.route('/api/rpps/processes/summary')
+@login_required
+@role_required('rpps')
+def get_rpps_processes_summary():
+    """Totais por tipo x status para os contadores da tela, sem enviar a lista"""
+    conn = get_db_connection()
+    rows = repositories.summarize_processes(conn, 'rpps', session['user_id'],
+                                            archived=request.args.get('archived', 'false') == 'true')
+    conn.close()
+    return jsonify({
+        'groups': [row._asdict() for row in rows],
+        'total': sum(row.total for row in rows)
+    })
+
 @app.route('/api/rpps/processes')
 @login_required
 @role_required('rpps')
 def get_rpps_processes():
-    show_archived = request.args.get('archived', 'false') == 'true'
+    if get_page_args():
+        return paginated_processes('rpps')
     
-    conn = sqlite3.connect('credenciamento.db')
-    c = conn.cursor()
-    
-    archived_filter = 1 if show_archived else 0
-    c.execute('''SELECT p.*,
-                        (SELECT COUNT(*) FROM documents WHERE process_id = p.id) as doc_count
-                 FROM processes p 
-                 WHERE p.rpps_id = ? AND p.is_archived = ? AND p.status != 'draft'
-                 ORDER BY p.created_at DESC''', (session['user_id'], archived_filter))
-    
-    processes = []
-    for row in c.fetchall():
-        processes.append({
-            'id': row[0],
-            'custom_id': row[1],  # posição 1
-            'financial_institution_id': row[2],
-            'financial_institution_name': row[3],
-            'financial_institution_cnpj': row[4],
-            'rpps_id': row[5],
-            'rpps_name': row[6],
-            'credentialing_type': row[7],
-            'status': row[8],
-            'created_at': row[9],
-            'updated_at': row[10],
-            'document_count': row[18],  # doc_count é a última coluna após todas as 18 colunas da tabela
-            'final_decision': row[14]
-        })
+    show_archived = request.args.get('archived', 'false') == 'true'
     
+    conn = get_db_connection()
+    rows = repositories.list_rpps_processes(conn, session['user_id'], archived=show_archived)
     conn.close()
-    return jsonify(processes)
+    
+    return jsonify([row._asdict() for row in rows])
 
 @app.route('/rpps/process/<int:process_id>')
 @login_required
@@ -3266,7 +3073,7 @@ def review_process(process_id):
     decision = data.get('decision')  # 'approved' or 'rejected'
     note = data.get('note', '')
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     new_status = 'approved' if decision == 'approved' else 'rejected'
@@ -3281,14 +3088,14 @@ def review_process(process_id):
                  WHERE id = ?''',
               (new_status, decision, note, session['user_id'], process_id))
     
-    conn.commit()
-    conn.close()
-    
     # Registrar no histórico
     if decision == 'approved':
-        log_process_history(process_id, 'Processo aprovado', note if note else 'Credenciamento aprovado pelo RPPS')
+        log_process_history(process_id, 'Processo aprovado', note if note else 'Credenciamento aprovado pelo RPPS', conn=conn)
     else:
-        log_process_history(process_id, 'Processo rejeitado', note if note else 'Credenciamento recusado pelo RPPS')
+        log_process_history(process_id, 'Processo rejeitado', note if note else 'Credenciamento recusado pelo RPPS', conn=conn)
+    
+    conn.commit()
+    conn.close()
     
     return jsonify({'success': True})
 
@@ -3296,7 +3103,7 @@ def review_process(process_id):
 @login_required
 @role_required('rpps')
 def archive_process(process_id):
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     c.execute('UPDATE processes SET is_archived = 1 WHERE id = ?', (process_id,))
     conn.commit()
@@ -3308,7 +3115,7 @@ def archive_process(process_id):
 @login_required
 @role_required('rpps')
 def restore_process(process_id):
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     c.execute('UPDATE processes SET is_archived = 0 WHERE id = ?', (process_id,))
     conn.commit()
@@ -3320,7 +3127,7 @@ def restore_process(process_id):
 @login_required
 @role_required('rpps')
 def rpps_delete_process(process_id):
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Deletar documentos físicos
@@ -3329,6 +3136,7 @@ def rpps_delete_process(process_id):
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         if os.path.exists(filepath):
             os.remove(filepath)
+        remove_sidecar(filepath)
     
     # Deletar do banco
     c.execute('DELETE FROM documents WHERE process_id = ?', (process_id,))
@@ -3365,7 +3173,19 @@ def admin_users_page():
 @role_required('admin')
 def get_entities():
     """Lista todas as entidades (RPPS e Instituições Financeiras)"""
-    conn = sqlite3.connect('credenciamento.db')
+    page_args = get_page_args()
+    if page_args:
+        conn = get_db_connection()
+        try:
+            page = repositories.page_entities(conn, request.args.get('type'),
+                                              request.args.get('q', '').strip(), *page_args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        finally:
+            conn.close()
+        return page_response(page, lambda row: row._asdict())
+    
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Buscar todas as entidades (usuários únicos por role)
@@ -3405,7 +3225,7 @@ def get_entities():
 @role_required('admin')
 def get_entity_users(entity_id):
     """Lista os usuários de uma entidade específica"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Buscar entidade
@@ -3460,7 +3280,7 @@ def create_entity_user(entity_id):
     """Cria novo usuário para uma entidade"""
     data = request.json
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Verificar se entidade existe
@@ -3512,7 +3332,7 @@ def update_user(user_id):
     """Atualiza dados de um usuário"""
     data = request.json
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Atualizar campos
@@ -3555,7 +3375,7 @@ def generate_reset_token(user_id):
     token = secrets.token_urlsafe(32)
     expires = (datetime.now() + timedelta(hours=24)).isoformat()
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     c.execute('''
@@ -3599,7 +3419,7 @@ def authorize_process(process_id):
     
     # Verificar senha do usuário logado
     user_id = session.get('user_id')
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     c.execute('SELECT password FROM users WHERE id = ?', (user_id,))
@@ -3634,7 +3454,7 @@ def authorize_process(process_id):
 @role_required('financial')
 def analyze_documents_pre(process_id):
     """Pré-análise de documentos pela IF antes de enviar"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Buscar documentos do processo
@@ -3703,7 +3523,7 @@ def analyze_documents_pre(process_id):
 @role_required('rpps')
 def get_ai_analysis(process_id):
     """Retorna análise completa de IA para o RPPS"""
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     c.execute('''
@@ -3733,7 +3553,7 @@ def get_analysis_report(process_id):
     """Retorna dados completos da análise para o relatório visual"""
     print(f"\n📊 Gerando relatório de análise para processo #{process_id}")
     
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
@@ -3749,77 +3569,50 @@ def get_analysis_report(process_id):
         return jsonify({'success': False, 'error': 'Processo não encontrado'}), 404
     
     process = dict(process_row)
+    conn.row_factory = None
     
-    # Buscar todos os documentos do processo
-    c.execute('''SELECT id, type, name, filename, status, analysis_data, 
-                 uploaded_at
-                 FROM documents WHERE process_id = ? ORDER BY uploaded_at''', 
-              (process_id,))
-    documents_rows = c.fetchall()
+    # Documentos com o resultado estruturado da análise (document_analysis / document_issue)
+    document_rows = repositories.list_document_report(conn, process_id)
+    document_issues = repositories.list_document_issues(conn, process_id)
+    summary = repositories.summarize_document_analysis(conn, process_id)
     
     conn.close()
     
-    # Processar documentos
     documents = []
-    total_score = 0
-    num_docs = 0
-    approved = 0
-    rejected = 0
-    warnings = 0
-    
-    for doc_row in documents_rows:
-        doc = dict(doc_row)
-        analysis_data = json.loads(doc['analysis_data']) if doc['analysis_data'] else {}
-        
-        # Extrair dados da análise
-        ai_analysis = analysis_data.get('ai_content_analysis', {})
-        signature_validation = analysis_data.get('signature_validation', {})
-        
-        # Calcular score
-        score = ai_analysis.get('score', 50)
-        is_valid = ai_analysis.get('is_valid', False)
-        
-        # Contabilizar
-        total_score += score
-        num_docs += 1
-        
-        if is_valid:
-            approved += 1
-        else:
-            rejected += 1
-        
-        if len(ai_analysis.get('warnings', [])) > 0:
-            warnings += 1
+    for doc in document_rows:
+        score = doc.score
+        issues = document_issues.get(doc.id, {})
         
         # Montar estrutura de documento com comentários explicativos
         doc_info = {
-            'id': doc['id'],
-            'name': doc['name'],
-            'type': doc['type'],
-            'filename': doc['filename'],
-            'status': doc['status'],
-            'uploaded_at': doc['uploaded_at'],
+            'id': doc.id,
+            'name': doc.name,
+            'type': doc.type,
+            'filename': doc.filename,
+            'status': doc.status,
+            'uploaded_at': doc.uploaded_at,
             'analysis': {
                 'score': score,
-                'is_valid': is_valid,
-                'issues': ai_analysis.get('issues', []),
-                'warnings': ai_analysis.get('warnings', []),
-                'summary': ai_analysis.get('summary', 'Análise concluída pela IA'),
+                'is_valid': bool(doc.is_valid),
+                'issues': issues.get('issue', []),
+                'warnings': issues.get('warning', []),
+                'summary': doc.summary or 'Análise concluída pela IA',
                 'tipo_correto': True,
                 'tipo_correto_comentario': 'Documento corresponde ao tipo declarado',
-                'instituicao_mencionada': ai_analysis.get('institution_mentioned', True),
-                'instituicao_comentario': ai_analysis.get('institution_comment', 'Instituição identificada no documento'),
-                'completude': ai_analysis.get('completeness', score),
-                'completude_comentario': ai_analysis.get('completeness_comment', f'Documento apresenta {score}% das informações esperadas'),
-                'coerencia': ai_analysis.get('coherence', score),
-                'coerencia_comentario': ai_analysis.get('coherence_comment', f'Informações apresentam coerência de {score}%')
+                'instituicao_mencionada': bool(doc.institution_mentioned) if doc.institution_mentioned is not None else True,
+                'instituicao_comentario': doc.institution_comment or 'Instituição identificada no documento',
+                'completude': doc.completeness if doc.completeness is not None else score,
+                'completude_comentario': doc.completeness_comment or f'Documento apresenta {score}% das informações esperadas',
+                'coerencia': doc.coherence if doc.coherence is not None else score,
+                'coerencia_comentario': doc.coherence_comment or f'Informações apresentam coerência de {score}%'
             }
         }
         
         documents.append(doc_info)
     
     # Calcular média
-    average_score = round(total_score / num_docs) if num_docs > 0 else 0
+    num_docs = summary.total_documents
+    average_score = round(summary.score_sum / num_docs) if num_docs > 0 else 0
     
     # Montar resposta
     report = {
@@ -3834,9 +3627,9 @@ def get_analysis_report(process_id):
             'created_at': process['created_at']
         },
         'summary': {
-            'approved': approved,
-            'rejected': rejected,
-            'warnings': warnings,
+            'approved': summary.approved,
+            'rejected': summary.rejected,
+            'warnings': summary.warnings,
             'average_score': average_score,
             'total_documents': num_docs
         },
@@ -3879,7 +3672,7 @@ def prepare_termo_pdf(doc_id):
         if file.filename == '':
             return jsonify({'error': 'Arquivo vazio'}), 400
         
-        conn = sqlite3.connect('credenciamento.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # Buscar documento original
@@ -3951,7 +3744,7 @@ def termo_if_signed(doc_id):
         if file.filename == '':
             return jsonify({'error': 'Arquivo vazio'}), 400
         
-        conn = sqlite3.connect('credenciamento.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # Buscar documento
@@ -4025,7 +3818,7 @@ def termo_final_signed(doc_id):
         if file.filename == '':
             return jsonify({'error': 'Arquivo vazio'}), 400
         
-        conn = sqlite3.connect('credenciamento.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         # Buscar documento
@@ -4083,7 +3876,7 @@ def termo_final_signed(doc_id):
 def get_termo_status(doc_id):
     """Obter status do workflow do termo"""
     try:
-        conn = sqlite3.connect('credenciamento.db')
+        conn = get_db_connection()
         c = conn.cursor()
         
         c.execute('''
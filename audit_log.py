@@ -0,0 +1,177 @@
+"""
+Gravação do Histórico de Processos (process_history) com Group Commit
+Os eventos vão para uma fila em memória; uma única thread escritora junta o que
+chegou em poucos milissegundos e grava tudo em uma transação (um fsync por lote).
+
+    audit_writer.enqueue(event)        # assíncrono (padrão do log_process_history)
+    write_history_event(conn, event)   # dentro da transação do chamador
+    audit_writer.flush()               # espera a fila esvaziar (leituras do histórico)
+
+No encerramento do processo (atexit) a fila é drenada antes de sair.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from database import get_db_connection, release_thread_connection
+
+FLUSH_INTERVAL_MS = int(os.getenv('AUDIT_FLUSH_INTERVAL_MS', '10'))
+MAX_BATCH_SIZE = int(os.getenv('AUDIT_MAX_BATCH_SIZE', '500'))
+SHUTDOWN_TIMEOUT = float(os.getenv('AUDIT_SHUTDOWN_TIMEOUT', '10'))
+WRITE_RETRIES = 3
+
+HistoryEvent = namedtuple('HistoryEvent', [
+    'process_id', 'user_id', 'user_name', 'user_role', 'action', 'details', 'created_at'
+])
+
+_INSERT_SQL = '''INSERT INTO process_history (process_id, user_id, user_name, user_role, action, details, created_at)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+
+def utc_timestamp():
+    """Mesmo formato de datetime('now') do SQLite, fixado no momento do evento"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def make_event(process_id, action, details=None, user_id=None, user_name=None, user_role=None):
+    return HistoryEvent(process_id, user_id, user_name, user_role, action, details, utc_timestamp())
+
+
+def write_history_event(conn, event):
+    """Grava o evento na transação do chamador (commit fica por conta dele)"""
+    conn.cursor().execute(_INSERT_SQL, tuple(event))
+
+
+class AuditWriter:
+    """Fila + thread escritora única; inicia sob demanda e reinicia após fork"""
+
+    def __init__(self, flush_interval_ms=FLUSH_INTERVAL_MS, max_batch_size=MAX_BATCH_SIZE):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+
+    def _ensure_thread(self):
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                # Fila herdada do processo pai não tem escritor neste processo
+                self._queue = queue.Queue()
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, event):
+        self._ensure_thread()
+        self._queue.put(event)
+
+    def flush(self, timeout=5.0):
+        """Espera até que todos os eventos enfileirados estejam gravados"""
+        if self._thread is None or self._pid != os.getpid():
+            return True
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout=SHUTDOWN_TIMEOUT):
+        """Drena a fila e encerra a thread (chamado no atexit)"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"⚠️  Histórico: {self._queue.qsize()} evento(s) não gravados no encerramento")
+
+    def _collect_batch(self, first):
+        """Junta os eventos que chegarem dentro da janela de group commit"""
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                event = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(event)
+            if event is None:
+                break
+        return batch
+
+    def _write_batch(self, events):
+        for attempt in range(1, WRITE_RETRIES + 1):
+            conn = get_db_connection()
+            try:
+                conn.executemany(_INSERT_SQL, [tuple(event) for event in events])
+                conn.commit()
+                self.written += len(events)
+                self.batches += 1
+                return
+            except Exception as e:
+                conn.rollback()
+                if attempt == WRITE_RETRIES:
+                    self.dropped += len(events)
+                    print(f"❌ Erro ao gravar {len(events)} evento(s) do histórico: {e}")
+                    return
+                time.sleep(0.05 * attempt)
+            finally:
+                conn.close()
+
+    def _run(self):
+        try:
+            while True:
+                first = self._queue.get()
+                batch = self._collect_batch(first)
+                events = [event for event in batch if event is not None]
+                try:
+                    if events:
+                        self._write_batch(events)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+                if len(events) < len(batch):
+                    # Sentinela de encerramento: grava o que restou e sai
+                    leftover = []
+                    while True:
+                        try:
+                            leftover.append(self._queue.get_nowait())
+                        except queue.Empty:
+                            break
+                    pending = [event for event in leftover if event is not None]
+                    if pending:
+                        self._write_batch(pending)
+                    for _ in leftover:
+                        self._queue.task_done()
+                    return
+        finally:
+            release_thread_connection()
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'dropped': self.dropped
+        }
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.close)
@@ -0,0 +1,127 @@
+"""
+Benchmark: análise de IA de vários documentos - uma chamada por vez x em paralelo
+Os provedores reais (OpenAI / Anthropic) rodam com um transporte httpx simulado:
+cada chamada responde depois de --latency segundos (com variação), sem rede e sem
+chave de API. Compara get_ai_analysis em sequência com get_ai_analyses (fan-out
+limitado pelo semáforo do provedor) e confere que os resultados são os mesmos.
+
+    python benchmarks/bench_ai_fanout.py                              # 20 documentos, OpenAI
+    python benchmarks/bench_ai_fanout.py --documents 50 --concurrency 8
+    python benchmarks/bench_ai_fanout.py --provider anthropic --latency 2
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import time
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_transport(latency, jitter, stats):
+    """Transporte httpx que responde no formato da API de cada provedor após um atraso"""
+    import httpx
+
+    class SlowTransport(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            stats['active'] += 1
+            stats['peak'] = max(stats['peak'], stats['active'])
+            stats['calls'] += 1
+            try:
+                body = json.loads(request.content)
+                prompt = body['messages'][-1]['content']
+                await asyncio.sleep(latency * random.uniform(1 - jitter, 1 + jitter))
+            finally:
+                stats['active'] -= 1
+            analysis = json.dumps({'is_valid': True, 'score': len(prompt) % 100, 'issues': [], 'warnings': []})
+            if request.url.path.endswith('/chat/completions'):
+                payload = {
+                    'id': 'bench', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': analysis}}],
+                    'usage': {'prompt_tokens': 100, 'completion_tokens': 50, 'total_tokens': 150}
+                }
+            else:
+                payload = {
+                    'id': 'bench', 'type': 'message', 'role': 'assistant', 'model': body['model'],
+                    'content': [{'type': 'text', 'text': analysis}], 'stop_reason': 'end_turn',
+                    'stop_sequence': None, 'usage': {'input_tokens': 100, 'output_tokens': 50}
+                }
+            return httpx.Response(200, json=payload)
+
+    return SlowTransport()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--provider', choices=['openai', 'anthropic'], default='openai')
+    parser.add_argument('--documents', type=int, default=20, help='documentos do processo')
+    parser.add_argument('--latency', type=float, default=1.0, help='segundos por chamada (média)')
+    parser.add_argument('--jitter', type=float, default=0.3, help='variação da latência (0.3 = ±30%%)')
+    parser.add_argument('--concurrency', type=int, default=None, help='limite do provedor (padrão: AI_MAX_CONCURRENCY)')
+    parser.add_argument('--skip-sequential', action='store_true', help='não roda a versão em sequência')
+    args = parser.parse_args()
+
+    # Mede só as chamadas: sem o cache de respostas, a 2ª rodada não iria ao provedor
+    os.environ['LLM_CACHE'] = 'false'
+    os.environ['AI_USAGE_TRACKING'] = 'false'
+    sys.path.insert(0, ROOT)
+    with redirect_stdout(io.StringIO()):
+        import ai_config
+
+    provider_class = {'openai': ai_config.OpenAIProvider, 'anthropic': ai_config.AnthropicProvider}[args.provider]
+    provider = provider_class('chave-de-benchmark')
+    if not provider.available:
+        print(f"❌ SDK do provedor {args.provider} não instalado")
+        return 1
+    if args.concurrency:
+        provider.max_concurrency = args.concurrency
+    stats = {'active': 0, 'peak': 0, 'calls': 0}
+    provider.transport = make_transport(args.latency, args.jitter, stats)
+    ai_config.ai_engine.providers = {args.provider: provider}
+    ai_config.ai_engine.active_provider = args.provider
+
+    requests = [(f'Analise o documento {i} do processo', f'Conteúdo do documento {i} ' * 20, 'apresentacao_institucional')
+                for i in range(args.documents)]
+
+    print(f"\n📊 {args.documents} documento(s), {args.provider}, latência {args.latency}s ±{args.jitter * 100:.0f}%, "
+          f"limite {provider.max_concurrency} chamada(s) simultânea(s)")
+
+    sequential = None
+    if not args.skip_sequential:
+        start = time.perf_counter()
+        sequential = [ai_config.get_ai_analysis(*request) for request in requests]
+        sequential_time = time.perf_counter() - start
+        print(f"   em sequência:  {sequential_time:6.2f}s")
+
+    stats['peak'] = 0
+    start = time.perf_counter()
+    parallel = ai_config.get_ai_analyses(requests)
+    parallel_time = time.perf_counter() - start
+    rounds = -(-args.documents // provider.max_concurrency)
+    print(f"   em paralelo:   {parallel_time:6.2f}s  (pico de {stats['peak']} chamada(s) simultânea(s); "
+          f"~{rounds} rodada(s) de {args.latency}s)")
+    if sequential is not None:
+        print(f"   ganho:         {sequential_time / parallel_time:6.1f}x")
+
+    failed = [r for r in parallel if not r.get('success')]
+    if failed:
+        print(f"❌ {len(failed)} chamada(s) falharam: {failed[0].get('error')}")
+        return 1
+    if sequential is not None and [r['analysis'] for r in sequential] != [r['analysis'] for r in parallel]:
+        print("❌ Resultados diferentes entre os dois modos")
+        return 1
+    if stats['peak'] > provider.max_concurrency:
+        print(f"❌ Limite do provedor ultrapassado ({stats['peak']} > {provider.max_concurrency})")
+        return 1
+    print("✅ Mesmos resultados, na ordem dos documentos, dentro do limite do provedor")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Benchmark: provedor de IA em tempestade de 429 / limite de taxa - fallback pela saúde
+Dois provedores reais (OpenAI e Anthropic) com transporte httpx simulado, sem rede:
+
+    storm  OpenAI (preferido) responde 429 com Retry-After a todas as chamadas;
+           o circuit breaker abre após AI_BREAKER_FAILURES falhas e o tráfego vai
+           para o Anthropic sem sleep (antes: 5s + 10s de espera por modelo Gemini,
+           com todos os workers dormindo juntos)
+    rpm    OpenAI saudável mas com --rpm requisições/minuto; o excedente da rajada
+           segue para o Anthropic em vez de esperar vaga
+
+    python benchmarks/bench_ai_resilience.py                       # storm, 30 documentos
+    python benchmarks/bench_ai_resilience.py --scenario rpm --rpm 10
+    python benchmarks/bench_ai_resilience.py --documents 100 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_rate_limited_transport(stats, retry_after):
+    """Transporte httpx que responde 429 (formato de erro da OpenAI) a todas as chamadas"""
+    import httpx
+
+    class RateLimitedTransport(httpx.AsyncBaseTransport):
+        async def handle_async_request(self, request):
+            stats['calls'] += 1
+            await asyncio.sleep(0.01)
+            return httpx.Response(429, headers={'retry-after': str(retry_after)},
+                                  json={'error': {'message': 'Rate limit reached', 'type': 'requests',
+                                                  'code': 'rate_limit_exceeded'}})
+
+    return RateLimitedTransport()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=['storm', 'rpm'], default='storm')
+    parser.add_argument('--documents', type=int, default=30, help='documentos analisados em paralelo')
+    parser.add_argument('--latency', type=float, default=0.3, help='segundos por chamada do provedor saudável')
+    parser.add_argument('--rpm', type=int, default=10, help='limite de requisições/minuto do OpenAI (cenário rpm)')
+    parser.add_argument('--retry-after', type=int, default=30, help='Retry-After das respostas 429 (cenário storm)')
+    args = parser.parse_args()
+
+    os.environ['LLM_CACHE'] = 'false'
+    os.environ['AI_USAGE_TRACKING'] = 'false'
+    if args.scenario == 'rpm':
+        os.environ['AI_RPM_OPENAI'] = str(args.rpm)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    with redirect_stdout(io.StringIO()):
+        import ai_config
+        import ai_resilience
+    from bench_ai_fanout import make_transport
+
+    openai_stats = {'active': 0, 'peak': 0, 'calls': 0}
+    anthropic_stats = {'active': 0, 'peak': 0, 'calls': 0}
+    openai = ai_config.OpenAIProvider('chave-de-benchmark')
+    anthropic = ai_config.AnthropicProvider('chave-de-benchmark')
+    if not (openai.available and anthropic.available):
+        print("❌ SDKs openai e anthropic são necessários")
+        return 1
+    if args.scenario == 'storm':
+        openai.transport = make_rate_limited_transport(openai_stats, args.retry_after)
+    else:
+        openai.transport = make_transport(args.latency, 0.1, openai_stats)
+    anthropic.transport = make_transport(args.latency, 0.1, anthropic_stats)
+    ai_config.ai_engine.providers = {'openai': openai, 'anthropic': anthropic}
+    ai_config.ai_engine.active_provider = 'openai'
+
+    requests = [(f'Analise o documento {i} do processo', f'Conteúdo do documento {i} ' * 20, 'rating')
+                for i in range(args.documents)]
+    print(f"\n📊 Cenário {args.scenario}: {args.documents} documento(s), preferido openai, "
+          f"latência {args.latency}s, breaker após {ai_resilience.FAILURE_THRESHOLD} falha(s)")
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        results = ai_config.get_ai_analyses(requests)
+    elapsed = time.perf_counter() - start
+
+    providers = Counter(r.get('engine_info', {}).get('provider', 'falhou') for r in results)
+    rounds = -(-args.documents // anthropic.max_concurrency)
+    print(f"   tempo total:        {elapsed:6.2f}s  (~{rounds} rodada(s) de {args.latency}s no provedor saudável)")
+    print(f"   chamadas HTTP:      openai {openai_stats['calls']}, anthropic {anthropic_stats['calls']}")
+    print(f"   respondido por:     {dict(providers)}")
+    health = ai_config.get_ai_health()
+    for name, snapshot in health['providers'].items():
+        print(f"   {name:<10} circuito {snapshot['state']:<9} erro {snapshot['error_rate']:.2f}  "
+              f"latência {snapshot['latency_ms']}ms  recusadas {snapshot['rejected']}  "
+              f"bloqueio {snapshot['blocked_for']}s  taxa x{snapshot['rate_factor']}")
+    print(f"   ordem de fallback agora: {health['order']}")
+
+    if providers.get('falhou'):
+        print(f"❌ {providers['falhou']} documento(s) sem resposta")
+        return 1
+    if args.scenario == 'storm' and openai_stats['calls'] > ai_resilience.FAILURE_THRESHOLD + openai.max_concurrency:
+        print(f"❌ Provedor em 429 continuou recebendo chamadas ({openai_stats['calls']})")
+        return 1
+    if args.scenario == 'rpm' and openai_stats['calls'] > args.rpm:
+        print(f"❌ Limite de {args.rpm} rpm ultrapassado ({openai_stats['calls']})")
+        return 1
+    print("✅ Todos os documentos respondidos sem esperas; tráfego desviado para o provedor saudável")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Benchmark: uso medido da IA e orçamento diário (ai_usage)
+Provedor real (OpenAI / Anthropic) com o transporte httpx simulado de
+bench_ai_fanout (100 tokens de entrada e 50 de saída por chamada) e um banco
+temporário com dois processos do mesmo RPPS em instituições diferentes.
+Várias threads analisam documentos ao mesmo tempo, cada uma marcada com
+ai_usage.attribute(processo, documento). Cada instituição tem orçamento de
+--budget US$ por dia: o 1º processo tem documentos demais para ele, o 2º cabe
+folgado. Confere que:
+
+    - cada chamada ficou registrada no processo/documento certo, com os tokens reais
+    - o gasto da 1ª instituição não passou do orçamento e o excedente nem chegou ao
+      provedor; a 2ª (outro orçamento) não teve nenhuma recusa
+    - o total de ai_budget_usage bate com a soma de ai_call_usage e não sobra reserva
+
+    python benchmarks/bench_ai_usage.py
+    python benchmarks/bench_ai_usage.py --documents 200 --budget 0.5 --threads 16
+    python benchmarks/bench_ai_usage.py --provider anthropic --budget 1
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# processo -> instituição financeira (orçamentos separados)
+INSTITUTIONS = {1: 902, 2: 903}
+
+
+def create_processes(conn):
+    """RPPS #901 com um processo na IF #902 e outro na IF #903"""
+    c = conn.cursor()
+    for user_id, name, role in [(901, 'RPPS Benchmark', 'rpps'), (902, 'IF Excedente', 'financial'),
+                                (903, 'IF Folgada', 'financial')]:
+        c.execute('''INSERT INTO users (id, email, password, name, cpf_cnpj, role)
+                     VALUES (?, ?, '-', ?, '-', ?)''', (user_id, f'bench{user_id}@example.com', name, role))
+    for process_id, institution_id in INSTITUTIONS.items():
+        c.execute('''INSERT INTO processes (id, financial_institution_id, financial_institution_name, rpps_id,
+                                            rpps_name, credentialing_type)
+                     VALUES (?, ?, ?, 901, 'RPPS Benchmark', 'Gestor')''',
+                  (process_id, institution_id, f'IF #{institution_id}'))
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--provider', choices=['openai', 'anthropic'], default='openai')
+    parser.add_argument('--documents', type=int, default=80, help='documentos do 1º processo (o 2º tem 1/4)')
+    parser.add_argument('--threads', type=int, default=8, help='threads analisando ao mesmo tempo')
+    parser.add_argument('--latency', type=float, default=0.05, help='segundos por chamada')
+    parser.add_argument('--budget', type=float, default=0.2, help='orçamento diário (US$) de cada instituição')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_ai_usage_')
+    os.chdir(workdir)
+    os.environ.pop('DATABASE_URL', None)
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'bench.db')
+    os.environ['LLM_CACHE'] = 'false'
+    os.environ['AI_USAGE_TRACKING'] = 'true'
+    os.environ['AI_BUDGET_INSTITUTION_DAILY_USD'] = str(args.budget)
+    os.environ['AI_BUDGET_RPPS_DAILY_USD'] = '0'
+    os.environ['AI_BUDGET_DAILY_USD'] = '0'
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    with redirect_stdout(io.StringIO()):
+        import ai_config
+        import ai_usage
+        from database import get_db_connection
+        from migrations import run_migrations
+        run_migrations(verbose=False)
+    from bench_ai_fanout import make_transport
+
+    provider_class = {'openai': ai_config.OpenAIProvider, 'anthropic': ai_config.AnthropicProvider}[args.provider]
+    provider = provider_class('chave-de-benchmark')
+    if not provider.available:
+        print(f"❌ SDK do provedor {args.provider} não instalado")
+        return 1
+    stats = {'active': 0, 'peak': 0, 'calls': 0}
+    provider.transport = make_transport(args.latency, 0.2, stats)
+    ai_config.ai_engine.providers = {args.provider: provider}
+    ai_config.ai_engine.active_provider = args.provider
+
+    conn = get_db_connection()
+    create_processes(conn)
+    conn.close()
+
+    def analyze(process_id, document_id):
+        with ai_usage.attribute(process_id, document_id):
+            return ai_config.get_ai_analysis(f'Analise o documento {document_id} do processo {process_id}',
+                                             f'Conteúdo do documento {document_id} ' * 20, 'rating')
+
+    # Documentos dos dois processos intercalados: as threads misturam as atribuições
+    small = max(1, args.documents // 4)
+    work = [(process_id, process_id * 10000 + i) for i in range(args.documents) for process_id in (1, 2)
+            if process_id == 1 or i < small]
+    print(f"\n📊 {len(work)} documento(s) em {args.threads} thread(s), {args.provider} ({provider.model}), "
+          f"orçamento de US$ {args.budget:.2f}/dia por instituição")
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()), ThreadPoolExecutor(args.threads) as pool:
+        results = list(pool.map(lambda item: analyze(*item), work))
+    elapsed = time.perf_counter() - start
+
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('''SELECT process_id, COUNT(*), SUM(input_tokens), SUM(output_tokens), SUM(cost_usd),
+                        COUNT(DISTINCT document_id), SUM(CASE WHEN document_id / 10000 = process_id THEN 1 ELSE 0 END)
+                 FROM ai_call_usage GROUP BY process_id ORDER BY process_id''')
+    by_process = {row[0]: row[1:] for row in c.fetchall()}
+    c.execute('''SELECT scope, scope_id, calls, cost_usd, reserved_usd FROM ai_budget_usage''')
+    budgets = {(row[0], row[1]): row[2:] for row in c.fetchall()}
+    c.execute('SELECT SUM(cost_usd) FROM ai_call_usage')
+    logged_cost = c.fetchone()[0] or 0.0
+    summary = ai_usage.get_summary(conn, 1)
+    conn.close()
+
+    refused = sum(1 for r in results if r.get('budget_exceeded'))
+    print(f"   tempo total:          {elapsed:6.2f}s  ({stats['calls']} chamada(s) ao provedor, pico {stats['peak']})")
+    for process_id, institution_id in INSTITUTIONS.items():
+        calls, input_tokens, output_tokens, cost, documents, matched = by_process.get(process_id, (0,) * 6)
+        print(f"   processo {process_id} (IF #{institution_id}): {calls:>4} chamada(s), {documents:>4} documento(s), "
+              f"{input_tokens or 0:>6} + {output_tokens or 0:>5} tokens, US$ {cost or 0:.4f}")
+    print(f"   recusadas pelo orçamento: {refused} (sem chamada ao provedor)")
+    print(f"   antes: {len(work) * 3000} tokens estimados (3000/documento); "
+          f"medido: {summary['input_tokens'] + summary['output_tokens']} tokens, US$ {summary['cost_usd']:.4f}")
+
+    limited = budgets.get(('institution', INSTITUTIONS[1]), (0, 0.0, 0.0))
+    global_row = budgets.get(('global', 0), (0, 0.0, 0.0))
+    if stats['calls'] != sum(row[0] for row in by_process.values()):
+        print(f"❌ Chamadas ao provedor ({stats['calls']}) diferentes das registradas")
+        return 1
+    if any(row[5] != row[0] for row in by_process.values()):
+        print("❌ Chamada registrada no processo errado")
+        return 1
+    if any(row[1] != row[0] * 100 or row[2] != row[0] * 50 for row in by_process.values()):
+        print("❌ Tokens registrados diferentes dos informados pelo provedor")
+        return 1
+    if limited[1] > args.budget + 1e-9:
+        print(f"❌ Orçamento da IF #{INSTITUTIONS[1]} ultrapassado: US$ {limited[1]:.4f} > {args.budget:.2f}")
+        return 1
+    if not refused or by_process.get(2, (0,))[0] != small:
+        print("❌ Só a instituição que passou do orçamento deveria ter chamadas recusadas")
+        return 1
+    if abs(global_row[1] - logged_cost) > 1e-6 or any(abs(row[2]) > 1e-9 for row in budgets.values()):
+        print(f"❌ Orçamento desencontrado do registro (US$ {global_row[1]:.6f} x {logged_cost:.6f}) ou reserva pendente")
+        return 1
+    print(f"✅ Atribuição correta, gasto da IF #{INSTITUTIONS[1]} US$ {limited[1]:.4f} dentro de US$ {args.budget:.2f}, "
+          f"orçamento igual à soma das chamadas e nenhuma reserva pendente")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
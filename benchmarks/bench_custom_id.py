@@ -0,0 +1,97 @@
+"""
+Benchmark: criação concorrente de processos (custom_id)
+Cria milhares de processos em paralelo pela rota /api/financial/create-process,
+em um banco temporário, e confere que nenhum custom_id colidiu.
+
+    python benchmarks/bench_custom_id.py                       # 4000 processos, 16 threads
+    python benchmarks/bench_custom_id.py --total 10000 --workers 32
+    python benchmarks/bench_custom_id.py --legacy              # compara com o LIKE + ORDER BY antigo
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def legacy_custom_id(conn, institution_name, credentialing_type):
+    """Algoritmo anterior: busca o maior ID com LIKE em outra consulta, sem reserva"""
+    institution_code = ''.join(ch.upper() for ch in institution_name if ch.isalpha())[:2].ljust(2, 'X')
+    type_letter = {'savings_management': 'G', 'investments': 'D', 'custody': 'A'}.get(credentialing_type, 'X')
+    c = conn.cursor()
+    c.execute('''SELECT custom_id FROM processes WHERE custom_id LIKE ?
+                 ORDER BY custom_id DESC LIMIT 1''', (f'{institution_code}%',))
+    last_id = c.fetchone()
+    next_number = int(last_id[0][2:7]) + 1 if last_id and last_id[0] else 1
+    return f"{institution_code}{next_number:05d}{type_letter}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--total', type=int, default=4000, help='processos a criar')
+    parser.add_argument('--workers', type=int, default=16, help='threads concorrentes')
+    parser.add_argument('--legacy', action='store_true', help='usar o gerador antigo (para comparação)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_custom_id_')
+    os.chdir(workdir)
+    if not os.getenv('DATABASE_URL'):
+        os.environ['DATABASE_PATH'] = os.path.join(workdir, 'bench.db')
+    sys.path.insert(0, ROOT)
+
+    import app as app_module
+    if args.legacy:
+        app_module.generate_custom_id = legacy_custom_id
+
+    errors = []
+    created = []
+    lock = threading.Lock()
+    per_worker = args.total // args.workers
+
+    def worker():
+        client = app_module.app.test_client()
+        client.post('/login', json={'email': 'financeira@teste.com', 'password': 'financeira123'})
+        for i in range(per_worker):
+            response = client.post('/api/financial/create-process',
+                                   json={'credentialing_type': 'investments', 'rpps_id': 1})
+            with lock:
+                if response.status_code == 200:
+                    created.append(response.get_json()['custom_id'])
+                else:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.workers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    conn = app_module.get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT COUNT(*), COUNT(DISTINCT custom_id) FROM processes')
+    rows, distinct_ids = c.fetchone()
+    conn.close()
+
+    mode = 'gerador antigo (LIKE)' if args.legacy else 'id_sequences'
+    print(f"\n📊 Criação concorrente de processos - {mode}")
+    print(f"   Threads: {args.workers} | Tentativas: {per_worker * args.workers}")
+    print(f"   Criados: {len(created)} | Falhas (colisão de UNIQUE): {len(errors)}")
+    print(f"   IDs duplicados retornados: {len(created) - len(set(created))}")
+    print(f"   Linhas no banco: {rows} | custom_id distintos: {distinct_ids}")
+    print(f"   Tempo: {elapsed:.2f}s | {len(created) / elapsed:.0f} processos/s")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    ok = not errors and len(created) == len(set(created)) == per_worker * args.workers
+    print(f"{'✅ Nenhuma colisão' if ok else '❌ Houve colisões'}")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
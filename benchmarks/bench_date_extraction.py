@@ -0,0 +1,139 @@
+"""
+Benchmark: extração de datas - regex + dateutil fuzzy x date_extraction
+Usa o texto completo dos PDFs da pasta (um documento por vez e todos juntos) e
+compara o caminho anterior (três regex não compiladas + date_parser.parse fuzzy
+em cada ocorrência) com date_extraction.find_dates. Mostra a vazão e as datas
+em que os dois discordam (ex.: "1 de janeiro de 2024" lido como dia de hoje).
+Antes, confere validity_date (regra de certidão vencida de analyze_certidao)
+com os textos de validade das certidões, como o intervalo do CRF do FGTS.
+
+    python benchmarks/bench_date_extraction.py                   # pasta "EXEMPLO CORRETO REAL"
+    python benchmarks/bench_date_extraction.py --multiply 20     # texto repetido 20x (documento longo)
+    python benchmarks/bench_date_extraction.py --show 20         # lista até 20 divergências
+"""
+
+import argparse
+import glob
+import io
+import os
+import re
+import sys
+import time
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LEGACY_PATTERNS = [
+    r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}',
+    r'\d{1,2}\s+de\s+\w+\s+de\s+\d{4}',
+    r'\w+\s+\d{1,2},\s+\d{4}',
+]
+
+
+def legacy_dates(text):
+    """extract_dates_from_text anterior (mantido só para comparação)"""
+    from dateutil import parser as date_parser
+    found = []
+    for pattern in LEGACY_PATTERNS:
+        for match in re.findall(pattern, text, re.IGNORECASE):
+            try:
+                found.append((match, date_parser.parse(match, fuzzy=True, dayfirst=True)))
+            except Exception:
+                continue
+    return found
+
+
+# (texto da certidão, validade esperada dd/mm/yyyy ou None)
+VALIDITY_CASES = [
+    ('CERTIFICADO DE REGULARIDADE DO FGTS - CRF\nValidade: 01/10/2026 a 30/10/2026', '30/10/2026'),
+    ('Validade:01/10/2026 a 30/10/2026', '30/10/2026'),
+    ('Validade: 180 dias a partir de 10/01/2024', None),
+    ('Certidão válida por 180 dias contados da data de emissão: 10/01/2024', None),
+    ('Emitida em 10/01/2025. Válida até 10/07/2025', '10/07/2025'),
+    ('Data de validade: 15 de março de 2027', '15/03/2027'),
+]
+
+
+def check_validity_cases():
+    """Quantos VALIDITY_CASES validity_date lê errado (lista cada um)"""
+    from date_extraction import validity_date
+    wrong = 0
+    for text, expected in VALIDITY_CASES:
+        found = validity_date(text)
+        found_text = found.strftime('%d/%m/%Y') if found else None
+        if found_text != expected:
+            wrong += 1
+            print(f"   ❌ {text!r}: validade {found_text}, esperado {expected}")
+    return wrong
+
+
+def best_time(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=os.path.join(ROOT, 'EXEMPLO CORRETO REAL'), help='pasta com os PDFs')
+    parser.add_argument('--multiply', type=int, default=1, help='repete o texto N vezes')
+    parser.add_argument('--repeat', type=int, default=3, help='repetições (vale o melhor tempo)')
+    parser.add_argument('--show', type=int, default=10, help='divergências a listar')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import document_extract
+    from date_extraction import find_dates
+
+    # Não grava .extract.json na pasta de exemplos
+    document_extract.PERSIST_EXTRACTS = False
+
+    wrong = check_validity_cases()
+    if wrong:
+        print(f"❌ validity_date errou {wrong} de {len(VALIDITY_CASES)} texto(s) de validade")
+        return 1
+    print(f"\n✅ validity_date: {len(VALIDITY_CASES)} texto(s) de validade lidos corretamente")
+
+    texts = []
+    with redirect_stdout(io.StringIO()):
+        for path in sorted(glob.glob(os.path.join(args.dir, '*'))):
+            if path.lower().endswith('.pdf'):
+                text = document_extract.get_extract(path).text
+                if text:
+                    texts.append((os.path.basename(path), text * args.multiply))
+    if not texts:
+        print(f"❌ Nenhum PDF com texto em {args.dir}")
+        return 1
+    texts.append(('(todos juntos)', '\n'.join(text for _, text in texts)))
+
+    print(f"\n📊 Extração de datas - melhor de {args.repeat}, texto x{args.multiply}")
+    print(f"   {'documento':<42} {'KB':>7} {'datas':>11} {'dateutil':>10} {'motor':>9} {'ganho':>6} {'MB/s':>6}")
+    for name, text in texts:
+        legacy_time, legacy = best_time(lambda: legacy_dates(text), args.repeat)
+        engine_time, engine = best_time(lambda: find_dates(text), args.repeat)
+        size_mb = len(text.encode('utf-8')) / 1024 / 1024
+        print(f"   {name[:42]:<42} {size_mb * 1024:>7.0f} {len(legacy):>5}/{len(engine):<5} "
+              f"{legacy_time * 1000:>8.1f}ms {engine_time * 1000:>7.1f}ms {legacy_time / engine_time:>5.0f}x "
+              f"{size_mb / engine_time:>6.1f}")
+
+    # Mesmo trecho, leituras diferentes
+    all_text = texts[-1][1]
+    engine_by_text = {found.text: found.date for found in find_dates(all_text)}
+    divergent = []
+    for match, legacy_date in legacy_dates(all_text):
+        engine_date = engine_by_text.get(match)
+        if engine_date is not None and engine_date != legacy_date and match not in [d[0] for d in divergent]:
+            divergent.append((match, legacy_date, engine_date))
+    print(f"\n   Trechos lidos de forma diferente: {len(divergent)}")
+    for match, legacy_date, engine_date in divergent[:args.show]:
+        print(f"   '{match}': dateutil {legacy_date:%d/%m/%Y} | motor {engine_date:%d/%m/%Y}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Benchmark: regras do Checklist/CadPrev - workbook completo x passada em streaming
+Para cada planilha da pasta, compara o caminho anterior (load_workbook completo
+com cores, lista de listas, texto juntado, any() por palavra-chave) com
+excel_rules.scan_sheet (read_only, uma passada). Mede tempo e pico de memória
+(tracemalloc) e confere que as duas análises dão o mesmo resultado.
+
+    python benchmarks/bench_excel_rules.py                          # pasta MODELOS
+    python benchmarks/bench_excel_rules.py --dir uploads --repeat 10
+    python benchmarks/bench_excel_rules.py --rows 5000              # + planilha sintética grande
+"""
+
+import argparse
+import glob
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CNPJ_PATTERN = r'\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}'
+
+
+def legacy_checklist_rules(file_path, institution_name, max_row=100):
+    """Caminho anterior: workbook completo + texto juntado + varreduras aninhadas"""
+    import document_extract
+    extract = document_extract.build_extract(file_path)
+    all_data = []
+    for row in extract.sheet_values(max_row):
+        if any(cell is not None for cell in row):
+            all_data.append([str(cell) if cell is not None else '' for cell in row])
+    excel_text = "\n".join([" | ".join(row) for row in all_data])
+    has_institution = any(institution_name.lower() in str(cell).lower() for row in all_data for cell in row)
+    has_cnpj = bool(re.search(CNPJ_PATTERN, excel_text))
+    empty_cells = sum(1 for row in all_data for cell in row if cell == '' or cell == 'None')
+    obs_keywords = ['observação', 'observacao', 'obs:', 'comentário', 'comentario']
+    obs_texts = []
+    if any(keyword in excel_text.lower() for keyword in obs_keywords):
+        for i, row in enumerate(all_data):
+            for j, cell in enumerate(row):
+                if any(keyword in str(cell).lower() for keyword in obs_keywords):
+                    if j + 1 < len(row):
+                        obs_texts.append(str(row[j + 1]))
+                    if i + 1 < len(all_data) and j < len(all_data[i + 1]):
+                        obs_texts.append(str(all_data[i + 1][j]))
+    short_observation = any(len(o) < 20 and o.strip() and o != 'None' for o in obs_texts)
+    negatives = ['❌', '✗', 'X', 'não', 'nao', 'pendente', 'falta']
+    negative_cells = sum(1 for row in all_data for cell in row
+                         if any(n in str(cell).lower() for n in negatives)
+                         and 'sim' not in str(cell).lower() and 'aprovad' not in str(cell).lower())
+    return has_institution, has_cnpj, empty_cells, short_observation, negative_cells
+
+
+def streaming_checklist_rules(file_path, institution_name, max_row=100):
+    import document_extract
+    import excel_rules
+    document_extract._memo.clear()
+    scan = excel_rules.scan_sheet(file_path, max_row, institution_name)
+    return scan.has_institution, scan.has_cnpj, scan.empty_cells, scan.short_observation, scan.negative_cells
+
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def synthetic_workbook(rows, directory):
+    """Checklist grande: perguntas, respostas 'Sim'/'Não', observações e um CNPJ"""
+    import openpyxl
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.append(['Item', 'Descrição', 'Atende', 'Observação'])
+    for i in range(rows):
+        sheet.append([i + 1, f'Requisito {i + 1} do credenciamento da instituição', 'Sim' if i % 7 else 'Não',
+                      'Documento anexado conforme o edital' if i % 5 else 'ok'])
+    sheet.append(['CNPJ', '12.345.678/0001-90', 'Instituição', 'BTG Pactual'])
+    path = os.path.join(directory, f'checklist_{rows}_linhas.xlsx')
+    wb.save(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=os.path.join(ROOT, 'MODELOS'), help='pasta com as planilhas')
+    parser.add_argument('--institution', default='BTG Pactual', help='nome da instituição procurado')
+    parser.add_argument('--max-row', type=int, default=100, help='linhas avaliadas (checklist: 100, CadPrev: 200)')
+    parser.add_argument('--rows', type=int, default=0, help='linhas de uma planilha sintética extra')
+    parser.add_argument('--repeat', type=int, default=5, help='repetições (vale o melhor tempo)')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import warnings
+    import document_extract
+    warnings.filterwarnings('ignore', module='openpyxl')
+    document_extract.PERSIST_EXTRACTS = False
+
+    files = sorted(p for p in glob.glob(os.path.join(args.dir, '*')) if p.lower().endswith(('.xlsx', '.xlsm')))
+    workdir = tempfile.mkdtemp(prefix='bench_excel_')
+    if args.rows:
+        files.append(synthetic_workbook(args.rows, workdir))
+        args.max_row = max(args.max_row, args.rows + 2)
+    if not files:
+        print(f"❌ Nenhuma planilha em {args.dir}")
+        return 1
+
+    print(f"\n📊 Regras de Checklist/CadPrev - {len(files)} planilha(s), melhor de {args.repeat}, até a linha {args.max_row}")
+    print(f"   {'arquivo':<44} {'completo':>9} {'stream':>9} {'ganho':>6} {'mem compl.':>11} {'mem stream':>11}  regras")
+    different = 0
+    for path in files:
+        with redirect_stdout(io.StringIO()):
+            legacy_time, legacy_peak, legacy = measure(
+                lambda: legacy_checklist_rules(path, args.institution, args.max_row), args.repeat)
+            stream_time, stream_peak, streamed = measure(
+                lambda: streaming_checklist_rules(path, args.institution, args.max_row), args.repeat)
+        same = legacy == streamed
+        different += 0 if same else 1
+        print(f"   {os.path.basename(path)[:44]:<44} {legacy_time * 1000:>7.1f}ms {stream_time * 1000:>7.1f}ms "
+              f"{legacy_time / stream_time:>5.1f}x {legacy_peak / 1024:>9.0f}KB {stream_peak / 1024:>9.0f}KB  "
+              f"{'iguais' if same else 'DIFERENTES'}")
+
+    print(f"{'✅ Mesmos resultados nos dois caminhos' if not different else f'❌ {different} planilha(s) com resultado diferente'}")
+    return 0 if not different else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
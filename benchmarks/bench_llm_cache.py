@@ -0,0 +1,107 @@
+"""
+Benchmark: cache de respostas da IA (llm_cache)
+O provedor real (OpenAI / Anthropic) roda com o transporte httpx simulado de
+bench_ai_fanout (--latency segundos por chamada, sem rede e sem chave de API) e
+um banco temporário. Três rodadas com os mesmos prompts:
+
+    1. cache vazio            - todas as chamadas vão ao provedor
+    2. mesmos prompts         - só acertos (espaços diferentes não mudam a chave)
+    3. bypass_cache=True      - vai ao provedor de novo e regrava as respostas
+
+Depois grava --overflow prompts novos para conferir o limite LRU (LLM_CACHE_MAX_ENTRIES).
+
+    python benchmarks/bench_llm_cache.py
+    python benchmarks/bench_llm_cache.py --documents 50 --latency 2
+    python benchmarks/bench_llm_cache.py --provider anthropic --max-entries 30
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--provider', choices=['openai', 'anthropic'], default='openai')
+    parser.add_argument('--documents', type=int, default=20, help='prompts distintos')
+    parser.add_argument('--latency', type=float, default=0.5, help='segundos por chamada (média)')
+    parser.add_argument('--max-entries', type=int, default=25, help='LLM_CACHE_MAX_ENTRIES do teste')
+    parser.add_argument('--overflow', type=int, default=10, help='prompts extras gravados depois das rodadas')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_llm_cache_')
+    os.chdir(workdir)
+    os.environ.pop('DATABASE_URL', None)
+    os.environ['DATABASE_PATH'] = os.path.join(workdir, 'bench.db')
+    os.environ['LLM_CACHE'] = 'true'
+    os.environ['LLM_CACHE_MAX_ENTRIES'] = str(args.max_entries)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    with redirect_stdout(io.StringIO()):
+        import ai_config
+        import llm_cache
+        from database import get_db_connection
+        from migrations import run_migrations
+        run_migrations(verbose=False)
+    from bench_ai_fanout import make_transport
+
+    provider_class = {'openai': ai_config.OpenAIProvider, 'anthropic': ai_config.AnthropicProvider}[args.provider]
+    provider = provider_class('chave-de-benchmark')
+    if not provider.available:
+        print(f"❌ SDK do provedor {args.provider} não instalado")
+        return 1
+    stats = {'active': 0, 'peak': 0, 'calls': 0}
+    provider.transport = make_transport(args.latency, 0.0, stats)
+    ai_config.ai_engine.providers = {args.provider: provider}
+    ai_config.ai_engine.active_provider = args.provider
+
+    requests = [(f'Analise o documento {i} do processo', f'Conteúdo do documento {i} ' * 20, 'apresentacao_institucional')
+                for i in range(args.documents)]
+    # Mesmo texto com espaços/quebras diferentes (como sai de outra extração do PDF)
+    reformatted = [(prompt, context.replace(' ', '  \n'), document_type) for prompt, context, document_type in requests]
+
+    def run(label, batch, bypass=False):
+        calls_before = stats['calls']
+        start = time.perf_counter()
+        results = [ai_config.get_ai_analysis(*request, bypass_cache=bypass) for request in batch]
+        elapsed = time.perf_counter() - start
+        cached = sum(1 for r in results if r.get('cached'))
+        print(f"   {label:<26} {elapsed:6.2f}s  {stats['calls'] - calls_before:>3} chamada(s) ao provedor, "
+              f"{cached:>3} do cache")
+        return results
+
+    print(f"\n📊 {args.documents} prompt(s), {args.provider}, latência {args.latency}s, "
+          f"limite {args.max_entries} entrada(s)")
+    first = run('1. cache vazio', requests)
+    second = run('2. mesmos prompts', reformatted)
+    run('3. bypass_cache=True', requests, bypass=True)
+    run(f'4. +{args.overflow} prompts novos',
+        [(f'Outro prompt {i}', 'Outro conteúdo', 'rating') for i in range(args.overflow)])
+
+    conn = get_db_connection()
+    cache_stats = llm_cache.get_stats(conn)
+    conn.close()
+    print(f"\n   entradas: {cache_stats['entries']} | acertos: {cache_stats['stored_hits']} | "
+          f"tokens economizados: {cache_stats['tokens_saved']} | evictions: {cache_stats['process']['evicted']}")
+
+    if [r['analysis'] for r in first] != [r['analysis'] for r in second]:
+        print("❌ Respostas do cache diferentes das originais")
+        return 1
+    if not all(r.get('cached') for r in second):
+        print("❌ A 2ª rodada deveria vir toda do cache")
+        return 1
+    if cache_stats['entries'] > args.max_entries:
+        print(f"❌ Limite de entradas ultrapassado ({cache_stats['entries']} > {args.max_entries})")
+        return 1
+    print("✅ Mesmas respostas, 2ª rodada sem chamadas ao provedor, cache dentro do limite")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+Benchmark: extração completa de PDF em série x em paralelo (pool de processos)
+Extrai cada PDF inteiro das duas formas, confere que o texto de todas as páginas
+é idêntico e mostra o tempo (o primeiro uso do pool inclui subir os processos).
+
+    python benchmarks/bench_parallel_extraction.py                   # pasta "EXEMPLO CORRETO REAL"
+    python benchmarks/bench_parallel_extraction.py --workers 4 --min-pages 10
+    python benchmarks/bench_parallel_extraction.py --dir uploads --page-timeout 5
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=os.path.join(ROOT, 'EXEMPLO CORRETO REAL'), help='pasta com os PDFs')
+    parser.add_argument('--workers', type=int, default=0, help='processos (padrão: automático pelo nº de páginas)')
+    parser.add_argument('--min-pages', type=int, default=20, help='ignora PDFs menores que isso')
+    parser.add_argument('--page-timeout', type=float, default=None, help='limite por página em segundos')
+    parser.add_argument('--repeat', type=int, default=3, help='repetições (vale o melhor tempo, pool já aquecido)')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import PyPDF2
+    import document_extract
+
+    document_extract.PARALLEL_MIN_PAGES = args.min_pages
+    automatic_workers = document_extract.extract_worker_count
+    if args.page_timeout:
+        document_extract.PAGE_TIMEOUT = args.page_timeout
+
+    files = []
+    for path in sorted(glob.glob(os.path.join(args.dir, '*'))):
+        if path.lower().endswith('.pdf'):
+            with open(path, 'rb') as f:
+                page_count = len(PyPDF2.PdfReader(f).pages)
+            if page_count >= args.min_pages:
+                files.append((path, page_count))
+    if not files:
+        print(f"❌ Nenhum PDF com {args.min_pages}+ páginas em {args.dir}")
+        return 1
+
+    print(f"\n📊 Extração completa em paralelo - {document_extract.available_cpus()} núcleo(s) disponível(is)")
+    print(f"   {'arquivo':<42} {'págs':>5} {'procs':>5} {'série':>9} {'1º uso':>9} {'paralelo':>9} {'ganho':>6}  texto")
+    different = 0
+    for path, page_count in files:
+        workers = args.workers or max(2, automatic_workers(page_count))
+
+        # Número de processos fixado em cada modo (1 = série)
+        document_extract.extract_worker_count = lambda pages: 1
+        serial_time = None
+        for _ in range(args.repeat):
+            elapsed, serial = timed(lambda: document_extract.build_extract(path))
+            serial_time = elapsed if serial_time is None else min(serial_time, elapsed)
+
+        document_extract.extract_worker_count = lambda pages, n=workers: n
+        cold_time, parallel = timed(lambda: document_extract.build_extract(path))
+        parallel_time = cold_time
+        for _ in range(args.repeat - 1):
+            elapsed, parallel = timed(lambda: document_extract.build_extract(path))
+            parallel_time = min(parallel_time, elapsed)
+
+        same = serial.page_texts == parallel.page_texts and serial.page_sizes == parallel.page_sizes
+        different += 0 if same else 1
+        print(f"   {os.path.basename(path)[:42]:<42} {page_count:>5} {workers:>5} "
+              f"{serial_time * 1000:>7.0f}ms {cold_time * 1000:>7.0f}ms {parallel_time * 1000:>7.0f}ms "
+              f"{serial_time / parallel_time:>5.1f}x  {'igual' if same else 'DIFERENTE'}")
+
+    print(f"{'✅ Texto idêntico nos dois modos' if not different else f'❌ {different} arquivo(s) com texto diferente'}")
+    return 0 if not different else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Benchmark: extração completa x leitura sob demanda (orçamento por tipo)
+Para cada PDF da pasta, mede a extração completa (build_extract, todas as páginas)
+e a leitura parcial usada pelos analisadores (extract_text_budgeted: para quando
+o orçamento do tipo foi atingido e a instituição e uma data já apareceram).
+Confere também que o trecho enviado ao prompt (text[:4000]) é o mesmo.
+
+    python benchmarks/bench_pdf_extraction.py                        # pasta "EXEMPLO CORRETO REAL"
+    python benchmarks/bench_pdf_extraction.py --dir uploads --repeat 5
+    python benchmarks/bench_pdf_extraction.py --institution "BTG Pactual"
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tipo de documento pelo nome do arquivo (só para escolher o orçamento)
+TYPE_BY_NAME = [
+    ('apresenta', 'apresentacao_institucional'),
+    ('qdd', 'qdd_anbima'),
+    ('declara', 'declaracao_unificada'),
+    ('nada consta', 'certidao_bacen_nada_consta'),
+    ('bacen', 'certidao_bacen_autorizacao'),
+    ('cvm', 'formulario_referencia_cvm'),
+    ('termo', 'termo_declaracao'),
+]
+
+
+def guess_type(file_name, default):
+    lower = file_name.lower()
+    for fragment, document_type in TYPE_BY_NAME:
+        if fragment in lower:
+            return document_type
+    return default
+
+
+def best_time(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=os.path.join(ROOT, 'EXEMPLO CORRETO REAL'), help='pasta com os PDFs')
+    parser.add_argument('--institution', default='BTG Pactual', help='nome da instituição procurado no texto')
+    parser.add_argument('--type', default='termo_declaracao', help='tipo para arquivos não reconhecidos pelo nome')
+    parser.add_argument('--repeat', type=int, default=3, help='repetições por arquivo (vale o melhor tempo)')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import document_extract
+    from ai_analyzer_rigorous import extract_text_budgeted
+
+    # Sem memória nem JSON ao lado do arquivo: cada medição lê o PDF de verdade
+    document_extract.PERSIST_EXTRACTS = False
+
+    def lazy(path, document_type):
+        document_extract._memo.clear()
+        return extract_text_budgeted(path, document_type, args.institution, needs_date=True)
+
+    files = sorted(p for p in glob.glob(os.path.join(args.dir, '*')) if p.lower().endswith('.pdf'))
+    if not files:
+        print(f"❌ Nenhum PDF em {args.dir}")
+        return 1
+
+    print(f"\n📊 Extração de PDF - {len(files)} arquivo(s), melhor de {args.repeat}")
+    print(f"   {'arquivo':<42} {'tipo':<28} {'págs':>9} {'completo':>9} {'parcial':>9} {'ganho':>6}  prompt")
+    total_full = total_lazy = 0.0
+    mismatches = 0
+    for path in files:
+        document_type = guess_type(os.path.basename(path), args.type)
+        full_time, extract = best_time(lambda: document_extract.build_extract(path), args.repeat)
+        lazy_time, (text, partial) = best_time(lambda: lazy(path, document_type), args.repeat)
+        total_full += full_time
+        total_lazy += lazy_time
+
+        # PDF sem texto (digitalizado) ou ilegível: os dois caminhos devem dar erro
+        if extract.error or not extract.text:
+            same_prompt = text.startswith('ERRO')
+        else:
+            same_prompt = text[:4000] == extract.text[:4000]
+        mismatches += 0 if same_prompt else 1
+        pages = f"{partial.pages_read}/{partial.page_count}" if partial else '-'
+        print(f"   {os.path.basename(path)[:42]:<42} {document_type:<28} {pages:>9} "
+              f"{full_time * 1000:>7.0f}ms {lazy_time * 1000:>7.0f}ms {full_time / lazy_time:>5.1f}x  "
+              f"{'igual' if same_prompt else 'DIFERENTE'}")
+
+    print(f"\n   Total: completo {total_full:.2f}s | parcial {total_lazy:.2f}s | "
+          f"ganho {total_full / total_lazy:.1f}x")
+    print(f"{'✅ Trecho do prompt idêntico em todos os arquivos' if not mismatches else f'⚠️ {mismatches} arquivo(s) com trecho diferente'}")
+    return 0 if not mismatches else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Benchmark: texto enviado à IA - cortes fixos x prompt_budget
+Para cada PDF da pasta compara o que ia para o provedor antes (text[:4000] no
+prompt + text[:3000] como contexto, o mesmo começo do documento duas vezes) com
+build_context (trechos escolhidos no documento inteiro dentro do orçamento):
+tokens enviados, páginas cobertas e palavras-chave do tipo que chegam à IA.
+
+    python benchmarks/bench_prompt_budget.py                       # pasta "EXEMPLO CORRETO REAL"
+    python benchmarks/bench_prompt_budget.py --budget 1000 --model claude-3-opus-20240229
+    python benchmarks/bench_prompt_budget.py --type rating --show
+"""
+
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def pages_covered(page_texts, sent_chars):
+    """Páginas que começam dentro dos primeiros sent_chars caracteres do texto"""
+    position = 0
+    covered = 0
+    for page_text in page_texts:
+        if not page_text:
+            continue
+        if position >= sent_chars:
+            break
+        covered += 1
+        position += len(page_text) + 1
+    return covered
+
+
+def keywords_in(text, keywords):
+    lower = text.lower()
+    return {k for k in keywords if k in lower}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=os.path.join(ROOT, 'EXEMPLO CORRETO REAL'), help='pasta com os PDFs')
+    parser.add_argument('--type', default='apresentacao_institucional', help='tipo de documento (palavras-chave)')
+    parser.add_argument('--institution', default='BTG Pactual', help='instituição esperada')
+    parser.add_argument('--budget', type=int, default=None, help='tokens de contexto (padrão: AI_CONTEXT_TOKENS)')
+    parser.add_argument('--model', default='gpt-4-turbo-preview', help='modelo usado na contagem de tokens')
+    parser.add_argument('--show', action='store_true', help='mostra o contexto montado de cada PDF')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    with redirect_stdout(io.StringIO()):
+        import document_extract
+        import prompt_budget
+        from ai_document_knowledge import get_relevance_keywords
+    # Não grava .extract.json na pasta de exemplos
+    document_extract.PERSIST_EXTRACTS = False
+    keywords = get_relevance_keywords(args.type)
+
+    print(f"\n📊 {args.type}, modelo {args.model} "
+          f"({'tiktoken' if prompt_budget.TIKTOKEN_AVAILABLE else 'estimativa por caracteres'}), "
+          f"orçamento {args.budget or prompt_budget.budget_for(args.type)} tokens")
+    print(f"   {'documento':<40} {'págs':>4} {'tokens antes':>13} {'depois':>7} "
+          f"{'páginas antes/depois':>21} {'palavras-chave antes/depois':>28} {'ms':>6}")
+    totals = [0, 0]
+    for path in sorted(glob.glob(os.path.join(args.dir, '*'))):
+        if not path.lower().endswith('.pdf'):
+            continue
+        with redirect_stdout(io.StringIO()):
+            extract = document_extract.get_extract(path)
+        if not extract.text:
+            continue
+        text, pages = extract.text, extract.page_texts
+
+        legacy_tokens = (prompt_budget.count_tokens(text[:4000], args.model)
+                         + prompt_budget.count_tokens(text[:3000], args.model))
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            selection = prompt_budget.build_context(pages, args.type, args.institution, args.budget, args.model)
+        elapsed = time.perf_counter() - start
+        totals[0] += legacy_tokens
+        totals[1] += selection.tokens
+
+        all_keywords = keywords_in(text, keywords)
+        print(f"   {os.path.basename(path)[:40]:<40} {len(pages):>4} {legacy_tokens:>13} {selection.tokens:>7} "
+              f"{pages_covered(pages, 4000):>10}/{selection.pages_used:<10} "
+              f"{len(keywords_in(text[:4000], all_keywords)):>12}/{len(keywords_in(selection.text, all_keywords)):<3}"
+              f"de {len(all_keywords):<9} {elapsed * 1000:>6.1f}")
+        if args.show:
+            print(selection.text)
+            print('-' * 80)
+
+    if totals[0]:
+        print(f"\n   total: {totals[0]} -> {totals[1]} tokens ({100 * (1 - totals[1] / totals[0]):.0f}% a menos)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
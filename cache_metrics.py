@@ -0,0 +1,38 @@
+"""
+Métricas dos caches (analysis_cache e llm_cache)
+Contadores deste processo e taxa de acerto; os totais persistidos ficam na
+coluna hit_count de cada tabela de cache.
+"""
+
+import threading
+
+
+class Counters:
+    """Acertos/erros/gravações deste processo, mais os campos extras de cada cache"""
+
+    def __init__(self, *extra_fields):
+        self.lock = threading.Lock()
+        self.fields = ('hits', 'misses', 'stores') + extra_fields
+        for field in self.fields:
+            setattr(self, field, 0)
+
+    def add(self, field, amount=1):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def as_dict(self):
+        """Valores atuais com a taxa de acerto deste processo"""
+        stats = {field: getattr(self, field) for field in self.fields}
+        stats['hit_rate'] = hit_rate(self.hits, self.misses)
+        return stats
+
+
+def hit_rate(hits, misses):
+    """Percentual de acertos (None sem nenhuma consulta)"""
+    lookups = hits + misses
+    return round(100 * hits / lookups, 1) if lookups else None
+
+
+def stored_hit_rate(stored_hits, entries):
+    """Cada entrada do cache nasceu de um erro (análise ou chamada feita): acertos / (acertos + entradas)"""
+    return hit_rate(stored_hits, entries or 0)
@@ -0,0 +1,546 @@
+"""
+Gerenciador de Conexões com o Banco de Dados
+SQLite (padrão): uma conexão por thread, reaproveitada entre requisições, em modo WAL.
+PostgreSQL (DATABASE_URL=postgres://...): pool de conexões compartilhado pelas threads,
+com tradução do SQL do app (placeholders, datas, INSERT OR IGNORE, lastrowid).
+"""
+
+import os
+import re
+import sqlite3
+import threading
+
+# Caminho do banco e parâmetros de ajuste (podem ser definidos no .env)
+DB_PATH = os.getenv('DATABASE_PATH', 'credenciamento.db')
+BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '15000'))
+CACHED_STATEMENTS = int(os.getenv('DB_CACHED_STATEMENTS', '256'))
+CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))
+
+# PostgreSQL: ativado quando DATABASE_URL aponta para um servidor Postgres
+DATABASE_URL = os.getenv('DATABASE_URL', '')
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+    import psycopg2.pool
+    PSYCOPG2_AVAILABLE = True
+except ImportError:
+    psycopg2 = None
+    PSYCOPG2_AVAILABLE = False
+
+
+def _backend_name(url):
+    return 'postgresql' if url.startswith(('postgres://', 'postgresql://')) else 'sqlite'
+
+
+BACKEND = _backend_name(DATABASE_URL)
+
+# Exceções equivalentes dos dois backends (usar em `except database.IntegrityError`)
+if PSYCOPG2_AVAILABLE:
+    IntegrityError = (sqlite3.IntegrityError, psycopg2.IntegrityError)
+    OperationalError = (sqlite3.OperationalError, psycopg2.OperationalError)
+    DatabaseError = (sqlite3.Error, psycopg2.Error)
+else:
+    IntegrityError = sqlite3.IntegrityError
+    OperationalError = sqlite3.OperationalError
+    DatabaseError = sqlite3.Error
+
+_local = threading.local()
+
+
+def get_dialect():
+    """'sqlite' ou 'postgresql'"""
+    return BACKEND
+
+
+# ==================== SQLITE ====================
+
+def _create_connection():
+    """Abre uma nova conexão SQLite já com os PRAGMAs de desempenho aplicados"""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=CACHED_STATEMENTS
+    )
+    c = conn.cursor()
+    # WAL: leitores não bloqueiam o escritor (e vice-versa)
+    c.execute('PRAGMA journal_mode=WAL')
+    # NORMAL é seguro em WAL e evita um fsync a cada commit
+    c.execute('PRAGMA synchronous=NORMAL')
+    c.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    c.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+    c.execute('PRAGMA temp_store=MEMORY')
+    c.close()
+    return conn
+
+
+class SQLiteBackend:
+    """Conexão persistente por thread (o arquivo é local, abrir/fechar não compensa)"""
+
+    dialect = 'sqlite'
+    keeps_connection = True
+
+    def acquire(self):
+        return _create_connection()
+
+    def release(self, conn, discard=False):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️  Erro ao fechar conexão da thread: {e}")
+
+    def in_transaction(self, conn):
+        return conn.in_transaction
+
+    def cursor(self, conn, row_factory):
+        cursor = conn.cursor()
+        if row_factory is not None:
+            cursor.row_factory = row_factory
+        return cursor
+
+    def forget_schema(self):
+        pass
+
+
+# ==================== POSTGRESQL ====================
+
+# Funções SQLite usadas no app e o equivalente criado no schema Postgres (migrations.py).
+# Datas continuam como texto 'YYYY-MM-DD HH:MM:SS' (UTC), igual ao SQLite.
+_PG_NOW_REPLACEMENTS = [
+    (re.compile(r"\bdatetime\(\s*'now'\s*\)", re.IGNORECASE), 'app_now()'),
+    (re.compile(r"\bdate\(\s*'now'\s*\)", re.IGNORECASE), 'app_today()'),
+]
+
+_PG_REPLACEMENTS = [
+    (re.compile(r'\bCURRENT_TIMESTAMP\b', re.IGNORECASE), 'app_now()'),
+    (re.compile(r'\bCURRENT_DATE\b', re.IGNORECASE), 'app_today()'),
+    # LIKE do SQLite não diferencia maiúsculas/minúsculas (ASCII)
+    (re.compile(r'(?<![\w])LIKE\b', re.IGNORECASE), 'ILIKE'),
+    (re.compile(r'\bBEGIN\s+IMMEDIATE\b', re.IGNORECASE), 'SELECT pg_advisory_xact_lock(7301)'),
+]
+
+# Tipos de coluna do DDL escrito para SQLite
+_PG_DDL_REPLACEMENTS = [
+    (re.compile(r'\bINTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT\b', re.IGNORECASE), 'SERIAL PRIMARY KEY'),
+    (re.compile(r'\bTIMESTAMP\b', re.IGNORECASE), 'TEXT'),
+    (re.compile(r'\bDATE\b(?=\s+(DEFAULT|NOT|,|\)))', re.IGNORECASE), 'TEXT'),
+    (re.compile(r'\bREAL\b', re.IGNORECASE), 'DOUBLE PRECISION'),
+    (re.compile(r'\bBLOB\b', re.IGNORECASE), 'BYTEA'),
+    (re.compile(r'\)\s*WITHOUT\s+ROWID', re.IGNORECASE), ')'),
+    # O SQLite nunca aplicou as FKs (PRAGMA foreign_keys desligado); mantemos o mesmo comportamento
+    (re.compile(r',\s*FOREIGN\s+KEY\s*\([^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)', re.IGNORECASE), ''),
+    (re.compile(r'\s+REFERENCES\s+\w+\s*\(\w+\)', re.IGNORECASE), ''),
+]
+
+_INSERT_RE = re.compile(r'^\s*INSERT\s+(OR\s+IGNORE\s+)?INTO\s+(\w+)', re.IGNORECASE)
+_DDL_RE = re.compile(r'^\s*(CREATE\s+TABLE|ALTER\s+TABLE)', re.IGNORECASE)
+
+_translation_cache = {}
+_TRANSLATION_CACHE_MAX = 2048
+
+
+def _split_quoted(sql):
+    """Separa o SQL em trechos (texto, está_entre_aspas)"""
+    parts = []
+    buf = []
+    quote = None
+    for ch in sql:
+        if quote:
+            buf.append(ch)
+            if ch == quote:
+                parts.append((''.join(buf), True))
+                buf = []
+                quote = None
+        elif ch in ("'", '"'):
+            if buf:
+                parts.append((''.join(buf), False))
+            buf = [ch]
+            quote = ch
+        else:
+            buf.append(ch)
+    if buf:
+        parts.append((''.join(buf), bool(quote)))
+    return parts
+
+
+def translate_sql(sql):
+    """
+    Converte o SQL escrito para SQLite no dialeto do Postgres.
+    Retorna (sql, tabela_do_insert, ignora_conflito).
+    """
+    cached = _translation_cache.get(sql)
+    if cached is not None:
+        return cached
+
+    is_ddl = bool(_DDL_RE.match(sql))
+    text_sql = sql
+    for pattern, replacement in _PG_NOW_REPLACEMENTS:
+        text_sql = pattern.sub(replacement, text_sql)
+    out = []
+    for text, quoted in _split_quoted(text_sql):
+        # '%' é o marcador do psycopg2 e precisa ser escapado inclusive dentro de literais
+        text = text.replace('%', '%%')
+        if quoted:
+            out.append(text)
+            continue
+        text = text.replace('?', '%s')
+        for pattern, replacement in _PG_REPLACEMENTS:
+            text = pattern.sub(replacement, text)
+        if is_ddl:
+            for pattern, replacement in _PG_DDL_REPLACEMENTS:
+                text = pattern.sub(replacement, text)
+        out.append(text)
+    translated = ''.join(out)
+
+    table = None
+    ignore = False
+    match = _INSERT_RE.match(translated)
+    if match:
+        table = match.group(2).lower()
+        if match.group(1):
+            ignore = True
+            translated = translated[:match.start(1)] + translated[match.end(1):]
+            translated = translated.rstrip().rstrip(';') + ' ON CONFLICT DO NOTHING'
+
+    result = (translated, table, ignore)
+    if len(_translation_cache) < _TRANSLATION_CACHE_MAX:
+        _translation_cache[sql] = result
+    return result
+
+
+class PgRow:
+    """Equivalente ao sqlite3.Row: acesso por índice ou nome, keys() e dict(row)"""
+
+    __slots__ = ('_values', '_index')
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._index[key]]
+        return self._values[key]
+
+    def keys(self):
+        return list(self._index)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        return isinstance(other, PgRow) and self._values == other._values
+
+    def __repr__(self):
+        return f'PgRow({dict(zip(self._index, self._values))})'
+
+
+class PgCursor:
+    """Cursor psycopg2 com a interface do sqlite3 (lastrowid, execute encadeável, row_factory)"""
+
+    def __init__(self, backend, conn, row_factory):
+        self._backend = backend
+        self._conn = conn
+        self._cursor = conn.cursor()
+        self.row_factory = row_factory
+        self.lastrowid = None
+
+    def execute(self, sql, parameters=()):
+        translated, table, _ = translate_sql(sql)
+        returning = False
+        if table and 'RETURNING' not in translated.upper() and self._backend.table_has_id(self._conn, table):
+            translated += ' RETURNING id'
+            returning = True
+        self._cursor.execute(translated, tuple(parameters))
+        self.lastrowid = None
+        if returning:
+            row = self._cursor.fetchone()
+            self.lastrowid = row[0] if row else None
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        translated, _, _ = translate_sql(sql)
+        self._cursor.executemany(translated, [tuple(p) for p in seq_of_parameters])
+        return self
+
+    def _wrap(self, row):
+        if row is None or self.row_factory is None:
+            return row
+        if self.row_factory is sqlite3.Row:
+            return PgRow(self._column_index(), row)
+        return self.row_factory(self, row)
+
+    def _column_index(self):
+        return {col[0]: i for i, col in enumerate(self._cursor.description or ())}
+
+    def fetchone(self):
+        return self._wrap(self._cursor.fetchone())
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if self.row_factory is None:
+            return rows
+        if self.row_factory is sqlite3.Row:
+            index = self._column_index()
+            return [PgRow(index, row) for row in rows]
+        return [self.row_factory(self, row) for row in rows]
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+        return [self._wrap(row) for row in rows]
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class PostgresBackend:
+    """Pool de conexões psycopg2; cada thread segura uma conexão só enquanto houver handle aberto"""
+
+    dialect = 'postgresql'
+    keeps_connection = False
+
+    def __init__(self, url):
+        self.url = url
+        self._pool = None
+        self._pool_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._tables_with_id = {}
+
+    def _get_pool(self):
+        pid = os.getpid()
+        if self._pool is None or self._pool_pid != pid:
+            with self._lock:
+                if self._pool is None or self._pool_pid != pid:
+                    if not PSYCOPG2_AVAILABLE:
+                        raise RuntimeError('DATABASE_URL aponta para PostgreSQL, mas o psycopg2 não está instalado')
+                    self._pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, self.url)
+                    self._pool_pid = pid
+                    # ThreadedConnectionPool falha quando esgotado; o semáforo faz a thread esperar
+                    self._slots = threading.BoundedSemaphore(DB_POOL_MAX)
+        return self._pool
+
+    def acquire(self):
+        pool = self._get_pool()
+        if not self._slots.acquire(timeout=DB_POOL_TIMEOUT):
+            raise psycopg2.OperationalError(f'Pool de conexões esgotado ({DB_POOL_MAX}) após {DB_POOL_TIMEOUT}s')
+        try:
+            conn = pool.getconn()
+            if conn.closed:
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        if self._pool is None or self._pool_pid != os.getpid():
+            return
+        try:
+            if not conn.closed and self.in_transaction(conn):
+                conn.rollback()
+        except psycopg2.Error as e:
+            print(f"⚠️  Conexão inválida descartada: {e}")
+            discard = True
+        try:
+            self._pool.putconn(conn, close=discard or bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def in_transaction(self, conn):
+        return conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self, conn, row_factory):
+        return PgCursor(self, conn, row_factory)
+
+    def table_has_id(self, conn, table):
+        """Se a tabela tem coluna id (para preencher lastrowid via RETURNING)"""
+        has_id = self._tables_with_id.get(table)
+        if has_id is None:
+            c = conn.cursor()
+            c.execute("""SELECT 1 FROM information_schema.columns
+                         WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'id'""",
+                      (table,))
+            has_id = c.fetchone() is not None
+            c.close()
+            self._tables_with_id[table] = has_id
+        return has_id
+
+    def forget_schema(self):
+        """Descarta o cache de colunas (após migrações)"""
+        self._tables_with_id.clear()
+
+
+def _create_backend():
+    if BACKEND == 'postgresql':
+        return PostgresBackend(DATABASE_URL)
+    return SQLiteBackend()
+
+
+backend = _create_backend()
+
+
+# ==================== HANDLES ====================
+
+def _get_thread_state():
+    """Retorna o estado da thread atual, descartando conexões herdadas de outro processo (fork)"""
+    pid = os.getpid()
+    if getattr(_local, 'pid', None) != pid:
+        # Conexão criada no processo pai (ex.: master do gunicorn) não pode ser usada no filho
+        _local.pid = pid
+        _local.conn = None
+        _local.depth = 0
+    if _local.conn is None:
+        _local.conn = backend.acquire()
+        _local.depth = 0
+    return _local
+
+
+class PooledConnection:
+    """
+    Handle leve sobre a conexão da thread.
+
+    Mantém a mesma interface usada no app (cursor, commit, rollback, close, row_factory),
+    mas close() apenas devolve a conexão ao pool. Handles aninhados
+    (ex.: log_process_history chamado dentro de uma rota) compartilham a mesma conexão;
+    transações não confirmadas só são descartadas quando o último handle é fechado,
+    exatamente como acontecia ao fechar uma conexão sqlite3 sem commit.
+    """
+
+    __slots__ = ('_state', '_conn', '_closed', 'row_factory')
+
+    def __init__(self, state):
+        self._state = state
+        self._conn = state.conn
+        self._closed = False
+        self.row_factory = None
+        state.depth += 1
+
+    @property
+    def dialect(self):
+        return backend.dialect
+
+    def cursor(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return backend.cursor(self._conn, self.row_factory)
+
+    def execute(self, sql, parameters=()):
+        cursor = self.cursor()
+        cursor.execute(sql, parameters)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        cursor = self.cursor()
+        cursor.executemany(sql, seq_of_parameters)
+        return cursor
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    @property
+    def in_transaction(self):
+        return backend.in_transaction(self._conn)
+
+    @property
+    def raw(self):
+        """Conexão subjacente (sqlite3 ou psycopg2) para APIs que exigem o objeto real"""
+        return self._conn
+
+    def close(self):
+        """Devolve a conexão ao pool"""
+        if self._closed:
+            return
+        self._closed = True
+        state = self._state
+        state.depth = max(0, state.depth - 1)
+        if state.depth == 0 and state.conn is self._conn:
+            if not backend.keeps_connection:
+                state.conn = None
+                backend.release(self._conn)
+            elif self._conn.in_transaction:
+                self._conn.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        self.close()
+        return False
+
+
+def get_db_connection():
+    """Obtém a conexão da thread atual (criada sob demanda e reaproveitada)"""
+    return PooledConnection(_get_thread_state())
+
+
+def release_thread_connection():
+    """Fecha/devolve a conexão da thread atual (usar ao final de threads de background)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and getattr(_local, 'pid', None) == os.getpid():
+        backend.release(conn)
+    _local.conn = None
+    _local.depth = 0
+
+
+def _reset_request_connection(exception=None):
+    """Fim da requisição: descarta transação pendente de handles que não foram fechados"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        return
+    _local.depth = 0
+    if not backend.keeps_connection:
+        # Handle esquecido aberto: a conexão volta ao pool para não esgotá-lo
+        release_thread_connection()
+        return
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    except sqlite3.Error as e:
+        print(f"⚠️  Conexão inválida descartada: {e}")
+        release_thread_connection()
+
+
+def init_app(app):
+    """Registra o ciclo de vida das conexões no Flask"""
+    app.teardown_appcontext(_reset_request_connection)
+
+
+def _after_fork_in_child():
+    # O filho recebe uma cópia do threading.local do pai; a troca força novas conexões
+    global _local
+    _local = threading.local()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,187 @@
+"""
+Extração de Datas em Português
+Uma varredura do texto com uma regex pré-compilada (três formatos), tabela de
+meses em português/inglês e construção direta do datetime - sem o parse "fuzzy"
+do dateutil, que completava campos ausentes com a data de hoje e errava
+"1 de janeiro de 2024" (virava 17/01/2024).
+
+    31/12/2024   31-12-24   12/31/2024 (mês > 12 na 2ª posição: formato americano)
+    15 de março de 2025   1º de abril de 2024
+    March 15, 2025   março 15, 2025
+
+Cada data vem com a posição no texto; dates_near_keywords escolhe as datas
+perto de palavras como "emissão" ou "validade". validity_date lê a data de
+validade de certidões: intervalo ("Validade: 01/10/2026 a 30/10/2026") vale
+pelo fim e prazo relativo ("180 dias a partir de 10/01/2024") não tem data.
+
+    for found in find_dates(text):
+        found.date, found.start, found.text
+    issue_date = latest_date_near(text, ISSUE_KEYWORDS)
+    valid_until = validity_date(text)
+"""
+
+import bisect
+import re
+import unicodedata
+from collections import namedtuple
+from datetime import datetime
+
+MONTHS = {
+    'janeiro': 1, 'fevereiro': 2, 'março': 3, 'marco': 3, 'abril': 4, 'maio': 5, 'junho': 6,
+    'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12,
+    'jan': 1, 'fev': 2, 'mar': 3, 'abr': 4, 'mai': 5, 'jun': 6,
+    'jul': 7, 'ago': 8, 'set': 9, 'out': 10, 'nov': 11, 'dez': 12,
+    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6,
+    'july': 7, 'august': 8, 'september': 9, 'october': 10, 'november': 11, 'december': 12,
+    'feb': 2, 'apr': 4, 'aug': 8, 'sep': 9, 'sept': 9, 'oct': 10, 'dec': 12,
+}
+
+_MONTH_NAMES = '|'.join(sorted((re.escape(name) for name in MONTHS), key=len, reverse=True))
+
+# Um único padrão, sempre começando pelo dia: o re pula direto para os dígitos
+# do texto em vez de tentar as alternativas em cada posição. O dia não pode
+# continuar um número ("2024" não vira dia "24").
+DATE_RE = re.compile(
+    r'(?P<day>\d(?<!\d\d)\d?)(?:'
+    r'[/-](?P<nm>\d{1,2})[/-](?P<ny>\d{4}|\d{2})(?!\d)'
+    r'|(?:º|°|o)?\s+de\s+(?P<lm>' + _MONTH_NAMES + r')\.?\s+de\s+(?P<ly>\d{4})(?!\d)'
+    r'|,\s+(?P<ey>\d{4})(?!\d))',
+    re.IGNORECASE
+)
+# "March 15, 2025": o mês vem antes do dia - conferido nos caracteres anteriores
+_MONTH_BEFORE_RE = re.compile(r'(?<![^\W\d_])(' + _MONTH_NAMES + r')\.?\s+$', re.IGNORECASE)
+
+ISSUE_KEYWORDS = ['emissão', 'emissao', 'emitida em', 'emitido em', 'expedida em', 'expedição',
+                  'data da certidão', 'gerada em', 'data de assinatura', 'assinado em']
+VALIDITY_KEYWORDS = ['validade', 'válida até', 'valida até', 'válido até', 'valido até',
+                     'vencimento', 'expira em', 'data de validade']
+
+# Entre a palavra-chave e a data: prazo contado a partir dela, não é o vencimento
+RELATIVE_VALIDITY_RE = re.compile(r'\b(?:dias?|m[eê]s|meses|anos?)\b|a\s+partir|contad[oa]s?', re.IGNORECASE)
+# Entre duas datas: intervalo "01/10/2026 a 30/10/2026"
+DATE_RANGE_RE = re.compile(r'\s*(?:a|à|até|ate|-|–)\s*', re.IGNORECASE)
+
+DateMatch = namedtuple('DateMatch', ['date', 'start', 'end', 'text'])
+
+
+def _normalize_month(name):
+    name = name.lower()
+    if name in MONTHS:
+        return MONTHS[name]
+    # "MARÇO" em PDFs às vezes vem decomposto (c + cedilha combinante)
+    plain = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return MONTHS.get(plain)
+
+
+def _full_year(year_text):
+    year = int(year_text)
+    if len(year_text) == 2:
+        # Como o %y do strptime: 00-68 -> 2000, 69-99 -> 1900
+        year += 2000 if year < 69 else 1900
+    return year
+
+
+def _build(day, month, year):
+    try:
+        return datetime(year, month, day)
+    except (ValueError, TypeError):
+        return None
+
+
+def _match_date(match, text):
+    """(datetime ou None, início do trecho)"""
+    day = int(match.group('day'))
+    if match.group('nm'):
+        month, year = int(match.group('nm')), _full_year(match.group('ny'))
+        if month > 12 and day <= 12:
+            day, month = month, day
+        return _build(day, month, year), match.start()
+    if match.group('lm'):
+        return _build(day, _normalize_month(match.group('lm')), int(match.group('ly'))), match.start()
+    before = _MONTH_BEFORE_RE.search(text, max(0, match.start() - 12), match.start())
+    if before is None:
+        return None, match.start()
+    return _build(day, _normalize_month(before.group(1)), int(match.group('ey'))), before.start()
+
+
+def find_dates(text):
+    """Todas as datas válidas do texto, na ordem em que aparecem (DateMatch com posição)"""
+    found = []
+    if not text:
+        return found
+    for match in DATE_RE.finditer(text):
+        date, start = _match_date(match, text)
+        if date is not None:
+            found.append(DateMatch(date, start, match.end(), text[start:match.end()]))
+    return found
+
+
+def extract_dates(text):
+    """Só os datetimes (substitui o antigo extract_dates_from_text)"""
+    return [found.date for found in find_dates(text)]
+
+
+def keyword_pattern(keywords):
+    return re.compile('|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)), re.IGNORECASE)
+
+
+_KEYWORD_PATTERNS = {}
+
+
+def _cached_keyword_pattern(keywords):
+    key = tuple(keywords)
+    pattern = _KEYWORD_PATTERNS.get(key)
+    if pattern is None:
+        pattern = _KEYWORD_PATTERNS[key] = keyword_pattern(keywords)
+    return pattern
+
+
+def dates_near_keywords(text, keywords, window=80, dates=None):
+    """
+    A primeira data depois de cada palavra-chave (até `window` caracteres adiante),
+    ex.: "Data de emissão: 10/01/2025" ou "Válida até 10/07/2025".
+    `dates` evita reprocessar o texto quando find_dates já foi chamado.
+    """
+    dates = find_dates(text) if dates is None else dates
+    if not dates:
+        return []
+    pattern = _cached_keyword_pattern(keywords)
+    starts = [found.start for found in dates]
+    near = []
+    for match in pattern.finditer(text):
+        index = bisect.bisect_left(starts, match.end())
+        if index < len(dates) and dates[index].start - match.end() <= window:
+            if not near or near[-1] is not dates[index]:
+                near.append(dates[index])
+    return near
+
+
+def latest_date_near(text, keywords, window=80, dates=None):
+    """Data mais recente perto das palavras-chave (ou None)"""
+    near = dates_near_keywords(text, keywords, window, dates)
+    return max((found.date for found in near), default=None)
+
+
+def validity_date(text, keywords=VALIDITY_KEYWORDS, window=40, dates=None):
+    """
+    Data de validade mais recente (ou None): a data logo após a palavra-chave;
+    em intervalo ("01/10/2026 a 30/10/2026") o fim dele. Prazo relativo
+    ("180 dias a partir de 10/01/2024", "contados da emissão") é ignorado - a
+    data ali é o início da contagem.
+    """
+    dates = find_dates(text) if dates is None else dates
+    if not dates:
+        return None
+    pattern = _cached_keyword_pattern(keywords)
+    starts = [found.start for found in dates]
+    found_dates = []
+    for match in pattern.finditer(text):
+        index = bisect.bisect_left(starts, match.end())
+        if index >= len(dates) or dates[index].start - match.end() > window:
+            continue
+        if RELATIVE_VALIDITY_RE.search(text, match.end(), dates[index].start):
+            continue
+        if index + 1 < len(dates) and DATE_RANGE_RE.fullmatch(text, dates[index].end, dates[index + 1].start):
+            index += 1
+        found_dates.append(dates[index].date)
+    return max(found_dates, default=None)
@@ -0,0 +1,59 @@
+"""
+Consultas ao Banco a partir do Event Loop de IA
+O motor de IA (ai_config) roda em um event loop; llm_cache e ai_usage mandam
+suas consultas para uma thread dedicada, com uma conexão própria por chamada,
+para não travar o loop. Falha no banco nunca derruba a análise: a transação é
+desfeita, o aviso sai uma única vez e a chamada devolve o valor padrão.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import get_db_connection
+
+
+class DBExecutor:
+    """Uma thread por módulo (recriada após fork) executando func(conn, ...)"""
+
+    def __init__(self, thread_name, warning, on_error=None):
+        # warning: aviso da primeira falha, com {error}; on_error(e) é chamado em toda falha
+        self.thread_name = thread_name
+        self.warning = warning
+        self.on_error = on_error
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def _get_executor(self):
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.thread_name)
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def run_with_connection(self, func, *args, default=None):
+        """Executa func(conn, ...) e confirma; em erro desfaz e devolve default"""
+        conn = get_db_connection()
+        try:
+            result = func(conn, *args)
+            conn.commit()
+            return result
+        except Exception as e:
+            conn.rollback()
+            if self.on_error:
+                self.on_error(e)
+            if not self._warned:
+                self._warned = True
+                print(self.warning.format(error=e))
+            return default
+        finally:
+            conn.close()
+
+    async def run(self, func, *args, default=None):
+        """run_with_connection na thread dedicada, sem bloquear o event loop"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), lambda: self.run_with_connection(func, *args, default=default))
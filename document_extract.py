@@ -0,0 +1,647 @@
+"""
+Extração Única de Documentos (DocumentExtract)
+Cada arquivo enviado é lido uma única vez (PyPDF2 ou openpyxl) e o resultado é
+compartilhado por todos os analisadores e validadores:
+
+    PDF:    texto por página, tamanho das páginas, criptografia
+    Excel:  grade da planilha ativa (valor + cor de fundo de cada célula) e o
+            texto de todas as abas
+    ambos:  datas candidatas e CNPJs encontrados no texto
+
+O extrato fica em memória (por caminho/mtime/tamanho) e é gravado ao lado do
+upload em '<arquivo>.extract.json'; outro processo (ex.: analysis_worker) que
+abrir o mesmo arquivo reaproveita o JSON em vez de reprocessar. Em pastas
+somente leitura ou de exemplos (ex.: "EXEMPLO CORRETO REAL") use
+DOCUMENT_EXTRACT_SIDECAR=false (ou PERSIST_EXTRACTS = False no script) para não
+gravar nada ao lado dos arquivos; os sidecars estão no .gitignore.
+
+    extract = get_extract(file_path)
+    extract.text                 # texto completo (páginas separadas por '\\n')
+    extract.sheet_values(100)    # linhas como em iter_rows(values_only=True)
+
+Para análises que só usam o começo do documento há a leitura sob demanda:
+read_pdf_text lê página a página e para assim que o orçamento de caracteres foi
+atingido e todos os sinais pedidos (nome da instituição, uma data, palavras-chave)
+já apareceram. Se o extrato completo já existe (memória ou JSON), ele é usado.
+
+    partial = read_pdf_text(file_path, 4000, signals)
+    partial.text, partial.complete, partial.full_text()
+
+PDFs grandes (Formulários de Referência, QDDs) na extração completa têm as
+páginas divididas em faixas entre processos (pool 'spawn' reutilizado), com
+limite de tempo por página (PDF_PAGE_TIMEOUT) para páginas patológicas
+(XFormObject). O número de processos sai do total de páginas e dos núcleos
+disponíveis; PDF_EXTRACT_WORKERS=1 mantém tudo no processo atual.
+"""
+
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import re
+import signal
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+
+from date_extraction import find_dates
+
+EXTRACT_VERSION = 2
+SIDECAR_SUFFIX = '.extract.json'
+PERSIST_EXTRACTS = os.getenv('DOCUMENT_EXTRACT_SIDECAR', 'true').lower() != 'false'
+MEMO_SIZE = 64
+
+# Extração paralela (só na extração completa de PDFs grandes)
+PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '40'))
+PAGES_PER_WORKER = int(os.getenv('PDF_PAGES_PER_WORKER', '20'))
+MAX_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', '0'))   # 0 = núcleos disponíveis
+PAGE_TIMEOUT = float(os.getenv('PDF_PAGE_TIMEOUT', '20'))
+
+KIND_PDF = 'pdf'
+KIND_EXCEL = 'excel'
+KIND_OTHER = 'other'
+
+CNPJ_PATTERN = re.compile(r'\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}')
+
+# Cores indexadas padrão do Excel
+INDEXED_COLORS = {
+    0: 'FF000000', 1: 'FFFFFFFF', 2: 'FFFF0000', 3: 'FF00FF00',
+    4: 'FF0000FF', 5: 'FFFFFF00', 6: 'FFFF00FF', 7: 'FF00FFFF',
+    10: 'FF00FF00', 11: 'FF0000FF', 13: 'FFFFFF00', 22: 'FFC0C0C0',
+    44: 'FFFFFF99', 45: 'FF99CCFF', 50: 'FFFF6600', 51: 'FF99CC00'
+}
+
+_HASH_CHUNK = 1024 * 1024
+_memo = OrderedDict()
+_hash_memo = {}
+_lock = threading.Lock()
+_pool = None
+_pool_size = 0
+
+
+def _stat_key(file_path):
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+
+def file_sha256(file_path):
+    """SHA-256 dos bytes do arquivo (memorizado por caminho/mtime/tamanho)"""
+    memo_key = _stat_key(file_path)
+    with _lock:
+        digest = _hash_memo.get(memo_key)
+    if digest:
+        return digest
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _lock:
+        if len(_hash_memo) >= 1024:
+            _hash_memo.clear()
+        _hash_memo[memo_key] = digest
+    return digest
+
+
+def cell_fill_color(cell):
+    """Cor de fundo (RGB) de uma célula openpyxl, ou None"""
+    try:
+        if cell.fill and cell.fill.patternType:
+            fg_color = cell.fill.fgColor
+            if fg_color:
+                if fg_color.type == 'rgb' and fg_color.rgb:
+                    return str(fg_color.rgb)
+                elif fg_color.type == 'indexed':
+                    return INDEXED_COLORS.get(fg_color.indexed, None)
+        return None
+    except Exception:
+        return None
+
+
+def _json_value(value):
+    """Valores de célula como tipos JSON (datas viram o mesmo texto de str(value))"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class DocumentExtract:
+    """Conteúdo já extraído de um arquivo; serializável em JSON (to_dict / from_dict)"""
+
+    def __init__(self, file_sha256=None, kind=KIND_OTHER, file_size=0, error=None,
+                 page_texts=None, page_sizes=None, is_encrypted=False,
+                 sheet=None, workbook_text='', date_candidates=None, cnpjs=None):
+        self.file_sha256 = file_sha256
+        self.kind = kind
+        self.file_size = file_size
+        self.error = error
+        self.page_texts = page_texts or []
+        self.page_sizes = page_sizes or []
+        self.is_encrypted = is_encrypted
+        # {'title', 'max_row', 'max_column', 'cells': [[linha, coluna, valor, cor], ...]}
+        self.sheet = sheet
+        self.workbook_text = workbook_text
+        self.date_candidates = date_candidates or []
+        self.cnpjs = cnpjs or []
+        self._grid = None
+
+    # ---------- PDF ----------
+
+    @property
+    def page_count(self):
+        return len(self.page_texts)
+
+    @property
+    def text(self):
+        """Texto das páginas com conteúdo, uma por linha (mesmo formato do extract_text_from_pdf)"""
+        if self.kind == KIND_EXCEL:
+            return self.workbook_text
+        return '\n'.join(t for t in self.page_texts if t).strip()
+
+    @property
+    def is_searchable(self):
+        return any(t and t.strip() for t in self.page_texts)
+
+    # ---------- Excel ----------
+
+    def require_sheet(self):
+        if self.kind != KIND_EXCEL or self.sheet is None:
+            raise ValueError(self.error or 'Arquivo não é uma planilha Excel')
+        return self.sheet
+
+    def _cell_grid(self):
+        if self._grid is None:
+            grid = {}
+            for row, col, value, color in self.require_sheet()['cells']:
+                grid[(row, col)] = (value, color)
+            self._grid = grid
+        return self._grid
+
+    def sheet_cells(self, max_row=None):
+        """Linhas da planilha ativa como listas de (valor, cor), da coluna 1 até max_column"""
+        sheet = self.require_sheet()
+        grid = self._cell_grid()
+        last_row = sheet['max_row'] if max_row is None else min(max_row, sheet['max_row'])
+        empty = (None, None)
+        for row in range(1, last_row + 1):
+            yield [grid.get((row, col), empty) for col in range(1, sheet['max_column'] + 1)]
+
+    def sheet_values(self, max_row=None):
+        """Equivalente a sheet.iter_rows(max_row=..., values_only=True)"""
+        for row in self.sheet_cells(max_row):
+            yield tuple(value for value, _ in row)
+
+    # ---------- Serialização ----------
+
+    def to_dict(self):
+        return {
+            'version': EXTRACT_VERSION,
+            'file_sha256': self.file_sha256,
+            'kind': self.kind,
+            'file_size': self.file_size,
+            'error': self.error,
+            'page_texts': self.page_texts,
+            'page_sizes': self.page_sizes,
+            'is_encrypted': self.is_encrypted,
+            'sheet': self.sheet,
+            'workbook_text': self.workbook_text,
+            'date_candidates': self.date_candidates,
+            'cnpjs': self.cnpjs,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data.pop('version', None)
+        return cls(**data)
+
+
+def _detect_kind(file_path):
+    with open(file_path, 'rb') as f:
+        header = f.read(8)
+    if header.startswith(b'%PDF'):
+        return KIND_PDF
+    if header.startswith(b'PK'):
+        return KIND_EXCEL
+    if file_path.lower().endswith('.pdf'):
+        return KIND_PDF
+    return KIND_OTHER
+
+
+class PageTimeout(Exception):
+    """Página excedeu PDF_PAGE_TIMEOUT (extração paralela)"""
+
+
+def _page_text(page):
+    try:
+        return page.extract_text() or ''
+    except PageTimeout:
+        raise
+    except Exception as e:
+        # Ignorar erros de decodificação de imagens XFormObject
+        if 'XFormObject' not in str(e):
+            print(f"⚠️ Erro ao extrair texto da página: {str(e)[:80]}")
+        return ''
+
+
+def _page_size(page):
+    try:
+        return [float(page.mediabox.width), float(page.mediabox.height)]
+    except Exception:
+        return None
+
+
+def _extract_pdf(extract, file_path):
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        extract.is_encrypted = bool(pdf_reader.is_encrypted)
+        workers = 1 if extract.is_encrypted else extract_worker_count(len(pdf_reader.pages))
+        if workers > 1:
+            try:
+                pages = _extract_pages_parallel(file_path, len(pdf_reader.pages), workers)
+            except Exception as e:
+                print(f"⚠️ Extração paralela falhou ({str(e)[:80]}) - extraindo em série")
+                pages = None
+            if pages is not None:
+                for page_text, page_size in pages:
+                    extract.page_texts.append(page_text)
+                    extract.page_sizes.append(page_size)
+                return
+        for page in pdf_reader.pages:
+            extract.page_texts.append(_page_text(page))
+            extract.page_sizes.append(_page_size(page))
+
+
+# ---------- Extração paralela ----------
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def extract_worker_count(page_count):
+    """Processos para um PDF: 1 (sem pool) abaixo de PARALLEL_MIN_PAGES, senão ~PAGES_PER_WORKER por processo"""
+    if page_count < PARALLEL_MIN_PAGES:
+        return 1
+    limit = MAX_EXTRACT_WORKERS or available_cpus()
+    return max(1, min(limit, math.ceil(page_count / PAGES_PER_WORKER)))
+
+
+_page_running = False
+
+
+def _raise_page_timeout(signum, frame):
+    if _page_running:
+        raise PageTimeout()
+
+
+def _extract_page_range(file_path, start, stop, page_timeout):
+    """Executado no processo do pool: texto e tamanho das páginas [start, stop)"""
+    global _page_running
+    results = []
+    timed_out = []
+    # Processo do pool roda as tarefas na thread principal: SIGALRM interrompe a página
+    previous = signal.signal(signal.SIGALRM, _raise_page_timeout)
+    try:
+        with open(file_path, 'rb') as file:
+            pages = PyPDF2.PdfReader(file).pages
+            for index in range(start, stop):
+                page = pages[index]
+                # Alarme repetido: o PyPDF2 engole algumas exceções internamente
+                _page_running = True
+                signal.setitimer(signal.ITIMER_REAL, page_timeout, 0.5)
+                try:
+                    page_text = _page_text(page)
+                except PageTimeout:
+                    page_text = ''
+                    timed_out.append(index + 1)
+                finally:
+                    _page_running = False
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+                results.append((page_text, _page_size(page)))
+    finally:
+        signal.signal(signal.SIGALRM, previous)
+    return results, timed_out
+
+
+def _get_pool(workers):
+    """Pool compartilhado (cresce se preciso); 'spawn' - nada herdado das threads do pai"""
+    global _pool, _pool_size
+    with _lock:
+        if _pool is None or _pool_size < workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_size = workers
+        return _pool
+
+
+def _discard_pool(pool):
+    """Pool travado ou quebrado: encerra os processos; o próximo uso cria outro"""
+    global _pool, _pool_size
+    with _lock:
+        if _pool is pool:
+            _pool = None
+            _pool_size = 0
+    for process in list((getattr(pool, '_processes', None) or {}).values()):
+        if process.is_alive():
+            process.kill()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_pages_parallel(file_path, page_count, workers):
+    """
+    Divide as páginas em faixas entre `workers` processos e junta na ordem.
+    Retorna [(texto, tamanho), ...] ou None se o pool falhou (o chamador extrai em série).
+    """
+    chunk = math.ceil(page_count / workers)
+    ranges = [(start, min(start + chunk, page_count)) for start in range(0, page_count, chunk)]
+    path = os.path.abspath(file_path)
+    pool = _get_pool(workers)
+    try:
+        futures = [pool.submit(_extract_page_range, path, start, stop, PAGE_TIMEOUT) for start, stop in ranges]
+    except (BrokenProcessPool, RuntimeError) as e:
+        print(f"⚠️ Pool de extração indisponível ({e}) - extraindo em série")
+        _discard_pool(pool)
+        return None
+
+    pages = []
+    timed_out = []
+    for index, (start, stop) in enumerate(ranges):
+        try:
+            # Folga além do limite por página: abrir o PDF em cada processo
+            range_pages, range_timeouts = futures[index].result(timeout=(stop - start) * PAGE_TIMEOUT + 30)
+        except FutureTimeoutError:
+            # Processo preso apesar do limite por página: descarta o pool e segue com um novo
+            print(f"⏳ Páginas {start + 1}-{stop} de {os.path.basename(file_path)} não terminaram - ignoradas")
+            _discard_pool(pool)
+            range_pages, range_timeouts = [('', None)] * (stop - start), list(range(start + 1, stop + 1))
+            pool = _get_pool(workers)
+            futures[index + 1:] = [pool.submit(_extract_page_range, path, next_start, next_stop, PAGE_TIMEOUT)
+                                   for next_start, next_stop in ranges[index + 1:]]
+        except (BrokenProcessPool, CancelledError) as e:
+            print(f"⚠️ Pool de extração quebrou ({e or 'cancelado'}) - extraindo em série")
+            _discard_pool(pool)
+            return None
+        pages.extend(range_pages)
+        timed_out.extend(range_timeouts)
+
+    if timed_out:
+        print(f"⏳ {len(timed_out)} página(s) de {os.path.basename(file_path)} excederam {PAGE_TIMEOUT:g}s "
+              f"e ficaram sem texto: {timed_out[:10]}")
+    return pages
+
+
+def _extract_excel(extract, file_path):
+    import openpyxl
+    wb = openpyxl.load_workbook(file_path, data_only=True)
+    try:
+        sheet = wb.active
+        cells = []
+        for row in sheet.iter_rows():
+            for cell in row:
+                color = cell_fill_color(cell)
+                if cell.value is not None or color:
+                    cells.append([cell.row, cell.column, _json_value(cell.value), color])
+        extract.sheet = {
+            'title': sheet.title,
+            'max_row': sheet.max_row,
+            'max_column': sheet.max_column,
+            'cells': cells,
+        }
+        # Texto de todas as abas (busca, datas e CNPJs)
+        lines = []
+        for worksheet in wb.worksheets:
+            for row in worksheet.iter_rows(values_only=True):
+                values = [str(v) for v in row if v is not None and str(v).strip()]
+                if values:
+                    lines.append(' '.join(values))
+        extract.workbook_text = '\n'.join(lines)
+    finally:
+        wb.close()
+
+
+def build_extract(file_path):
+    """Lê o arquivo uma vez e monta o DocumentExtract (erros ficam em extract.error)"""
+    extract = DocumentExtract(file_sha256=file_sha256(file_path), file_size=os.path.getsize(file_path))
+    try:
+        extract.kind = _detect_kind(file_path)
+        if extract.kind == KIND_PDF:
+            _extract_pdf(extract, file_path)
+        elif extract.kind == KIND_EXCEL:
+            _extract_excel(extract, file_path)
+        else:
+            extract.error = 'Formato de arquivo não suportado para extração'
+    except Exception as e:
+        extract.error = str(e)
+
+    text = extract.text
+    if text:
+        extract.date_candidates = [found.text for found in find_dates(text)]
+        extract.cnpjs = sorted(set(CNPJ_PATTERN.findall(text)))
+    return extract
+
+
+def sidecar_path(file_path):
+    return file_path + SIDECAR_SUFFIX
+
+
+def _load_sidecar(file_path):
+    path = sidecar_path(file_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != EXTRACT_VERSION or data.get('file_sha256') != file_sha256(file_path):
+            return None
+        return DocumentExtract.from_dict(data)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"⚠️ Extrato inválido ignorado ({path}): {e}")
+        return None
+
+
+def _save_sidecar(file_path, extract):
+    path = sidecar_path(file_path)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(extract.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ Não foi possível gravar o extrato de {file_path}: {e}")
+
+
+def _remember(memo_key, extract):
+    with _lock:
+        _memo[memo_key] = extract
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+
+
+def _existing_extract(file_path):
+    """Extrato já pronto (memória ou JSON ao lado do upload), sem ler o arquivo"""
+    memo_key = _stat_key(file_path)
+    with _lock:
+        extract = _memo.get(memo_key)
+        if extract is not None:
+            _memo.move_to_end(memo_key)
+            return extract
+    extract = _load_sidecar(file_path) if PERSIST_EXTRACTS else None
+    if extract is not None:
+        _remember(memo_key, extract)
+    return extract
+
+
+def get_extract(file_path):
+    """Extrato do arquivo: memória -> JSON ao lado do upload -> leitura do arquivo"""
+    extract = _existing_extract(file_path)
+    if extract is not None:
+        return extract
+
+    extract = build_extract(file_path)
+    if PERSIST_EXTRACTS:
+        _save_sidecar(file_path, extract)
+    _remember(_stat_key(file_path), extract)
+    return extract
+
+
+def get_pdf_extract(file_path):
+    """Extrato de um PDF; ValueError se o arquivo não pôde ser lido como PDF"""
+    extract = get_extract(file_path)
+    if extract.error:
+        raise ValueError(extract.error)
+    if extract.kind != KIND_PDF:
+        raise ValueError('Arquivo não é um PDF')
+    return extract
+
+
+def iter_sheet_values(file_path):
+    """
+    Valores da planilha ativa linha a linha, da linha 1 em diante, sem montar a
+    pasta de trabalho em memória (openpyxl read_only; não lê cores). Cada tupla
+    vai só até a última célula existente na linha. Se o extrato completo já está
+    pronto, as linhas vêm dele.
+    """
+    extract = _existing_extract(file_path)
+    if extract is not None:
+        yield from extract.sheet_values()
+        return
+
+    import openpyxl
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = wb.active
+        # A dimensão gravada no arquivo nem sempre confere (ex.: A1:AMJ85)
+        sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+# ---------- Leitura sob demanda (com orçamento) ----------
+
+def iter_pdf_pages(file_path):
+    """Gera (total_de_páginas, texto) página a página; quem consome decide quando parar"""
+    with open(file_path, 'rb') as file:
+        pages = PyPDF2.PdfReader(file).pages
+        page_count = len(pages)
+        for page in pages:
+            yield page_count, _page_text(page)
+
+
+def _signal_found(signal, page_text, page_lower):
+    """Sinal = grupo de alternativas (texto em minúsculas ou regex); basta uma aparecer"""
+    for term in signal:
+        if isinstance(term, str):
+            if term in page_lower:
+                return True
+        elif term.search(page_text):
+            return True
+    return False
+
+
+class PartialText:
+    """Texto das primeiras páginas de um PDF (complete=True quando cobre o arquivo todo)"""
+
+    def __init__(self, file_path, page_texts, pages_read, page_count, complete):
+        self.file_path = file_path
+        self.page_texts = page_texts
+        self.pages_read = pages_read
+        self.page_count = page_count
+        self.complete = complete
+
+    @property
+    def text(self):
+        # Mesmo formato de DocumentExtract.text
+        return '\n'.join(t for t in self.page_texts if t).strip()
+
+    def full_text(self):
+        """Texto completo - para regras que precisam do documento inteiro"""
+        if self.complete:
+            return self.text
+        return get_pdf_extract(self.file_path).text
+
+    def all_page_texts(self):
+        """Todas as páginas - para a seleção de trechos enviados à IA (prompt_budget)"""
+        if self.complete:
+            return self.page_texts
+        return get_pdf_extract(self.file_path).page_texts
+
+
+def read_pdf_text(file_path, budget_chars, signals=()):
+    """
+    Lê páginas até somar budget_chars caracteres E encontrar todos os sinais
+    (ou até o fim do arquivo). Sinal ausente = continua lendo, então uma regra
+    de "não encontrado" só conclui depois de ver o documento inteiro.
+    ValueError se o arquivo não é um PDF legível.
+    """
+    extract = _existing_extract(file_path)
+    if extract is not None:
+        if extract.error:
+            raise ValueError(extract.error)
+        if extract.kind != KIND_PDF:
+            raise ValueError('Arquivo não é um PDF')
+        return PartialText(file_path, extract.page_texts, extract.page_count, extract.page_count, True)
+
+    if _detect_kind(file_path) != KIND_PDF:
+        raise ValueError('Arquivo não é um PDF')
+
+    pending = [signal for signal in signals if signal]
+    page_texts = []
+    page_count = 0
+    chars = 0
+    pages = iter_pdf_pages(file_path)
+    try:
+        for page_count, page_text in pages:
+            page_texts.append(page_text)
+            chars += len(page_text)
+            if pending:
+                page_lower = page_text.lower()
+                pending = [s for s in pending if not _signal_found(s, page_text, page_lower)]
+            if chars >= budget_chars and not pending:
+                break
+    except Exception as e:
+        raise ValueError(str(e)) from e
+    finally:
+        pages.close()
+
+    complete = len(page_texts) == page_count
+    return PartialText(file_path, page_texts, len(page_texts), page_count, complete)
+
+
+def remove_sidecar(file_path):
+    """Chamado junto com a exclusão do arquivo enviado"""
+    path = sidecar_path(file_path)
+    if os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"⚠️ Erro ao remover extrato {path}: {e}")
@@ -7,8 +7,8 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
-import sqlite3
 import os
+from database import get_db_connection
 
 class EmailService:
     """Serviço de envio de e-mails automáticos"""
@@ -58,7 +58,7 @@ class EmailService:
     def log_email(self, process_id, recipient_email, recipient_name, subject, body, status='sent', error=None):
         """Registra e-mail no banco de dados"""
         try:
-            conn = sqlite3.connect('credenciamento.db')
+            conn = get_db_connection()
             c = conn.cursor()
             c.execute('''INSERT INTO email_logs 
                          (process_id, recipient_email, recipient_name, subject, body, status, error_message)
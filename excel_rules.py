@@ -0,0 +1,110 @@
+"""
+Regras do Checklist e do CadPrev em uma única passada pela planilha
+As linhas chegam em streaming (document_extract.iter_sheet_values, openpyxl
+read_only) e cada célula é examinada uma vez: as listas de palavras-chave viram
+uma alternância compilada (um re.search por célula para a lista inteira) em vez
+de any(keyword in ...) por palavra, e nada de juntar a planilha em um texto só.
+
+    scan = scan_sheet(file_path, max_row=100, institution_name='BTG Pactual')
+    scan.has_cnpj, scan.empty_cells, scan.negative_cells, ...
+"""
+
+import re
+
+from document_extract import iter_sheet_values
+
+CNPJ_RE = re.compile(r'\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}')
+NUMBER_RE = re.compile(r'\d+[.,]?\d*')
+
+
+def keyword_matcher(keywords):
+    """Uma regex com todas as palavras (as mais longas primeiro); casa com texto em minúsculas"""
+    return re.compile('|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)))
+
+
+OBSERVATION_KEYWORDS = keyword_matcher(['observação', 'observacao', 'obs:', 'comentário', 'comentario'])
+# 'X' maiúsculo nunca casa com a célula em minúsculas - mantido como na regra original
+NEGATIVE_KEYWORDS = keyword_matcher(['❌', '✗', 'X', 'não', 'nao', 'pendente', 'falta'])
+POSITIVE_KEYWORDS = keyword_matcher(['sim', 'aprovad'])
+VOLUME_KEYWORDS = keyword_matcher(['volume', 'gerido', 'patrimônio', 'patrimonio', 'aum', 'total'])
+
+
+def _is_large_number(match):
+    return len(match.replace(',', '').replace('.', '')) > 6
+
+
+class SheetScan:
+    """Resultado da passada: indicadores usados pelas regras de analyze_checklist/analyze_cadprev"""
+
+    def __init__(self):
+        self.rows = 0                  # linhas com alguma célula preenchida (até max_row)
+        self.width = 0                 # colunas da planilha (maior linha do arquivo)
+        self.filled_cells = 0          # células com texto (fora '' e 'None')
+        self.has_institution = False
+        self.has_cnpj = False
+        self.has_observations = False
+        self.short_observation = False
+        self.negative_cells = 0
+        self.has_volume = False
+        self.has_large_number = False
+        self.long_text_cells = 0       # respostas com mais de 50 caracteres
+
+    @property
+    def total_cells(self):
+        return self.rows * self.width
+
+    @property
+    def empty_cells(self):
+        return self.total_cells - self.filled_cells
+
+
+def _check_observation(scan, text):
+    if len(text) < 20 and text.strip() and text != 'None':
+        scan.short_observation = True
+
+
+def scan_sheet(file_path, max_row, institution_name=None):
+    """Uma passada pelas linhas 1..max_row da planilha ativa (o resto do arquivo só conta colunas)"""
+    scan = SheetScan()
+    institution = institution_name.lower() if institution_name else None
+    # Colunas com palavra de observação na linha preenchida anterior (a resposta pode estar logo abaixo)
+    observation_columns = []
+
+    for row_number, row in enumerate(iter_sheet_values(file_path), start=1):
+        scan.width = max(scan.width, len(row))
+        if row_number > max_row or not any(cell is not None for cell in row):
+            continue
+        scan.rows += 1
+
+        cells = ['' if cell is None else str(cell) for cell in row]
+        for column in observation_columns:
+            if column < len(cells):
+                _check_observation(scan, cells[column])
+        observation_columns = []
+
+        for column, text in enumerate(cells):
+            if text == '':
+                continue
+            if text != 'None':
+                scan.filled_cells += 1
+            lower = text.lower()
+
+            if institution and not scan.has_institution and institution in lower:
+                scan.has_institution = True
+            if not scan.has_cnpj and CNPJ_RE.search(text):
+                scan.has_cnpj = True
+            if len(text) > 50:
+                scan.long_text_cells += 1
+            if NEGATIVE_KEYWORDS.search(lower) and not POSITIVE_KEYWORDS.search(lower):
+                scan.negative_cells += 1
+            if not scan.has_volume and VOLUME_KEYWORDS.search(lower):
+                scan.has_volume = True
+            if not scan.has_large_number and any(_is_large_number(m) for m in NUMBER_RE.findall(text)):
+                scan.has_large_number = True
+            if OBSERVATION_KEYWORDS.search(lower):
+                scan.has_observations = True
+                if column + 1 < len(cells):
+                    _check_observation(scan, cells[column + 1])
+                observation_columns.append(column)
+
+    return scan
@@ -1,14 +1,14 @@
 """
 Script para forçar análise de documentos que ficaram travados no status 'analyzing'
 """
-import sqlite3
+from database import get_db_connection
 import os
 from ai_analyzer_rigorous import analyze_document_rigorous
 from datetime import datetime
 import json
 
 def force_analyze_stuck_documents():
-    conn = sqlite3.connect('credenciamento.db')
+    conn = get_db_connection()
     c = conn.cursor()
     
     # Buscar documentos com status 'analyzing'
@@ -0,0 +1,202 @@
+"""
+Cache de Respostas da IA (prompt normalizado + modelo + provedor)
+analyze_apresentacao_institucional e os demais analisadores montam o mesmo
+prompt sempre que o texto e a instituição se repetem; a resposta do provedor é
+reaproveitada em vez de gastar outra chamada. A chave é o SHA-256 de:
+
+    system prompt + prompt + contexto (espaços normalizados, já ajustado por
+    prompt_budget.fit_context como é enviado ao provedor) + provedor + modelo
+
+Validade por tipo de documento: LLM_CACHE_TTL_HOURS, LLM_CACHE_DATE_TTL_HOURS
+para tipos que dependem da data de hoje e LLM_CACHE_TTL_HOURS_<TIPO> para
+sobrescrever um tipo. Tamanho limitado (LLM_CACHE_MAX_ENTRIES / LLM_CACHE_MAX_MB):
+ao passar do limite saem as entradas usadas há mais tempo (LRU).
+LLM_CACHE=false desliga o cache; bypass_cache=True em get_ai_analysis ignora a
+resposta guardada e grava a nova.
+
+O motor de IA roda em um event loop; lookup_async/store_async executam as
+consultas na thread de db_executor (com a conexão dela) para não travar o loop.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from cache_metrics import Counters, stored_hit_rate
+from db_executor import DBExecutor
+
+CACHE_ENABLED = os.getenv('LLM_CACHE', 'true').lower() != 'false'
+TTL_HOURS = int(os.getenv('LLM_CACHE_TTL_HOURS', '168'))
+DATE_TTL_HOURS = int(os.getenv('LLM_CACHE_DATE_TTL_HOURS', '24'))
+MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '5000'))
+MAX_BYTES = int(float(os.getenv('LLM_CACHE_MAX_MB', '50')) * 1024 * 1024)
+
+# rpps_ai_analyzer usa "RPPS_Analysis_<tipo>" como tipo do documento
+TYPE_PREFIXES = ('RPPS_Analysis_',)
+
+
+# Acertos/erros deste processo (o total persistido fica em llm_cache.hit_count)
+counters = Counters('bypassed', 'evicted', 'errors', 'tokens_saved')
+
+
+def _timestamp(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _utc_now():
+    return datetime.now(timezone.utc)
+
+
+def normalize(text):
+    """Espaços, quebras de linha e tabulações repetidos não mudam a chave"""
+    return ' '.join((text or '').split())
+
+
+def make_key(system_prompt, prompt, context, provider, model):
+    raw = '\x1f'.join([normalize(system_prompt), normalize(prompt), normalize(context), provider or '', model or ''])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def base_type(document_type):
+    document_type = document_type or ''
+    for prefix in TYPE_PREFIXES:
+        if document_type.startswith(prefix):
+            return document_type[len(prefix):]
+    return document_type
+
+
+def ttl_for(document_type):
+    document_type = base_type(document_type)
+    override = os.getenv(f'LLM_CACHE_TTL_HOURS_{document_type.upper()}') if document_type else None
+    if override:
+        return timedelta(hours=float(override))
+    # Mesmo conjunto do cache de análises (import tardio: analysis_cache importa o motor de IA)
+    from analysis_cache import DATE_SENSITIVE_TYPES
+    if document_type in DATE_SENSITIVE_TYPES:
+        return timedelta(hours=DATE_TTL_HOURS)
+    return timedelta(hours=TTL_HOURS)
+
+
+def _tokens(result):
+    tokens = result.get('tokens_used')
+    return tokens if isinstance(tokens, int) else None
+
+
+def lookup(conn, cache_key):
+    """Resposta guardada e ainda válida (ou None); registra o acerto na linha do cache"""
+    if not CACHE_ENABLED:
+        return None
+    now = _timestamp(_utc_now())
+    c = conn.cursor()
+    c.execute('''SELECT response, tokens_used FROM llm_cache
+                 WHERE cache_key = ? AND expires_at > ?''', (cache_key, now))
+    row = c.fetchone()
+    if row is None:
+        counters.add('misses')
+        return None
+    c.execute('''UPDATE llm_cache SET hit_count = hit_count + 1, last_used_at = ?
+                 WHERE cache_key = ?''', (now, cache_key))
+    counters.add('hits')
+    counters.add('tokens_saved', row[1] or 0)
+
+    # Nada foi gasto nesta chamada: custo zero, tokens economizados à parte
+    result = json.loads(row[0])
+    result['cached'] = True
+    result['tokens_saved'] = row[1] or 0
+    result['tokens_used'] = 0
+    result['input_tokens'] = 0
+    result['output_tokens'] = 0
+    result['cost_estimate'] = 0.0
+    return result
+
+
+def store(conn, cache_key, provider, model, document_type, result):
+    """Grava uma resposta bem-sucedida e aplica os limites de tamanho"""
+    if not CACHE_ENABLED or not isinstance(result, dict) or not result.get('success'):
+        return
+    response = json.dumps(result)
+    now = _utc_now()
+    c = conn.cursor()
+    c.execute('''INSERT INTO llm_cache
+                 (cache_key, provider, model, document_type, response, tokens_used, size_bytes,
+                  created_at, expires_at, last_used_at, hit_count)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+                 ON CONFLICT (cache_key) DO UPDATE SET
+                     response = excluded.response, tokens_used = excluded.tokens_used,
+                     size_bytes = excluded.size_bytes, created_at = excluded.created_at,
+                     expires_at = excluded.expires_at, last_used_at = excluded.last_used_at''',
+              (cache_key, provider, model, document_type, response, _tokens(result), len(response.encode('utf-8')),
+               _timestamp(now), _timestamp(now + ttl_for(document_type)), _timestamp(now)))
+    counters.add('stores')
+    _evict(c, now)
+
+
+def _evict(c, now):
+    """Vencidas saem sempre; depois, as usadas há mais tempo até caber nos limites"""
+    c.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (_timestamp(now),))
+    c.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM llm_cache')
+    entries, total_bytes = c.fetchone()
+    if entries <= MAX_ENTRIES and total_bytes <= MAX_BYTES:
+        return
+    excess_entries = max(0, entries - MAX_ENTRIES)
+    excess_bytes = max(0, total_bytes - MAX_BYTES)
+    victims = []
+    c.execute('SELECT cache_key, size_bytes FROM llm_cache ORDER BY last_used_at')
+    for cache_key, size_bytes in c.fetchall():
+        if len(victims) >= excess_entries and excess_bytes <= 0:
+            break
+        victims.append((cache_key,))
+        excess_bytes -= size_bytes
+    c.executemany('DELETE FROM llm_cache WHERE cache_key = ?', victims)
+    counters.add('evicted', len(victims))
+
+
+# Consultas do event loop de IA: falha no cache nunca derruba a análise
+_db = DBExecutor('llm-cache', "⚠️  Cache de respostas da IA indisponível ({error}) - seguindo sem cache",
+                 on_error=lambda e: counters.add('errors'))
+
+
+async def lookup_async(cache_key):
+    if not CACHE_ENABLED:
+        return None
+    return await _db.run(lookup, cache_key)
+
+
+async def store_async(cache_key, provider, model, document_type, result):
+    if not CACHE_ENABLED or not result.get('success'):
+        return
+    await _db.run(store, cache_key, provider, model, document_type, result)
+
+
+def get_stats(conn):
+    """Métricas do cache: entradas, ocupação, acertos e tokens economizados"""
+    c = conn.cursor()
+    now = _timestamp(_utc_now())
+    c.execute('''SELECT COUNT(*), SUM(CASE WHEN expires_at > ? THEN 1 ELSE 0 END), SUM(hit_count),
+                        SUM(size_bytes), SUM(hit_count * COALESCE(tokens_used, 0))
+                 FROM llm_cache''', (now,))
+    entries, active, stored_hits, total_bytes, tokens_saved = c.fetchone()
+    stored_hits = stored_hits or 0
+    c.execute('''SELECT provider, model, COUNT(*), SUM(hit_count), SUM(hit_count * COALESCE(tokens_used, 0))
+                 FROM llm_cache GROUP BY provider, model ORDER BY SUM(hit_count) DESC, provider''')
+    by_model = [{'provider': row[0], 'model': row[1], 'entries': row[2], 'hits': row[3] or 0,
+                 'tokens_saved': row[4] or 0} for row in c.fetchall()]
+    c.execute('''SELECT document_type, COUNT(*), SUM(hit_count) FROM llm_cache
+                 GROUP BY document_type ORDER BY SUM(hit_count) DESC, document_type''')
+    by_type = [{'document_type': row[0], 'entries': row[1], 'hits': row[2] or 0} for row in c.fetchall()]
+
+    return {
+        'enabled': CACHE_ENABLED,
+        'limits': {'max_entries': MAX_ENTRIES, 'max_mb': round(MAX_BYTES / 1024 / 1024, 1),
+                   'ttl_hours': TTL_HOURS, 'date_ttl_hours': DATE_TTL_HOURS},
+        'entries': entries or 0,
+        'active_entries': active or 0,
+        'size_mb': round((total_bytes or 0) / 1024 / 1024, 2),
+        'stored_hits': stored_hits,
+        'tokens_saved': tokens_saved or 0,
+        'hit_rate': stored_hit_rate(stored_hits, entries),
+        'process': counters.as_dict(),
+        'by_model': by_model,
+        'by_type': by_type
+    }
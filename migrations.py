@@ -0,0 +1,1214 @@
+"""
+Migrações Versionadas do Banco de Dados
+Substitui o init_db() com ALTER TABLE/except e os scripts migrate_*.py avulsos.
+
+Cada migração roda uma única vez, em ordem, e a versão aplicada fica registrada
+na tabela schema_version. Uso:
+
+    python migrations.py            # aplica as migrações pendentes
+    python migrations.py --status   # mostra a versão atual
+    python migrations.py --check    # verifica se as consultas principais usam os índices
+
+Com DATABASE_URL apontando para um PostgreSQL, o mesmo DDL é traduzido por database.py;
+triggers e busca textual têm versões próprias para o Postgres (plpgsql / tsvector).
+"""
+
+import sys
+from werkzeug.security import generate_password_hash
+from database import get_db_connection, get_dialect, backend
+
+
+# ==================== FUNÇÕES AUXILIARES ====================
+
+def _is_postgres():
+    return get_dialect() == 'postgresql'
+
+
+def _column_exists(c, table, column):
+    if _is_postgres():
+        c.execute('''SELECT 1 FROM information_schema.columns
+                     WHERE table_schema = current_schema() AND table_name = ? AND column_name = ?''',
+                  (table, column))
+        return c.fetchone() is not None
+    c.execute(f'PRAGMA table_info({table})')
+    return any(row[1] == column for row in c.fetchall())
+
+
+def _create_pg_functions(c):
+    """Funções usadas pelo SQL traduzido no Postgres (datas em texto UTC, como no SQLite)"""
+    c.execute('''CREATE OR REPLACE FUNCTION app_now() RETURNS TEXT AS $$
+                     SELECT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')
+                 $$ LANGUAGE SQL STABLE''')
+    c.execute('''CREATE OR REPLACE FUNCTION app_today() RETURNS TEXT AS $$
+                     SELECT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD')
+                 $$ LANGUAGE SQL STABLE''')
+    # Sem depender da extensão unaccent (nem sempre disponível em Postgres gerenciado)
+    c.execute('''CREATE OR REPLACE FUNCTION app_unaccent(value TEXT) RETURNS TEXT AS $$
+                     SELECT translate(lower(value), 'áàâãäéèêëíìîïóòôõöúùûüçñ', 'aaaaaeeeeiiiiooooouuuucn')
+                 $$ LANGUAGE SQL IMMUTABLE''')
+
+
+def _add_column(c, table, column, definition):
+    """Adiciona a coluna somente se ainda não existir (bancos antigos já podem tê-la)"""
+    if not _column_exists(c, table, column):
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+# ==================== MIGRAÇÕES ====================
+
+def _migration_001_baseline(c):
+    """Esquema base: tabelas do antigo init_db() + colunas dos scripts migrate_*.py"""
+
+    # Tabela de usuários
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  email TEXT UNIQUE NOT NULL,
+                  password TEXT NOT NULL,
+                  name TEXT NOT NULL,
+                  cpf_cnpj TEXT NOT NULL,
+                  role TEXT NOT NULL,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+    # Tabela de processos de credenciamento
+    c.execute('''CREATE TABLE IF NOT EXISTS processes
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  custom_id TEXT UNIQUE,
+                  financial_institution_id INTEGER NOT NULL,
+                  financial_institution_name TEXT NOT NULL,
+                  financial_institution_cnpj TEXT,
+                  rpps_id INTEGER NOT NULL,
+                  rpps_name TEXT NOT NULL,
+                  credentialing_type TEXT NOT NULL,
+                  status TEXT DEFAULT 'draft',
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  submitted_at TIMESTAMP,
+                  reviewed_at TIMESTAMP,
+                  final_review_note TEXT,
+                  final_decision TEXT,
+                  final_decision_at TIMESTAMP,
+                  final_decision_by INTEGER,
+                  is_archived INTEGER DEFAULT 0,
+                  FOREIGN KEY (financial_institution_id) REFERENCES users(id),
+                  FOREIGN KEY (rpps_id) REFERENCES users(id))''')
+
+    # Tabela de documentos
+    c.execute('''CREATE TABLE IF NOT EXISTS documents
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  process_id INTEGER NOT NULL,
+                  type TEXT NOT NULL,
+                  name TEXT NOT NULL,
+                  filename TEXT NOT NULL,
+                  mime_type TEXT NOT NULL,
+                  uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  uploaded_by INTEGER NOT NULL,
+                  status TEXT DEFAULT 'pending',
+                  analysis_data TEXT,
+                  workflow_status TEXT DEFAULT 'initial',
+                  workflow_version INTEGER DEFAULT 1,
+                  FOREIGN KEY (process_id) REFERENCES processes(id),
+                  FOREIGN KEY (uploaded_by) REFERENCES users(id))''')
+
+    # Tabela de comunicações
+    c.execute('''CREATE TABLE IF NOT EXISTS communications
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  process_id INTEGER NOT NULL,
+                  sender_id INTEGER,
+                  sender_role TEXT NOT NULL,
+                  message TEXT NOT NULL,
+                  message_type TEXT DEFAULT 'comment',
+                  is_internal INTEGER DEFAULT 0,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (process_id) REFERENCES processes(id),
+                  FOREIGN KEY (sender_id) REFERENCES users(id))''')
+
+    # Rastrear documentos solicitados que já foram atendidos
+    _add_column(c, 'communications', 'is_fulfilled', 'INTEGER DEFAULT 0')
+
+    # Tabela de histórico do processo
+    c.execute('''CREATE TABLE IF NOT EXISTS process_history
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  process_id INTEGER NOT NULL,
+                  user_id INTEGER,
+                  user_name TEXT,
+                  user_role TEXT,
+                  action TEXT NOT NULL,
+                  details TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (process_id) REFERENCES processes(id),
+                  FOREIGN KEY (user_id) REFERENCES users(id))''')
+
+    # Tabela de controle de uso de IA (proteção financeira)
+    c.execute('''CREATE TABLE IF NOT EXISTS ai_usage_log
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  process_id INTEGER NOT NULL,
+                  user_id INTEGER NOT NULL,
+                  documents_analyzed INTEGER DEFAULT 0,
+                  tokens_estimated INTEGER DEFAULT 0,
+                  analysis_date DATE DEFAULT CURRENT_DATE,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (process_id) REFERENCES processes(id),
+                  FOREIGN KEY (user_id) REFERENCES users(id))''')
+
+    # Tabela de Documentos Especiais (Termo de Credenciamento - fluxo de assinaturas)
+    # Status: excel_if, pdf_rpps_signed, awaiting_if_signature, signed_by_if, official_final
+    c.execute('''CREATE TABLE IF NOT EXISTS special_documents
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  process_id INTEGER NOT NULL,
+                  document_type TEXT NOT NULL,
+                  version INTEGER DEFAULT 1,
+                  status TEXT NOT NULL,
+                  filename TEXT NOT NULL,
+                  original_filename TEXT,
+                  mime_type TEXT,
+                  uploaded_by INTEGER,
+                  uploaded_by_role TEXT,
+                  notes TEXT,
+                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (process_id) REFERENCES processes(id),
+                  FOREIGN KEY (uploaded_by) REFERENCES users(id))''')
+
+    # --- antigo migrate_database.py ---
+    _add_column(c, 'documents', 'rpps_analysis', 'TEXT')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS process_returns (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        process_id INTEGER NOT NULL,
+        returned_by INTEGER NOT NULL,
+        returned_to INTEGER NOT NULL,
+        reason TEXT NOT NULL,
+        observations TEXT,
+        status TEXT DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        resolved_at TIMESTAMP,
+        FOREIGN KEY (process_id) REFERENCES processes(id),
+        FOREIGN KEY (returned_by) REFERENCES users(id),
+        FOREIGN KEY (returned_to) REFERENCES users(id)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS action_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        process_id INTEGER,
+        document_id INTEGER,
+        user_id INTEGER NOT NULL,
+        action_type TEXT NOT NULL,
+        action_details TEXT,
+        ip_address TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (process_id) REFERENCES processes(id),
+        FOREIGN KEY (document_id) REFERENCES documents(id),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS email_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        process_id INTEGER,
+        recipient_email TEXT NOT NULL,
+        recipient_name TEXT,
+        subject TEXT NOT NULL,
+        body TEXT NOT NULL,
+        sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        status TEXT DEFAULT 'sent',
+        error_message TEXT,
+        FOREIGN KEY (process_id) REFERENCES processes(id)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS organizations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        cnpj TEXT UNIQUE NOT NULL,
+        email TEXT NOT NULL,
+        phone TEXT,
+        type TEXT NOT NULL,
+        status TEXT DEFAULT 'active',
+        created_by INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (created_by) REFERENCES users(id)
+    )''')
+
+    _add_column(c, 'users', 'organization_id', 'INTEGER REFERENCES organizations(id)')
+    _add_column(c, 'processes', 'return_count', 'INTEGER DEFAULT 0')
+    _add_column(c, 'processes', 'last_returned_at', 'TIMESTAMP')
+
+    # --- antigo migrate_multi_users.py ---
+    _add_column(c, 'users', 'entity_id', 'INTEGER')
+    _add_column(c, 'users', 'is_active', 'INTEGER DEFAULT 1')
+    _add_column(c, 'users', 'reset_token', 'TEXT')
+    _add_column(c, 'users', 'reset_token_expires', 'TEXT')
+    _add_column(c, 'users', 'last_login', 'TEXT')
+    _add_column(c, 'users', 'user_number', 'INTEGER')  # 1 a 5 para cada entidade
+
+    _add_column(c, 'processes', 'is_authorized', 'INTEGER DEFAULT 0')
+    _add_column(c, 'processes', 'authorized_by', 'INTEGER')
+    _add_column(c, 'processes', 'authorized_at', 'TEXT')
+    _add_column(c, 'processes', 'ai_pre_analysis', 'TEXT')   # JSON com análise prévia da IF
+    _add_column(c, 'processes', 'ai_full_analysis', 'TEXT')  # JSON com análise completa do RPPS
+    _add_column(c, 'processes', 'ai_analysis_date', 'TEXT')
+
+    _add_column(c, 'documents', 'has_signature', 'INTEGER DEFAULT 0')
+    _add_column(c, 'documents', 'signature_valid', 'INTEGER')
+    _add_column(c, 'documents', 'signature_info', 'TEXT')   # JSON com informações do certificado
+
+    # --- antigo migrate_termo_workflow.py ---
+    _add_column(c, 'documents', 'workflow_status', "TEXT DEFAULT 'initial'")
+    _add_column(c, 'documents', 'workflow_version', 'INTEGER DEFAULT 1')
+    _add_column(c, 'documents', 'original_filename', 'TEXT')
+    _add_column(c, 'documents', 'prepared_by', 'TEXT')
+    _add_column(c, 'documents', 'prepared_at', 'TEXT')
+    _add_column(c, 'documents', 'signed_by_if_at', 'TEXT')
+    _add_column(c, 'documents', 'final_signed_at', 'TEXT')
+
+    # --- antigo migrate_user_profile.py ---
+    for column in ('endereco', 'telefone', 'email_institucional', 'foto_perfil',
+                   'cidade', 'estado', 'cep', 'razao_social'):
+        _add_column(c, 'users', column, 'TEXT')
+
+    # --- antigo migrate_admin.py ---
+    c.execute('''CREATE TABLE IF NOT EXISTS subscriptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        organization_id INTEGER NOT NULL,
+        plan_type TEXT NOT NULL,
+        annual_value REAL NOT NULL,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        status TEXT DEFAULT 'active',
+        payment_method TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (organization_id) REFERENCES organizations(id)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        subscription_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        payment_date TEXT NOT NULL,
+        status TEXT DEFAULT 'pending',
+        payment_method TEXT,
+        notes TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (subscription_id) REFERENCES subscriptions(id)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS system_settings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        setting_key TEXT UNIQUE NOT NULL,
+        setting_value TEXT NOT NULL,
+        description TEXT,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS audit_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        action TEXT NOT NULL,
+        entity_type TEXT,
+        entity_id INTEGER,
+        details TEXT,
+        ip_address TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )''')
+
+    _add_column(c, 'organizations', 'organization_type', "TEXT DEFAULT 'rpps'")
+
+    default_settings = [
+        ('default_rpps_annual_fee', '5000.00', 'Valor anual padrão para assinatura RPPS'),
+        ('default_financial_annual_fee', '8000.00', 'Valor anual padrão para assinatura Instituição Financeira'),
+        ('system_currency', 'BRL', 'Moeda do sistema'),
+        ('company_name', 'Sistema de Credenciamento RPPS', 'Nome da empresa'),
+        ('admin_email', 'admin@credenciamento.com', 'Email do administrador'),
+        ('enable_notifications', 'true', 'Ativar notificações por email')
+    ]
+    c.executemany('''INSERT OR IGNORE INTO system_settings (setting_key, setting_value, description)
+                     VALUES (?, ?, ?)''', default_settings)
+
+    # Inserir usuários de teste se não existirem
+    c.execute("SELECT COUNT(*) FROM users")
+    if c.fetchone()[0] == 0:
+        test_users = [
+            ('rpps@teste.com', generate_password_hash('rpps123'), 'RPPS Teste', '12345678000190', 'rpps'),
+            ('financeira@teste.com', generate_password_hash('financeira123'), 'Instituição Financeira Teste', '98765432000180', 'financial_institution'),
+            ('suporte.aicsj@gmail.com', generate_password_hash('Fieleaquelequeprometeu'), 'Administrador do Sistema', '00000000000', 'admin')
+        ]
+        c.executemany('INSERT INTO users (email, password, name, cpf_cnpj, role) VALUES (?, ?, ?, ?, ?)', test_users)
+
+    # Usuários existentes passam a ser o primeiro usuário da sua própria entidade
+    c.execute('''UPDATE users SET entity_id = id, user_number = 1, is_active = 1
+                 WHERE entity_id IS NULL''')
+
+
+def _migration_002_indexes(c):
+    """Índices compostos alinhados aos caminhos de acesso das telas de detalhe e listagens"""
+    indexes = [
+        # Detalhe do processo: tudo é filtrado por process_id
+        'CREATE INDEX IF NOT EXISTS idx_documents_process_uploaded ON documents(process_id, uploaded_at)',
+        'CREATE INDEX IF NOT EXISTS idx_communications_process ON communications(process_id)',
+        'CREATE INDEX IF NOT EXISTS idx_communications_process_type ON communications(process_id, message_type, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_process_history_process_created ON process_history(process_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_ai_usage_process_date ON ai_usage_log(process_id, analysis_date)',
+        'CREATE INDEX IF NOT EXISTS idx_ai_usage_process_created ON ai_usage_log(process_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_special_documents_process_type ON special_documents(process_id, document_type, version)',
+        'CREATE INDEX IF NOT EXISTS idx_special_documents_process_status ON special_documents(process_id, status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_email_logs_process ON email_logs(process_id)',
+
+        # Listagens RPPS / IF (filtro por dono + arquivado, ordenadas por data)
+        'CREATE INDEX IF NOT EXISTS idx_processes_rpps_archived_created ON processes(rpps_id, is_archived, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_processes_fi_archived_created ON processes(financial_institution_id, is_archived, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_processes_type_status ON processes(credentialing_type, status)',
+        'CREATE INDEX IF NOT EXISTS idx_processes_status ON processes(status)',
+
+        # Usuários (antigo migrate_multi_users.py + listagem de entidades)
+        'CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)',
+        'CREATE INDEX IF NOT EXISTS idx_users_entity ON users(entity_id)',
+        'CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)',
+        'CREATE INDEX IF NOT EXISTS idx_users_reset_token ON users(reset_token)',
+        'CREATE INDEX IF NOT EXISTS idx_processes_authorized ON processes(is_authorized)',
+    ]
+    for sql in indexes:
+        c.execute(sql)
+    # Estatísticas para o planejador escolher os índices corretos
+    c.execute('ANALYZE')
+
+
+def _migration_003_counters(c):
+    """Contadores por processo e totais status x tipo mantidos por triggers"""
+    _add_column(c, 'processes', 'document_count', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(c, 'processes', 'pending_request_count', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(c, 'processes', 'last_activity_at', 'TIMESTAMP')
+
+    # Carga inicial a partir dos dados existentes
+    c.execute('''UPDATE processes SET
+                    document_count = (SELECT COUNT(*) FROM documents d WHERE d.process_id = processes.id),
+                    pending_request_count = (SELECT COUNT(*) FROM communications m
+                                             WHERE m.process_id = processes.id
+                                             AND m.message_type = 'document_request'
+                                             AND COALESCE(m.is_fulfilled, 0) = 0),
+                    last_activity_at = COALESCE(
+                        (SELECT MAX(created_at) FROM process_history h WHERE h.process_id = processes.id),
+                        updated_at, created_at)''')
+
+    # Totais globais por status x tipo de credenciamento (dashboard admin)
+    c.execute('''CREATE TABLE IF NOT EXISTS process_status_rollup
+                 (status TEXT NOT NULL,
+                  credentialing_type TEXT NOT NULL,
+                  total INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (status, credentialing_type)) WITHOUT ROWID''')
+    c.execute('DELETE FROM process_status_rollup')
+    c.execute('''INSERT INTO process_status_rollup (status, credentialing_type, total)
+                 SELECT COALESCE(status, ''), credentialing_type, COUNT(*)
+                 FROM processes GROUP BY COALESCE(status, ''), credentialing_type''')
+
+    if _is_postgres():
+        _create_pg_counter_triggers(c)
+        return
+
+    triggers = [
+        # documents -> processes.document_count / last_activity_at
+        '''CREATE TRIGGER IF NOT EXISTS trg_documents_count_insert AFTER INSERT ON documents
+           BEGIN
+               UPDATE processes SET document_count = document_count + 1,
+                                    last_activity_at = CURRENT_TIMESTAMP
+               WHERE id = NEW.process_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_documents_count_delete AFTER DELETE ON documents
+           BEGIN
+               UPDATE processes SET document_count = document_count - 1,
+                                    last_activity_at = CURRENT_TIMESTAMP
+               WHERE id = OLD.process_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_documents_count_move AFTER UPDATE OF process_id ON documents
+           WHEN OLD.process_id IS NOT NEW.process_id
+           BEGIN
+               UPDATE processes SET document_count = document_count - 1 WHERE id = OLD.process_id;
+               UPDATE processes SET document_count = document_count + 1 WHERE id = NEW.process_id;
+           END''',
+
+        # communications -> processes.pending_request_count / last_activity_at
+        f'''CREATE TRIGGER IF NOT EXISTS trg_communications_count_insert AFTER INSERT ON communications
+            BEGIN
+                UPDATE processes SET pending_request_count = pending_request_count + {_PENDING_NEW},
+                                     last_activity_at = CURRENT_TIMESTAMP
+                WHERE id = NEW.process_id;
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_communications_count_delete AFTER DELETE ON communications
+            BEGIN
+                UPDATE processes SET pending_request_count = pending_request_count - {_PENDING_OLD}
+                WHERE id = OLD.process_id;
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_communications_count_update
+            AFTER UPDATE OF is_fulfilled, message_type, process_id ON communications
+            BEGIN
+                UPDATE processes SET pending_request_count = pending_request_count - {_PENDING_OLD}
+                WHERE id = OLD.process_id;
+                UPDATE processes SET pending_request_count = pending_request_count + {_PENDING_NEW}
+                WHERE id = NEW.process_id;
+            END''',
+
+        # process_history -> processes.last_activity_at
+        '''CREATE TRIGGER IF NOT EXISTS trg_process_history_activity AFTER INSERT ON process_history
+           BEGIN
+               UPDATE processes SET last_activity_at = CURRENT_TIMESTAMP WHERE id = NEW.process_id;
+           END''',
+
+        '''CREATE TRIGGER IF NOT EXISTS trg_processes_activity_insert AFTER INSERT ON processes
+           WHEN NEW.last_activity_at IS NULL
+           BEGIN
+               UPDATE processes SET last_activity_at = COALESCE(NEW.created_at, CURRENT_TIMESTAMP)
+               WHERE id = NEW.id;
+           END''',
+
+        # processes -> process_status_rollup
+        '''CREATE TRIGGER IF NOT EXISTS trg_processes_rollup_insert AFTER INSERT ON processes
+           BEGIN
+               INSERT INTO process_status_rollup (status, credentialing_type, total)
+               VALUES (COALESCE(NEW.status, ''), NEW.credentialing_type, 1)
+               ON CONFLICT (status, credentialing_type) DO UPDATE SET total = total + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_processes_rollup_delete AFTER DELETE ON processes
+           BEGIN
+               UPDATE process_status_rollup SET total = total - 1
+               WHERE status = COALESCE(OLD.status, '') AND credentialing_type = OLD.credentialing_type;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_processes_rollup_update
+           AFTER UPDATE OF status, credentialing_type ON processes
+           WHEN OLD.status IS NOT NEW.status OR OLD.credentialing_type IS NOT NEW.credentialing_type
+           BEGIN
+               UPDATE process_status_rollup SET total = total - 1
+               WHERE status = COALESCE(OLD.status, '') AND credentialing_type = OLD.credentialing_type;
+               INSERT INTO process_status_rollup (status, credentialing_type, total)
+               VALUES (COALESCE(NEW.status, ''), NEW.credentialing_type, 1)
+               ON CONFLICT (status, credentialing_type) DO UPDATE SET total = total + 1;
+           END''',
+    ]
+    for sql in triggers:
+        c.execute(sql)
+
+
+_PENDING_NEW = "(CASE WHEN NEW.message_type = 'document_request' AND COALESCE(NEW.is_fulfilled, 0) = 0 THEN 1 ELSE 0 END)"
+_PENDING_OLD = "(CASE WHEN OLD.message_type = 'document_request' AND COALESCE(OLD.is_fulfilled, 0) = 0 THEN 1 ELSE 0 END)"
+
+
+def _create_pg_trigger(c, name, timing, table, function):
+    c.execute(f'DROP TRIGGER IF EXISTS {name} ON {table}')
+    c.execute(f'CREATE TRIGGER {name} {timing} ON {table} FOR EACH ROW EXECUTE FUNCTION {function}()')
+
+
+def _create_pg_counter_triggers(c):
+    """Mesmos contadores da migração 003, em plpgsql"""
+    c.execute('''CREATE OR REPLACE FUNCTION trg_documents_count() RETURNS TRIGGER AS $$
+                 BEGIN
+                     IF TG_OP = 'INSERT' THEN
+                         UPDATE processes SET document_count = document_count + 1, last_activity_at = app_now()
+                         WHERE id = NEW.process_id;
+                     ELSIF TG_OP = 'DELETE' THEN
+                         UPDATE processes SET document_count = document_count - 1, last_activity_at = app_now()
+                         WHERE id = OLD.process_id;
+                     ELSIF OLD.process_id IS DISTINCT FROM NEW.process_id THEN
+                         UPDATE processes SET document_count = document_count - 1 WHERE id = OLD.process_id;
+                         UPDATE processes SET document_count = document_count + 1 WHERE id = NEW.process_id;
+                     END IF;
+                     RETURN NULL;
+                 END $$ LANGUAGE plpgsql''')
+    _create_pg_trigger(c, 'trg_documents_count', 'AFTER INSERT OR DELETE OR UPDATE OF process_id',
+                       'documents', 'trg_documents_count')
+
+    c.execute(f'''CREATE OR REPLACE FUNCTION trg_communications_count() RETURNS TRIGGER AS $$
+                  BEGIN
+                      IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                          UPDATE processes SET pending_request_count = pending_request_count - {_PENDING_OLD}
+                          WHERE id = OLD.process_id;
+                      END IF;
+                      IF TG_OP = 'INSERT' THEN
+                          UPDATE processes SET pending_request_count = pending_request_count + {_PENDING_NEW},
+                                               last_activity_at = app_now()
+                          WHERE id = NEW.process_id;
+                      ELSIF TG_OP = 'UPDATE' THEN
+                          UPDATE processes SET pending_request_count = pending_request_count + {_PENDING_NEW}
+                          WHERE id = NEW.process_id;
+                      END IF;
+                      RETURN NULL;
+                  END $$ LANGUAGE plpgsql''')
+    _create_pg_trigger(c, 'trg_communications_count',
+                       'AFTER INSERT OR DELETE OR UPDATE OF is_fulfilled, message_type, process_id',
+                       'communications', 'trg_communications_count')
+
+    c.execute('''CREATE OR REPLACE FUNCTION trg_process_history_activity() RETURNS TRIGGER AS $$
+                 BEGIN
+                     UPDATE processes SET last_activity_at = app_now() WHERE id = NEW.process_id;
+                     RETURN NULL;
+                 END $$ LANGUAGE plpgsql''')
+    _create_pg_trigger(c, 'trg_process_history_activity', 'AFTER INSERT',
+                       'process_history', 'trg_process_history_activity')
+
+    # No Postgres o valor inicial é definido antes da inserção (BEFORE), sem UPDATE extra
+    c.execute('''CREATE OR REPLACE FUNCTION trg_processes_activity_insert() RETURNS TRIGGER AS $$
+                 BEGIN
+                     IF NEW.last_activity_at IS NULL THEN
+                         NEW.last_activity_at := COALESCE(NEW.created_at, app_now());
+                     END IF;
+                     RETURN NEW;
+                 END $$ LANGUAGE plpgsql''')
+    _create_pg_trigger(c, 'trg_processes_activity_insert', 'BEFORE INSERT',
+                       'processes', 'trg_processes_activity_insert')
+
+    c.execute('''CREATE OR REPLACE FUNCTION trg_processes_rollup() RETURNS TRIGGER AS $$
+                 BEGIN
+                     IF TG_OP = 'UPDATE' AND OLD.status IS NOT DISTINCT FROM NEW.status
+                        AND OLD.credentialing_type IS NOT DISTINCT FROM NEW.credentialing_type THEN
+                         RETURN NULL;
+                     END IF;
+                     IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                         UPDATE process_status_rollup SET total = total - 1
+                         WHERE status = COALESCE(OLD.status, '') AND credentialing_type = OLD.credentialing_type;
+                     END IF;
+                     IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                         INSERT INTO process_status_rollup (status, credentialing_type, total)
+                         VALUES (COALESCE(NEW.status, ''), NEW.credentialing_type, 1)
+                         ON CONFLICT (status, credentialing_type)
+                         DO UPDATE SET total = process_status_rollup.total + 1;
+                     END IF;
+                     RETURN NULL;
+                 END $$ LANGUAGE plpgsql''')
+    _create_pg_trigger(c, 'trg_processes_rollup',
+                       'AFTER INSERT OR DELETE OR UPDATE OF status, credentialing_type',
+                       'processes', 'trg_processes_rollup')
+
+
+def _migration_004_pagination_indexes(c):
+    """Índices para paginação por cursor, filtros por status e totais das listas"""
+    # Linhas antigas sem data de atividade quebrariam a comparação do cursor
+    c.execute('''UPDATE processes SET last_activity_at = COALESCE(updated_at, created_at, CURRENT_TIMESTAMP)
+                 WHERE last_activity_at IS NULL''')
+    c.execute('''UPDATE processes SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)
+                 WHERE updated_at IS NULL''')
+
+    indexes = [
+        'CREATE INDEX IF NOT EXISTS idx_processes_rpps_status_created ON processes(rpps_id, is_archived, status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_processes_fi_status_created ON processes(financial_institution_id, is_archived, status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_processes_rpps_summary ON processes(rpps_id, is_archived, credentialing_type, status)',
+        'CREATE INDEX IF NOT EXISTS idx_processes_rpps_activity ON processes(rpps_id, is_archived, last_activity_at)',
+        'CREATE INDEX IF NOT EXISTS idx_processes_fi_activity ON processes(financial_institution_id, is_archived, last_activity_at)',
+        'CREATE INDEX IF NOT EXISTS idx_users_role_name ON users(role, name)',
+        'CREATE INDEX IF NOT EXISTS idx_organizations_created ON organizations(created_at)',
+    ]
+    for sql in indexes:
+        c.execute(sql)
+    c.execute('ANALYZE')
+
+
+def _migration_005_search_index(c):
+    """Índice FTS5 de documentos, comunicações e histórico (ver search_index.py)"""
+    if _is_postgres():
+        _create_pg_search_index(c)
+        return
+
+    # rowid = id de origem * 4 + código (0 documento, 1 comunicação, 2 histórico)
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+                    title, body,
+                    process_id UNINDEXED, source UNINDEXED, source_id UNINDEXED,
+                    tokenize = 'unicode61 remove_diacritics 2',
+                    prefix = '2 3 4')''')
+
+    triggers = [
+        '''CREATE TRIGGER IF NOT EXISTS trg_search_communications_insert AFTER INSERT ON communications
+           BEGIN
+               INSERT INTO search_index (rowid, title, body, process_id, source, source_id)
+               VALUES (NEW.id * 4 + 1, COALESCE(NEW.message_type, 'comment'), NEW.message,
+                       NEW.process_id, 'communication', NEW.id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_search_communications_update
+           AFTER UPDATE OF message, message_type, process_id ON communications
+           BEGIN
+               DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1;
+               INSERT INTO search_index (rowid, title, body, process_id, source, source_id)
+               VALUES (NEW.id * 4 + 1, COALESCE(NEW.message_type, 'comment'), NEW.message,
+                       NEW.process_id, 'communication', NEW.id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_search_communications_delete AFTER DELETE ON communications
+           BEGIN
+               DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_search_history_insert AFTER INSERT ON process_history
+           BEGIN
+               INSERT INTO search_index (rowid, title, body, process_id, source, source_id)
+               VALUES (NEW.id * 4 + 2, NEW.action, COALESCE(NEW.details, ''),
+                       NEW.process_id, 'history', NEW.id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_search_history_delete AFTER DELETE ON process_history
+           BEGIN
+               DELETE FROM search_index WHERE rowid = OLD.id * 4 + 2;
+           END''',
+        # O texto do documento é inserido pela análise; aqui só limpamos na exclusão
+        '''CREATE TRIGGER IF NOT EXISTS trg_search_documents_delete AFTER DELETE ON documents
+           BEGIN
+               DELETE FROM search_index WHERE rowid = OLD.id * 4;
+           END''',
+    ]
+    for sql in triggers:
+        c.execute(sql)
+
+    # Carga inicial de comunicações e histórico (documentos: python search_index.py --reindex-documents)
+    c.execute('''INSERT OR REPLACE INTO search_index (rowid, title, body, process_id, source, source_id)
+                 SELECT id * 4 + 1, COALESCE(message_type, 'comment'), message, process_id, 'communication', id
+                 FROM communications''')
+    c.execute('''INSERT OR REPLACE INTO search_index (rowid, title, body, process_id, source, source_id)
+                 SELECT id * 4 + 2, action, COALESCE(details, ''), process_id, 'history', id
+                 FROM process_history''')
+
+
+def _create_pg_search_index(c):
+    """Versão Postgres do índice: tabela comum com tsvector + GIN, mesmos rowids e triggers"""
+    c.execute('''CREATE TABLE IF NOT EXISTS search_index (
+                    rowid BIGINT PRIMARY KEY,
+                    title TEXT,
+                    body TEXT,
+                    process_id INTEGER,
+                    source TEXT,
+                    source_id INTEGER,
+                    tsv TSVECTOR)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_search_index_tsv ON search_index USING GIN (tsv)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_search_index_process ON search_index(process_id)')
+
+    # Título com peso maior que o corpo (equivalente ao bm25(5, 1) do FTS5)
+    c.execute('''CREATE OR REPLACE FUNCTION trg_search_index_tsv() RETURNS TRIGGER AS $$
+                 BEGIN
+                     NEW.tsv := setweight(to_tsvector('simple', app_unaccent(COALESCE(NEW.title, ''))), 'A')
+                             || setweight(to_tsvector('simple', app_unaccent(COALESCE(NEW.body, ''))), 'B');
+                     RETURN NEW;
+                 END $$ LANGUAGE plpgsql''')
+    _create_pg_trigger(c, 'trg_search_index_tsv', 'BEFORE INSERT OR UPDATE', 'search_index', 'trg_search_index_tsv')
+
+    c.execute('''CREATE OR REPLACE FUNCTION trg_search_communications() RETURNS TRIGGER AS $$
+                 BEGIN
+                     IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                         DELETE FROM search_index WHERE rowid = OLD.id * 4 + 1;
+                     END IF;
+                     IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                         INSERT INTO search_index (rowid, title, body, process_id, source, source_id)
+                         VALUES (NEW.id * 4 + 1, COALESCE(NEW.message_type, 'comment'), NEW.message,
+                                 NEW.process_id, 'communication', NEW.id);
+                     END IF;
+                     RETURN NULL;
+                 END $$ LANGUAGE plpgsql''')
+    _create_pg_trigger(c, 'trg_search_communications',
+                       'AFTER INSERT OR DELETE OR UPDATE OF message, message_type, process_id',
+                       'communications', 'trg_search_communications')
+
+    c.execute('''CREATE OR REPLACE FUNCTION trg_search_history() RETURNS TRIGGER AS $$
+                 BEGIN
+                     IF TG_OP = 'DELETE' THEN
+                         DELETE FROM search_index WHERE rowid = OLD.id * 4 + 2;
+                     ELSE
+                         INSERT INTO search_index (rowid, title, body, process_id, source, source_id)
+                         VALUES (NEW.id * 4 + 2, NEW.action, COALESCE(NEW.details, ''),
+                                 NEW.process_id, 'history', NEW.id);
+                     END IF;
+                     RETURN NULL;
+                 END $$ LANGUAGE plpgsql''')
+    _create_pg_trigger(c, 'trg_search_history', 'AFTER INSERT OR DELETE', 'process_history', 'trg_search_history')
+
+    c.execute('''CREATE OR REPLACE FUNCTION trg_search_documents_delete() RETURNS TRIGGER AS $$
+                 BEGIN
+                     DELETE FROM search_index WHERE rowid = OLD.id * 4;
+                     RETURN NULL;
+                 END $$ LANGUAGE plpgsql''')
+    _create_pg_trigger(c, 'trg_search_documents_delete', 'AFTER DELETE', 'documents', 'trg_search_documents_delete')
+
+    c.execute('''INSERT INTO search_index (rowid, title, body, process_id, source, source_id)
+                 SELECT id * 4 + 1, COALESCE(message_type, 'comment'), message, process_id, 'communication', id
+                 FROM communications
+                 ON CONFLICT (rowid) DO NOTHING''')
+    c.execute('''INSERT INTO search_index (rowid, title, body, process_id, source, source_id)
+                 SELECT id * 4 + 2, action, COALESCE(details, ''), process_id, 'history', id
+                 FROM process_history
+                 ON CONFLICT (rowid) DO NOTHING''')
+
+
+def _migration_006_analysis_results(c):
+    """Resultados de análise em tabelas (document_analysis / document_issue) em vez do JSON"""
+    c.execute('''CREATE TABLE IF NOT EXISTS document_analysis
+                 (document_id INTEGER PRIMARY KEY,
+                  process_id INTEGER NOT NULL,
+                  score INTEGER,
+                  is_valid INTEGER,
+                  content_ok INTEGER,
+                  tcees_passed INTEGER,
+                  signature_validated INTEGER,
+                  signature_valid INTEGER,
+                  final_verdict TEXT,
+                  summary TEXT,
+                  completeness INTEGER,
+                  completeness_comment TEXT,
+                  coherence INTEGER,
+                  coherence_comment TEXT,
+                  institution_mentioned INTEGER,
+                  institution_comment TEXT,
+                  issue_count INTEGER NOT NULL DEFAULT 0,
+                  warning_count INTEGER NOT NULL DEFAULT 0,
+                  analyzed_at TIMESTAMP,
+                  provider TEXT,
+                  latency_ms INTEGER,
+                  FOREIGN KEY (document_id) REFERENCES documents(id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS document_issue
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  document_id INTEGER NOT NULL,
+                  process_id INTEGER NOT NULL,
+                  severity TEXT NOT NULL,
+                  position INTEGER NOT NULL DEFAULT 0,
+                  text TEXT NOT NULL,
+                  FOREIGN KEY (document_id) REFERENCES documents(id))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_document_analysis_process ON document_analysis(process_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_document_analysis_verdict ON document_analysis(final_verdict)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_document_issue_document ON document_issue(document_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_document_issue_process ON document_issue(process_id, document_id, position)')
+
+    # Documento excluído leva junto o resultado da análise
+    if _is_postgres():
+        c.execute('''CREATE OR REPLACE FUNCTION trg_document_analysis_delete() RETURNS TRIGGER AS $$
+                     BEGIN
+                         DELETE FROM document_issue WHERE document_id = OLD.id;
+                         DELETE FROM document_analysis WHERE document_id = OLD.id;
+                         RETURN NULL;
+                     END $$ LANGUAGE plpgsql''')
+        _create_pg_trigger(c, 'trg_document_analysis_delete', 'AFTER DELETE', 'documents',
+                           'trg_document_analysis_delete')
+    else:
+        c.execute('''CREATE TRIGGER IF NOT EXISTS trg_document_analysis_delete AFTER DELETE ON documents
+                     BEGIN
+                         DELETE FROM document_issue WHERE document_id = OLD.id;
+                         DELETE FROM document_analysis WHERE document_id = OLD.id;
+                     END''')
+
+    # Handle aninhado: mesma conexão e mesma transação da migração
+    from analysis_store import backfill_from_archive
+    conn = get_db_connection()
+    try:
+        backfill_from_archive(conn)
+    finally:
+        conn.close()
+
+
+def _migration_007_id_sequences(c):
+    """Sequência por código de instituição para o custom_id (substitui o LIKE + ORDER BY)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS id_sequences
+                 (prefix TEXT PRIMARY KEY,
+                  last_value INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID''')
+    # Continua a numeração dos IDs já emitidos (IT00042G -> IT = 42)
+    c.execute('''INSERT INTO id_sequences (prefix, last_value)
+                 SELECT substr(custom_id, 1, 2), MAX(CAST(substr(custom_id, 3, 5) AS INTEGER))
+                 FROM processes
+                 WHERE custom_id IS NOT NULL AND length(custom_id) = 8
+                 GROUP BY substr(custom_id, 1, 2)
+                 ON CONFLICT (prefix) DO NOTHING''')
+
+
+def _migration_008_analysis_jobs(c):
+    """Fila durável de análises (substitui a thread por upload)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS analysis_jobs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  job_type TEXT NOT NULL,
+                  document_id INTEGER,
+                  process_id INTEGER,
+                  payload TEXT,
+                  priority INTEGER NOT NULL DEFAULT 0,
+                  status TEXT NOT NULL DEFAULT 'queued',
+                  attempts INTEGER NOT NULL DEFAULT 0,
+                  max_attempts INTEGER NOT NULL DEFAULT 3,
+                  run_after TEXT NOT NULL,
+                  lease_owner TEXT,
+                  lease_expires_at TEXT,
+                  heartbeat_at TEXT,
+                  last_error TEXT,
+                  created_at TEXT NOT NULL,
+                  started_at TEXT,
+                  finished_at TEXT)''')
+    # Reserva do próximo job: status + prioridade + horário liberado
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_analysis_jobs_claim
+                 ON analysis_jobs(status, priority DESC, run_after, id)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_analysis_jobs_lease
+                 ON analysis_jobs(status, lease_expires_at)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analysis_jobs_document ON analysis_jobs(document_id, status)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analysis_jobs_process ON analysis_jobs(process_id)')
+
+
+def _migration_009_analysis_cache(c):
+    """Cache de resultados de análise por SHA-256 do arquivo + tipo + instituição + versão"""
+    c.execute('''CREATE TABLE IF NOT EXISTS analysis_cache
+                 (cache_key TEXT PRIMARY KEY,
+                  file_sha256 TEXT NOT NULL,
+                  document_type TEXT NOT NULL,
+                  institution_key TEXT NOT NULL,
+                  analyzer_version TEXT NOT NULL,
+                  result TEXT NOT NULL,
+                  created_at TEXT NOT NULL,
+                  expires_at TEXT NOT NULL,
+                  hit_count INTEGER NOT NULL DEFAULT 0,
+                  last_hit_at TEXT)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analysis_cache_expires ON analysis_cache(expires_at)')
+
+
+def _migration_010_analysis_runs(c):
+    """Execuções de análise do processo inteiro (um job por documento na fila)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS analysis_runs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  process_id INTEGER NOT NULL,
+                  user_id INTEGER,
+                  status TEXT NOT NULL DEFAULT 'running',
+                  total_documents INTEGER NOT NULL DEFAULT 0,
+                  summary TEXT,
+                  created_at TEXT NOT NULL,
+                  finished_at TEXT)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analysis_runs_process ON analysis_runs(process_id, id)')
+    _add_column(c, 'analysis_jobs', 'run_id', 'INTEGER')
+    _add_column(c, 'analysis_jobs', 'result', 'TEXT')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analysis_jobs_run ON analysis_jobs(run_id, status)')
+
+
+def _migration_011_process_analysis_state(c):
+    """Último resultado de cada documento na análise do processo (hash + versão do analisador)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS process_analysis_state
+                 (document_id INTEGER PRIMARY KEY,
+                  process_id INTEGER NOT NULL,
+                  file_sha256 TEXT NOT NULL,
+                  document_type TEXT,
+                  institution_key TEXT NOT NULL,
+                  analyzer_version TEXT NOT NULL,
+                  score INTEGER,
+                  is_valid INTEGER,
+                  issue_count INTEGER NOT NULL DEFAULT 0,
+                  run_id INTEGER,
+                  analyzed_at TEXT NOT NULL,
+                  FOREIGN KEY (document_id) REFERENCES documents(id))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_process_analysis_state_process ON process_analysis_state(process_id)')
+    _add_column(c, 'analysis_runs', 'reused_documents', 'INTEGER NOT NULL DEFAULT 0')
+
+    # Documento excluído sai do parecer do processo
+    if _is_postgres():
+        c.execute('''CREATE OR REPLACE FUNCTION trg_process_analysis_state_delete() RETURNS TRIGGER AS $$
+                     BEGIN
+                         DELETE FROM process_analysis_state WHERE document_id = OLD.id;
+                         RETURN NULL;
+                     END $$ LANGUAGE plpgsql''')
+        _create_pg_trigger(c, 'trg_process_analysis_state_delete', 'AFTER DELETE', 'documents',
+                           'trg_process_analysis_state_delete')
+    else:
+        c.execute('''CREATE TRIGGER IF NOT EXISTS trg_process_analysis_state_delete AFTER DELETE ON documents
+                     BEGIN
+                         DELETE FROM process_analysis_state WHERE document_id = OLD.id;
+                     END''')
+
+
+def _migration_012_llm_cache(c):
+    """Cache de respostas da IA por prompt normalizado + provedor + modelo (LRU por last_used_at)"""
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_cache
+                 (cache_key TEXT PRIMARY KEY,
+                  provider TEXT NOT NULL,
+                  model TEXT NOT NULL,
+                  document_type TEXT,
+                  response TEXT NOT NULL,
+                  tokens_used INTEGER,
+                  size_bytes INTEGER NOT NULL,
+                  created_at TEXT NOT NULL,
+                  expires_at TEXT NOT NULL,
+                  last_used_at TEXT NOT NULL,
+                  hit_count INTEGER NOT NULL DEFAULT 0)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used_at)')
+
+
+def _migration_013_ai_call_usage(c):
+    """Uso medido de cada chamada de IA (tokens, custo, latência) e orçamento diário por escopo"""
+    c.execute('''CREATE TABLE IF NOT EXISTS ai_call_usage
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  process_id INTEGER,
+                  document_id INTEGER,
+                  job_id INTEGER,
+                  rpps_id INTEGER,
+                  institution_id INTEGER,
+                  provider TEXT NOT NULL,
+                  model TEXT NOT NULL,
+                  document_type TEXT,
+                  input_tokens INTEGER NOT NULL DEFAULT 0,
+                  output_tokens INTEGER NOT NULL DEFAULT 0,
+                  cost_usd REAL NOT NULL DEFAULT 0,
+                  latency_ms INTEGER,
+                  success INTEGER NOT NULL,
+                  error TEXT,
+                  usage_day TEXT NOT NULL,
+                  created_at TEXT NOT NULL)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_ai_call_usage_day ON ai_call_usage(usage_day)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_ai_call_usage_process ON ai_call_usage(process_id)')
+    # Gasto + reserva do dia por escopo ('global' / 'rpps' / 'institution'); a reserva é um UPDATE condicional
+    c.execute('''CREATE TABLE IF NOT EXISTS ai_budget_usage
+                 (scope TEXT NOT NULL,
+                  scope_id INTEGER NOT NULL,
+                  usage_day TEXT NOT NULL,
+                  calls INTEGER NOT NULL DEFAULT 0,
+                  input_tokens INTEGER NOT NULL DEFAULT 0,
+                  output_tokens INTEGER NOT NULL DEFAULT 0,
+                  cost_usd REAL NOT NULL DEFAULT 0,
+                  reserved_usd REAL NOT NULL DEFAULT 0,
+                  PRIMARY KEY (scope, scope_id, usage_day))''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_ai_budget_usage_day ON ai_budget_usage(usage_day)')
+
+
+def _migration_014_one_running_analysis(c):
+    """No máximo uma execução de análise em andamento por processo (índice único parcial)"""
+    # Execuções duplicadas de corridas antigas: fica a mais recente de cada processo
+    c.execute('''UPDATE analysis_runs SET status = 'completed', finished_at = created_at
+                 WHERE status = 'running'
+                   AND id NOT IN (SELECT MAX(id) FROM analysis_runs WHERE status = 'running' GROUP BY process_id)''')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_analysis_runs_one_running
+                 ON analysis_runs(process_id) WHERE status = 'running' ''')
+
+
+# (versão, descrição, função) - sempre acrescentar no final, nunca renumerar
+MIGRATIONS = [
+    (1, 'Esquema base (init_db + scripts migrate_*.py)', _migration_001_baseline),
+    (2, 'Índices compostos para consultas frequentes', _migration_002_indexes),
+    (3, 'Contadores por processo e rollup status x tipo (triggers)', _migration_003_counters),
+    (4, 'Índices de paginação por cursor', _migration_004_pagination_indexes),
+    (5, 'Busca textual FTS5 (documentos, comunicações, histórico)', _migration_005_search_index),
+    (6, 'Resultados de análise estruturados (document_analysis / document_issue)', _migration_006_analysis_results),
+    (7, 'Sequências atômicas do custom_id (id_sequences)', _migration_007_id_sequences),
+    (8, 'Fila durável de análises (analysis_jobs)', _migration_008_analysis_jobs),
+    (9, 'Cache de resultados de análise (analysis_cache)', _migration_009_analysis_cache),
+    (10, 'Execuções de análise por processo (analysis_runs)', _migration_010_analysis_runs),
+    (11, 'Estado da análise incremental por documento (process_analysis_state)', _migration_011_process_analysis_state),
+    (12, 'Cache de respostas da IA (llm_cache)', _migration_012_llm_cache),
+    (13, 'Uso medido e orçamento diário da IA (ai_call_usage / ai_budget_usage)', _migration_013_ai_call_usage),
+    (14, 'Uma execução de análise em andamento por processo', _migration_014_one_running_analysis),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ==================== EXECUÇÃO ====================
+
+def _ensure_version_table(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                 (version INTEGER PRIMARY KEY,
+                  description TEXT NOT NULL,
+                  applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+
+
+def get_schema_version(conn):
+    """Retorna a última versão aplicada (0 se o banco ainda não foi versionado)"""
+    c = conn.cursor()
+    try:
+        c.execute('SELECT MAX(version) FROM schema_version')
+        row = c.fetchone()
+        return row[0] or 0
+    except Exception:
+        # No Postgres o erro invalida a transação corrente
+        conn.rollback()
+        return 0
+
+
+def run_migrations(verbose=True):
+    """Aplica as migrações pendentes. Seguro para rodar em paralelo (lock de escrita)."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    applied = []
+    try:
+        # BEGIN IMMEDIATE: apenas um processo migra; os demais aguardam e encontram tudo aplicado
+        # (no Postgres vira um advisory lock da transação)
+        if conn.in_transaction:
+            conn.commit()
+        c.execute('BEGIN IMMEDIATE')
+        if _is_postgres():
+            _create_pg_functions(c)
+        _ensure_version_table(c)
+        current = get_schema_version(conn)
+
+        for version, description, migration in MIGRATIONS:
+            if version <= current:
+                continue
+            if verbose:
+                print(f"🔧 Aplicando migração {version:03d}: {description}")
+            migration(c)
+            c.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                      (version, description))
+            applied.append(version)
+
+        conn.commit()
+        backend.forget_schema()
+        if verbose:
+            if applied:
+                print(f"✅ Banco atualizado para a versão {LATEST_VERSION}")
+            else:
+                print(f"✅ Banco já está na versão {current}")
+        return applied
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Erro ao aplicar migrações: {e}")
+        raise
+    finally:
+        conn.close()
+
+
+def ensure_schema():
+    """Chamado na importação do app: só migra se o banco estiver desatualizado"""
+    conn = get_db_connection()
+    try:
+        current = get_schema_version(conn)
+    finally:
+        conn.close()
+    if current < LATEST_VERSION:
+        run_migrations()
+
+
+# ==================== VERIFICAÇÃO DOS PLANOS DE CONSULTA ====================
+
+# (descrição, SQL, parâmetros, índices aceitos)
+QUERY_PLAN_CHECKS = [
+    ('Documentos do processo',
+     'SELECT id, type, name, status FROM documents WHERE process_id = ? ORDER BY uploaded_at DESC',
+     (1,), ('idx_documents_process_uploaded',)),
+    ('Comunicações do processo',
+     'SELECT id, message, created_at FROM communications WHERE process_id = ? ORDER BY id DESC',
+     (1,), ('idx_communications_process',)),
+    ('Comunicações por tipo',
+     "SELECT sender_role, message, created_at FROM communications WHERE process_id = ? AND message_type = 'document_request' ORDER BY created_at ASC",
+     (1,), ('idx_communications_process_type',)),
+    ('Histórico do processo',
+     'SELECT action, details, created_at FROM process_history WHERE process_id = ? ORDER BY created_at ASC',
+     (1,), ('idx_process_history_process_created',)),
+    ('Limite diário de análises IA',
+     "SELECT COUNT(*), COALESCE(SUM(documents_analyzed), 0) FROM ai_usage_log WHERE process_id = ? AND analysis_date = DATE('now')",
+     (1,), ('idx_ai_usage_process_date',)),
+    ('Última análise IA (cooldown)',
+     'SELECT created_at FROM ai_usage_log WHERE process_id = ? ORDER BY created_at DESC LIMIT 1',
+     (1,), ('idx_ai_usage_process_created',)),
+    ('Lista de processos do RPPS',
+     "SELECT id FROM processes WHERE rpps_id = ? AND is_archived = ? AND status != 'draft' ORDER BY created_at DESC",
+     (1, 0), ('idx_processes_rpps_archived_created',)),
+    ('Lista de processos da IF',
+     'SELECT id FROM processes WHERE financial_institution_id = ? AND is_archived = 0 ORDER BY created_at DESC',
+     (1,), ('idx_processes_fi_archived_created',)),
+    ('Processos por categoria',
+     "SELECT COUNT(*) FROM processes WHERE credentialing_type = ? AND status = 'aprovado'",
+     ('Gestor',), ('idx_processes_type_status',)),
+    ('Documentos especiais do processo',
+     "SELECT id FROM special_documents WHERE process_id = ? AND status = 'awaiting_if_signature' ORDER BY created_at DESC LIMIT 1",
+     (1,), ('idx_special_documents_process_status',)),
+    ('Versão do termo',
+     'SELECT MAX(version) FROM special_documents WHERE process_id = ? AND document_type = ?',
+     (1, 'termo_credenciamento'), ('idx_special_documents_process_type',)),
+    ('Página de processos do RPPS (cursor)',
+     "SELECT id FROM processes p WHERE p.rpps_id = ? AND p.status != 'draft' AND p.is_archived = ? AND (p.created_at, p.id) < (?, ?) ORDER BY p.created_at DESC, p.id DESC LIMIT 51",
+     (1, 0, '2030-01-01', 10**9), ('idx_processes_rpps_archived_created',)),
+    ('Página de processos do RPPS por status',
+     "SELECT id FROM processes p WHERE p.rpps_id = ? AND p.status != 'draft' AND p.is_archived = ? AND p.status IN (?) ORDER BY p.created_at DESC, p.id DESC LIMIT 51",
+     (1, 0, 'submitted'), ('idx_processes_rpps_status_created', 'idx_processes_rpps_archived_created')),
+    ('Resumo tipo x status do RPPS',
+     "SELECT p.status, p.credentialing_type, COUNT(*) FROM processes p WHERE p.rpps_id = ? AND p.status != 'draft' AND p.is_archived = ? GROUP BY p.credentialing_type, p.status",
+     (1, 0), ('idx_processes_rpps_summary',)),
+    ('Página de entidades',
+     "SELECT u.id FROM users u WHERE u.role IN ('financial', 'rpps') AND (u.name, u.id) > (?, ?) ORDER BY u.name ASC, u.id ASC LIMIT 51",
+     ('', 0), ('idx_users_role_name',)),
+    ('Problemas apontados na análise (relatório)',
+     'SELECT document_id, severity, text FROM document_issue WHERE process_id = ? ORDER BY document_id, position',
+     (1,), ('idx_document_issue_process',)),
+    ('Totais do relatório de análise',
+     'SELECT COUNT(*), SUM(COALESCE(a.score, 50)) FROM documents d LEFT JOIN document_analysis a ON a.document_id = d.id WHERE d.process_id = ?',
+     (1,), ('idx_documents_process_uploaded',)),
+    ('Usuários da entidade',
+     'SELECT id FROM users WHERE entity_id = ?',
+     (1,), ('idx_users_entity',)),
+    ('Próximo job da fila de análises',
+     "SELECT id FROM analysis_jobs WHERE status = 'queued' AND run_after <= ? AND (run_id IS NULL OR run_id NOT IN (SELECT run_id FROM analysis_jobs WHERE status = 'running' AND run_id IS NOT NULL GROUP BY run_id HAVING COUNT(*) >= ?)) ORDER BY priority DESC, run_after, id LIMIT 1",
+     ('2100-01-01 00:00:00', 4), ('idx_analysis_jobs_claim',)),
+    ('Parecer incremental do processo',
+     'SELECT d.id, s.score, s.is_valid FROM documents d LEFT JOIN process_analysis_state s ON s.document_id = d.id WHERE d.process_id = ?',
+     (1,), ('idx_documents_process_uploaded',)),
+    ('Jobs de uma execução de análise',
+     'SELECT id, status FROM analysis_jobs WHERE run_id = ? ORDER BY id',
+     (1,), ('idx_analysis_jobs_run',)),
+    ('Entradas menos usadas do cache da IA (LRU)',
+     'SELECT cache_key, size_bytes FROM llm_cache ORDER BY last_used_at',
+     (), ('idx_llm_cache_last_used',)),
+    ('Uso da IA no período (painel admin)',
+     'SELECT provider, model, COUNT(*), SUM(cost_usd) FROM ai_call_usage WHERE usage_day >= ? GROUP BY provider, model',
+     ('2000-01-01',), ('idx_ai_call_usage_day',)),
+    ('Uso da IA do processo',
+     'SELECT COUNT(*), SUM(cost_usd) FROM ai_call_usage WHERE process_id = ?',
+     (1,), ('idx_ai_call_usage_process',)),
+    ('Reserva no orçamento diário da IA',
+     "UPDATE ai_budget_usage SET reserved_usd = reserved_usd + ? WHERE scope = ? AND scope_id = ? AND usage_day = ? AND cost_usd + reserved_usd + ? <= ?",
+     (0.1, 'rpps', 1, '2030-01-01', 0.1, 5), ('sqlite_autoindex_ai_budget_usage_1',)),
+    ('Leases expirados da fila de análises',
+     "UPDATE analysis_jobs SET status = 'queued' WHERE status = 'running' AND lease_expires_at < ?",
+     ('2000-01-01 00:00:00',), ('idx_analysis_jobs_lease',)),
+]
+
+
+def check_query_plans(verbose=True):
+    """Roda EXPLAIN QUERY PLAN nas consultas principais e confirma o uso dos índices esperados"""
+    if _is_postgres():
+        # O planejador do Postgres depende do volume de dados; a verificação vale para o SQLite
+        if verbose:
+            print("ℹ️  Verificação de planos disponível apenas para SQLite")
+        return []
+    conn = get_db_connection()
+    c = conn.cursor()
+    failures = []
+    try:
+        for description, sql, params, expected in QUERY_PLAN_CHECKS:
+            c.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' | '.join(row[3] for row in c.fetchall())
+            ok = any(f'INDEX {index}' in plan for index in expected)
+            if not ok:
+                failures.append((description, plan))
+            if verbose:
+                print(f"{'✅' if ok else '❌'} {description}: {plan}")
+    finally:
+        conn.close()
+
+    if verbose:
+        if failures:
+            print(f"\n❌ {len(failures)} consulta(s) sem o índice esperado")
+        else:
+            print(f"\n✅ Todas as {len(QUERY_PLAN_CHECKS)} consultas usam índices")
+    return failures
+
+
+def check_counters(verbose=True):
+    """Confere os contadores mantidos por triggers contra uma contagem completa"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        c.execute('''SELECT COUNT(*) FROM processes p
+                     WHERE p.document_count != (SELECT COUNT(*) FROM documents d WHERE d.process_id = p.id)
+                     OR p.pending_request_count != (SELECT COUNT(*) FROM communications m
+                                                    WHERE m.process_id = p.id
+                                                    AND m.message_type = 'document_request'
+                                                    AND COALESCE(m.is_fulfilled, 0) = 0)''')
+        drifted = c.fetchone()[0]
+        c.execute('''SELECT COUNT(*) FROM (
+                        SELECT COALESCE(status, '') AS status, credentialing_type, COUNT(*) AS total
+                        FROM processes GROUP BY 1, 2) t
+                     LEFT JOIN process_status_rollup r
+                        ON r.status = t.status AND r.credentialing_type = t.credentialing_type
+                     WHERE r.total IS NULL OR r.total != t.total''')
+        drifted += c.fetchone()[0]
+    finally:
+        conn.close()
+    if verbose:
+        print(f"{'✅' if drifted == 0 else '❌'} Contadores consistentes: {drifted} divergência(s)")
+    return drifted
+
+
+if __name__ == '__main__':
+    if '--status' in sys.argv:
+        conn = get_db_connection()
+        print(f"📋 Versão do esquema: {get_schema_version(conn)} (mais recente: {LATEST_VERSION})")
+        conn.close()
+    elif '--check' in sys.argv:
+        run_migrations(verbose=False)
+        failures = check_query_plans()
+        drifted = check_counters()
+        sys.exit(1 if failures or drifted else 0)
+    else:
+        run_migrations()
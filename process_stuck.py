@@ -1,8 +1,8 @@
-import sqlite3
+from database import get_db_connection
 import sys
 sys.stdout.reconfigure(encoding='utf-8')
 
-conn = sqlite3.connect('credenciamento.db')
+conn = get_db_connection()
 c = conn.cursor()
 
 # Buscar documentos em analyzing
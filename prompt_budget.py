@@ -0,0 +1,303 @@
+"""
+Orçamento de Tokens do Prompt e Seleção de Trechos
+Em vez de cortar o documento às cegas (text[:4000] no prompt, text[:3000] no
+contexto e context[:8000] de novo no provedor), o contexto enviado à IA é
+montado com os trechos mais relevantes do documento inteiro, até
+AI_CONTEXT_TOKENS tokens (AI_CONTEXT_TOKENS_<TIPO> para um tipo):
+
+    1. linhas repetidas em muitas páginas (cabeçalho/rodapé) ficam só na 1ª vez
+    2. o texto vira trechos de até PASSAGE_CHARS caracteres
+    3. cada trecho pontua pelas palavras-chave do tipo (ai_document_knowledge),
+       menção à instituição e datas; o começo do documento sempre entra e a
+       sobra do orçamento cobre páginas ainda não vistas
+    4. os escolhidos voltam na ordem do documento, com "[página N]" e "[...]"
+
+Tokens contados por modelo: tiktoken quando instalado (modelos OpenAI); senão
+caracteres por token da família do modelo. fit_context, chamado pelo motor de
+IA antes de cada chamada, tira do contexto o que já está no prompt e aplica o
+teto AI_CONTEXT_MAX_TOKENS.
+
+    selection = build_context(page_texts, 'apresentacao_institucional', institution_name)
+    get_ai_analysis(prompt, selection.text, 'apresentacao_institucional')
+"""
+
+import math
+import os
+import re
+import textwrap
+from collections import Counter, namedtuple
+
+from ai_document_knowledge import get_relevance_keywords
+from date_extraction import DATE_RE
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+CONTEXT_TOKENS = int(os.getenv('AI_CONTEXT_TOKENS', '1500'))
+CONTEXT_MAX_TOKENS = int(os.getenv('AI_CONTEXT_MAX_TOKENS', '2500'))
+PASSAGE_CHARS = 700
+# Parte do orçamento reservada ao começo do documento (título, identificação)
+HEAD_SHARE = 0.2
+# Linha em pelo menos metade das páginas (mín. 3) = cabeçalho/rodapé
+REPEATED_LINE_MIN_PAGES = 3
+# O contexto é comparado com o prompt em blocos de linhas com pelo menos isso de caracteres
+DEDUPE_MIN_CHARS = 40
+
+# Caracteres por token (texto em português) quando não há tokenizador do modelo
+CHARS_PER_TOKEN = {'gpt': 3.6, 'claude': 3.3, 'gemini': 4.0}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+ContextSelection = namedtuple('ContextSelection',
+                              ['text', 'tokens', 'source_tokens', 'passages_used', 'passages_total',
+                               'pages_used', 'pages_total'])
+Passage = namedtuple('Passage', ['page', 'text'])
+
+_encodings = {}
+
+
+def active_model():
+    """Modelo do provedor de IA ativo ('' sem IA configurada)"""
+    import ai_config  # tardio: ai_config importa este módulo
+    provider = ai_config.ai_engine.providers.get(ai_config.ai_engine.active_provider)
+    return provider.model if provider else ''
+
+
+def _encoding(model):
+    if not TIKTOKEN_AVAILABLE or not model.startswith('gpt'):
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except Exception:
+            try:
+                _encodings[model] = tiktoken.get_encoding('cl100k_base')
+            except Exception:
+                # Sem o arquivo do tokenizador (ex.: sem rede): estimativa por caracteres
+                _encodings[model] = None
+    return _encodings[model]
+
+
+def chars_per_token(model):
+    for family, ratio in CHARS_PER_TOKEN.items():
+        if family in model:
+            return ratio
+    return DEFAULT_CHARS_PER_TOKEN
+
+
+def count_tokens(text, model=None):
+    """Tokens do texto no modelo (None = modelo do provedor ativo)"""
+    if not text:
+        return 0
+    model = (active_model() if model is None else model) or ''
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / chars_per_token(model))
+
+
+def budget_for(document_type):
+    name = re.sub(r'\W+', '_', (document_type or '').upper()).strip('_')
+    override = os.getenv(f'AI_CONTEXT_TOKENS_{name}') if name else None
+    return int(override) if override else CONTEXT_TOKENS
+
+
+def _line_key(line):
+    # Número de página/data no rodapé não impede de reconhecer a linha repetida
+    return re.sub(r'\d+', '#', ' '.join(line.lower().split()))
+
+
+def strip_repeated_lines(pages):
+    """Cabeçalhos e rodapés (mesma linha em muitas páginas) ficam só na primeira ocorrência"""
+    if len(pages) < REPEATED_LINE_MIN_PAGES:
+        return pages
+    counts = Counter()
+    for page in pages:
+        counts.update({_line_key(line) for line in page.splitlines() if len(line.strip()) >= 4})
+    threshold = max(REPEATED_LINE_MIN_PAGES, len(pages) // 2)
+    repeated = {key for key, pages_with_line in counts.items() if pages_with_line >= threshold}
+    if not repeated:
+        return pages
+    seen = set()
+    cleaned = []
+    for page in pages:
+        kept = []
+        for line in page.splitlines():
+            key = _line_key(line)
+            if key in repeated:
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(line)
+        cleaned.append('\n'.join(kept))
+    return cleaned
+
+
+def split_passages(pages):
+    """Trechos de até PASSAGE_CHARS caracteres, quebrando de preferência em linhas em branco"""
+    passages = []
+    for page_number, page in enumerate(pages, 1):
+        chunk = []
+        size = 0
+        for line in page.splitlines():
+            line = line.strip()
+            if not line:
+                if size >= PASSAGE_CHARS // 3:
+                    passages.append(Passage(page_number, '\n'.join(chunk)))
+                    chunk, size = [], 0
+                continue
+            pieces = [line] if len(line) <= PASSAGE_CHARS else textwrap.wrap(line, PASSAGE_CHARS)
+            for piece in pieces:
+                if chunk and size + len(piece) > PASSAGE_CHARS:
+                    passages.append(Passage(page_number, '\n'.join(chunk)))
+                    chunk, size = [], 0
+                chunk.append(piece)
+                size += len(piece) + 1
+        if chunk:
+            passages.append(Passage(page_number, '\n'.join(chunk)))
+    return passages
+
+
+def _keyword_regex(keywords):
+    keywords = [k for k in keywords if k]
+    if not keywords:
+        return None
+    alternatives = '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+    return re.compile(r'(?<!\w)(?:' + alternatives + r')(?!\w)', re.IGNORECASE)
+
+
+def _relevance(text, keyword_re, institution):
+    """Palavras-chave distintas valem mais que repetições; instituição e datas somam"""
+    score = 0.0
+    if keyword_re is not None:
+        found = [m.group().lower() for m in keyword_re.finditer(text)]
+        score += 2 * len(set(found)) + 0.5 * min(len(found) - len(set(found)), 4)
+    if institution and institution in text.lower():
+        score += 4
+    if DATE_RE.search(text):
+        score += 1
+    return score
+
+
+def build_context(pages, document_type, institution_name=None, budget_tokens=None, model=None):
+    """
+    Trechos mais relevantes do documento dentro do orçamento de tokens.
+    pages: textos das páginas (ou o texto inteiro, sem marcação de página).
+    """
+    paged = not isinstance(pages, str)
+    pages = strip_repeated_lines([page or '' for page in pages]) if paged else [pages or '']
+    model = (active_model() if model is None else model) or ''
+    budget = budget_for(document_type) if budget_tokens is None else budget_tokens
+
+    passages = split_passages(pages)
+    if not passages:
+        return ContextSelection('', 0, 0, 0, 0, 0, len(pages))
+    tokens = [count_tokens(p.text, model) for p in passages]
+    source_tokens = sum(tokens)
+
+    if source_tokens <= budget:
+        chosen = set(range(len(passages)))
+    else:
+        chosen = set()
+        used = 0
+        # 1. Começo do documento
+        for i in range(len(passages)):
+            if used + tokens[i] > budget * HEAD_SHARE and chosen:
+                break
+            if used + tokens[i] <= budget:
+                chosen.add(i)
+                used += tokens[i]
+
+        # 2. Trechos mais relevantes (pontuação por token, para não favorecer trechos longos)
+        institution = ' '.join((institution_name or '').lower().split())
+        keyword_re = _keyword_regex(get_relevance_keywords(document_type))
+        value = {i: _relevance(passages[i].text, keyword_re, institution) / (1 + tokens[i] / 400)
+                 for i in range(len(passages)) if i not in chosen}
+        for i in sorted(value, key=lambda i: (-value[i], i)):
+            if value[i] <= 0:
+                break
+            if used + tokens[i] <= budget:
+                chosen.add(i)
+                used += tokens[i]
+
+        # 3. Sobra do orçamento: páginas que ainda não apareceram
+        covered = {passages[i].page for i in chosen}
+        for i, passage in enumerate(passages):
+            if passage.page not in covered and i not in chosen and used + tokens[i] <= budget:
+                chosen.add(i)
+                used += tokens[i]
+                covered.add(passage.page)
+
+    parts = []
+    previous = None
+    for i in sorted(chosen):
+        page = passages[i].page
+        if paged and (previous is None or page != passages[previous].page):
+            parts.append(f'[página {page}]')
+        elif i != (previous + 1 if previous is not None else 0):
+            parts.append('[...]')
+        parts.append(passages[i].text)
+        previous = i
+    if previous != len(passages) - 1:
+        parts.append('[...]')
+    text = '\n'.join(parts)
+
+    selection = ContextSelection(text, count_tokens(text, model), source_tokens, len(chosen), len(passages),
+                                 len({passages[i].page for i in chosen}), len(pages))
+    if len(chosen) < len(passages):
+        print(f"✂️  Contexto da IA: {selection.passages_used}/{selection.passages_total} trechos, "
+              f"{selection.pages_used}/{selection.pages_total} páginas, "
+              f"~{selection.tokens} de {source_tokens} tokens")
+    return selection
+
+
+def dedupe_against(prompt, context):
+    """Remove do contexto os blocos de linhas que já aparecem no prompt"""
+    normalized_prompt = ' '.join((prompt or '').split())
+    if not normalized_prompt or not context:
+        return context
+    kept = []
+    block = []
+    dropped = False
+    for line in context.splitlines():
+        block.append(line)
+        key = ' '.join(' '.join(block).split())
+        if len(key) >= DEDUPE_MIN_CHARS:
+            dropped = key in normalized_prompt
+            if not dropped:
+                kept.extend(block)
+            block = []
+    # Sobra curta no fim: só sai junto com o bloco anterior
+    key = ' '.join(' '.join(block).split())
+    if key and not (dropped and key in normalized_prompt):
+        kept.extend(block)
+    return '\n'.join(kept).strip()
+
+
+def truncate_to_tokens(text, max_tokens, model=None):
+    """Corta no fim de uma linha para caber em max_tokens"""
+    model = (active_model() if model is None else model) or ''
+    tokens = count_tokens(text, model)
+    if tokens <= max_tokens:
+        return text
+    cut = int(len(text) * max_tokens / tokens)
+    while cut > 0:
+        piece = text[:cut]
+        boundary = piece.rfind('\n')
+        if boundary > cut // 2:
+            piece = piece[:boundary]
+        if count_tokens(piece, model) <= max_tokens:
+            return piece
+        cut = int(cut * 0.9)
+    return ''
+
+
+def fit_context(prompt, context, model=None, max_tokens=None):
+    """Contexto final da chamada: sem o que já está no prompt e dentro do teto de tokens"""
+    if not context:
+        return ''
+    context = dedupe_against(prompt, context)
+    return truncate_to_tokens(context, CONTEXT_MAX_TOKENS if max_tokens is None else max_tokens, model)
@@ -0,0 +1,559 @@
+"""
+Camada de Acesso a Dados (repositórios)
+Consultas com colunas nomeadas para processos, documentos, comunicações e histórico.
+
+Cada função projeta apenas as colunas que o endpoint usa e devolve tuplas nomeadas
+(namedtuple), leves e imutáveis. Use row._asdict() para serializar em JSON.
+
+As listagens grandes usam paginação por cursor (keyset): o cursor guarda o valor
+da coluna de ordenação e o id do último item, então cada página é uma busca no
+índice, sem OFFSET.
+"""
+
+import base64
+import json
+import sqlite3
+from collections import namedtuple
+from datetime import date, timedelta
+
+
+# ==================== TIPOS DE LINHA ====================
+
+ProcessListRow = namedtuple('ProcessListRow', [
+    'id', 'custom_id', 'financial_institution_id', 'financial_institution_name',
+    'financial_institution_cnpj', 'rpps_id', 'rpps_name', 'credentialing_type',
+    'status', 'created_at', 'updated_at', 'final_decision', 'document_count',
+    'pending_request_count', 'last_activity_at'
+])
+
+CategoryProcessRow = namedtuple('CategoryProcessRow', [
+    'id', 'custom_id', 'institution_name', 'credentialing_type', 'status', 'created_at',
+    'document_count'
+])
+
+StatusRollupRow = namedtuple('StatusRollupRow', ['status', 'credentialing_type', 'total'])
+
+EntityRow = namedtuple('EntityRow', [
+    'id', 'name', 'type', 'cpf_cnpj', 'email', 'user_count', 'foto_perfil', 'telefone',
+    'endereco', 'cidade', 'estado', 'razao_social', 'email_institucional', 'cep'
+])
+
+OrganizationRow = namedtuple('OrganizationRow', [
+    'id', 'name', 'cnpj', 'email', 'phone', 'type', 'organization_type', 'status',
+    'created_by', 'created_at', 'updated_at', 'user_email'
+])
+
+# Página de resultados: itens, cursor da próxima página (None no fim) e total (só na 1ª página)
+Page = namedtuple('Page', ['items', 'next_cursor', 'total'])
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+ProcessDetailRow = namedtuple('ProcessDetailRow', [
+    'id', 'custom_id', 'financial_institution_name', 'rpps_name', 'credentialing_type',
+    'status', 'created_at', 'submitted_at', 'final_review_note', 'final_decision'
+])
+
+ProcessTimelineRow = namedtuple('ProcessTimelineRow', [
+    'created_at', 'financial_institution_name', 'rpps_name', 'status',
+    'submitted_at', 'reviewed_at', 'final_decision_at', 'final_decision'
+])
+
+DocumentRow = namedtuple('DocumentRow', [
+    'id', 'process_id', 'document_type', 'name', 'filename', 'mime_type',
+    'uploaded_at', 'status', 'workflow_status', 'workflow_version'
+])
+
+DocumentAnalysisRow = namedtuple('DocumentAnalysisRow', [
+    'id', 'type', 'name', 'filename', 'mime_type', 'uploaded_at', 'status', 'analysis_data'
+])
+
+DocumentReportRow = namedtuple('DocumentReportRow', [
+    'id', 'name', 'type', 'filename', 'status', 'uploaded_at', 'score', 'is_valid', 'summary',
+    'completeness', 'completeness_comment', 'coherence', 'coherence_comment',
+    'institution_mentioned', 'institution_comment', 'warning_count'
+])
+
+AnalysisSummaryRow = namedtuple('AnalysisSummaryRow', [
+    'total_documents', 'approved', 'rejected', 'warnings', 'score_sum'
+])
+
+AnalysisStatsRow = namedtuple('AnalysisStatsRow', [
+    'document_type', 'analyzed', 'average_score', 'approved', 'rejected', 'issue_count',
+    'warning_count', 'tcees_checked', 'tcees_passed', 'average_latency_ms'
+])
+
+CommunicationRow = namedtuple('CommunicationRow', [
+    'id', 'message', 'sender_role', 'message_type', 'sender_name', 'created_at'
+])
+
+CommunicationEventRow = namedtuple('CommunicationEventRow', [
+    'sender_role', 'message', 'created_at'
+])
+
+HistoryRow = namedtuple('HistoryRow', [
+    'user_name', 'user_role', 'action', 'details', 'created_at'
+])
+
+
+def _fetch_all(c, row_type):
+    return list(map(row_type._make, c.fetchall()))
+
+
+def _fetch_one(c, row_type):
+    row = c.fetchone()
+    return row_type._make(row) if row else None
+
+
+# ==================== PAGINAÇÃO POR CURSOR ====================
+
+def encode_cursor(*values):
+    """Cursor opaco com os valores de ordenação do último item da página"""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Decodifica o cursor; ValueError se estiver malformado"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Cursor inválido')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Cursor inválido')
+    return values
+
+
+def clamp_page_size(limit):
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def _keyset_page(c, select_sql, count_sql, where, params, sort_expr, id_expr,
+                 descending, limit, cursor, row_type, cursor_fields):
+    """
+    Executa uma consulta paginada por (sort_expr, id).
+    cursor_fields: função row -> (valor_ordenação, id) usada para montar o próximo cursor.
+    """
+    where = list(where)
+    params = list(params)
+    filter_where = list(where)
+    filter_params = list(params)
+
+    if cursor:
+        last_sort, last_id = decode_cursor(cursor, 2)
+        op = '<' if descending else '>'
+        where.append(f'({sort_expr}, {id_expr}) {op} (?, ?)')
+        params.extend([last_sort, last_id])
+
+    direction = 'DESC' if descending else 'ASC'
+    sql = select_sql
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += f' ORDER BY {sort_expr} {direction}, {id_expr} {direction} LIMIT ?'
+    c.execute(sql, params + [limit + 1])
+    items = _fetch_all(c, row_type)
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(*cursor_fields(items[-1]))
+
+    # Total só na primeira página (as seguintes reaproveitam o valor do cliente)
+    total = None
+    if not cursor and count_sql:
+        count = count_sql
+        if filter_where:
+            count += ' WHERE ' + ' AND '.join(filter_where)
+        c.execute(count, filter_params)
+        total = c.fetchone()[0]
+
+    return Page(items, next_cursor, total)
+
+
+# ==================== PROCESSOS ====================
+
+# Contadores vêm das colunas mantidas por triggers (migração 003), sem JOIN em documents
+_PROCESS_LIST_SELECT = '''
+    SELECT p.id, p.custom_id, p.financial_institution_id, p.financial_institution_name,
+           p.financial_institution_cnpj, p.rpps_id, p.rpps_name, p.credentialing_type,
+           p.status, p.created_at, p.updated_at, p.final_decision,
+           p.document_count, p.pending_request_count, p.last_activity_at
+    FROM processes p
+'''
+
+
+def list_financial_processes(conn, financial_institution_id):
+    """Processos ativos (não arquivados) de uma instituição financeira"""
+    c = conn.cursor()
+    c.execute(_PROCESS_LIST_SELECT + '''
+        WHERE p.financial_institution_id = ? AND p.is_archived = 0
+        ORDER BY p.created_at DESC''', (financial_institution_id,))
+    return _fetch_all(c, ProcessListRow)
+
+
+def list_rpps_processes(conn, rpps_id, archived=False):
+    """Processos enviados a um RPPS (rascunhos ficam de fora)"""
+    c = conn.cursor()
+    c.execute(_PROCESS_LIST_SELECT + '''
+        WHERE p.rpps_id = ? AND p.is_archived = ? AND p.status != 'draft'
+        ORDER BY p.created_at DESC''', (rpps_id, 1 if archived else 0))
+    return _fetch_all(c, ProcessListRow)
+
+
+# Ordenações permitidas para as listas de processos (chave da API -> expressão SQL)
+PROCESS_SORTS = {
+    'created_at': 'p.created_at',
+    'updated_at': 'p.updated_at',
+    'last_activity_at': 'p.last_activity_at',
+    'custom_id': "COALESCE(p.custom_id, '')",
+    'institution': 'p.financial_institution_name',
+}
+
+_PROCESS_SORT_FIELDS = {
+    'created_at': lambda row: row.created_at,
+    'updated_at': lambda row: row.updated_at,
+    'last_activity_at': lambda row: row.last_activity_at,
+    'custom_id': lambda row: row.custom_id or '',
+    'institution': lambda row: row.financial_institution_name,
+}
+
+
+def _process_filters(owner, owner_id, filters):
+    """Monta o WHERE das listas de processos a partir dos filtros da API"""
+    if owner == 'rpps':
+        where = ['p.rpps_id = ?', "p.status != 'draft'"]
+    else:
+        where = ['p.financial_institution_id = ?']
+    params = [owner_id]
+
+    where.append('p.is_archived = ?')
+    params.append(1 if filters.get('archived') else 0)
+
+    if filters.get('status'):
+        statuses = filters['status']
+        where.append(f"p.status IN ({','.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if filters.get('types'):
+        types = filters['types']
+        where.append(f"p.credentialing_type IN ({','.join('?' * len(types))})")
+        params.extend(types)
+    if filters.get('institution_id'):
+        where.append('p.financial_institution_id = ?')
+        params.append(filters['institution_id'])
+    if filters.get('institution'):
+        where.append('p.financial_institution_name LIKE ?')
+        params.append(filters['institution'] + '%')
+    if filters.get('q'):
+        where.append('(p.financial_institution_name LIKE ? OR p.custom_id LIKE ? OR p.rpps_name LIKE ?)')
+        like = f"%{filters['q']}%"
+        params.extend([like, like, like])
+    if filters.get('created_from'):
+        where.append('p.created_at >= ?')
+        params.append(filters['created_from'])
+    if filters.get('created_to'):
+        # Data final inclusiva (YYYY-MM-DD cobre o dia inteiro); calculada aqui para valer em qualquer banco
+        try:
+            next_day = date.fromisoformat(filters['created_to'][:10]) + timedelta(days=1)
+        except ValueError:
+            raise ValueError('created_to deve estar no formato YYYY-MM-DD')
+        where.append('p.created_at < ?')
+        params.append(next_day.isoformat())
+    return where, params
+
+
+def page_processes(conn, owner, owner_id, filters=None, sort='created_at', descending=True,
+                   limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    Lista paginada de processos de um RPPS (owner='rpps') ou de uma IF (owner='financial').
+    filters: status (lista), types (lista), institution_id, institution (prefixo do nome),
+             q (busca livre), created_from / created_to (YYYY-MM-DD), archived (bool)
+    """
+    if sort not in PROCESS_SORTS:
+        raise ValueError(f'Ordenação inválida: {sort}')
+    where, params = _process_filters(owner, owner_id, filters or {})
+    sort_field = _PROCESS_SORT_FIELDS[sort]
+    return _keyset_page(
+        conn.cursor(),
+        _PROCESS_LIST_SELECT,
+        'SELECT COUNT(*) FROM processes p',
+        where, params,
+        PROCESS_SORTS[sort], 'p.id',
+        descending, clamp_page_size(limit), cursor,
+        ProcessListRow,
+        lambda row: (sort_field(row), row.id)
+    )
+
+
+def summarize_processes(conn, owner, owner_id, archived=False):
+    """Totais por tipo x status dos processos do dono (alimenta contadores e pastas da tela)"""
+    where, params = _process_filters(owner, owner_id, {'archived': archived})
+    c = conn.cursor()
+    c.execute(f'''SELECT p.status, p.credentialing_type, COUNT(*)
+                  FROM processes p WHERE {' AND '.join(where)}
+                  GROUP BY p.credentialing_type, p.status''', params)
+    return _fetch_all(c, StatusRollupRow)
+
+
+def list_category_processes(conn, credentialing_type):
+    """Processos de um tipo de credenciamento (painel admin)"""
+    c = conn.cursor()
+    c.execute('''SELECT id, custom_id, financial_institution_name, credentialing_type, status,
+                        created_at, document_count
+                 FROM processes
+                 WHERE credentialing_type = ?
+                 ORDER BY created_at DESC''', (credentialing_type,))
+    return _fetch_all(c, CategoryProcessRow)
+
+
+def get_status_rollup(conn, credentialing_type=None):
+    """Totais status x tipo mantidos por triggers (poucas linhas, sem varrer processes)"""
+    c = conn.cursor()
+    if credentialing_type is None:
+        c.execute('SELECT status, credentialing_type, total FROM process_status_rollup WHERE total > 0')
+    else:
+        c.execute('''SELECT status, credentialing_type, total FROM process_status_rollup
+                     WHERE credentialing_type = ? AND total > 0''', (credentialing_type,))
+    return _fetch_all(c, StatusRollupRow)
+
+
+def get_process_detail(conn, process_id):
+    c = conn.cursor()
+    c.execute('''SELECT id, custom_id, financial_institution_name, rpps_name, credentialing_type,
+                        status, created_at, submitted_at, final_review_note, final_decision
+                 FROM processes WHERE id = ?''', (process_id,))
+    return _fetch_one(c, ProcessDetailRow)
+
+
+def get_process_timeline(conn, process_id):
+    """Datas e nomes usados para montar os eventos inferidos do histórico"""
+    c = conn.cursor()
+    c.execute('''SELECT created_at, financial_institution_name, rpps_name, status,
+                        submitted_at, reviewed_at, final_decision_at, final_decision
+                 FROM processes WHERE id = ?''', (process_id,))
+    return _fetch_one(c, ProcessTimelineRow)
+
+
+# ==================== DOCUMENTOS ====================
+
+def list_process_documents(conn, process_id):
+    c = conn.cursor()
+    c.execute('''SELECT id, process_id, type, name, filename, mime_type, uploaded_at,
+                        COALESCE(status, 'pending'), COALESCE(workflow_status, 'initial'),
+                        COALESCE(workflow_version, 1)
+                 FROM documents WHERE process_id = ? ORDER BY uploaded_at DESC''', (process_id,))
+    return _fetch_all(c, DocumentRow)
+
+
+def list_documents_with_analysis(conn, process_id):
+    c = conn.cursor()
+    c.execute('''SELECT id, type, name, filename, mime_type, uploaded_at, status, analysis_data
+                 FROM documents WHERE process_id = ?''', (process_id,))
+    return _fetch_all(c, DocumentAnalysisRow)
+
+
+# ==================== COMUNICAÇÕES ====================
+
+def list_process_communications(conn, process_id):
+    """Mensagens trocadas entre IF e RPPS (exclui as análises automáticas da IA)"""
+    c = conn.cursor()
+    c.execute('''SELECT c.id, c.message, c.sender_role, c.message_type, u.name, c.created_at
+                 FROM communications c
+                 LEFT JOIN users u ON c.sender_id = u.id
+                 WHERE c.process_id = ?
+                 AND (c.message_type = 'comment' OR c.message_type = 'message')
+                 AND c.message NOT LIKE '%**Análise%'
+                 AND c.message NOT LIKE '%Análise com IA%'
+                 AND c.message NOT LIKE '%**Score:**%'
+                 ORDER BY c.id ASC''', (process_id,))
+    return _fetch_all(c, CommunicationRow)
+
+
+def page_process_communications(conn, process_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """Mesma lista de list_process_communications, paginada por id crescente"""
+    return _keyset_page(
+        conn.cursor(),
+        '''SELECT c.id, c.message, c.sender_role, c.message_type, u.name, c.created_at
+           FROM communications c
+           LEFT JOIN users u ON c.sender_id = u.id''',
+        'SELECT COUNT(*) FROM communications c',
+        ['c.process_id = ?',
+         "(c.message_type = 'comment' OR c.message_type = 'message')",
+         "c.message NOT LIKE '%**Análise%'",
+         "c.message NOT LIKE '%Análise com IA%'",
+         "c.message NOT LIKE '%**Score:**%'"],
+        [process_id],
+        'c.id', 'c.id',
+        False, clamp_page_size(limit), cursor,
+        CommunicationRow,
+        lambda row: (row.id, row.id)
+    )
+
+
+def list_communications_by_type(conn, process_id, message_type):
+    c = conn.cursor()
+    c.execute('''SELECT sender_role, message, created_at FROM communications
+                 WHERE process_id = ? AND message_type = ?
+                 ORDER BY created_at ASC''', (process_id, message_type))
+    return _fetch_all(c, CommunicationEventRow)
+
+
+# ==================== ENTIDADES / ORGANIZAÇÕES ====================
+
+def page_entities(conn, entity_type=None, q=None, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """Entidades (RPPS e IFs) em ordem alfabética, paginadas por (nome, id)"""
+    where = ["u.role IN ('financial', 'rpps')"]
+    params = []
+    if entity_type:
+        where.append('u.role = ?')
+        params.append(entity_type)
+    if q:
+        where.append('(u.name LIKE ? OR u.cpf_cnpj LIKE ? OR u.email LIKE ?)')
+        like = f'%{q}%'
+        params.extend([like, like, like])
+    return _keyset_page(
+        conn.cursor(),
+        '''SELECT u.id, u.name, u.role, u.cpf_cnpj, u.email,
+                  (SELECT COUNT(*) FROM users u2 WHERE u2.entity_id = u.id),
+                  u.foto_perfil, u.telefone, u.endereco, u.cidade, u.estado, u.razao_social,
+                  u.email_institucional, u.cep
+           FROM users u''',
+        'SELECT COUNT(*) FROM users u',
+        where, params,
+        'u.name', 'u.id',
+        False, clamp_page_size(limit), cursor,
+        EntityRow,
+        lambda row: (row.name, row.id)
+    )
+
+
+def page_organizations(conn, status=None, q=None, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """Organizações mais recentes primeiro, paginadas por (created_at, id)"""
+    where = []
+    params = []
+    if status:
+        where.append('o.status = ?')
+        params.append(status)
+    if q:
+        where.append('(o.name LIKE ? OR o.cnpj LIKE ?)')
+        params.extend([f'%{q}%', f'%{q}%'])
+    return _keyset_page(
+        conn.cursor(),
+        '''SELECT o.id, o.name, o.cnpj, o.email, o.phone, o.type, o.organization_type, o.status,
+                  o.created_by, o.created_at, o.updated_at,
+                  (SELECT u.email FROM users u WHERE u.organization_id = o.id LIMIT 1)
+           FROM organizations o''',
+        'SELECT COUNT(*) FROM organizations o',
+        where, params,
+        "COALESCE(o.created_at, '')", 'o.id',
+        True, clamp_page_size(limit), cursor,
+        OrganizationRow,
+        lambda row: (row.created_at or '', row.id)
+    )
+
+
+# ==================== SEQUÊNCIAS ====================
+
+# RETURNING existe a partir do SQLite 3.35 (e sempre no Postgres)
+_UPSERT_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def next_sequence_value(conn, prefix):
+    """
+    Incrementa e retorna o próximo número da sequência (id_sequences) de forma atômica.
+    Deve rodar na mesma transação do INSERT que usa o número: o upsert trava a linha
+    da sequência até o commit, então chamadas concorrentes nunca recebem o mesmo valor.
+    """
+    c = conn.cursor()
+    upsert = '''INSERT INTO id_sequences (prefix, last_value) VALUES (?, 1)
+                ON CONFLICT (prefix) DO UPDATE SET last_value = id_sequences.last_value + 1'''
+    if _UPSERT_RETURNING or getattr(conn, 'dialect', 'sqlite') != 'sqlite':
+        c.execute(upsert + ' RETURNING last_value', (prefix,))
+    else:
+        c.execute(upsert, (prefix,))
+        c.execute('SELECT last_value FROM id_sequences WHERE prefix = ?', (prefix,))
+    return c.fetchone()[0]
+
+
+# ==================== HISTÓRICO ====================
+
+def list_process_history(conn, process_id):
+    c = conn.cursor()
+    c.execute('''SELECT user_name, user_role, action, details, created_at
+                 FROM process_history
+                 WHERE process_id = ?
+                 ORDER BY created_at ASC''', (process_id,))
+    return _fetch_all(c, HistoryRow)
+
+# ==================== RESULTADOS DE ANÁLISE ====================
+
+def list_document_report(conn, process_id):
+    """Documentos do processo com o resultado estruturado da análise (sem ler o JSON)"""
+    c = conn.cursor()
+    c.execute('''SELECT d.id, d.name, d.type, d.filename, d.status, d.uploaded_at,
+                        COALESCE(a.score, 50), COALESCE(a.is_valid, 0), a.summary,
+                        a.completeness, a.completeness_comment, a.coherence, a.coherence_comment,
+                        a.institution_mentioned, a.institution_comment, COALESCE(a.warning_count, 0)
+                 FROM documents d
+                 LEFT JOIN document_analysis a ON a.document_id = d.id
+                 WHERE d.process_id = ?
+                 ORDER BY d.uploaded_at''', (process_id,))
+    return _fetch_all(c, DocumentReportRow)
+
+
+def list_document_issues(conn, process_id):
+    """{document_id: {'issue': [...], 'warning': [...]}} na ordem original"""
+    c = conn.cursor()
+    c.execute('''SELECT document_id, severity, text FROM document_issue
+                 WHERE process_id = ?
+                 ORDER BY document_id, position''', (process_id,))
+    issues = {}
+    for document_id, severity, text in c.fetchall():
+        issues.setdefault(document_id, {'issue': [], 'warning': []}).setdefault(severity, []).append(text)
+    return issues
+
+
+def summarize_document_analysis(conn, process_id):
+    """Totais do relatório (aprovados, reprovados, com alertas, soma dos scores)"""
+    c = conn.cursor()
+    c.execute('''SELECT COUNT(*),
+                        COALESCE(SUM(CASE WHEN COALESCE(a.is_valid, 0) = 1 THEN 1 ELSE 0 END), 0),
+                        COALESCE(SUM(CASE WHEN COALESCE(a.is_valid, 0) = 0 THEN 1 ELSE 0 END), 0),
+                        COALESCE(SUM(CASE WHEN COALESCE(a.warning_count, 0) > 0 THEN 1 ELSE 0 END), 0),
+                        COALESCE(SUM(COALESCE(a.score, 50)), 0)
+                 FROM documents d
+                 LEFT JOIN document_analysis a ON a.document_id = d.id
+                 WHERE d.process_id = ?''', (process_id,))
+    return _fetch_one(c, AnalysisSummaryRow)
+
+
+def get_analysis_stats(conn):
+    """Agregados por tipo de documento para o dashboard (score médio, reprovações, TCEES)"""
+    c = conn.cursor()
+    c.execute('''SELECT d.type, COUNT(*), AVG(a.score),
+                        SUM(CASE WHEN a.final_verdict = 'approved' THEN 1 ELSE 0 END),
+                        SUM(CASE WHEN a.final_verdict = 'rejected' THEN 1 ELSE 0 END),
+                        SUM(a.issue_count), SUM(a.warning_count),
+                        SUM(CASE WHEN a.tcees_passed IS NOT NULL THEN 1 ELSE 0 END),
+                        SUM(CASE WHEN a.tcees_passed = 1 THEN 1 ELSE 0 END),
+                        AVG(a.latency_ms)
+                 FROM document_analysis a
+                 JOIN documents d ON d.id = a.document_id
+                 GROUP BY d.type
+                 ORDER BY COUNT(*) DESC''')
+    return _fetch_all(c, AnalysisStatsRow)
+
+
+def list_top_issues(conn, limit=10):
+    """Problemas mais frequentes apontados nas análises"""
+    c = conn.cursor()
+    c.execute('''SELECT text, COUNT(*) FROM document_issue
+                 WHERE severity = 'issue'
+                 GROUP BY text
+                 ORDER BY COUNT(*) DESC
+                 LIMIT ?''', (limit,))
+    return c.fetchall()
@@ -147,7 +147,8 @@ Seja PROFUNDO, TÉCNICO e ÚTIL. Sua análise será crucial para a decisão do R
     
     try:
         # Chamar IA para análise robusta
-        result = get_ai_analysis(prompt, context, f"RPPS_Analysis_{document_type}")
+        # A análise prévia já está no prompt - não vai de novo como contexto
+        result = get_ai_analysis(prompt, "", f"RPPS_Analysis_{document_type}")
         
         if result['success']:
             analysis_result = result['analysis']
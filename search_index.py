@@ -0,0 +1,189 @@
+"""
+Busca Textual (SQLite FTS5 / PostgreSQL tsvector)
+Índice único sobre o texto extraído dos documentos, as comunicações e o histórico.
+
+Comunicações e histórico entram no índice por triggers (migração 005); o texto dos
+documentos é indexado quando a análise do upload termina. O rowid de cada entrada
+codifica a origem (id * 4 + código), então atualizar/remover é uma busca direta.
+
+    python search_index.py --reindex-documents   # reindexa os arquivos já enviados
+"""
+
+import html
+import os
+import re
+import sys
+
+from database import get_db_connection, get_dialect
+
+# Código da origem no rowid do índice
+SOURCE_DOCUMENT = 0
+SOURCE_COMMUNICATION = 1
+SOURCE_HISTORY = 2
+
+# Limite de texto indexado por documento (Formulários de Referência passam de 1MB)
+MAX_INDEXED_CHARS = int(os.getenv('SEARCH_MAX_INDEXED_CHARS', '400000'))
+
+UPLOAD_FOLDER = 'uploads'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Marcadores internos do snippet (trocados por <mark> depois de escapar o HTML)
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+# ts_headline do Postgres não aceita caracteres de controle nas opções
+_PG_MARK_START = '[[['
+_PG_MARK_END = ']]]'
+_PG_HEADLINE_OPTIONS = f'StartSel={_PG_MARK_START}, StopSel={_PG_MARK_END}, MaxWords=16, MinWords=6, MaxFragments=1'
+
+
+def search_rowid(source_code, source_id):
+    return source_id * 4 + source_code
+
+
+# ==================== INDEXAÇÃO ====================
+
+def extract_document_text(file_path):
+    """Texto indexável do arquivo (PDF ou Excel); string vazia se não houver texto"""
+    try:
+        # Mesmo extrato usado pelos analisadores (arquivo lido uma única vez)
+        from document_extract import get_extract
+        extract = get_extract(file_path)
+        if extract.error:
+            raise ValueError(extract.error)
+        return extract.text[:MAX_INDEXED_CHARS]
+    except Exception as e:
+        print(f"⚠️  Não foi possível extrair texto para a busca ({os.path.basename(file_path)}): {str(e)[:80]}")
+    return ''
+
+
+def index_document_text(conn, document_id, process_id, title, text):
+    """Insere/atualiza o texto de um documento no índice (na transação do chamador)"""
+    c = conn.cursor()
+    rowid = search_rowid(SOURCE_DOCUMENT, document_id)
+    c.execute('DELETE FROM search_index WHERE rowid = ?', (rowid,))
+    if text:
+        c.execute('''INSERT INTO search_index (rowid, title, body, process_id, source, source_id)
+                     VALUES (?, ?, ?, ?, 'document', ?)''',
+                  (rowid, title, text[:MAX_INDEXED_CHARS], process_id, document_id))
+
+
+def index_document_file(conn, document_id, process_id, title, file_path):
+    """Extrai o texto do arquivo e indexa; retorna o número de caracteres indexados"""
+    text = extract_document_text(file_path)
+    index_document_text(conn, document_id, process_id, title, text)
+    return len(text)
+
+
+def reindex_documents(verbose=True):
+    """Reindexa todos os documentos enviados (uso manual após a migração)"""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT id, process_id, name, filename FROM documents')
+    documents = c.fetchall()
+    indexed = 0
+    try:
+        for doc_id, process_id, name, filename in documents:
+            file_path = os.path.join(UPLOAD_FOLDER, filename)
+            if not os.path.exists(file_path):
+                continue
+            chars = index_document_file(conn, doc_id, process_id, name, file_path)
+            conn.commit()
+            indexed += 1
+            if verbose:
+                print(f"🔎 Documento #{doc_id} indexado ({chars} caracteres)")
+    finally:
+        conn.close()
+    if verbose:
+        print(f"✅ {indexed} documento(s) indexado(s)")
+    return indexed
+
+
+# ==================== CONSULTA ====================
+
+def build_match_query(query):
+    """Converte o texto digitado em consulta FTS5: todos os termos, com busca por prefixo"""
+    tokens = _TOKEN_RE.findall(query or '')
+    return ' '.join(f'"{token}"*' for token in tokens[:12])
+
+
+def build_tsquery(query):
+    """Equivalente Postgres: termos em AND, com prefixo"""
+    tokens = _TOKEN_RE.findall(query or '')
+    return ' & '.join(f'{token}:*' for token in tokens[:12])
+
+
+def _format_snippet(raw, start=_MARK_START, end=_MARK_END):
+    escaped = html.escape(raw or '')
+    return escaped.replace(start, '<mark>').replace(end, '</mark>')
+
+
+def search(conn, query, user_id, user_role, process_id=None, limit=20):
+    """
+    Busca ranqueada (bm25) restrita aos processos do usuário.
+    RPPS vê os processos recebidos, IF os processos que criou e o admin vê todos.
+    """
+    postgres = get_dialect() == 'postgresql'
+    match = build_tsquery(query) if postgres else build_match_query(query)
+    if not match:
+        return []
+
+    where = ['s.tsv @@ q.query' if postgres else 'search_index MATCH ?']
+    params = [] if postgres else [match]
+    if user_role == 'rpps':
+        where.append('p.rpps_id = ?')
+        params.append(user_id)
+    elif user_role in ('financial_institution', 'financial'):
+        where.append('p.financial_institution_id = ?')
+        params.append(user_id)
+    elif user_role != 'admin':
+        return []
+    if process_id:
+        where.append('s.process_id = ?')
+        params.append(process_id)
+
+    c = conn.cursor()
+    if postgres:
+        c.execute(f'''SELECT s.source, s.source_id, s.process_id, p.custom_id, p.financial_institution_name,
+                             s.title,
+                             ts_headline('simple', s.body, q.query, ?),
+                             -ts_rank(s.tsv, q.query)
+                      FROM search_index s
+                      JOIN processes p ON p.id = s.process_id,
+                           (SELECT to_tsquery('simple', app_unaccent(?)) AS query) q
+                      WHERE {' AND '.join(where)}
+                      ORDER BY 8
+                      LIMIT ?''', [_PG_HEADLINE_OPTIONS, match] + params + [limit])
+        marks = (_PG_MARK_START, _PG_MARK_END)
+    else:
+        c.execute(f'''SELECT s.source, s.source_id, s.process_id, p.custom_id, p.financial_institution_name,
+                             s.title,
+                             snippet(search_index, 1, '{_MARK_START}', '{_MARK_END}', '…', 16),
+                             bm25(search_index, 5.0, 1.0)
+                      FROM search_index s
+                      JOIN processes p ON p.id = s.process_id
+                      WHERE {' AND '.join(where)}
+                      ORDER BY bm25(search_index, 5.0, 1.0)
+                      LIMIT ?''', params + [limit])
+        marks = (_MARK_START, _MARK_END)
+
+    results = []
+    for row in c.fetchall():
+        results.append({
+            'source': row[0],
+            'source_id': row[1],
+            'process_id': row[2],
+            'custom_id': row[3],
+            'institution_name': row[4],
+            'title': row[5],
+            'snippet': _format_snippet(row[6], *marks),
+            'score': round(-float(row[7]), 4)
+        })
+    return results
+
+
+if __name__ == '__main__':
+    if '--reindex-documents' in sys.argv:
+        reindex_documents()
+    else:
+        print(__doc__)